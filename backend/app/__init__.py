@@ -108,6 +108,15 @@ def create_app():
         except Exception as e:
             print(f"⚠️ Failed to register {module_name}.{attr}: {e}", flush=True)
 
+    # --------------------------------------------------
+    # WARM THE DEVICE FINGERPRINT INDEX (BACKGROUND)
+    # --------------------------------------------------
+    try:
+        from app.routes.device_routes import device_service
+        device_service.warm_fingerprint_index()
+    except Exception as e:
+        print(f"⚠️ Fingerprint index warm-up failed: {e}", flush=True)
+
     # --------------------------------------------------
     # INITIALIZE SOCKET.IO (OPTIONAL)
     # --------------------------------------------------
@@ -5,8 +5,7 @@ Authentication middleware for Zero Trust Security Framework
 from functools import wraps
 from flask import request, jsonify, g
 from app.services.auth_service import auth_service
-import jwt
-import os
+from app.services.token_verifier import TokenError, token_verifier
 
 def require_auth(f):
     """Decorator to require authentication"""
@@ -26,16 +25,12 @@ def require_auth(f):
             
             # Verify token
             try:
-                payload = jwt.decode(
-                    token, 
-                    os.getenv('JWT_SECRET_KEY', 'default-secret'), 
-                    algorithms=['HS256']
-                )
+                payload = token_verifier.verify(token)
                 g.current_user_id = payload.get('user_id')
                 g.current_user = payload
-            except jwt.ExpiredSignatureError:
-                return jsonify({'error': 'Token has expired'}), 401
-            except jwt.InvalidTokenError:
+            except TokenError as e:
+                if e.code == 'expired':
+                    return jsonify({'error': 'Token has expired'}), 401
                 return jsonify({'error': 'Invalid token'}), 401
             
             return f(*args, **kwargs)
@@ -76,11 +71,7 @@ def optional_auth(f):
             if auth_header:
                 try:
                     token = auth_header.split(' ')[1]  # Bearer <token>
-                    payload = jwt.decode(
-                        token, 
-                        os.getenv('JWT_SECRET_KEY', 'default-secret'), 
-                        algorithms=['HS256']
-                    )
+                    payload = token_verifier.verify(token)
                     g.current_user_id = payload.get('user_id')
                     g.current_user = payload
                 except:
@@ -9,21 +9,21 @@ from functools import wraps
 from datetime import datetime, timedelta
 import re
 import html
-import json
 import hashlib
 import secrets
 import urllib.parse
 import os
-from collections import defaultdict
-import threading
 from typing import Dict, Any, List, Optional
 import bleach
 from app.services.audit_logger import audit_logger
+from app.services.rate_limit_engine import SlidingWindowCounterLimiter
+from app.services.threat_pattern_scanner import (
+    SQL_INJECTION, XSS, ThreatPatternScanner, signatures_for
+)
 import sys
 
-# Rate limiting storage (in-memory for simplicity, use Redis in production)
-rate_limit_storage = defaultdict(list)
-rate_limit_lock = threading.Lock()
+# In-memory rate limiting fallback (sharded, fixed memory per key, idle keys evicted)
+rate_limit_storage = SlidingWindowCounterLimiter()
 
 # Maximum request payload sizes
 MAX_CONTENT_LENGTH = 1 * 1024 * 1024  # 1 MB in bytes
@@ -73,6 +73,14 @@ SQL_INJECTION_PATTERNS = [
     r'(\bsp_executesql\b)',
 ]
 
+# Both pattern lists compiled into one pass per string
+threat_scanner = ThreatPatternScanner(
+    signatures_for(SQL_INJECTION_PATTERNS, SQL_INJECTION) + signatures_for(DANGEROUS_PATTERNS, XSS)
+)
+
+# Null bytes and other control characters removed from sanitized strings
+CONTROL_CHARACTERS = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+
 
 def add_security_headers(response):
     """
@@ -156,49 +164,37 @@ def rate_limit(limit_type='default'):
                     # Fall through to in-memory implementation
             
             # In-memory rate limiting (fallback)
-            with rate_limit_lock:
-                now = datetime.utcnow()
-                cutoff_time = now - timedelta(seconds=window_seconds)
-                
-                # Clean old entries
-                rate_limit_storage[key] = [
-                    timestamp for timestamp in rate_limit_storage[key]
-                    if timestamp > cutoff_time
-                ]
-                
-                # Check if limit exceeded
-                if len(rate_limit_storage[key]) >= max_requests:
-                    # Log rate limit violation
-                    try:
-                        audit_logger.log_event(
-                            event_type='rate_limit_exceeded',
-                            user_id=getattr(g, 'user_id', None),
-                            action='rate_limit_check',
-                            resource=request.path,
-                            result='failure',
-                            details={
-                                'client_id': client_id,
-                                'limit_type': limit_type,
-                                'current_count': len(rate_limit_storage[key]),
-                                'max_requests': max_requests,
-                                'window_seconds': window_seconds
-                            },
-                            severity='medium'
-                        )
-                    except Exception as e:
-                        print(f"Failed to log rate limit event: {e}", file=sys.stderr)
-                    
-                    return jsonify({
-                        'success': False,
-                        'error': {
-                            'code': 'RATE_LIMIT_EXCEEDED',
-                            'message': f'Rate limit exceeded. Maximum {max_requests} requests per {window_seconds} seconds.',
-                            'retry_after': window_seconds
-                        }
-                    }), 429
+            allowed, current_count = rate_limit_storage.hit(key, max_requests, window_seconds)
+            
+            if not allowed:
+                # Log rate limit violation
+                try:
+                    audit_logger.log_event(
+                        event_type='rate_limit_exceeded',
+                        user_id=getattr(g, 'user_id', None),
+                        action='rate_limit_check',
+                        resource=request.path,
+                        result='failure',
+                        details={
+                            'client_id': client_id,
+                            'limit_type': limit_type,
+                            'current_count': current_count,
+                            'max_requests': max_requests,
+                            'window_seconds': window_seconds
+                        },
+                        severity='medium'
+                    )
+                except Exception as e:
+                    print(f"Failed to log rate limit event: {e}", file=sys.stderr)
                 
-                # Add current request
-                rate_limit_storage[key].append(now)
+                return jsonify({
+                    'success': False,
+                    'error': {
+                        'code': 'RATE_LIMIT_EXCEEDED',
+                        'message': f'Rate limit exceeded. Maximum {max_requests} requests per {window_seconds} seconds.',
+                        'retry_after': window_seconds
+                    }
+                }), 429
             
             return f(*args, **kwargs)
         return decorated_function
@@ -215,16 +211,7 @@ def detect_sql_injection(value: str) -> bool:
     Returns:
         True if potential SQL injection detected
     """
-    if not isinstance(value, str):
-        return False
-    
-    value_lower = value.lower()
-    
-    for pattern in SQL_INJECTION_PATTERNS:
-        if re.search(pattern, value_lower, re.IGNORECASE):
-            return True
-    
-    return False
+    return SQL_INJECTION in threat_scanner.categories(threat_scanner.scan(value))
 
 
 def detect_xss_attempt(value: str) -> bool:
@@ -237,23 +224,17 @@ def detect_xss_attempt(value: str) -> bool:
     Returns:
         True if potential XSS detected
     """
-    if not isinstance(value, str):
-        return False
-    
-    for pattern in DANGEROUS_PATTERNS:
-        if re.search(pattern, value, re.IGNORECASE | re.DOTALL):
-            return True
-    
-    return False
+    return XSS in threat_scanner.categories(threat_scanner.scan(value))
 
 
-def sanitize_string(value: str, allow_html: bool = False) -> str:
+def sanitize_string(value: str, allow_html: bool = False, threats: Optional[set] = None) -> str:
     """
     Enhanced string sanitization to prevent XSS and injection attacks
     
     Args:
         value: String to sanitize
         allow_html: Whether to allow safe HTML tags
+        threats: Collects the threat categories detected in the string
         
     Returns:
         Sanitized string
@@ -261,8 +242,12 @@ def sanitize_string(value: str, allow_html: bool = False) -> str:
     if not isinstance(value, str):
         return value
     
+    detected = threat_scanner.categories(threat_scanner.scan(value))
+    if threats is not None:
+        threats.update(detected)
+    
     # Check for SQL injection attempts
-    if detect_sql_injection(value):
+    if SQL_INJECTION in detected:
         try:
             audit_logger.log_event(
                 event_type='security_violation',
@@ -284,7 +269,7 @@ def sanitize_string(value: str, allow_html: bool = False) -> str:
         return ""
     
     # Check for XSS attempts
-    if detect_xss_attempt(value):
+    if XSS in detected:
         try:
             audit_logger.log_event(
                 event_type='security_violation',
@@ -321,41 +306,55 @@ def sanitize_string(value: str, allow_html: bool = False) -> str:
         pass  # Keep original if URL decoding fails
     
     # Remove null bytes and other control characters
-    sanitized = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', sanitized)
+    sanitized = sanitized.translate(CONTROL_CHARACTERS)
     
     # Normalize whitespace
-    sanitized = re.sub(r'\s+', ' ', sanitized).strip()
-    
-    return sanitized
+    return ' '.join(sanitized.split())
 
 
-def sanitize_dict(data: Any, allow_html: bool = False) -> Any:
+def sanitize_dict(data: Any, allow_html: bool = False, threats: Optional[set] = None) -> Any:
     """
     Recursively sanitize dictionary values with enhanced security
     
     Args:
         data: Data structure to sanitize
         allow_html: Whether to allow safe HTML tags in strings
+        threats: Collects the threat categories detected anywhere in the data
         
     Returns:
         Sanitized data structure
     """
+    # Repeated keys and values are sanitized once
+    return _sanitize_value(data, allow_html, {}, threats)
+
+
+def _sanitize_value(data: Any, allow_html: bool, cache: Dict[tuple, Any], threats: Optional[set]) -> Any:
     if isinstance(data, dict):
         sanitized = {}
         for key, value in data.items():
             # Sanitize keys as well
-            clean_key = sanitize_string(str(key), allow_html=False)
-            sanitized[clean_key] = sanitize_dict(value, allow_html)
+            clean_key = _sanitize_cached(str(key), False, cache, threats)
+            sanitized[clean_key] = _sanitize_value(value, allow_html, cache, threats)
         return sanitized
     elif isinstance(data, list):
-        return [sanitize_dict(item, allow_html) for item in data]
+        return [_sanitize_value(item, allow_html, cache, threats) for item in data]
     elif isinstance(data, str):
-        return sanitize_string(data, allow_html)
+        return _sanitize_cached(data, allow_html, cache, threats)
     elif isinstance(data, (int, float, bool)) or data is None:
         return data
     else:
         # Convert unknown types to string and sanitize
-        return sanitize_string(str(data), allow_html=False)
+        return _sanitize_cached(str(data), False, cache, threats)
+
+
+def _sanitize_cached(value: str, allow_html: bool, cache: Dict[tuple, Any], threats: Optional[set]) -> str:
+    entry = cache.get((value, allow_html))
+    if entry is None:
+        detected = set()
+        entry = cache[(value, allow_html)] = (sanitize_string(value, allow_html, detected), detected)
+    if threats is not None:
+        threats.update(entry[1])
+    return entry[0]
 
 
 def validate_request_size(max_size: Optional[int] = None):
@@ -431,12 +430,11 @@ def sanitize_input(allow_html: bool = False, strict_mode: bool = True):
                 try:
                     data = request.get_json()
                     if data:
-                        # Check for potential attacks before sanitization
-                        original_str = json.dumps(data, default=str)
-                        if detect_sql_injection(original_str) or detect_xss_attempt(original_str):
+                        # Detection and sanitization share one scan per string
+                        threats = set()
+                        sanitized_data = sanitize_dict(data, allow_html, threats)
+                        if threats:
                             security_violations.append('malicious_json_payload')
-                        
-                        sanitized_data = sanitize_dict(data, allow_html)
                         # Store sanitized data in g for access in route handlers
                         g.sanitized_data = sanitized_data
                 except Exception as e:
@@ -468,10 +466,11 @@ def sanitize_input(allow_html: bool = False, strict_mode: bool = True):
             sanitized_args = {}
             for key, value in request.args.items():
                 clean_key = sanitize_string(key, allow_html=False)
-                clean_value = sanitize_string(value, allow_html=False)
+                threats = set()
+                clean_value = sanitize_string(value, allow_html=False, threats=threats)
                 
                 # Check for attacks in query parameters
-                if detect_sql_injection(value) or detect_xss_attempt(value):
+                if threats:
                     security_violations.append(f'malicious_query_param_{key}')
                 
                 sanitized_args[clean_key] = clean_value
@@ -482,10 +481,11 @@ def sanitize_input(allow_html: bool = False, strict_mode: bool = True):
                 sanitized_form = {}
                 for key, value in request.form.items():
                     clean_key = sanitize_string(key, allow_html=False)
-                    clean_value = sanitize_string(value, allow_html)
+                    threats = set()
+                    clean_value = sanitize_string(value, allow_html, threats)
                     
                     # Check for attacks in form data
-                    if detect_sql_injection(value) or detect_xss_attempt(value):
+                    if threats:
                         security_violations.append(f'malicious_form_field_{key}')
                     
                     sanitized_form[clean_key] = clean_value
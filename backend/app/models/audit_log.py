@@ -257,8 +257,18 @@ def create_audit_log(
         raise Exception(f"Audit log validation failed: {error_message}")
     
     # Create audit log document in Firestore
+    log_data = audit_log.to_dict()
     log_ref = db.collection('auditLogs').document(audit_log.log_id)
-    log_ref.set(audit_log.to_dict())
+    log_ref.set(log_data)
+    
+    # Keep the user's threat prediction features and the attack detectors current
+    try:
+        from app.services.threat_feature_store import threat_feature_store
+        from app.services.streaming_threat_detector import streaming_threat_detector
+        threat_feature_store.record_event(log_data)
+        streaming_threat_detector.ingest(log_data)
+    except Exception as e:
+        print(f"Error updating threat features: {str(e)}")
     
     return audit_log
 
@@ -106,7 +106,8 @@ class DeviceFingerprint(BaseModel):
     trustScore: float = Field(default=100, ge=0, le=100, description="Device trust score")
     registeredAt: datetime = Field(default_factory=datetime.utcnow)
     lastVerified: datetime = Field(default_factory=datetime.utcnow)
-    verificationHistory: List[VerificationResult] = Field(default_factory=list)
+    verificationHistory: List[VerificationResult] = Field(default_factory=list, description="Most recent verifications (capped)")
+    verificationCount: int = Field(default=0, ge=0, description="Total verifications including rolled-up ones")
     isApproved: bool = Field(default=True)
     approvedBy: Optional[str] = Field(None, description="Admin who approved device")
     deviceName: str = Field(default="Unknown Device")
@@ -7,6 +7,7 @@ from flask import Blueprint, request, jsonify
 from functools import wraps
 from app.services.auth_service import auth_service
 from app.services.policy_engine import policy_engine
+from app.services.peer_cohort_store import peer_cohort_store
 from app.models.access_request import create_access_request, get_access_request_by_id, update_access_request
 from app.models.user import get_user_by_id
 from app.models.notification import create_notification
@@ -222,6 +223,16 @@ def submit_access_request():
         # Update the request in Firestore
         update_access_request(db, access_request.request_id, update_data)
         
+        # Fold the decision into the peer cohort aggregates
+        peer_cohort_store.record_decision(
+            user_id=user_id,
+            role=user_role,
+            department=user.department,
+            resource_type=data['resource'],
+            decision=access_request.decision,
+            timestamp=access_request.timestamp
+        )
+        
         # Create notification for user
         _create_access_request_notification(
             db=db,
@@ -548,6 +559,17 @@ def resubmit_access_request(request_id):
             'denialReason': new_request.denial_reason
         })
         
+        # Fold the decision into the peer cohort aggregates
+        requesting_user = get_user_by_id(db, user_id)
+        peer_cohort_store.record_decision(
+            user_id=user_id,
+            role=user_role,
+            department=requesting_user.department if requesting_user else None,
+            resource_type=resource,
+            decision=new_request.decision,
+            timestamp=new_request.timestamp
+        )
+        
         # Create notification for user
         _create_access_request_notification(
             db=db,
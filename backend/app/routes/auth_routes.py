@@ -4,12 +4,13 @@ Fast and reliable Firebase authentication with backend session management
 """
 
 import os
-import jwt
 import secrets
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import Blueprint, request, jsonify, make_response
 
+from app.services.token_verifier import TokenError, token_verifier
+
 # Firebase imports
 try:
     from app.firebase_config import verify_firebase_token, get_firestore_client
@@ -23,7 +24,6 @@ except Exception as e:
 bp = Blueprint("auth", __name__, url_prefix="/api/auth")
 
 IS_DEV = os.getenv("FLASK_ENV", "development") == "development"
-JWT_SECRET = os.getenv("JWT_SECRET_KEY", "dev_jwt_secret")
 BYPASS_FIREBASE = os.getenv("BYPASS_FIREBASE_NETWORK_ERRORS", "false").lower() == "true"
 
 
@@ -56,16 +56,17 @@ def create_session_token(user_data):
         'type': 'access',
         'last_activity': now.isoformat()
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+    return token_verifier.encode(payload)
 
 def verify_session_token(token):
     """Verify JWT session token"""
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise Exception("Token expired")
-    except jwt.InvalidTokenError:
+        return token_verifier.verify(token)
+    except TokenError as e:
+        if e.code == 'expired':
+            raise Exception("Token expired")
+        if e.code == 'revoked':
+            raise Exception("Token revoked")
         raise Exception("Invalid token")
 
 def get_user_from_firestore(uid):
@@ -436,6 +437,11 @@ def logout():
         return _cors_preflight_response("POST,OPTIONS")
 
     try:
+        token = request.cookies.get("session_token")
+        if token:
+            # Cached verifications of this token must not outlive the logout
+            token_verifier.revoke(token)
+
         resp = make_response(jsonify({
             "success": True,
             "message": "Logged out successfully"
@@ -5,7 +5,7 @@ Handles device registration, validation, and management
 
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
-from app.services.device_fingerprint_service import DeviceFingerprintService
+from app.services.device_fingerprint_service import device_fingerprint_service
 from app.services.auth_service_simple import auth_service
 from app.services.audit_logger import AuditLogger
 from app.middleware.authorization import require_auth, require_role
@@ -15,7 +15,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 device_bp = Blueprint('device', __name__, url_prefix='/api/devices')
-device_service = DeviceFingerprintService()
+device_service = device_fingerprint_service
 auth_service = auth_service
 audit_logger = AuditLogger()
 
@@ -195,7 +195,7 @@ def list_user_devices(user_id):
                 "registeredAt": device.get("registeredAt"),
                 "lastVerified": device.get("lastVerified"),
                 "isActive": device.get("isActive"),
-                "verificationCount": len(device.get("verificationHistory", []))
+                "verificationCount": device.get("verificationCount", len(device.get("verificationHistory", [])))
             }
             safe_devices.append(safe_device)
         
@@ -256,6 +256,8 @@ def remove_device(device_id):
             "deactivatedAt": firestore.SERVER_TIMESTAMP,
             "deactivatedBy": current_user['uid']
         })
+        device_service.fingerprint_index.set_active(device_id, False)
+        device_service.invalidate_user_devices(device_data.get('userId'))
         
         # Log the device removal
         audit_logger.log_event(
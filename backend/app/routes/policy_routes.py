@@ -11,6 +11,7 @@ from app.models.policy import (
 )
 from app.firebase_config import get_firestore_client
 from app.services.audit_logger import audit_logger
+from app.services.policy_engine import policy_engine
 from datetime import datetime
 
 bp = Blueprint('policy', __name__, url_prefix='/api')
@@ -146,6 +147,7 @@ def create_or_update_policy():
             
             # Get updated policy
             updated_policy = get_policy_by_id(db, policy_id)
+            policy_engine.policy_index.upsert(policy_id, updated_policy.to_dict())
             
             # Log policy change
             audit_logger.log_policy_change(
@@ -214,6 +216,7 @@ def create_or_update_policy():
                     priority=priority,
                     created_by=admin_id
                 )
+                policy_engine.policy_index.upsert(policy.policy_id, policy.to_dict())
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -431,6 +434,7 @@ def delete_policy_route(policy_id):
         
         # Soft delete policy
         delete_policy(db, policy_id)
+        policy_engine.policy_index.remove(policy_id)
         
         # Log policy deletion
         audit_logger.log_policy_change(
@@ -0,0 +1,250 @@
+"""
+Activity Tracker
+Write-coalescing last-activity timestamps for users and sessions
+"""
+
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.firebase_config import get_firestore_client
+
+try:
+    from google.api_core.exceptions import NotFound
+except ImportError:  # pragma: no cover - installed with firebase_admin
+    NotFound = None
+
+logger = logging.getLogger(__name__)
+
+# Firestore limit on operations per batch
+MAX_BATCH_SIZE = 500
+
+
+def _is_not_found(error: Exception) -> bool:
+    if NotFound is not None and isinstance(error, NotFound):
+        return True
+    return type(error).__name__ == 'NotFound'
+
+
+class ActivityTracker:
+    """
+    Keeps the latest activity time per user in memory and writes it in batches.
+
+    ``touch()`` only updates an in-memory timestamp, so a busy user costs one
+    Firestore write per ``flush_interval`` instead of one per request, which
+    also keeps each document under Firestore's sustained per-document write
+    rate. A background thread writes the latest value of every dirty user in
+    batches of up to 500 and a final flush runs at shutdown.
+
+    With ``create_missing`` the field is merged into the document (creating
+    it if needed); without it documents are only updated, so activity after
+    a session document was deleted does not recreate it.
+
+    At most ``max_dirty`` users wait to be written. When the set is full the
+    flusher is woken early and activity of further users is dropped until it
+    has drained, and counted in the metrics.
+    """
+
+    def __init__(
+        self,
+        collection: str,
+        field: str = 'lastActivity',
+        db=None,
+        create_missing: bool = True,
+        flush_interval: Optional[float] = None,
+        max_dirty: Optional[int] = None
+    ):
+        """
+        Initialize the tracker
+
+        Args:
+            collection (str): Collection of the documents, keyed by user ID
+            field (str): Timestamp field written on each document
+            db: Firestore client (defaults to the shared client on first write)
+            create_missing (bool): Merge into missing documents instead of skipping them
+            flush_interval (float): Seconds between batched writes
+            max_dirty (int): Users that may wait to be written at once
+        """
+        self.collection = collection
+        self.field = field
+        self._db = db
+        self.create_missing = create_missing
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv('ACTIVITY_FLUSH_INTERVAL', '10')
+        )
+        self.max_dirty = max_dirty or int(os.getenv('ACTIVITY_MAX_DIRTY_USERS', '50000'))
+
+        self._dirty: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+        self.metrics = {
+            'touches': 0,
+            'coalesced': 0,
+            'written': 0,
+            'missing': 0,
+            'batches': 0,
+            'failed_commits': 0,
+            'dropped': 0
+        }
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_firestore_client()
+        return self._db
+
+    def touch(self, user_id: str, timestamp: Optional[datetime] = None) -> bool:
+        """
+        Record activity of a user
+
+        Args:
+            user_id (str): User (document) ID
+            timestamp (datetime): Activity time (defaults to now)
+
+        Returns:
+            bool: True if the activity will be written
+        """
+        if not user_id:
+            return False
+        timestamp = timestamp or datetime.utcnow()
+
+        with self._lock:
+            self.metrics['touches'] += 1
+            current = self._dirty.get(user_id)
+            if current is not None:
+                self.metrics['coalesced'] += 1
+                if timestamp > current:
+                    self._dirty[user_id] = timestamp
+                return True
+            if len(self._dirty) >= self.max_dirty:
+                self.metrics['dropped'] += 1
+                self._wake_event.set()
+                return False
+            self._dirty[user_id] = timestamp
+
+        if self._stop_event.is_set():
+            # Shut down: write on the caller's thread
+            self.flush()
+        else:
+            self._ensure_started()
+        return True
+
+    def get_last_activity(self, user_id: str) -> Optional[datetime]:
+        """Latest activity recorded in this process that has not been written yet"""
+        with self._lock:
+            return self._dirty.get(user_id)
+
+    def flush(self) -> int:
+        """
+        Write the latest activity of every dirty user
+
+        Returns:
+            int: Number of documents written
+        """
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                self._wake_event.clear()
+            if not dirty:
+                return 0
+
+            user_ids = list(dirty)
+            written = 0
+            for start in range(0, len(user_ids), MAX_BATCH_SIZE):
+                chunk = user_ids[start:start + MAX_BATCH_SIZE]
+                try:
+                    batch = self.db.batch()
+                    for user_id in chunk:
+                        ref = self.db.collection(self.collection).document(user_id)
+                        if self.create_missing:
+                            batch.set(ref, {self.field: dirty[user_id]}, merge=True)
+                        else:
+                            batch.update(ref, {self.field: dirty[user_id]})
+                    batch.commit()
+                    written += len(chunk)
+                    self.metrics['batches'] += 1
+                except Exception as e:
+                    if not self.create_missing and _is_not_found(e):
+                        # One deleted document fails the whole batch, update the rest one by one
+                        written += self._write_each(chunk, dirty)
+                    else:
+                        self.metrics['failed_commits'] += 1
+                        logger.error(f"Error writing {self.field} for {len(chunk)} {self.collection}: {str(e)}")
+                        self._restore(chunk, dirty)
+
+            with self._lock:
+                self.metrics['written'] += written
+            return written
+
+    def _write_each(self, user_ids: List[str], dirty: Dict[str, datetime]) -> int:
+        written = 0
+        for user_id in user_ids:
+            try:
+                self.db.collection(self.collection).document(user_id).update({self.field: dirty[user_id]})
+                written += 1
+            except Exception as e:
+                if _is_not_found(e):
+                    self.metrics['missing'] += 1
+                else:
+                    self.metrics['failed_commits'] += 1
+                    logger.error(f"Error writing {self.field} for {self.collection}/{user_id}: {str(e)}")
+                    self._restore([user_id], dirty)
+        return written
+
+    def _restore(self, user_ids: List[str], dirty: Dict[str, datetime]) -> None:
+        """Put timestamps of a failed write back unless newer activity arrived meanwhile"""
+        with self._lock:
+            for user_id in user_ids:
+                current = self._dirty.get(user_id)
+                if current is None or current < dirty[user_id]:
+                    self._dirty[user_id] = dirty[user_id]
+
+    def shutdown(self) -> None:
+        """Stop the flusher and write what is pending"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.flush_interval * 2, 1.0))
+        self.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get touch and write counters
+
+        Returns:
+            dict: Counters and the number of users waiting to be written
+        """
+        with self._lock:
+            return {**self.metrics, 'dirty_users': len(self._dirty)}
+
+    def _ensure_started(self) -> None:
+        """Start the background flusher on first use"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._stop_event.is_set() or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f'activity-flusher-{self.collection}', daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self) -> None:
+        """Flusher loop, woken early when the dirty set is full"""
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.flush_interval)
+            if self._stop_event.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:  # pragma: no cover - flush handles its own errors
+                logger.error(f"Activity flusher error: {e}")
@@ -0,0 +1,226 @@
+"""
+Audit Archive
+Date-partitioned, compressed NDJSON archive segments with a queryable manifest
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.services.audit_export import AuditExportStream
+
+logger = logging.getLogger(__name__)
+
+
+class _HashingStream:
+    """Pass-through iterable that computes the SHA-256 of the chunks it yields"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = chunks
+        self.sha256 = hashlib.sha256()
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.sha256.update(chunk)
+            yield chunk
+
+
+class AuditArchiveStore:
+    """
+    Writes archived audit logs as date-partitioned segments and reads back
+    only the segments overlapping a requested range.
+
+    Each segment is a gzip-compressed NDJSON file holding the logs of one UTC
+    day from one archival batch, stored at
+    ``audit-archives/date=YYYY-MM-DD/segment-<id>.ndjson.gz``. For every
+    segment a manifest document in ``auditArchiveSegments`` records the
+    partition date, min/max timestamp, event types, row count and checksum.
+    Range reads query the manifest by partition date, skip segments whose
+    timestamps or event types cannot match, and stream-decode the rest line
+    by line.
+    """
+
+    MANIFEST_COLLECTION = 'auditArchiveSegments'
+    PREFIX = 'audit-archives'
+    FORMAT_VERSION = '3.0'
+
+    def __init__(self, storage_service, db):
+        """
+        Initialize the archive store
+
+        Args:
+            storage_service: FirebaseStorageService used for segment files
+            db: Firestore client holding the segment manifest
+        """
+        self.storage_service = storage_service
+        self.db = db
+
+    def write_segments(self, logs: List[Dict[str, Any]], archived_at: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Archive logs as one segment per UTC day
+
+        Args:
+            logs (list): Audit log records
+            archived_at (datetime): Archival time (defaults to now)
+
+        Returns:
+            list: Manifest entries of the written segments
+
+        Raises:
+            Exception: If a segment could not be uploaded or indexed; segments
+                written before the failure remain valid
+        """
+        archived_at = archived_at or datetime.utcnow()
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for log in logs:
+            timestamp = self._parse_timestamp(log.get('timestamp'))
+            if timestamp is None:
+                logger.warning(f"Archiving log {log.get('logId')} without a timestamp under 1970-01-01")
+                timestamp = datetime(1970, 1, 1)
+            by_day.setdefault(timestamp.strftime('%Y-%m-%d'), []).append(log)
+
+        entries = []
+        for day, day_logs in sorted(by_day.items()):
+            entries.append(self._write_segment(day, day_logs, archived_at))
+        return entries
+
+    def read_range(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        event_types: Optional[List[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream archived logs within a time range
+
+        Args:
+            start_date (datetime): Range start (inclusive)
+            end_date (datetime): Range end (inclusive)
+            event_types (list): Optional event type filter
+
+        Yields:
+            dict: Archived audit log records
+        """
+        wanted_types = set(event_types) if event_types else None
+
+        for segment in self.find_segments(start_date, end_date, event_types):
+            try:
+                for log in self._read_segment(segment['path']):
+                    timestamp = self._parse_timestamp(log.get('timestamp'))
+                    if timestamp is None or not start_date <= timestamp <= end_date:
+                        continue
+                    if wanted_types and log.get('eventType') not in wanted_types:
+                        continue
+                    yield log
+            except Exception as e:
+                logger.error(f"Error reading archive segment {segment['path']}: {e}")
+
+    def find_segments(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        event_types: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Manifest entries of segments that may contain logs in the range
+
+        Args:
+            start_date (datetime): Range start
+            end_date (datetime): Range end
+            event_types (list): Optional event type filter
+
+        Returns:
+            list: Manifest entries ordered by partition date
+        """
+        query = (self.db.collection(self.MANIFEST_COLLECTION)
+                 .where('partitionDate', '>=', start_date.strftime('%Y-%m-%d'))
+                 .where('partitionDate', '<=', end_date.strftime('%Y-%m-%d'))
+                 .order_by('partitionDate'))
+
+        wanted_types = set(event_types) if event_types else None
+        segments = []
+        for doc in query.stream():
+            segment = doc.to_dict()
+            min_ts = self._parse_timestamp(segment.get('minTimestamp'))
+            max_ts = self._parse_timestamp(segment.get('maxTimestamp'))
+            if min_ts and min_ts > end_date or max_ts and max_ts < start_date:
+                continue
+            if wanted_types and not wanted_types.intersection(segment.get('eventTypes') or []):
+                continue
+            segments.append(segment)
+        return segments
+
+    def _write_segment(self, day: str, logs: List[Dict[str, Any]], archived_at: datetime) -> Dict[str, Any]:
+        """Upload one segment and record it in the manifest"""
+        segment_id = f"{day.replace('-', '')}-{uuid.uuid4().hex[:12]}"
+        path = f"{self.PREFIX}/date={day}/segment-{segment_id}.ndjson.gz"
+        timestamps = [ts for ts in (self._parse_timestamp(log.get('timestamp')) for log in logs) if ts]
+
+        stream = AuditExportStream(logs, 'ndjson', 'gzip')
+        hashing = _HashingStream(stream)
+        self.storage_service.upload_stream(
+            path,
+            hashing,
+            content_type=stream.content_type,
+            metadata={'segmentId': segment_id, 'partitionDate': day, 'rowCount': str(len(logs))}
+        )
+
+        entry = {
+            'segmentId': segment_id,
+            'path': path,
+            'partitionDate': day,
+            'minTimestamp': min(timestamps) if timestamps else None,
+            'maxTimestamp': max(timestamps) if timestamps else None,
+            'eventTypes': sorted({log.get('eventType') for log in logs if log.get('eventType')}),
+            'rowCount': len(logs),
+            'compressedBytes': stream.stats['bytes_compressed'],
+            'sha256': hashing.sha256.hexdigest(),
+            'format': 'ndjson+gzip',
+            'formatVersion': self.FORMAT_VERSION,
+            'archivedAt': archived_at
+        }
+
+        try:
+            self.db.collection(self.MANIFEST_COLLECTION).document(segment_id).set(entry)
+        except Exception:
+            # An unindexed segment is unreachable; remove it so the batch can be retried
+            self.storage_service.delete_file(path)
+            raise
+
+        logger.info(f"Archived {len(logs)} logs to {path}")
+        return entry
+
+    def _read_segment(self, path: str) -> Iterator[Dict[str, Any]]:
+        """Stream-decode a segment line by line"""
+        with self.storage_service.open_read_stream(path) as raw:
+            with gzip.GzipFile(fileobj=raw, mode='rb') as decompressed:
+                for line in io.TextIOWrapper(decompressed, encoding='utf-8'):
+                    if not line.strip():
+                        continue
+                    log = json.loads(line)
+                    # Restore the stored datetime (offset included) so integrity hashes recompute identically
+                    if isinstance(log.get('timestamp'), str):
+                        try:
+                            log['timestamp'] = datetime.fromisoformat(log['timestamp'])
+                        except ValueError:
+                            pass
+                    yield log
+
+    @staticmethod
+    def _parse_timestamp(value) -> Optional[datetime]:
+        """Parse stored timestamps into naive UTC datetimes"""
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = (value - value.utcoffset()).replace(tzinfo=None)
+            return value
+        if isinstance(value, str):
+            try:
+                return AuditArchiveStore._parse_timestamp(datetime.fromisoformat(value.replace('Z', '+00:00')))
+            except ValueError:
+                return None
+        return None
@@ -0,0 +1,593 @@
+"""
+Audit Checkpoint Service
+Hash-chained Merkle checkpoints over time windows of audit logs
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+from app.firebase_config import get_firestore_client
+from app.services.audit_integrity_verifier import StreamingIntegrityVerifier
+
+logger = logging.getLogger(__name__)
+
+# Chain hash used as the predecessor of the first checkpoint
+GENESIS_CHAIN_HASH = '0' * 64
+
+# Fields needed to rebuild a window's Merkle tree
+LEAF_FIELDS = ['logId', 'integrityHash', 'timestamp']
+
+
+def leaf_hash(log_id: str, integrity_hash: str) -> bytes:
+    """Merkle leaf for one audit record (domain-separated from inner nodes)"""
+    return hashlib.sha256(b'\x00' + f"{log_id}:{integrity_hash or ''}".encode('utf-8')).digest()
+
+
+def _node_hash(left: bytes, right: bytes) -> bytes:
+    """Merkle inner node"""
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    """
+    Compute the Merkle root of a list of leaf hashes
+
+    An odd node at the end of a level is promoted unchanged.
+
+    Args:
+        leaves (list): Leaf hashes in tree order
+
+    Returns:
+        bytes: Root hash (hash of the empty string for no leaves)
+    """
+    if not leaves:
+        return hashlib.sha256(b'').digest()
+
+    level = list(leaves)
+    while len(level) > 1:
+        next_level = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0]
+
+
+def inclusion_proof(leaves: List[bytes], index: int) -> List[Dict[str, str]]:
+    """
+    Build the audit path proving that leaves[index] is part of the tree
+
+    Args:
+        leaves (list): Leaf hashes in tree order
+        index (int): Position of the leaf
+
+    Returns:
+        list: Sibling hashes from the leaf up, each with the side it sits on
+    """
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({'side': 'left' if sibling < index else 'right', 'hash': level[sibling].hex()})
+
+        next_level = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+        index //= 2
+    return proof
+
+
+def verify_inclusion(leaf: bytes, proof: List[Dict[str, str]], root_hex: str) -> bool:
+    """
+    Check an inclusion proof against a Merkle root
+
+    Args:
+        leaf (bytes): Leaf hash
+        proof (list): Audit path from inclusion_proof()
+        root_hex (str): Expected root as hex
+
+    Returns:
+        bool: True if the proof leads to the root
+    """
+    node = leaf
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        node = _node_hash(sibling, node) if step['side'] == 'left' else _node_hash(node, sibling)
+    return hmac.compare_digest(node.hex(), root_hex or '')
+
+
+class AuditCheckpointService:
+    """
+    Seals fixed time windows of audit logs into chained Merkle checkpoints.
+
+    For every window (one minute by default) that contains logs, a document
+    in ``auditCheckpoints`` stores the Merkle root over the window's records
+    (leaves sorted by log ID), the leaf count and an HMAC chain hash linking
+    it to the previous checkpoint. Editing a record changes its window root,
+    deleting one changes the root and count, and removing or rewriting a
+    checkpoint breaks the chain.
+
+    Checking the chain for a range only reads checkpoint documents. A range
+    check additionally reads the logIds and hashes of the range to compare
+    roots, and only windows whose root mismatches are re-verified record by
+    record. Inclusion proofs show an individual record belongs to its
+    sealed window.
+    """
+
+    COLLECTION = 'auditCheckpoints'
+    STATE_DOCUMENT = ('systemConfig', 'auditCheckpointState')
+
+    def __init__(
+        self,
+        hmac_key: bytes,
+        db=None,
+        window_seconds: Optional[int] = None,
+        settle_seconds: Optional[int] = None
+    ):
+        """
+        Initialize the checkpoint service
+
+        Args:
+            hmac_key (bytes): Key for the checkpoint chain (the audit HMAC key)
+            db: Firestore client (defaults to the shared client)
+            window_seconds (int): Checkpoint window length
+            settle_seconds (int): Delay before a window is sealed, covering queued audit writes
+        """
+        self.hmac_key = hmac_key
+        self.db = db if db is not None else get_firestore_client()
+        self.window_seconds = window_seconds or int(os.getenv('AUDIT_CHECKPOINT_WINDOW_SECONDS', '60'))
+        self.settle_seconds = settle_seconds if settle_seconds is not None else int(
+            os.getenv('AUDIT_CHECKPOINT_SETTLE_SECONDS', '120')
+        )
+
+    def build_checkpoints(self, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Seal every complete window since the latest checkpoint
+
+        Args:
+            until (datetime): Seal windows ending at or before this time
+                (defaults to now minus the settle delay)
+
+        Returns:
+            dict: Checkpoints created, logs sealed and the latest checkpoint ID
+        """
+        latest = self.get_latest_checkpoint()
+        end = self.window_start(until or datetime.utcnow() - timedelta(seconds=self.settle_seconds))
+
+        if latest:
+            start = self._naive(latest['windowEnd'])
+        else:
+            first = list(self.db.collection('auditLogs').order_by('timestamp').limit(1).stream())
+            if not first:
+                return {'checkpoints_created': 0, 'logs_sealed': 0, 'latest_checkpoint_id': None}
+            start = self.window_start(self._naive(first[0].to_dict().get('timestamp')))
+
+        results = {'checkpoints_created': 0, 'logs_sealed': 0,
+                   'latest_checkpoint_id': latest['checkpointId'] if latest else None}
+        if start >= end:
+            return results
+
+        previous = latest
+        batch, pending = self.db.batch(), 0
+        for window, leaves in self._window_leaves(self._leaf_query(start, end)):
+            checkpoint = self._make_checkpoint(window, leaves, previous)
+            batch.set(self.db.collection(self.COLLECTION).document(checkpoint['checkpointId']), checkpoint)
+            pending += 1
+            results['checkpoints_created'] += 1
+            results['logs_sealed'] += len(leaves)
+            previous = checkpoint
+            if pending >= 500:
+                batch.commit()
+                batch, pending = self.db.batch(), 0
+        if pending:
+            batch.commit()
+
+        results['latest_checkpoint_id'] = previous['checkpointId'] if previous else None
+        if results['checkpoints_created']:
+            logger.info(f"Sealed {results['logs_sealed']} audit logs into {results['checkpoints_created']} checkpoints")
+        return results
+
+    def reseal_late_logs(self, logs: Iterable[Dict[str, Any]], reason: str = 'journal_replay') -> Dict[str, Any]:
+        """
+        Reopen and re-seal windows that late records landed in
+
+        Records replayed from the write journal keep their original timestamps,
+        which can fall inside windows that were sealed without them. Each such
+        window is re-sealed only if its other records still reproduce the
+        sealed root, so tampering is not laundered into a new checkpoint. The
+        re-sealed checkpoint keeps the previous root and the reason as an
+        audit note, and every later checkpoint is re-linked into the chain.
+
+        Args:
+            logs (iterable): Late audit records (logId and timestamp)
+            reason (str): Why the windows were reopened
+
+        Returns:
+            dict: Checkpoints re-sealed and windows refused because they no
+                longer match their seal
+        """
+        results = {'checkpoints_resealed': 0, 'windows_refused': []}
+        latest = self.get_latest_checkpoint()
+        if not latest:
+            return results
+        sealed_until = self._naive(latest['windowEnd'])
+
+        late_ids: Dict[datetime, set] = {}
+        for log in logs:
+            timestamp = self._naive(log.get('timestamp'))
+            if timestamp is not None and log.get('logId') and timestamp < sealed_until:
+                late_ids.setdefault(self.window_start(timestamp), set()).add(log['logId'])
+        if not late_ids:
+            return results
+
+        first = min(late_ids)
+        chain = self.verify_chain(first, sealed_until)
+        if not chain['chain_valid']:
+            logger.error(f"Not re-sealing audit windows from {first}: checkpoint chain is broken")
+            results['windows_refused'] = [self._checkpoint_id(window) for window in sorted(late_ids)]
+            return results
+        anchor_id = chain['checkpoints'][0].get('previousCheckpointId')
+        checkpoints = {c['checkpointId']: c for c in chain['checkpoints']}
+
+        resealed = set()
+        for window in sorted(late_ids):
+            checkpoint_id = self._checkpoint_id(window)
+            leaves = next(iter(self._window_leaves(
+                self._leaf_query(window, window + timedelta(seconds=self.window_seconds))
+            )), (window, []))[1]
+            sealed = checkpoints.get(checkpoint_id)
+            if sealed is not None:
+                earlier = [leaf for leaf_id, leaf in leaves if leaf_id not in late_ids[window]]
+                if (sealed.get('leafCount') != len(earlier)
+                        or merkle_root(earlier).hex() != sealed.get('merkleRoot')):
+                    results['windows_refused'].append(checkpoint_id)
+                    continue
+            checkpoint = self._make_checkpoint(window, leaves, None)
+            checkpoint['reseal'] = {
+                'reason': reason,
+                'resealedAt': datetime.utcnow(),
+                'lateLogs': sorted(late_ids[window]),
+                'previousMerkleRoot': sealed.get('merkleRoot') if sealed else None,
+                'previousLeafCount': sealed.get('leafCount', 0) if sealed else 0
+            }
+            checkpoints[checkpoint_id] = checkpoint
+            resealed.add(checkpoint_id)
+
+        if not resealed:
+            if results['windows_refused']:
+                logger.error(f"Late audit logs fall in windows that no longer match their seal: "
+                             f"{results['windows_refused']}")
+            return results
+
+        # Re-link from the first re-sealed window so later chain hashes cover the new roots
+        ordered = sorted(checkpoints.values(), key=lambda c: self._naive(c['windowStart']))
+        start = next(i for i, c in enumerate(ordered) if c['checkpointId'] in resealed)
+        if start:
+            previous = ordered[start - 1]
+        else:
+            previous = self.db.collection(self.COLLECTION).document(anchor_id).get().to_dict() if anchor_id else None
+        batch, pending = self.db.batch(), 0
+        for checkpoint in ordered[start:]:
+            checkpoint['previousCheckpointId'] = previous['checkpointId'] if previous else None
+            checkpoint['previousChainHash'] = previous['chainHash'] if previous else GENESIS_CHAIN_HASH
+            checkpoint['chainHash'] = self.chain_hash(checkpoint['previousChainHash'], checkpoint)
+            batch.set(self.db.collection(self.COLLECTION).document(checkpoint['checkpointId']), checkpoint)
+            pending += 1
+            previous = checkpoint
+            if pending >= 500:
+                batch.commit()
+                batch, pending = self.db.batch(), 0
+        if pending:
+            batch.commit()
+
+        results['checkpoints_resealed'] = len(resealed)
+        logger.warning(f"Re-sealed {len(resealed)} audit checkpoints for late records ({reason})")
+        if results['windows_refused']:
+            logger.error(f"Late audit logs fall in windows that no longer match their seal: "
+                         f"{results['windows_refused']}")
+        return results
+
+    def verify_chain(self, start: datetime, end: datetime) -> Dict[str, Any]:
+        """
+        Verify the checkpoint chain for a time range without reading any logs
+
+        Args:
+            start (datetime): Range start
+            end (datetime): Range end
+
+        Returns:
+            dict: Chain status and the checkpoints covering the range
+        """
+        checkpoints = self._checkpoints_in_range(start, end)
+        errors = []
+
+        # The checkpoint just before the range anchors the first link
+        previous = None
+        links = checkpoints
+        if checkpoints and checkpoints[0].get('previousCheckpointId'):
+            anchor = self.db.collection(self.COLLECTION).document(checkpoints[0]['previousCheckpointId']).get()
+            if anchor.exists:
+                previous = anchor.to_dict()
+            else:
+                errors.append({'checkpointId': checkpoints[0]['checkpointId'],
+                               'error': 'Previous checkpoint missing'})
+                previous, links = checkpoints[0], checkpoints[1:]
+
+        for checkpoint in links:
+            error = self._check_link(checkpoint, previous)
+            if error:
+                errors.append({'checkpointId': checkpoint['checkpointId'], 'error': error})
+            previous = checkpoint
+
+        return {
+            'chain_valid': not errors,
+            'checkpoints_checked': len(checkpoints),
+            'chain_errors': errors,
+            'checkpoints': checkpoints
+        }
+
+    def verify_range(self, start: datetime, end: datetime, full_scan_on_mismatch: bool = True) -> Dict[str, Any]:
+        """
+        Verify that the sealed logs of a time range are intact
+
+        Reads only logId/integrityHash for the range to recompute the window
+        roots. Windows whose root or count mismatches are re-verified record
+        by record to find modified entries and count missing ones.
+
+        Args:
+            start (datetime): Range start
+            end (datetime): Range end
+            full_scan_on_mismatch (bool): Re-verify mismatched windows record by record
+
+        Returns:
+            dict: Verification results
+        """
+        archived_before = self._archived_before()
+        if archived_before and start < archived_before:
+            start = archived_before
+
+        chain = self.verify_chain(start, end)
+        checkpoints = {c['checkpointId']: c for c in chain.pop('checkpoints')}
+        results = dict(chain, windows_verified=0, windows_mismatched=[], unsealed_logs=0,
+                       archived_before=archived_before)
+
+        if checkpoints:
+            sealed_until = max(self._naive(c['windowEnd']) for c in checkpoints.values())
+            range_start = self.window_start(start)
+            seen = set()
+
+            for window, leaves in self._window_leaves(self._leaf_query(range_start, min(end, sealed_until))):
+                checkpoint_id = self._checkpoint_id(window)
+                seen.add(checkpoint_id)
+                checkpoint = checkpoints.get(checkpoint_id)
+                if checkpoint is None:
+                    results['unsealed_logs'] += len(leaves)
+                    continue
+                if (checkpoint.get('leafCount') == len(leaves)
+                        and merkle_root([leaf for _, leaf in leaves]).hex() == checkpoint.get('merkleRoot')):
+                    results['windows_verified'] += 1
+                else:
+                    results['windows_mismatched'].append(
+                        self._inspect_window(checkpoint, len(leaves), full_scan_on_mismatch)
+                    )
+
+            for checkpoint_id, checkpoint in checkpoints.items():
+                if checkpoint_id not in seen:
+                    # Every log of a sealed window is gone
+                    results['windows_mismatched'].append(
+                        self._inspect_window(checkpoint, 0, full_scan_on_mismatch)
+                    )
+
+        results['status'] = 'intact' if results['chain_valid'] and not results['windows_mismatched'] else 'compromised'
+        return results
+
+    def get_inclusion_proof(self, log_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Prove that an audit record is part of its sealed window
+
+        Args:
+            log_id (str): Audit log ID
+
+        Returns:
+            dict: Proof with leaf, audit path and checkpoint root, or None if
+                the log or its checkpoint does not exist
+        """
+        log_doc = self.db.collection('auditLogs').document(log_id).get()
+        if not log_doc.exists:
+            return None
+        log_data = log_doc.to_dict()
+
+        window = self.window_start(self._naive(log_data.get('timestamp')))
+        checkpoint_doc = self.db.collection(self.COLLECTION).document(self._checkpoint_id(window)).get()
+        if not checkpoint_doc.exists:
+            return None
+        checkpoint = checkpoint_doc.to_dict()
+
+        leaves = next(iter(self._window_leaves(
+            self._leaf_query(window, window + timedelta(seconds=self.window_seconds))
+        )), (window, []))[1]
+        ids = [leaf_id for leaf_id, _ in leaves]
+        if log_id not in ids:
+            return None
+        index = ids.index(log_id)
+
+        return {
+            'logId': log_id,
+            'integrityHash': log_data.get('integrityHash'),
+            'leafHash': leaves[index][1].hex(),
+            'leafIndex': index,
+            'proof': inclusion_proof([leaf for _, leaf in leaves], index),
+            'checkpointId': checkpoint['checkpointId'],
+            'merkleRoot': checkpoint['merkleRoot'],
+            'chainHash': checkpoint.get('chainHash')
+        }
+
+    @staticmethod
+    def verify_inclusion_proof(proof: Dict[str, Any]) -> bool:
+        """
+        Check a proof produced by get_inclusion_proof()
+
+        Args:
+            proof (dict): Inclusion proof
+
+        Returns:
+            bool: True if the record hashes up to the checkpoint root
+        """
+        leaf = leaf_hash(proof['logId'], proof.get('integrityHash'))
+        return verify_inclusion(leaf, proof.get('proof', []), proof.get('merkleRoot'))
+
+    def record_archival(self, archived_before: datetime) -> None:
+        """
+        Note that logs before a time were moved to the archive
+
+        Range verification skips archived windows instead of reporting their
+        logs as missing.
+
+        Args:
+            archived_before (datetime): Archival cutoff
+        """
+        collection, document = self.STATE_DOCUMENT
+        self.db.collection(collection).document(document).set({'archivedBefore': archived_before}, merge=True)
+
+    def get_latest_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """Most recent checkpoint, or None before the first one is written"""
+        docs = list(
+            self.db.collection(self.COLLECTION)
+            .order_by('windowStart', direction=firestore.Query.DESCENDING)
+            .limit(1)
+            .stream()
+        )
+        return docs[0].to_dict() if docs else None
+
+    def window_start(self, timestamp: datetime) -> datetime:
+        """Start of the window containing a timestamp"""
+        epoch = datetime(1970, 1, 1)
+        offset = int((timestamp - epoch).total_seconds()) // self.window_seconds * self.window_seconds
+        return epoch + timedelta(seconds=offset)
+
+    def chain_hash(self, previous_chain_hash: str, checkpoint: Dict[str, Any]) -> str:
+        """HMAC linking a checkpoint to its predecessor"""
+        message = '|'.join([
+            previous_chain_hash,
+            checkpoint['checkpointId'],
+            checkpoint['merkleRoot'],
+            str(checkpoint['leafCount'])
+        ])
+        return hmac.new(self.hmac_key, message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _make_checkpoint(self, window: datetime, leaves: List[Tuple[str, bytes]],
+                         previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the checkpoint document for a window"""
+        checkpoint = {
+            'checkpointId': self._checkpoint_id(window),
+            'windowStart': window,
+            'windowEnd': window + timedelta(seconds=self.window_seconds),
+            'leafCount': len(leaves),
+            'merkleRoot': merkle_root([leaf for _, leaf in leaves]).hex(),
+            'previousCheckpointId': previous['checkpointId'] if previous else None,
+            'previousChainHash': previous['chainHash'] if previous else GENESIS_CHAIN_HASH,
+            'createdAt': datetime.utcnow()
+        }
+        checkpoint['chainHash'] = self.chain_hash(checkpoint['previousChainHash'], checkpoint)
+        return checkpoint
+
+    def _check_link(self, checkpoint: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Validate one chain link, returning an error message if broken"""
+        expected_previous_hash = previous['chainHash'] if previous else GENESIS_CHAIN_HASH
+        expected_previous_id = previous['checkpointId'] if previous else None
+
+        if checkpoint.get('previousCheckpointId') != expected_previous_id:
+            return 'Chain link points to an unexpected checkpoint'
+        if checkpoint.get('previousChainHash') != expected_previous_hash:
+            return 'Previous chain hash mismatch'
+        if not hmac.compare_digest(checkpoint.get('chainHash') or '',
+                                   self.chain_hash(expected_previous_hash, checkpoint)):
+            return 'Chain hash mismatch - checkpoint may have been modified'
+        return None
+
+    def _inspect_window(self, checkpoint: Dict[str, Any], actual_count: int, full_scan: bool) -> Dict[str, Any]:
+        """Describe a mismatched window, re-verifying its records if requested"""
+        finding = {
+            'checkpointId': checkpoint['checkpointId'],
+            'windowStart': checkpoint['windowStart'],
+            'expectedCount': checkpoint.get('leafCount', 0),
+            'actualCount': actual_count,
+            'missingLogs': max(0, checkpoint.get('leafCount', 0) - actual_count),
+            'unexpectedLogs': max(0, actual_count - checkpoint.get('leafCount', 0))
+        }
+        if full_scan and actual_count:
+            window = self._naive(checkpoint['windowStart'])
+            query = (self.db.collection('auditLogs')
+                     .where('timestamp', '>=', window)
+                     .where('timestamp', '<', window + timedelta(seconds=self.window_seconds)))
+            scan = StreamingIntegrityVerifier(self.hmac_key).verify_all(query.stream())
+            finding['tamperedLogs'] = scan['tampered_logs']
+        return finding
+
+    def _checkpoints_in_range(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Checkpoints whose window overlaps the range, oldest first"""
+        query = (self.db.collection(self.COLLECTION)
+                 .where('windowStart', '>=', self.window_start(start))
+                 .where('windowStart', '<', end)
+                 .order_by('windowStart'))
+        return [doc.to_dict() for doc in query.stream()]
+
+    def _leaf_query(self, start: datetime, end: datetime):
+        """Projected range query returning only the fields needed for leaves"""
+        return (self.db.collection('auditLogs')
+                .where('timestamp', '>=', start)
+                .where('timestamp', '<', end)
+                .order_by('timestamp')
+                .select(LEAF_FIELDS)
+                .stream())
+
+    def _window_leaves(self, docs: Iterable[Any]) -> Iterator[Tuple[datetime, List[Tuple[str, bytes]]]]:
+        """Group a timestamp-ordered stream into windows of (logId, leaf) sorted by logId"""
+        current, leaves = None, []
+        for doc in docs:
+            data = doc.to_dict() if hasattr(doc, 'to_dict') else doc
+            timestamp = self._naive(data.get('timestamp'))
+            if timestamp is None or not data.get('logId'):
+                continue
+            window = self.window_start(timestamp)
+            if window != current:
+                if leaves:
+                    yield current, sorted(leaves)
+                current, leaves = window, []
+            leaves.append((data['logId'], leaf_hash(data['logId'], data.get('integrityHash'))))
+        if leaves:
+            yield current, sorted(leaves)
+
+    def _archived_before(self) -> Optional[datetime]:
+        """Archival watermark recorded by record_archival()"""
+        collection, document = self.STATE_DOCUMENT
+        snapshot = self.db.collection(collection).document(document).get()
+        if not snapshot.exists:
+            return None
+        return self._naive((snapshot.to_dict() or {}).get('archivedBefore'))
+
+    @staticmethod
+    def _checkpoint_id(window: datetime) -> str:
+        """Document ID of the checkpoint for a window"""
+        return window.strftime('%Y%m%dT%H%M%S')
+
+    @staticmethod
+    def _naive(value) -> Optional[datetime]:
+        """Normalize stored timestamps to naive UTC datetimes"""
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = (value - value.utcoffset()).replace(tzinfo=None)
+            return value
+        if isinstance(value, str):
+            try:
+                return AuditCheckpointService._naive(datetime.fromisoformat(value.replace('Z', '+00:00')))
+            except ValueError:
+                return None
+        return None
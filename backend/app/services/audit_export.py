@@ -0,0 +1,252 @@
+"""
+Audit Export
+Streaming, compressed encoding of audit logs for compliance exports
+"""
+
+import csv
+import gzip
+import io
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd compression is optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Fixed CSV schema: the fields written by EnhancedAuditService.log_comprehensive_event.
+# Anything else a record carries goes into the trailing 'extra' column as JSON.
+EXPORT_FIELDS = [
+    'logId', 'eventType', 'subType', 'userId', 'targetUserId', 'deviceId', 'visitorId',
+    'resourceSegmentId', 'action', 'result', 'timestamp', 'sessionId', 'ipAddress',
+    'userAgent', 'parsedUserAgent', 'geolocation', 'riskScore', 'confidenceScore',
+    'details', 'dataAccessed', 'complianceFlags', 'retentionCategory', 'encryptionStatus',
+    'severity', 'version', 'source', 'integrityHash'
+]
+EXTRA_FIELD = 'extra'
+
+FORMATS = {
+    'json': ('json', 'application/json'),
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+    'csv': ('csv', 'text/csv')
+}
+COMPRESSIONS = {
+    None: ('', None),
+    'gzip': ('.gz', 'application/gzip'),
+    'zstd': ('.zst', 'application/zstd')
+}
+
+
+def json_default(value):
+    """JSON encoder hook for Firestore values"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_audit_logs(
+    db,
+    start_date: datetime,
+    end_date: datetime,
+    event_types: Optional[List[str]] = None,
+    page_size: int = 1000
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream audit logs in a date range page by page
+
+    Only one page of documents is held at a time.
+
+    Args:
+        db: Firestore client
+        start_date (datetime): Range start (inclusive)
+        end_date (datetime): Range end (inclusive)
+        event_types (list): Optional event type filter (up to 10 values)
+        page_size (int): Documents per page
+
+    Yields:
+        dict: Audit log records in timestamp order
+    """
+    query = (db.collection('auditLogs')
+             .where('timestamp', '>=', start_date)
+             .where('timestamp', '<=', end_date))
+    if event_types and len(event_types) <= 10:
+        query = query.where('eventType', 'in', event_types)
+    query = query.order_by('timestamp')
+
+    last_doc = None
+    while True:
+        page = (query.start_after(last_doc) if last_doc else query).limit(page_size)
+        count = 0
+        for doc in page.stream():
+            count += 1
+            last_doc = doc
+            yield doc.to_dict()
+        if count < page_size:
+            break
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only buffer whose contents are drained between records"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def __len__(self):
+        return len(self._buffer)
+
+
+class AuditExportStream:
+    """
+    Iterable of compressed byte chunks encoding a stream of audit records.
+
+    Records are serialized one at a time (JSON document, NDJSON or CSV with
+    the fixed EXPORT_FIELDS schema) through an incremental gzip or zstd
+    compressor; compressed output is yielded whenever ``chunk_size`` bytes
+    have accumulated. Memory use is bounded by the chunk size, independent
+    of how many records are exported. Counters are available in ``stats``
+    once iteration finishes.
+    """
+
+    def __init__(
+        self,
+        records: Iterable[Dict[str, Any]],
+        format_type: str = 'ndjson',
+        compression: Optional[str] = 'gzip',
+        metadata: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 1024 * 1024
+    ):
+        """
+        Initialize the export stream
+
+        Args:
+            records (iterable): Audit records to encode
+            format_type (str): 'json', 'ndjson' or 'csv'
+            compression (str): 'gzip', 'zstd' or None
+            metadata (dict): Export metadata (JSON document header)
+            chunk_size (int): Compressed bytes per yielded chunk
+        """
+        if format_type not in FORMATS:
+            raise ValueError(f"Unsupported format: {format_type}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+
+        self.records = records
+        self.format_type = format_type
+        self.compression = compression
+        self.metadata = metadata or {}
+        self.chunk_size = chunk_size
+        self.stats = {'records': 0, 'bytes_raw': 0, 'bytes_compressed': 0}
+
+    @property
+    def file_extension(self) -> str:
+        """File extension for the encoded output (e.g. 'ndjson.gz')"""
+        return FORMATS[self.format_type][0] + COMPRESSIONS[self.compression][0]
+
+    @property
+    def content_type(self) -> str:
+        """MIME type of the encoded output"""
+        return COMPRESSIONS[self.compression][1] or FORMATS[self.format_type][1]
+
+    def __iter__(self) -> Iterator[bytes]:
+        sink = _ChunkSink()
+        writer = self._open_compressor(sink)
+
+        def emit(text: str):
+            data = text.encode('utf-8')
+            self.stats['bytes_raw'] += len(data)
+            writer.write(data)
+
+        for text in self._encode():
+            emit(text)
+            if len(sink) >= self.chunk_size:
+                chunk = sink.drain()
+                self.stats['bytes_compressed'] += len(chunk)
+                yield chunk
+
+        if writer is not sink:
+            writer.close()
+        chunk = sink.drain()
+        if chunk:
+            self.stats['bytes_compressed'] += len(chunk)
+            yield chunk
+
+    def _open_compressor(self, sink: _ChunkSink):
+        """Wrap the sink in the configured incremental compressor"""
+        if self.compression == 'gzip':
+            return gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=6)
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=3).stream_writer(sink, closefd=False)
+        return sink
+
+    def _encode(self) -> Iterator[str]:
+        """Serialize records one at a time in the configured format"""
+        if self.format_type == 'csv':
+            yield from self._encode_csv()
+            return
+
+        if self.format_type == 'json':
+            yield '{"metadata":' + json.dumps(self.metadata, default=json_default) + ',"logs":['
+            separator = ''
+            for record in self.records:
+                self.stats['records'] += 1
+                yield separator + json.dumps(record, default=json_default)
+                separator = ','
+            yield ']}\n'
+            return
+
+        for record in self.records:
+            self.stats['records'] += 1
+            yield json.dumps(record, default=json_default) + '\n'
+
+    def _encode_csv(self) -> Iterator[str]:
+        """Serialize records as CSV rows with the fixed schema"""
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow(EXPORT_FIELDS + [EXTRA_FIELD])
+        yield self._take(line)
+
+        known = set(EXPORT_FIELDS)
+        for record in self.records:
+            self.stats['records'] += 1
+            row = [self._csv_value(record.get(field)) for field in EXPORT_FIELDS]
+            extra = {k: v for k, v in record.items() if k not in known}
+            row.append(json.dumps(extra, default=json_default, sort_keys=True) if extra else '')
+            writer.writerow(row)
+            yield self._take(line)
+
+    @staticmethod
+    def _csv_value(value) -> Any:
+        """Flatten a field value for CSV"""
+        if value is None:
+            return ''
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=json_default, sort_keys=True)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def _take(buffer: io.StringIO) -> str:
+        """Return and clear the buffered CSV text"""
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
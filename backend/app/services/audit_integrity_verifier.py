@@ -0,0 +1,268 @@
+"""
+Audit Integrity Verifier
+Single-pass streaming HMAC verification of audit log records
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _serializable(obj):
+    """Make an object JSON serializable"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    elif isinstance(obj, dict):
+        return {k: _serializable(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_serializable(item) for item in obj]
+    else:
+        return obj
+
+
+def compute_integrity_hash(hmac_key: bytes, log_data: Dict[str, Any]) -> str:
+    """
+    Compute the HMAC-SHA256 integrity hash of an audit record
+
+    Top-level datetimes and nested dictionaries are normalized before the
+    record is serialized canonically (sorted keys, compact separators).
+
+    Args:
+        hmac_key (bytes): HMAC key
+        log_data (dict): Audit record without its integrityHash field
+
+    Returns:
+        str: Hex digest
+    """
+    serializable_data = {}
+    for key, value in log_data.items():
+        if isinstance(value, datetime):
+            serializable_data[key] = value.isoformat()
+        elif isinstance(value, dict):
+            serializable_data[key] = _serializable(value)
+        else:
+            serializable_data[key] = value
+
+    canonical_data = json.dumps(serializable_data, sort_keys=True, separators=(',', ':'))
+    return hmac.new(hmac_key, canonical_data.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def verify_record(hmac_key: bytes, log_data: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+    """
+    Verify one audit record against its stored integrity hash
+
+    Args:
+        hmac_key (bytes): HMAC key
+        log_data (dict): Audit record including integrityHash
+
+    Returns:
+        tuple: (is_valid, error_message)
+    """
+    data = dict(log_data)
+    stored_hash = data.pop('integrityHash', '')
+    try:
+        calculated_hash = compute_integrity_hash(hmac_key, data)
+    except Exception as e:
+        return False, f"Error verifying integrity: {e}"
+
+    if stored_hash and hmac.compare_digest(stored_hash, calculated_hash):
+        return True, None
+    return False, "Integrity hash mismatch - log may have been tampered with"
+
+
+def _verify_chunk(hmac_key: bytes, records: List[Dict[str, Any]]) -> List[Tuple[bool, Optional[str]]]:
+    """Verify a chunk of records (runs in a worker)"""
+    return [verify_record(hmac_key, record) for record in records]
+
+
+class _CompletedChunk:
+    """Already computed chunk result with the Future interface used by the drain loop"""
+
+    def __init__(self, outcomes):
+        self._outcomes = outcomes
+
+    def result(self):
+        return self._outcomes
+
+
+class StreamingIntegrityVerifier:
+    """
+    Verifies audit records as they stream out of a range query.
+
+    Records are grouped into chunks and hashed in a worker pool while the
+    query keeps streaming, so each record is read exactly once (no
+    follow-up fetch by log ID). Results are yielded in input order with a
+    bounded number of chunks in flight, keeping memory flat for arbitrarily
+    large ranges. Progress (records processed, failures, throughput) is
+    reported to an optional callback after every chunk.
+
+    A thread pool is used by default. A process pool (opt-in, for batch jobs
+    where hashing should scale across cores) starts its workers with
+    ``spawn`` rather than forking the web worker and its open sockets, locks
+    and background threads; where child processes cannot be started (for
+    example inside daemonic Celery workers) the verifier falls back to threads.
+    """
+
+    def __init__(
+        self,
+        hmac_key: bytes,
+        workers: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        use_processes: Optional[bool] = None
+    ):
+        """
+        Initialize the verifier
+
+        Args:
+            hmac_key (bytes): HMAC key used to seal audit records
+            workers (int): Worker count (defaults to the CPU count)
+            chunk_size (int): Records hashed per worker task
+            use_processes (bool): Use a spawned process pool instead of threads
+                (defaults to AUDIT_VERIFY_EXECUTOR=process, off unless set)
+        """
+        self.hmac_key = hmac_key
+        self.workers = workers or int(os.getenv('AUDIT_VERIFY_WORKERS', '0')) or os.cpu_count() or 1
+        self.chunk_size = chunk_size or int(os.getenv('AUDIT_VERIFY_CHUNK_SIZE', '500'))
+        if use_processes is None:
+            use_processes = os.getenv('AUDIT_VERIFY_EXECUTOR', 'thread').lower() == 'process'
+        self.use_processes = use_processes and self.workers > 1
+
+    def verify(
+        self,
+        records: Iterable[Any],
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Iterator[Tuple[Dict[str, Any], bool, Optional[str]]]:
+        """
+        Verify records as they arrive
+
+        Args:
+            records: Firestore document snapshots or record dictionaries
+            progress_callback (callable): Called with progress statistics after each chunk
+
+        Yields:
+            tuple: (log_data, is_valid, error_message) in input order
+        """
+        started = time.time()
+        progress = {'processed': 0, 'verified': 0, 'failed': 0,
+                    'elapsed_seconds': 0.0, 'records_per_second': 0.0}
+        max_in_flight = self.workers * 2
+
+        executor = None
+        pending = deque()
+        first_chunk = None
+        try:
+            for chunk in self._chunks(records):
+                if first_chunk is None and executor is None:
+                    # Hold the first chunk back: small inputs are verified inline without a pool
+                    first_chunk = chunk
+                    continue
+                if executor is None:
+                    executor = self._create_executor()
+                    pending.append((first_chunk, executor.submit(_verify_chunk, self.hmac_key, first_chunk)))
+                    first_chunk = None
+                pending.append((chunk, executor.submit(_verify_chunk, self.hmac_key, chunk)))
+                while len(pending) >= max_in_flight:
+                    yield from self._drain(pending.popleft(), progress, started, progress_callback)
+
+            if first_chunk is not None:
+                pending.append((first_chunk, _CompletedChunk(_verify_chunk(self.hmac_key, first_chunk))))
+            while pending:
+                yield from self._drain(pending.popleft(), progress, started, progress_callback)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def verify_all(
+        self,
+        records: Iterable[Any],
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        max_failures: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Verify records and summarize the outcome
+
+        Args:
+            records: Firestore document snapshots or record dictionaries
+            progress_callback (callable): Called with progress statistics after each chunk
+            max_failures (int): Maximum failed records listed individually (None for all)
+
+        Returns:
+            dict: Verification results with throughput
+        """
+        results = {
+            'total_logs': 0,
+            'verified_logs': 0,
+            'failed_logs': 0,
+            'tampered_logs': [],
+            'errors': []
+        }
+        started = time.time()
+
+        for log_data, is_valid, error_msg in self.verify(records, progress_callback):
+            results['total_logs'] += 1
+            if is_valid:
+                results['verified_logs'] += 1
+                continue
+            results['failed_logs'] += 1
+            if max_failures is None or len(results['tampered_logs']) < max_failures:
+                results['tampered_logs'].append({
+                    'logId': log_data.get('logId'),
+                    'timestamp': log_data.get('timestamp'),
+                    'error': error_msg
+                })
+
+        elapsed = time.time() - started
+        results['elapsed_seconds'] = round(elapsed, 3)
+        results['logs_per_second'] = round(results['total_logs'] / elapsed, 1) if elapsed > 0 else 0.0
+        return results
+
+    def _create_executor(self) -> Executor:
+        """Create the worker pool, falling back to threads if processes are unavailable"""
+        if self.use_processes and not multiprocessing.current_process().daemon:
+            try:
+                return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            except (AssertionError, OSError, NotImplementedError, ValueError) as e:
+                logger.warning(f"Process pool unavailable for integrity verification, using threads: {e}")
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='audit-verify')
+
+    def _chunks(self, records: Iterable[Any]) -> Iterator[List[Dict[str, Any]]]:
+        """Group streamed records into chunks of plain dictionaries"""
+        chunk = []
+        for record in records:
+            if hasattr(record, 'to_dict'):
+                record = record.to_dict() or {}
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _drain(entry, progress, started, progress_callback):
+        """Yield the results of a completed chunk and report progress"""
+        chunk, future = entry
+        outcomes = future.result()
+        for log_data, (is_valid, error_msg) in zip(chunk, outcomes):
+            progress['processed'] += 1
+            progress['verified' if is_valid else 'failed'] += 1
+            yield log_data, is_valid, error_msg
+
+        if progress_callback:
+            elapsed = time.time() - started
+            progress['elapsed_seconds'] = round(elapsed, 3)
+            progress['records_per_second'] = round(progress['processed'] / elapsed, 1) if elapsed > 0 else 0.0
+            try:
+                progress_callback(dict(progress))
+            except Exception as e:
+                logger.warning(f"Integrity progress callback failed: {e}")
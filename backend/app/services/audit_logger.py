@@ -10,6 +10,9 @@ from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 from app.firebase_config import get_firestore_client
 from app.models.audit_log import AuditLog
+from app.services.audit_write_pipeline import audit_write_pipeline
+from app.services.threat_feature_store import threat_feature_store
+from app.services.streaming_threat_detector import streaming_threat_detector
 
 
 class AuditLogger:
@@ -17,6 +20,7 @@ class AuditLogger:
     
     def __init__(self):
         self.db = get_firestore_client()
+        self.write_pipeline = audit_write_pipeline
         
         # Email configuration
         self.smtp_host = os.getenv('SMTP_HOST', 'smtp.gmail.com')
@@ -75,9 +79,18 @@ class AuditLogger:
                 print(f"Audit log validation failed: {error_message}")
                 return None
             
-            # Save to Firestore
-            log_ref = self.db.collection('auditLogs').document(audit_log.log_id)
-            log_ref.set(audit_log.to_dict())
+            # Queue for the background writer
+            log_data = audit_log.to_dict()
+            if not self.write_pipeline.submit('auditLogs', audit_log.log_id, log_data):
+                print("Error logging event: audit write pipeline unavailable")
+                return None
+            
+            # Keep the user's threat prediction features and the attack detectors current
+            try:
+                threat_feature_store.record_event(log_data)
+                streaming_threat_detector.ingest(log_data)
+            except Exception as e:
+                print(f"Error updating threat features: {str(e)}")
             
             # Send alert for high-severity events
             if severity in ['high', 'critical']:
@@ -0,0 +1,521 @@
+"""
+Audit Write Pipeline
+Asynchronous batched ingestion of audit records into Firestore
+"""
+
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from queue import Queue, Empty, Full
+from typing import Any, Callable, Dict, List, Optional
+
+from app.firebase_config import get_firestore_client
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 operations
+MAX_BATCH_SIZE = 500
+
+
+class _PendingWrite:
+    """A queued document write"""
+
+    __slots__ = ('collection', 'doc_id', 'data', 'prepare', 'enqueued_at')
+
+    def __init__(self, collection, doc_id, data, prepare=None, enqueued_at=None):
+        self.collection = collection
+        self.doc_id = doc_id
+        self.data = data
+        self.prepare = prepare
+        self.enqueued_at = enqueued_at if enqueued_at is not None else time.time()
+
+
+class AuditWritePipeline:
+    """
+    Bounded in-process queue drained by a background writer thread.
+
+    Callers hand over a finished document with ``submit()`` and return
+    immediately; the writer groups whatever is queued into Firestore batch
+    commits of up to 500 writes. An optional ``prepare`` callable attached to
+    a write runs on the writer thread just before the commit, so expensive
+    enrichment (GeoIP, user agent parsing, integrity hashing) stays out of
+    the request path as well.
+
+    When the queue is full, ``submit()`` waits briefly and then spills the
+    write to a local JSONL journal instead of blocking the request. Batches
+    that still fail after retries are journaled the same way. The journal is
+    replayed by the writer once Firestore accepts writes again, and anything
+    still queued at interpreter exit is flushed (or journaled) by an atexit
+    hook.
+    """
+
+    def __init__(
+        self,
+        db=None,
+        max_queue_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        enqueue_timeout: Optional[float] = None,
+        journal_path: Optional[str] = None,
+        async_enabled: Optional[bool] = None,
+        max_retries: int = 3,
+        replay_interval: float = 30.0
+    ):
+        """
+        Initialize the pipeline
+
+        Args:
+            db: Firestore client (defaults to the shared client)
+            max_queue_size (int): Queue capacity before writes spill to the journal
+            batch_size (int): Writes per Firestore batch commit (capped at 500)
+            flush_interval (float): Seconds the writer waits for work before idling
+            enqueue_timeout (float): Seconds submit() waits on a full queue before spilling
+            journal_path (str): JSONL file used for spilled writes
+            async_enabled (bool): False writes inline on the caller's thread
+            max_retries (int): Commit attempts per batch before it is journaled
+            replay_interval (float): Minimum seconds between journal replay attempts
+        """
+        self.db = db if db is not None else get_firestore_client()
+        self.max_queue_size = max_queue_size or int(os.getenv('AUDIT_QUEUE_MAX_SIZE', '10000'))
+        self.batch_size = min(MAX_BATCH_SIZE, batch_size or int(os.getenv('AUDIT_WRITE_BATCH_SIZE', str(MAX_BATCH_SIZE))))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv('AUDIT_FLUSH_INTERVAL', '0.5'))
+        self.enqueue_timeout = enqueue_timeout if enqueue_timeout is not None else float(os.getenv('AUDIT_ENQUEUE_TIMEOUT', '0.05'))
+        self.journal_path = journal_path or os.getenv(
+            'AUDIT_JOURNAL_PATH', os.path.join(tempfile.gettempdir(), 'audit_journal.jsonl')
+        )
+        if async_enabled is None:
+            async_enabled = os.getenv('AUDIT_ASYNC_WRITES', 'true').lower() == 'true'
+        self.async_enabled = async_enabled
+        self.max_retries = max(1, max_retries)
+        self.replay_interval = replay_interval
+
+        self._queue: Queue = Queue(maxsize=self.max_queue_size)
+        self._start_lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_replay_attempt = 0.0
+        self._replay_listeners: List[Callable[[List[_PendingWrite]], None]] = []
+
+        self.metrics = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'failed_commits': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'dropped': 0,
+            'max_queue_depth': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_lag_seconds': 0.0,
+            'max_lag_seconds': 0.0,
+            'total_lag_seconds': 0.0
+        }
+
+    def submit(
+        self,
+        collection: str,
+        doc_id: str,
+        data: Dict[str, Any],
+        prepare: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    ) -> bool:
+        """
+        Queue a document write
+
+        Args:
+            collection (str): Target collection
+            doc_id (str): Document ID
+            data (dict): Document data (must not be mutated by the caller afterwards)
+            prepare (callable): Optional hook returning the final document, run before commit
+
+        Returns:
+            bool: True if the write was queued, committed or journaled, False if it was dropped
+        """
+        if self.db is None:
+            self._incr('dropped')
+            return False
+
+        item = _PendingWrite(collection, doc_id, data, prepare)
+
+        if not self.async_enabled or self._stop_event.is_set():
+            return self._commit([item], spill=False) == 1 or self._spill([item])
+
+        self._ensure_started()
+        try:
+            self._queue.put(item, timeout=self.enqueue_timeout)
+        except Full:
+            # Backpressure: the request never waits on Firestore, overflow goes to disk
+            return self._spill([item])
+
+        with self._metrics_lock:
+            self.metrics['enqueued'] += 1
+            depth = self._queue.qsize()
+            if depth > self.metrics['max_queue_depth']:
+                self.metrics['max_queue_depth'] = depth
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until every queued write has been committed or journaled
+
+        Args:
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            bool: True if the queue drained within the timeout
+        """
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if self._thread is None or not self._thread.is_alive():
+                self._drain_inline()
+                break
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """
+        Stop accepting queued writes, flush what is pending and stop the writer
+
+        Writes submitted after shutdown are committed inline. Anything the
+        writer could not commit within the timeout is journaled.
+
+        Args:
+            timeout (float): Maximum seconds to wait for the flush
+        """
+        self.flush(timeout)
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.flush_interval * 2, 1.0))
+
+        leftover = self._take_queued()
+        if leftover:
+            self._spill(leftover)
+
+    def replay_journal(self) -> int:
+        """
+        Commit journaled writes
+
+        The journal is moved aside to ``<journal>.replay`` and that file is
+        only removed once every record in it has been committed. Chunks that
+        still fail are written back to it for the next attempt, so a crash or
+        outage during replay never loses records; at worst a chunk is
+        committed twice, which is harmless because writes are keyed by
+        document ID.
+
+        Returns:
+            int: Number of journaled writes committed
+        """
+        self._last_replay_attempt = time.time()
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            return self._replay()
+        finally:
+            self._replay_lock.release()
+
+    def add_replay_listener(self, listener: Callable[[List[_PendingWrite]], None]) -> None:
+        """
+        Register a callback for writes committed from the journal
+
+        Replayed records keep their original timestamps, so consumers that
+        already processed that time range (e.g. sealed checkpoints) are told
+        about them after each committed chunk.
+
+        Args:
+            listener (callable): Called with the committed writes
+        """
+        self._replay_listeners.append(listener)
+
+    def _replay(self) -> int:
+        """Replay the journal (caller holds the replay lock)"""
+        replay_path = f"{self.journal_path}.replay"
+
+        with self._journal_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.journal_path):
+                    return 0
+                os.replace(self.journal_path, replay_path)
+
+        items: List[_PendingWrite] = []
+        try:
+            with open(replay_path, 'r', encoding='utf-8') as journal:
+                for line in journal:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line, object_hook=_decode_value)
+                    except ValueError:
+                        logger.error("Skipping unreadable audit journal line")
+                        continue
+                    items.append(_PendingWrite(
+                        record['collection'], record['docId'], record['data'],
+                        enqueued_at=record.get('enqueuedAt')
+                    ))
+        except OSError as e:
+            logger.error(f"Error reading audit journal: {e}")
+            return 0
+
+        replayed = 0
+        failed: List[_PendingWrite] = []
+        for start in range(0, len(items), self.batch_size):
+            chunk = items[start:start + self.batch_size]
+            committed = self._commit(chunk, spill=False)
+            if committed:
+                replayed += committed
+                self._notify_replayed(chunk)
+            else:
+                failed.extend(chunk)
+
+        try:
+            with self._journal_lock:
+                if failed:
+                    self._write_journal(replay_path, failed, mode='w')
+                else:
+                    os.remove(replay_path)
+        except OSError as e:
+            # The replay file is left as it was and is retried in full next time
+            logger.error(f"Error updating audit replay journal: {e}")
+
+        self._incr('replayed', replayed)
+        if replayed:
+            logger.info(f"Replayed {replayed} journaled audit writes")
+        return replayed
+
+    def _notify_replayed(self, items: List[_PendingWrite]) -> None:
+        """Hand committed journal writes to the replay listeners"""
+        for listener in self._replay_listeners:
+            try:
+                listener(items)
+            except Exception as e:
+                logger.error(f"Error in audit replay listener: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get queue depth, batch size and end-to-end lag metrics
+
+        Returns:
+            dict: Pipeline metrics
+        """
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        total_lag = metrics.pop('total_lag_seconds')
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['queue_capacity'] = self.max_queue_size
+        metrics['avg_batch_size'] = round(metrics['written'] / metrics['batches'], 2) if metrics['batches'] else 0.0
+        metrics['avg_lag_seconds'] = round(total_lag / metrics['written'], 4) if metrics['written'] else 0.0
+        metrics['journal_pending'] = self._journal_pending()
+        metrics['async_enabled'] = self.async_enabled
+        metrics['writer_running'] = self._thread is not None and self._thread.is_alive()
+        return metrics
+
+    def _ensure_started(self) -> None:
+        """Start the writer thread on first use"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self) -> None:
+        """Writer loop: collect up to batch_size queued writes and commit them together"""
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except Empty:
+                self._maybe_replay()
+                continue
+
+            items = [first]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            try:
+                self._commit(items)
+            except Exception as e:  # pragma: no cover - _commit handles its own errors
+                logger.error(f"Audit writer error: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _maybe_replay(self) -> None:
+        """Replay the journal when idle, at most once per replay interval"""
+        if time.time() - self._last_replay_attempt < self.replay_interval:
+            return
+        try:
+            self.replay_journal()
+        except Exception as e:
+            logger.error(f"Error replaying audit journal: {e}")
+
+    def _commit(self, items: List[_PendingWrite], spill: bool = True) -> int:
+        """
+        Commit writes in one Firestore batch, retrying and journaling on failure
+
+        Args:
+            items (list): Writes to commit (at most 500)
+            spill (bool): Journal the writes if every attempt fails
+
+        Returns:
+            int: Number of writes committed
+        """
+        docs = []
+        for item in items:
+            data = item.data
+            if item.prepare is not None:
+                try:
+                    data = item.prepare(data)
+                except Exception as e:
+                    logger.error(f"Error preparing audit record {item.doc_id}: {e}")
+                item.prepare = None
+                item.data = data
+            docs.append(item)
+
+        delay = 0.1
+        for attempt in range(self.max_retries):
+            try:
+                batch = self.db.batch()
+                for item in docs:
+                    batch.set(self.db.collection(item.collection).document(item.doc_id), item.data)
+                batch.commit()
+                self._record_batch(docs)
+                return len(docs)
+            except Exception as e:
+                self._incr('failed_commits')
+                logger.warning(f"Audit batch commit failed (attempt {attempt + 1}/{self.max_retries}): {e}")
+                if attempt + 1 < self.max_retries:
+                    time.sleep(delay)
+                    delay *= 2
+
+        if spill:
+            self._spill(docs)
+        return 0
+
+    def _record_batch(self, items: List[_PendingWrite]) -> None:
+        """Update batch size and lag metrics after a successful commit"""
+        now = time.time()
+        lags = [max(0.0, now - item.enqueued_at) for item in items]
+        with self._metrics_lock:
+            self.metrics['batches'] += 1
+            self.metrics['written'] += len(items)
+            self.metrics['last_batch_size'] = len(items)
+            self.metrics['max_batch_size'] = max(self.metrics['max_batch_size'], len(items))
+            self.metrics['last_lag_seconds'] = round(max(lags), 4)
+            self.metrics['max_lag_seconds'] = max(self.metrics['max_lag_seconds'], round(max(lags), 4))
+            self.metrics['total_lag_seconds'] += sum(lags)
+
+    def _spill(self, items: List[_PendingWrite]) -> bool:
+        """Append writes to the local journal, returning False if they had to be dropped"""
+        try:
+            with self._journal_lock:
+                self._write_journal(self.journal_path, items, mode='a')
+            self._incr('spilled', len(items))
+            return True
+        except OSError as e:
+            logger.error(f"Error writing audit journal, {len(items)} records lost: {e}")
+            self._incr('dropped', len(items))
+            return False
+
+    def _write_journal(self, path: str, items: List[_PendingWrite], mode: str) -> None:
+        """Write records to a journal file and fsync it (caller holds the journal lock)"""
+        lines = []
+        for item in items:
+            data = item.data
+            if item.prepare is not None:
+                try:
+                    data = item.prepare(data)
+                except Exception as e:
+                    logger.error(f"Error preparing audit record {item.doc_id}: {e}")
+            lines.append(json.dumps({
+                'collection': item.collection,
+                'docId': item.doc_id,
+                'data': data,
+                'enqueuedAt': item.enqueued_at
+            }, default=_encode_value))
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if mode == 'w':
+            # Rewrite atomically so a crash mid-write keeps the previous file
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as journal:
+                journal.write('\n'.join(lines) + '\n')
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(tmp_path, path)
+            return
+        with open(path, mode, encoding='utf-8') as journal:
+            journal.write('\n'.join(lines) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _drain_inline(self) -> None:
+        """Commit queued writes on the calling thread (writer not running)"""
+        items = self._take_queued()
+        for start in range(0, len(items), self.batch_size):
+            self._commit(items[start:start + self.batch_size])
+
+    def _take_queued(self) -> List[_PendingWrite]:
+        """Remove everything currently queued"""
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except Empty:
+                break
+            self._queue.task_done()
+        return items
+
+    def _journal_pending(self) -> int:
+        """Number of writes waiting in the journal"""
+        pending = 0
+        with self._journal_lock:
+            for path in (self.journal_path, f"{self.journal_path}.replay"):
+                try:
+                    with open(path, 'r', encoding='utf-8') as journal:
+                        pending += sum(1 for line in journal if line.strip())
+                except OSError:
+                    continue
+        return pending
+
+    def _incr(self, name: str, amount: int = 1) -> None:
+        """Increment a counter"""
+        with self._metrics_lock:
+            self.metrics[name] += amount
+
+
+def _encode_value(value):
+    """JSON encoder hook preserving datetimes in the journal"""
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    return str(value)
+
+
+def _decode_value(obj):
+    """JSON decoder hook restoring journaled datetimes"""
+    if len(obj) == 1 and '$datetime' in obj:
+        try:
+            return datetime.fromisoformat(obj['$datetime'])
+        except ValueError:
+            return obj['$datetime']
+    return obj
+
+
+# Singleton instance
+audit_write_pipeline = AuditWritePipeline()
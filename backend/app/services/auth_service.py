@@ -3,7 +3,6 @@ Authentication Service
 Handles user authentication, token verification, session management, and MFA operations
 """
 
-import jwt
 import pyotp
 import os
 import io
@@ -13,6 +12,8 @@ from datetime import datetime, timedelta
 from firebase_admin import auth, firestore
 from cryptography.fernet import Fernet
 from app.firebase_config import get_firestore_client, verify_firebase_token
+from app.services.activity_tracker import ActivityTracker
+from app.services.token_verifier import TokenError, token_verifier
 
 
 class AuthService:
@@ -20,8 +21,8 @@ class AuthService:
     
     def __init__(self):
         self.db = get_firestore_client()
-        self.jwt_secret = os.getenv('JWT_SECRET_KEY', 'dev_jwt_secret')
-        self.jwt_algorithm = os.getenv('JWT_ALGORITHM', 'HS256')
+        # Session activity is written in periodic batches, never recreating a deleted session
+        self.activity_tracker = ActivityTracker('sessions', db=self.db, create_missing=False)
         self.jwt_expiration_minutes = int(os.getenv('JWT_EXPIRATION_MINUTES', 60))
         self.refresh_token_expiration_days = int(os.getenv('REFRESH_TOKEN_EXPIRATION_DAYS', 7))
         self.session_inactivity_minutes = int(os.getenv('SESSION_INACTIVITY_MINUTES', 30))
@@ -102,7 +103,7 @@ class AuthService:
                 'last_activity': datetime.utcnow().isoformat()
             }
             
-            access_token = jwt.encode(access_payload, self.jwt_secret, algorithm=self.jwt_algorithm)
+            access_token = token_verifier.encode(access_payload)
             
             # Create refresh token with 7-day expiration
             refresh_expiration = datetime.utcnow() + timedelta(days=self.refresh_token_expiration_days)
@@ -116,7 +117,7 @@ class AuthService:
                 'type': 'refresh'
             }
             
-            refresh_token = jwt.encode(refresh_payload, self.jwt_secret, algorithm=self.jwt_algorithm)
+            refresh_token = token_verifier.encode(refresh_payload)
             
             # Generate CSRF token
             csrf_token = secrets.token_urlsafe(32)
@@ -152,28 +153,24 @@ class AuthService:
         Raises:
             Exception: If token is invalid, expired, or inactive
         """
+        max_inactivity = self.session_inactivity_minutes * 60 if check_inactivity else None
         try:
-            payload = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
-            
-            # Verify token type
-            if payload.get('type') != 'access':
-                raise Exception("Invalid token type")
-            
-            # Check inactivity timeout
-            if check_inactivity:
-                last_activity_str = payload.get('last_activity')
-                if last_activity_str:
-                    last_activity = datetime.fromisoformat(last_activity_str)
-                    inactivity_duration = datetime.utcnow() - last_activity
-                    
-                    if inactivity_duration.total_seconds() > (self.session_inactivity_minutes * 60):
-                        raise Exception("Session timeout due to inactivity")
-            
-            return payload
-        except jwt.ExpiredSignatureError:
-            raise Exception("Session expired")
-        except jwt.InvalidTokenError:
+            # Signature and expiry are checked once per token, later calls are a cache lookup
+            payload = token_verifier.verify(token, max_inactivity=max_inactivity)
+        except TokenError as e:
+            if e.code == 'expired':
+                raise Exception("Session expired")
+            if e.code == 'inactive':
+                raise Exception("Session timeout due to inactivity")
+            if e.code == 'revoked':
+                raise Exception("Session has been revoked")
             raise Exception("Invalid session token")
+        
+        # Verify token type
+        if payload.get('type') != 'access':
+            raise Exception("Invalid token type")
+        
+        return payload
     
     def refresh_session_with_token(self, refresh_token):
         """
@@ -187,7 +184,11 @@ class AuthService:
         """
         try:
             # Verify refresh token
-            payload = jwt.decode(refresh_token, self.jwt_secret, algorithms=[self.jwt_algorithm])
+            # Refresh tokens are single-use, so they are not cached
+            try:
+                payload = token_verifier.decode(refresh_token)
+            except TokenError as e:
+                raise Exception("Refresh token expired" if e.code == 'expired' else "Invalid refresh token")
             
             # Verify token type
             if payload.get('type') != 'refresh':
@@ -223,10 +224,6 @@ class AuthService:
             new_tokens = self.create_session(user_id, user_data)
             
             return new_tokens
-        except jwt.ExpiredSignatureError:
-            raise Exception("Refresh token expired")
-        except jwt.InvalidTokenError:
-            raise Exception("Invalid refresh token")
         except Exception as e:
             raise Exception(f"Session refresh failed: {str(e)}")
     
@@ -506,10 +503,7 @@ class AuthService:
             user_id (str): User ID
         """
         try:
-            session_ref = self.db.collection('sessions').document(user_id)
-            session_ref.update({
-                'lastActivity': datetime.utcnow()
-            })
+            self.activity_tracker.touch(user_id)
         except Exception as e:
             print(f"Error updating last activity: {str(e)}")
     
@@ -521,6 +515,7 @@ class AuthService:
             user_id (str): User ID
         """
         try:
+            token_verifier.revoke_user(user_id)
             self.db.collection('sessions').document(user_id).delete()
         except Exception as e:
             print(f"Error invalidating session: {str(e)}")
@@ -533,10 +528,12 @@ class AuthService:
             user_id (str): User ID
         """
         try:
+            # Reject access tokens already issued, including cached verifications
+            token_verifier.revoke_user(user_id)
+            
             # Delete session document
             self.db.collection('sessions').document(user_id).delete()
             
-            # Could also maintain a blacklist of tokens if needed
             print(f"All sessions invalidated for user {user_id}")
         except Exception as e:
             print(f"Error invalidating all sessions: {str(e)}")
@@ -565,7 +562,7 @@ class AuthService:
                 'last_activity': datetime.utcnow().isoformat()
             }
             
-            access_token = jwt.encode(access_payload, self.jwt_secret, algorithm=self.jwt_algorithm)
+            access_token = token_verifier.encode(access_payload)
             
             # Update last activity in session
             self.update_last_activity(user_id)
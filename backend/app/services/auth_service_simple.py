@@ -3,10 +3,9 @@ Simple Auth Service for Testing
 Minimal authentication service for device fingerprinting testing
 """
 
-import jwt
-import os
-from datetime import datetime, timedelta
 from firebase_admin import firestore
+from app.services.activity_tracker import ActivityTracker
+from app.services.token_verifier import TokenError, token_verifier
 
 
 class AuthService:
@@ -14,26 +13,24 @@ class AuthService:
     
     def __init__(self):
         self.db = firestore.client()
-        self.jwt_secret = os.getenv('JWT_SECRET_KEY', 'dev_jwt_secret')
-        self.jwt_algorithm = 'HS256'
+        self.activity_tracker = ActivityTracker('users', db=self.db)
     
     def verify_session_token(self, token, check_inactivity=True):
         """Verify JWT session token"""
         try:
-            payload = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
-            return payload
-        except jwt.ExpiredSignatureError:
-            raise Exception("Token has expired")
-        except jwt.InvalidTokenError:
+            return token_verifier.verify(token)
+        except TokenError as e:
+            if e.code == 'expired':
+                raise Exception("Token has expired")
+            if e.code == 'revoked':
+                raise Exception("Token has been revoked")
             raise Exception("Invalid token")
     
     def update_last_activity(self, user_id):
         """Update user's last activity timestamp"""
         try:
-            user_ref = self.db.collection('users').document(user_id)
-            user_ref.set({
-                'lastActivity': datetime.utcnow()
-            }, merge=True)
+            # Coalesced in memory and written in batches every ACTIVITY_FLUSH_INTERVAL seconds
+            self.activity_tracker.touch(user_id)
         except Exception as e:
             print(f"Error updating last activity: {e}")
 
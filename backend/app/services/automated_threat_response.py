@@ -8,7 +8,6 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Set
 import json
 import logging
-from collections import defaultdict
 
 from app.firebase_config import db
 from app.models.threat_prediction import ThreatPrediction, ThreatIndicator
@@ -17,6 +16,9 @@ from app.models.resource_segment import ResourceSegment
 from app.models.notification import create_notification
 from app.services.enhanced_audit_service import enhanced_audit_service
 from app.services.realtime_event_service import realtime_event_processor
+from app.services.streaming_threat_detector import (
+    streaming_threat_detector, FAILURES_BY_DEVICE, FAILURES_BY_PATTERN
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,7 +30,7 @@ class AutomatedThreatResponse:
     
     def __init__(self):
         self.failed_attempt_threshold = 10  # Failed attempts within time window
-        self.time_window_minutes = 10  # Time window for failed attempts
+        self.time_window_minutes = int(streaming_threat_detector.short_window_seconds // 60)  # Time window for failed attempts
         self.coordinated_attack_threshold = 3  # Minimum users for coordinated attack
         self.coordinated_attack_attempts = 5  # Minimum attempts per user
         self.blocked_devices = set()  # In-memory cache of blocked devices
@@ -47,42 +49,27 @@ class AutomatedThreatResponse:
             List of detected threats
         """
         try:
-            cutoff_time = datetime.utcnow() - timedelta(minutes=self.time_window_minutes)
-            
-            # Query failed access attempts
-            query = db.collection('audit_logs')\
-                     .where('result', '==', 'failure')\
-                     .where('timestamp', '>=', cutoff_time)
-            
-            if device_fingerprint:
-                query = query.where('device_fingerprint', '==', device_fingerprint)
-            
-            docs = query.stream()
-            
-            # Group by device fingerprint
-            device_failures = defaultdict(list)
-            
-            for doc in docs:
-                data = doc.to_dict()
-                device_fp = data.get('device_fingerprint')
-                if device_fp:
-                    device_failures[device_fp].append(data)
+            # Failed attempts per device over the time window, kept current by the audit write path
+            device_windows = {
+                window['key']: window
+                for window in streaming_threat_detector.snapshot(FAILURES_BY_DEVICE, key=device_fingerprint)
+            }
             
             threats = []
             
-            for device_fp, failures in device_failures.items():
-                if len(failures) >= self.failed_attempt_threshold:
+            for device_fp, window in device_windows.items():
+                if window['count'] >= self.failed_attempt_threshold:
                     # Create threat detection
                     threat = {
                         'threat_type': 'multiple_failed_attempts',
                         'device_fingerprint': device_fp,
-                        'failed_attempts': len(failures),
+                        'failed_attempts': window['count'],
                         'time_window_minutes': self.time_window_minutes,
                         'severity': 'high',
                         'detected_at': datetime.utcnow().isoformat(),
-                        'user_ids': list(set(f.get('user_id') for f in failures if f.get('user_id'))),
-                        'ip_addresses': list(set(f.get('ip_address') for f in failures if f.get('ip_address'))),
-                        'failure_details': failures
+                        'user_ids': list(window['members'].get('users', {})),
+                        'ip_addresses': list(window['members'].get('ips', {})),
+                        'failure_details': window['samples']
                     }
                     
                     threats.append(threat)
@@ -169,48 +156,22 @@ class AutomatedThreatResponse:
             List of detected coordinated attacks
         """
         try:
-            cutoff_time = datetime.utcnow() - timedelta(minutes=self.time_window_minutes)
-            
-            # Query recent failed/denied attempts
-            query = db.collection('audit_logs')\
-                     .where('result', 'in', ['failure', 'denied'])\
-                     .where('timestamp', '>=', cutoff_time)\
-                     .limit(1000)
-            
-            docs = query.stream()
-            
-            # Group by resource and action patterns
-            attack_patterns = defaultdict(lambda: {
-                'users': set(),
-                'attempts': [],
-                'ip_addresses': set(),
-                'device_fingerprints': set()
-            })
-            
-            for doc in docs:
-                data = doc.to_dict()
-                resource_type = data.get('resource_type', 'unknown')
-                action = data.get('action', 'unknown')
-                user_id = data.get('user_id')
-                ip_address = data.get('ip_address')
-                device_fp = data.get('device_fingerprint')
-                
-                pattern_key = f"{resource_type}:{action}"
-                
-                if user_id:
-                    attack_patterns[pattern_key]['users'].add(user_id)
-                if ip_address:
-                    attack_patterns[pattern_key]['ip_addresses'].add(ip_address)
-                if device_fp:
-                    attack_patterns[pattern_key]['device_fingerprints'].add(device_fp)
-                
-                attack_patterns[pattern_key]['attempts'].append(data)
+            # Failed and denied attempts per resource and action over the time window
+            attack_patterns = {
+                window['key']: {
+                    'users': set(window['members'].get('users', {})),
+                    'attempt_count': window['count'],
+                    'ip_addresses': set(window['members'].get('ips', {})),
+                    'device_fingerprints': set(window['members'].get('devices', {}))
+                }
+                for window in streaming_threat_detector.snapshot(FAILURES_BY_PATTERN)
+            }
             
             coordinated_attacks = []
             
             for pattern_key, pattern_data in attack_patterns.items():
                 user_count = len(pattern_data['users'])
-                attempt_count = len(pattern_data['attempts'])
+                attempt_count = pattern_data['attempt_count']
                 
                 # Check for coordinated attack criteria
                 if (user_count >= self.coordinated_attack_threshold and 
@@ -0,0 +1,263 @@
+"""
+Behavioral Features
+Columnar NumPy extraction of keystroke, mouse and navigation features
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+KEYSTROKE_FEATURE_COUNT = 15
+MOUSE_FEATURE_COUNT = 12
+NAVIGATION_FEATURE_COUNT = 8
+
+CORRECTION_KEYS = frozenset(('Backspace', 'Delete'))
+
+
+def default_keystroke_features() -> Dict[str, float]:
+    """Keystroke features of a session without enough keystrokes"""
+    return {f'keystroke_feature_{i}': 0.0 for i in range(KEYSTROKE_FEATURE_COUNT)}
+
+
+def default_mouse_features() -> Dict[str, float]:
+    """Mouse features of a session without enough mouse movement"""
+    return {f'mouse_feature_{i}': 0.0 for i in range(MOUSE_FEATURE_COUNT)}
+
+
+def default_navigation_features() -> Dict[str, float]:
+    """Navigation features of a session without navigation events"""
+    return {f'navigation_feature_{i}': 0.0 for i in range(NAVIGATION_FEATURE_COUNT)}
+
+
+def column(events: List[Dict], field: str, default: float = 0.0, required: bool = False) -> np.ndarray:
+    """
+    Convert one numeric field of a list of events into a float64 array
+
+    Args:
+        events (list): Event dicts
+        field (str): Field name
+        default (float): Value for events without the field
+        required (bool): Raise KeyError for events without the field
+
+    Returns:
+        np.ndarray: Field values in event order
+    """
+    if required:
+        values = (event[field] for event in events)
+    else:
+        values = (event.get(field, default) for event in events)
+    return np.fromiter(values, dtype=np.float64, count=len(events))
+
+
+def flag_column(events: List[Dict], field: str) -> np.ndarray:
+    """Convert a truthy field of a list of events into a bool array"""
+    return np.fromiter((bool(event.get(field)) for event in events), dtype=bool, count=len(events))
+
+
+def _mean(values: np.ndarray) -> float:
+    return float(values.mean()) if values.size else 0
+
+
+def _std(values: np.ndarray) -> float:
+    return float(values.std()) if values.size else 0
+
+
+def _ratio(mask: np.ndarray) -> float:
+    return float(np.count_nonzero(mask)) / mask.size if mask.size else 0
+
+
+def _rate(count: int, span: float, unit: float) -> float:
+    """Events per time unit over a span in milliseconds"""
+    return count / (span / unit) if span > 0 else 0
+
+
+def _hold_durations(down_ts: np.ndarray, down_codes: np.ndarray, up_ts: np.ndarray, up_codes: np.ndarray) -> np.ndarray:
+    """
+    Pair each keydown with the earliest later keyup of the same code
+
+    Downs and ups are merged and sorted by (code, timestamp) with ups ahead of
+    downs on equal timestamps, so the nearest following up of each down in
+    the merged order is its release. A reverse running minimum finds that up
+    for every position in one pass.
+    """
+    if not down_ts.size or not up_ts.size:
+        return np.empty(0, dtype=np.float64)
+
+    codes = np.concatenate((down_codes, up_codes))
+    timestamps = np.concatenate((down_ts, up_ts))
+    is_down = np.concatenate((np.ones(down_ts.size, dtype=np.int8), np.zeros(up_ts.size, dtype=np.int8)))
+
+    order = np.lexsort((is_down, timestamps, codes))
+    codes, timestamps, is_down = codes[order], timestamps[order], is_down[order]
+
+    total = order.size
+    positions = np.where(is_down == 0, np.arange(total), total)
+    next_up = np.minimum.accumulate(positions[::-1])[::-1]
+
+    down_positions = np.flatnonzero(is_down)
+    release = next_up[down_positions]
+    matched = release < total
+    down_positions, release = down_positions[matched], release[matched]
+    same_key = codes[release] == codes[down_positions]
+
+    return timestamps[release[same_key]] - timestamps[down_positions[same_key]]
+
+
+def _group_ids(keys: Iterable[Any], count: int) -> np.ndarray:
+    """Map hashable keys to dense integer ids in first-seen order"""
+    ids: Dict[Any, int] = {}
+    return np.fromiter((ids.setdefault(key, len(ids)) for key in keys), dtype=np.int64, count=count)
+
+
+def _event_key(event: Dict) -> Any:
+    """Hashable identity of an event's fields"""
+    try:
+        key = tuple(sorted(event.items()))
+        hash(key)
+        return key
+    except TypeError:
+        return repr(sorted(event.items(), key=lambda item: item[0]))
+
+
+def keystroke_features(keystroke_data: Optional[List[Dict]]) -> Dict[str, float]:
+    """
+    Extract the 15 keystroke features of a session
+
+    Args:
+        keystroke_data (list): Raw keydown/keyup events
+
+    Returns:
+        dict: Keystroke features in model input order
+    """
+    if not keystroke_data or len(keystroke_data) < 2:
+        return default_keystroke_features()
+
+    event_types = np.array([event.get('eventType') for event in keystroke_data], dtype=object)
+    is_down = event_types == 'keydown'
+    is_up = event_types == 'keyup'
+
+    down_count = int(np.count_nonzero(is_down))
+    if down_count < 2:
+        return default_keystroke_features()
+
+    timestamps = column(keystroke_data, 'timestamp')
+    codes = _group_ids((event.get('code') for event in keystroke_data), len(keystroke_data))
+
+    down_ts = timestamps[is_down]
+    inter_key_times = np.diff(down_ts)
+    hold_durations = _hold_durations(down_ts, codes[is_down], timestamps[is_up], codes[is_up])
+
+    downs = [keystroke_data[i] for i in np.flatnonzero(is_down)]
+    corrections = np.fromiter((event.get('key') in CORRECTION_KEYS for event in downs), dtype=bool, count=down_count)
+    event_ids = _group_ids((_event_key(event) for event in downs), down_count)
+    repeated = np.bincount(event_ids)[event_ids] > 1
+
+    digraphs = inter_key_times[(inter_key_times > 50) & (inter_key_times < 200)]
+
+    return {
+        'avg_inter_key_time': _mean(inter_key_times),
+        'std_inter_key_time': _std(inter_key_times),
+        'avg_hold_duration': _mean(hold_durations),
+        'std_hold_duration': _std(hold_durations),
+        'typing_speed': _rate(down_count, down_ts[-1] - down_ts[0], 60000),
+        'error_rate': _ratio(corrections),
+        'avg_key_pair_time': _mean(inter_key_times[:10]),
+        'shift_usage': _ratio(flag_column(downs, 'shiftKey')),
+        'ctrl_usage': _ratio(flag_column(downs, 'ctrlKey')),
+        'alt_usage': _ratio(flag_column(downs, 'altKey')),
+        'common_digraph_time': _mean(digraphs),
+        'rhythm_consistency': 1 / (_std(inter_key_times) + 1),
+        'pause_frequency': _ratio(inter_key_times > 1000),
+        'burst_frequency': _ratio(inter_key_times < 100),
+        # Share of keydowns recorded more than once with identical fields
+        'key_repetition_rate': _ratio(repeated)
+    }
+
+
+def mouse_features(mouse_data: Optional[List[Dict]]) -> Dict[str, float]:
+    """
+    Extract the 12 mouse features of a session
+
+    Args:
+        mouse_data (list): Raw mouse movement events
+
+    Returns:
+        dict: Mouse features in model input order
+    """
+    if not mouse_data or len(mouse_data) < 3:
+        return default_mouse_features()
+
+    velocities = column(mouse_data, 'velocity')
+    time_deltas = column(mouse_data, 'timeDelta', default=1.0)[1:]
+    x = column(mouse_data, 'x', required=True)
+    y = column(mouse_data, 'y', required=True)
+
+    positive = time_deltas > 0
+    accelerations = np.abs(np.diff(velocities)[positive] / time_deltas[positive])
+
+    dx, dy = np.diff(x), np.diff(y)
+    distances = np.sqrt(dx * dx + dy * dy)
+    angles = np.abs(np.diff(np.arctan2(dy, dx)))
+
+    span = mouse_data[-1]['timestamp'] - mouse_data[0]['timestamp']
+
+    return {
+        'avg_velocity': _mean(velocities),
+        'std_velocity': _std(velocities),
+        'avg_acceleration': _mean(accelerations),
+        'max_velocity': float(velocities.max()),
+        'avg_angle_change': _mean(angles),
+        'movement_straightness': 1 / (_mean(angles) + 1) if angles.size else 0,
+        'idle_time_ratio': _ratio(velocities < 0.1),
+        'avg_distance': _mean(distances),
+        'movement_frequency': _rate(len(mouse_data), span, 1000),
+        'jitter': _ratio(distances < 5),
+        'smooth_movement_ratio': _ratio(accelerations < 0.5),
+        'direction_change_freq': _ratio(angles > np.pi / 4)
+    }
+
+
+def navigation_features(
+    navigation_data: Optional[List[Dict]],
+    click_data: Optional[List[Dict]],
+    scroll_data: Optional[List[Dict]]
+) -> Dict[str, float]:
+    """
+    Extract the 8 navigation features of a session
+
+    Args:
+        navigation_data (list): Page navigation events
+        click_data (list): Click events
+        scroll_data (list): Scroll events
+
+    Returns:
+        dict: Navigation features in model input order
+    """
+    if not navigation_data:
+        return default_navigation_features()
+
+    click_data = click_data or []
+    scroll_data = scroll_data or []
+
+    timestamps = column(navigation_data, 'timestamp', required=True)
+    dwell_times = np.diff(timestamps)
+    scroll_distances = np.abs(np.diff(column(scroll_data, 'scrollY', required=True)))
+
+    total_time = timestamps[-1] - timestamps[0] if timestamps.size > 1 else 1
+
+    return {
+        'page_visit_frequency': _rate(len(navigation_data), total_time, 60000),
+        'avg_dwell_time': _mean(dwell_times),
+        'navigation_speed': _rate(len(navigation_data), total_time, 1000),
+        'back_forward_usage': 0,  # Would need browser history API
+        'scroll_frequency': _rate(len(scroll_data), total_time, 1000),
+        'avg_scroll_distance': _mean(scroll_distances),
+        'click_frequency': _rate(len(click_data), total_time, 1000),
+        'click_to_nav_ratio': len(click_data) / len(navigation_data)
+    }
+
+
+def feature_vector(*feature_groups: Dict[str, float]) -> np.ndarray:
+    """Concatenate feature groups into a float32 model input vector"""
+    values = [value for group in feature_groups for value in group.values()]
+    return np.array(values, dtype=np.float32)
@@ -0,0 +1,225 @@
+"""
+Behavioral Model Registry
+Bounded in-memory LRU of loaded per-user behavioral models
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _RegistryEntry:
+    """A resolved model version and its loaded value (None if the user has no model)"""
+
+    __slots__ = ('version', 'value', 'checked_at')
+
+    def __init__(self, version, value, checked_at):
+        self.version = version
+        self.value = value
+        self.checked_at = checked_at
+
+
+class BehavioralModelRegistry:
+    """
+    Thread-safe LRU of loaded (model, scaler) pairs keyed by user and model version.
+
+    ``version_resolver(user_id)`` returns the current version of a user's
+    stored model (None if there is none) and ``loader(user_id, version)``
+    loads it. A cached entry is served without touching storage until
+    ``revalidate_seconds`` have passed since its version was last checked;
+    after that the version is re-resolved and the model is reloaded only if
+    it changed, which picks up models retrained by other workers. Training in
+    this process replaces the entry directly through ``publish``. Users
+    without a model are cached as negative entries so they do not hit
+    storage on every call either.
+
+    Loads of the same user are single-flight: concurrent misses wait for one
+    load instead of each reading the model from disk.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str, Any], Optional[Any]],
+        version_resolver: Callable[[str], Optional[Any]],
+        max_models: int = 256,
+        revalidate_seconds: Optional[float] = 60.0
+    ):
+        """
+        Initialize the registry
+
+        Args:
+            loader (callable): Loads the model of (user_id, version); returns None on failure
+            version_resolver (callable): Returns the stored model version of a user or None
+            max_models (int): Maximum number of cached users
+            revalidate_seconds (float): Seconds before a cached version is re-resolved
+                (0 checks on every call, None only on explicit invalidation)
+        """
+        self.loader = loader
+        self.version_resolver = version_resolver
+        self.max_models = max(1, max_models)
+        self.revalidate_seconds = revalidate_seconds
+
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, _RegistryEntry]' = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'loads': 0,
+            'load_failures': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'total_load_seconds': 0.0,
+            'max_load_seconds': 0.0
+        }
+
+    def get(self, user_id: str) -> Optional[Any]:
+        """
+        Get the loaded model of a user, loading it on a miss
+
+        Args:
+            user_id (str): User ID
+
+        Returns:
+            The loaded value (e.g. a (model, scaler) tuple) or None if the user has no model
+        """
+        entry = self._fresh_entry(user_id)
+        if entry is not None:
+            return entry.value
+
+        with self._loading_lock(user_id):
+            # Another thread may have loaded the model while we waited
+            entry = self._fresh_entry(user_id)
+            if entry is not None:
+                return entry.value
+
+            try:
+                version = self.version_resolver(user_id)
+            except Exception as e:
+                logger.error(f"Error resolving model version for user {user_id}: {e}")
+                self._count('misses')
+                return None
+
+            with self._lock:
+                cached = self._entries.get(user_id)
+                if cached is not None and cached.version == version:
+                    cached.checked_at = time.monotonic()
+                    self._entries.move_to_end(user_id)
+                    self.stats['hits'] += 1
+                    return cached.value
+                self.stats['misses'] += 1
+
+            value = self._load(user_id, version) if version is not None else None
+            if version is not None and value is None:
+                # Do not cache failed loads; the next call retries
+                with self._lock:
+                    self._entries.pop(user_id, None)
+                return None
+
+            self._store(user_id, version, value)
+            return value
+
+    def publish(self, user_id: str, value: Any, version: Any) -> None:
+        """
+        Install a freshly trained model as the current version of a user
+
+        Args:
+            user_id (str): User ID
+            value: Loaded value to serve
+            version: Version of the stored model
+        """
+        self._store(user_id, version, value)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """
+        Drop the cached model of a user (or of all users)
+
+        Args:
+            user_id (str): User ID, None to clear the registry
+        """
+        with self._lock:
+            if user_id is None:
+                self.stats['invalidations'] += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(user_id, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit ratio, load time and size statistics
+
+        Returns:
+            dict: Registry statistics
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['models'] = sum(1 for entry in self._entries.values() if entry.value is not None)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['avg_load_seconds'] = round(stats['total_load_seconds'] / stats['loads'], 4) if stats['loads'] else 0.0
+        stats['total_load_seconds'] = round(stats['total_load_seconds'], 4)
+        stats['max_load_seconds'] = round(stats['max_load_seconds'], 4)
+        stats['max_models'] = self.max_models
+        return stats
+
+    def _fresh_entry(self, user_id: str) -> Optional[_RegistryEntry]:
+        """Return the cached entry if it can be served without re-resolving its version"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if self.revalidate_seconds is not None and \
+                    time.monotonic() - entry.checked_at >= self.revalidate_seconds:
+                return None
+            self._entries.move_to_end(user_id)
+            self.stats['hits'] += 1
+            return entry
+
+    def _load(self, user_id: str, version: Any) -> Optional[Any]:
+        """Load a model version and record its load time"""
+        started = time.perf_counter()
+        try:
+            value = self.loader(user_id, version)
+        except Exception as e:
+            logger.error(f"Error loading model for user {user_id}: {e}")
+            value = None
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            if value is None:
+                self.stats['load_failures'] += 1
+            else:
+                self.stats['loads'] += 1
+                self.stats['total_load_seconds'] += elapsed
+                self.stats['max_load_seconds'] = max(self.stats['max_load_seconds'], elapsed)
+        return value
+
+    def _store(self, user_id: str, version: Any, value: Any) -> None:
+        """Insert an entry, evicting the least recently used users if full"""
+        with self._lock:
+            self._entries[user_id] = _RegistryEntry(version, value, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_models:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def _loading_lock(self, user_id: str) -> threading.Lock:
+        """Get the per-user lock that serializes loads of one user"""
+        with self._lock:
+            lock = self._loading.get(user_id)
+            if lock is None:
+                if len(self._loading) > self.max_models * 4:
+                    # Drop locks nobody holds so the map stays bounded
+                    for key in [k for k, v in self._loading.items() if not v.locked()]:
+                        del self._loading[key]
+                lock = self._loading.setdefault(user_id, threading.Lock())
+            return lock
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
@@ -0,0 +1,285 @@
+"""
+Broadcast Scheduler
+Coalesces WebSocket updates per room into periodic frames of deltas
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+FRAME_EVENT = 'update_frame'
+
+FRAME_INTERVAL_MS = int(os.getenv('WEBSOCKET_FRAME_INTERVAL_MS', '250'))
+ROOM_QUEUE_SIZE = int(os.getenv('WEBSOCKET_ROOM_QUEUE_SIZE', '500'))
+FULL_SYNC_FRAMES = int(os.getenv('WEBSOCKET_FULL_SYNC_FRAMES', '40'))
+ROOM_STATE_SIZE = int(os.getenv('WEBSOCKET_ROOM_STATE_SIZE', '2000'))
+
+_MISSING = object()
+
+
+def diff(previous: Any, current: Any) -> Optional[Dict[str, Any]]:
+    """
+    Shallow delta between two payloads
+
+    Args:
+        previous: Payload last sent for the same key
+        current: New payload
+
+    Returns:
+        dict: {'delta': changed fields, 'removed': dropped fields}, or None if
+        the payloads are not both dicts and must be sent in full
+    """
+    if not isinstance(previous, dict) or not isinstance(current, dict):
+        return None
+    changed = {k: v for k, v in current.items() if previous.get(k, _MISSING) != v}
+    removed = [k for k in previous if k not in current]
+    return {'delta': changed, 'removed': removed}
+
+
+class _Room:
+    """Pending updates and last-sent state of one room"""
+
+    def __init__(self):
+        self.pending = OrderedDict()  # (event, key) -> data, oldest first
+        self.sent = OrderedDict()  # (event, key) -> last data sent, least recently sent first
+        self.seq = 0
+        self.stats = defaultdict(int)
+
+
+class BroadcastScheduler:
+    """
+    Sends room updates as one frame per room every ``interval_ms``.
+
+    Updates enqueued with a key supersede the pending update with the same
+    event and key, so a burst of risk-score recalculations for one session
+    reaches clients as its latest value only. Keyed updates are sent as a
+    shallow delta against the value last sent for that key; every
+    ``full_sync_frames`` frames a room's state is forgotten so the next
+    updates go out in full and late subscribers catch up. Each room's
+    pending queue is bounded and the oldest updates are dropped when a room
+    falls behind.
+
+    Frames are emitted as ``update_frame`` events::
+
+        {'room': ..., 'seq': n, 'full': bool, 'dropped': n,
+         'updates': [{'event': ..., 'key': ..., 'data': {...}} or
+                     {'event': ..., 'key': ..., 'delta': {...}, 'removed': [...]}]}
+
+    A gap in ``seq`` tells a client that a frame was lost and it should wait
+    for the next full frame.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, Any, Optional[str]], Any],
+        interval_ms: int = FRAME_INTERVAL_MS,
+        max_queue_per_room: int = ROOM_QUEUE_SIZE,
+        full_sync_frames: int = FULL_SYNC_FRAMES,
+        max_state_per_room: int = ROOM_STATE_SIZE
+    ):
+        """
+        Initialize broadcast scheduler
+
+        Args:
+            send (callable): Emits (event, data, room), returning False if it was not sent
+            interval_ms (int): Milliseconds between frames
+            max_queue_per_room (int): Pending updates kept per room
+            full_sync_frames (int): Frames between full resends of keyed state
+            max_state_per_room (int): Last-sent values remembered per room for deltas
+        """
+        self.send = send
+        self.interval = interval_ms / 1000.0
+        self.max_queue_per_room = max_queue_per_room
+        self.full_sync_frames = full_sync_frames
+        self.max_state_per_room = max_state_per_room
+
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._sequence = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self.metrics = {
+            'enqueued': 0,
+            'frames_sent': 0,
+            'updates_sent': 0,
+            'superseded': 0,
+            'dropped_updates': 0,
+            'dropped_frames': 0
+        }
+
+    def enqueue(self, event: str, data: Any, room: str, key: Optional[Hashable] = None) -> bool:
+        """
+        Queue an update for the next frame of a room
+
+        Args:
+            event (str): Update type, e.g. heatmap_update
+            data: JSON-serializable payload
+            room (str): Target room
+            key: Identity of the updated object; a newer update with the same
+                event and key replaces a pending one and is sent as a delta
+
+        Returns:
+            bool: True if queued, False if it replaced no pending update and
+            the room queue was full so the oldest update was dropped
+        """
+        accepted = True
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None:
+                state = self._rooms[room] = _Room()
+
+            if key is None:
+                self._sequence += 1
+                slot = (event, None, self._sequence)
+            else:
+                slot = (event, key)
+
+            if slot in state.pending:
+                state.pending.pop(slot)
+                state.stats['superseded'] += 1
+                self.metrics['superseded'] += 1
+            elif len(state.pending) >= self.max_queue_per_room:
+                state.pending.popitem(last=False)
+                state.stats['dropped_updates'] += 1
+                self.metrics['dropped_updates'] += 1
+                accepted = False
+
+            state.pending[slot] = data
+            self.metrics['enqueued'] += 1
+
+        self._ensure_started()
+        return accepted
+
+    def reset_room(self, room: str):
+        """Send the next updates of a room in full, e.g. after a client joins it"""
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is not None:
+                state.sent.clear()
+
+    def _build_frame(self, room: str, state: _Room) -> Optional[Dict[str, Any]]:
+        if not state.pending:
+            return None
+
+        full = self.full_sync_frames > 0 and state.seq % self.full_sync_frames == 0
+        if full:
+            state.sent.clear()
+
+        updates = []
+        for slot, data in state.pending.items():
+            event, key = slot[0], slot[1]
+            update = {'event': event, 'key': key}
+            if key is None:
+                update['data'] = data
+            else:
+                changes = diff(state.sent.get(slot), data) if slot in state.sent else None
+                if changes is None:
+                    update['data'] = data
+                elif not changes['delta'] and not changes['removed']:
+                    state.stats['unchanged'] += 1
+                    continue
+                else:
+                    update.update(changes)
+                state.sent.pop(slot, None)
+                state.sent[slot] = data
+                while len(state.sent) > self.max_state_per_room:
+                    state.sent.popitem(last=False)
+            updates.append(update)
+
+        state.pending.clear()
+        dropped = state.stats['dropped_updates'] - state.stats['reported_dropped']
+        state.stats['reported_dropped'] = state.stats['dropped_updates']
+        if not updates:
+            return None
+
+        state.seq += 1
+        return {'room': room, 'seq': state.seq, 'full': full, 'dropped': dropped,
+                'updates': updates, 'sentAt': time.time()}
+
+    def flush(self) -> int:
+        """
+        Send one frame for every room with pending updates
+
+        Returns:
+            int: Number of frames sent
+        """
+        with self._send_lock:
+            with self._lock:
+                frames = []
+                for room, state in self._rooms.items():
+                    frame = self._build_frame(room, state)
+                    if frame is not None:
+                        frames.append((state, frame))
+
+            sent = 0
+            for state, frame in frames:
+                try:
+                    delivered = self.send(FRAME_EVENT, frame, frame['room']) is not False
+                except Exception as e:
+                    logger.error(f"Failed to send frame to {frame['room']}: {e}")
+                    delivered = False
+
+                with self._lock:
+                    if delivered:
+                        sent += 1
+                        state.stats['frames_sent'] += 1
+                        state.stats['updates_sent'] += len(frame['updates'])
+                        self.metrics['frames_sent'] += 1
+                        self.metrics['updates_sent'] += len(frame['updates'])
+                    else:
+                        # Clients missed these values, resend keyed state in full next time
+                        state.sent.clear()
+                        state.stats['dropped_frames'] += 1
+                        self.metrics['dropped_frames'] += 1
+            return sent
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='broadcast-scheduler', daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Broadcast scheduler flush failed: {e}")
+
+    def shutdown(self):
+        """Stop the frame timer and send what is pending"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            rooms = {
+                room: {
+                    'queue_depth': len(state.pending),
+                    'tracked_keys': len(state.sent),
+                    'seq': state.seq,
+                    **{name: state.stats[name] for name in (
+                        'frames_sent', 'updates_sent', 'superseded', 'unchanged',
+                        'dropped_updates', 'dropped_frames'
+                    )}
+                }
+                for room, state in self._rooms.items()
+            }
+        return {**self.metrics, 'interval_ms': int(self.interval * 1000), 'rooms': rooms}
+
+    def get_room_metrics(self, room: str) -> Dict[str, Any]:
+        return self.get_metrics()['rooms'].get(room, {'queue_depth': 0})
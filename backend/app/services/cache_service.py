@@ -1,30 +1,143 @@
 """
 Cache Service for AI Innovations
 Provides caching for ML models, contextual scores, and threat predictions
-Uses Redis with appropriate TTLs for each data type
+Uses a bounded in-process LRU/TTL tier backed by Redis when it is configured
 """
 
 import json
-import pickle
-import base64
+import os
+import threading
 from datetime import datetime, timedelta
-from redis_config import (
-    get_redis_client,
-    is_redis_available,
-    cache_set,
-    cache_get,
-    cache_delete,
-    cache_exists,
-    cache_context_score,
-    get_cached_context_score,
-    cache_model,
-    get_cached_model,
-    session_set,
-    session_get,
-    session_delete,
-    session_update_ttl
+import redis_config
+from redis_config import is_redis_available
+from app.services.local_cache import LocalCache
+
+
+# Per-namespace size limits for the in-process tier
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', '5000'))
+LOCAL_CACHE_NAMESPACE_LIMITS = {
+    'behavioral_model': 200,
+    'device_profile': LOCAL_CACHE_MAX_ENTRIES,
+    'context_score': 10000,
+    'threat_score': 10000,
+    'session': 10000,
+    'session_risk': 10000,
+    'ip_reputation': 10000,
+    'geolocation': 10000,
+    'assistant_response': 1000,
+}
+
+# When Redis is shared between workers the local copy is only kept briefly so
+# writes from other workers become visible quickly
+LOCAL_TTL_WITH_REDIS = int(os.getenv('LOCAL_CACHE_TTL_WITH_REDIS', '60'))
+
+# Device decisions must reflect a removed or newly registered device on every
+# worker at once, so these keys are only cached in the shared Redis tier
+SHARED_ONLY_PREFIXES = (
+    'device_profile:fingerprint_validation:',
+    'device_profile:user_devices:',
+    'device_profile:device_generation:',
 )
 
+_local_cache = LocalCache(
+    default_max_entries=LOCAL_CACHE_MAX_ENTRIES,
+    namespace_limits=LOCAL_CACHE_NAMESPACE_LIMITS
+)
+
+_tier_stats_lock = threading.Lock()
+_tier_stats = {'redisHits': 0, 'redisMisses': 0}
+
+
+def _encode(value):
+    """
+    Serialize a value the same way the Redis tier does
+
+    The local tier stores this payload rather than the object itself so both
+    tiers hand back the same types (datetimes come back as strings) and every
+    read returns a private copy that callers are free to mutate.
+    """
+    return json.dumps(value, default=str)
+
+
+def _local_allowed(key):
+    """Whether a key may be held in the in-process tier"""
+    return not key.startswith(SHARED_ONLY_PREFIXES)
+
+
+def _local_ttl(ttl):
+    """TTL for the in-process copy of a value"""
+    if not is_redis_available():
+        return ttl
+    return min(ttl, LOCAL_TTL_WITH_REDIS) if ttl else LOCAL_TTL_WITH_REDIS
+
+
+def cache_set(key, value, ttl=None):
+    """Store a value in the local tier and, when configured, in Redis"""
+    if value is None:
+        return cache_delete(key)
+
+    try:
+        payload = _encode(value)
+    except (TypeError, ValueError):
+        return False
+
+    if not _local_allowed(key):
+        return redis_config.cache_set(key, value, ttl)
+
+    _local_cache.set(key, payload, _local_ttl(ttl))
+    redis_config.cache_set(key, value, ttl)
+    return True
+
+
+def cache_get(key):
+    """Read a value from the local tier, falling back to Redis"""
+    local = _local_allowed(key)
+    if local:
+        payload = _local_cache.get(key)
+        if payload is not None:
+            return json.loads(payload)
+    if not is_redis_available():
+        return None
+
+    value = redis_config.cache_get(key)
+    with _tier_stats_lock:
+        _tier_stats['redisHits' if value is not None else 'redisMisses'] += 1
+    if value is not None and local:
+        _local_cache.set(key, _encode(value), LOCAL_TTL_WITH_REDIS)
+    return value
+
+
+def cache_delete(key):
+    """Delete a value from both tiers"""
+    deleted = _local_cache.delete(key)
+    return redis_config.cache_delete(key) or deleted
+
+
+def cache_exists(key):
+    """Check whether a key exists in either tier"""
+    return _local_cache.exists(key) or redis_config.cache_exists(key)
+
+
+def session_set(session_id, value, ttl=None):
+    """Store session data in both tiers"""
+    return cache_set(f"{redis_config.SESSION_PREFIX}{session_id}", value, ttl)
+
+
+def session_get(session_id):
+    """Read session data from either tier"""
+    return cache_get(f"{redis_config.SESSION_PREFIX}{session_id}")
+
+
+def session_delete(session_id):
+    """Delete session data from both tiers"""
+    return cache_delete(f"{redis_config.SESSION_PREFIX}{session_id}")
+
+
+def session_update_ttl(session_id, ttl):
+    """Reset the TTL of session data in both tiers"""
+    touched = _local_cache.touch(f"{redis_config.SESSION_PREFIX}{session_id}", _local_ttl(ttl))
+    return redis_config.session_update_ttl(session_id, ttl) or touched
+
 
 class CacheService:
     """
@@ -42,7 +155,12 @@ class CacheService:
     
     @staticmethod
     def is_available():
-        """Check if Redis is available"""
+        """Check if the cache is available (the local tier always is)"""
+        return True
+    
+    @staticmethod
+    def is_redis_available():
+        """Check if the shared Redis tier is available"""
         return is_redis_available()
     
     # Behavioral Biometrics Caching
@@ -128,7 +246,8 @@ class CacheService:
         if ttl is None:
             ttl = CacheService.TTL_CONTEXT_SCORE
         
-        return cache_context_score(request_id, context_data, ttl)
+        key = f"context_score:{request_id}"
+        return cache_set(key, context_data, ttl)
     
     @staticmethod
     def get_contextual_score(request_id):
@@ -141,7 +260,8 @@ class CacheService:
         Returns:
             Context data or None
         """
-        return get_cached_context_score(request_id)
+        key = f"context_score:{request_id}"
+        return cache_get(key)
     
     @staticmethod
     def cache_device_profile(device_id, profile_data, ttl=None):
@@ -176,6 +296,20 @@ class CacheService:
         key = f"device_profile:{device_id}"
         return cache_get(key)
     
+    @staticmethod
+    def delete_device_profile(device_id):
+        """
+        Delete cached device profile
+        
+        Args:
+            device_id: Device identifier
+            
+        Returns:
+            bool: Whether a cached value was deleted
+        """
+        key = f"device_profile:{device_id}"
+        return cache_delete(key)
+    
     # Threat Prediction Caching
     
     @staticmethod
@@ -502,13 +636,6 @@ class CacheService:
         Returns:
             int: Number of keys deleted
         """
-        if not is_redis_available():
-            return 0
-        
-        redis_client = get_redis_client()
-        if not redis_client:
-            return 0
-        
         patterns = [
             f"behavioral_model:{user_id}",
             f"threat_score:{user_id}",
@@ -521,16 +648,45 @@ class CacheService:
         
         return deleted
     
+    @staticmethod
+    def purge_expired():
+        """
+        Drop expired entries from the local tier
+        
+        Returns:
+            int: Number of entries removed
+        """
+        return _local_cache.purge_expired()
+    
     @staticmethod
     def get_cache_stats():
         """
         Get cache statistics
         
         Returns:
-            dict: Cache statistics
-        """
-        from redis_config import get_redis_stats
-        return get_redis_stats()
+            dict: Combined hit/miss/eviction counters plus per-tier details
+        """
+        local_stats = _local_cache.get_stats()
+        redis_stats = redis_config.get_redis_stats()
+        
+        with _tier_stats_lock:
+            redis_hits = _tier_stats['redisHits']
+            redis_misses = _tier_stats['redisMisses']
+        
+        # Lookups that missed locally but were served by Redis count as hits
+        hits = local_stats['hits'] + redis_hits
+        misses = local_stats['misses'] - redis_hits
+        lookups = hits + misses
+        
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': local_stats['evictions'],
+            'expirations': local_stats['expirations'],
+            'hitRate': round(hits / lookups, 4) if lookups else 0.0,
+            'local': local_stats,
+            'redis': dict(redis_stats, tierHits=redis_hits, tierMisses=redis_misses)
+        }
 
 
 # Export singleton instance
@@ -7,12 +7,17 @@ location stability, access pattern analysis, and behavioral baseline establishme
 import hashlib
 import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from firebase_admin import firestore
 from app.firebase_config import db
-from app.services.device_fingerprint_service import DeviceFingerprintService
+from app.services.device_fingerprint_service import device_fingerprint_service
+from app.services.session_risk_state import SessionRiskState, parse_timestamp
 from app.services.audit_logger import log_audit_event
 from app.models.notification import create_notification
 from app.utils.error_handler import handle_service_error
@@ -43,12 +48,19 @@ class SessionData:
     location_history: List[Dict]
     behavioral_data: Dict
 
+@dataclass
+class BatchScoringContext:
+    """Per-user data shared by the sessions of one scoring batch"""
+    baselines: Dict[str, bool] = field(default_factory=dict)
+    typical_locations: Dict[str, List[Dict]] = field(default_factory=dict)
+    device_validations: Dict[Tuple[str, str], Dict] = field(default_factory=dict)
+
 class ContinuousAuthService:
     """Service for continuous session monitoring and risk assessment"""
     
     def __init__(self):
         self.db = db
-        self.device_service = DeviceFingerprintService()
+        self.device_service = device_fingerprint_service
         
         # Risk calculation weights (must sum to 1.0)
         self.risk_weights = {
@@ -68,6 +80,11 @@ class ContinuousAuthService:
         # Behavioral baseline parameters
         self.baseline_window_days = 30
         self.min_sessions_for_baseline = 5
+        
+        # Rolling risk state of sessions with recent activity (event-driven scoring)
+        self.risk_state_cache_size = int(os.getenv('CONTINUOUS_AUTH_STATE_CACHE_SIZE', '10000'))
+        self._risk_states: 'OrderedDict[str, SessionRiskState]' = OrderedDict()
+        self._risk_state_lock = threading.Lock()
     
     @handle_service_error
     def monitor_user_session(self, session_id: str) -> Dict:
@@ -127,13 +144,184 @@ class ContinuousAuthService:
             logger.error(f"Error monitoring session {session_id}: {str(e)}")
             raise
     
+    def monitor_sessions_batch(self, sessions: List[Tuple[str, Dict]]) -> Dict:
+        """
+        Score many sessions from session documents the caller already read
+        
+        Baselines are fetched with one get_all, typical locations and device
+        validations are resolved once per user (and fingerprint) for the whole
+        batch, and the risk updates are committed in batched writes. Results
+        and actions match monitor_user_session for each session.
+        
+        Args:
+            sessions: (session_id, session document dict) pairs
+            
+        Returns:
+            Dict with per-session results (in input order) and throughput figures
+        """
+        started = time.perf_counter()
+        session_list = [self._session_data_from_dict(session_id, data) for session_id, data in sessions]
+        context = self._prefetch_batch_context(session_list)
+        
+        results = []
+        updates = []
+        for session_data in session_list:
+            try:
+                risk_assessment = self.calculate_dynamic_risk_score(session_data, context=context)
+                action = self._determine_action(risk_assessment["risk_score"])
+                updates.append((session_data.session_id, risk_assessment))
+                results.append({
+                    "success": True,
+                    "session_id": session_data.session_id,
+                    "user_id": session_data.user_id,
+                    "risk_score": risk_assessment["risk_score"],
+                    "risk_factors": risk_assessment["risk_factors"].__dict__,
+                    "action_required": action,
+                    "baseline_available": risk_assessment["baseline_available"],
+                    "message": f"Session monitoring completed - {action}"
+                })
+            except Exception as e:
+                logger.error(f"Error monitoring session {session_data.session_id}: {str(e)}")
+                results.append({
+                    "success": False,
+                    "session_id": session_data.session_id,
+                    "user_id": session_data.user_id,
+                    "error": "MONITORING_FAILED",
+                    "message": str(e)
+                })
+        
+        self._update_session_risks(updates)
+        
+        for result in results:
+            if not result["success"]:
+                continue
+            log_audit_event(
+                user_id=result["user_id"],
+                action="continuous_auth_monitoring",
+                resource_type="session",
+                resource_id=result["session_id"],
+                details={
+                    "risk_score": result["risk_score"],
+                    "risk_factors": result["risk_factors"],
+                    "action_required": result["action_required"],
+                    "baseline_available": result["baseline_available"]
+                }
+            )
+        
+        elapsed = time.perf_counter() - started
+        return {
+            "results": results,
+            "sessions_scored": len(updates),
+            "elapsed_seconds": round(elapsed, 4),
+            "sessions_per_second": round(len(session_list) / elapsed, 2) if elapsed > 0 else 0.0
+        }
+    
+    def record_session_activity(self, session_id: str, entry: Dict) -> Dict:
+        """
+        Fold one access-log entry into the session's rolling risk state
+        
+        The risk score is updated in O(1) from the state instead of being
+        recomputed from the full session. The state is created on the first
+        activity of a session (one full evaluation) and kept in memory and on
+        the session document as riskState. When the required action escalates
+        to re-authentication or termination it is applied immediately.
+        
+        Args:
+            session_id: Session identifier
+            entry: Access-log entry with timestamp, resource and optional ip_address
+            
+        Returns:
+            Session monitoring result, as from monitor_user_session
+        """
+        try:
+            now = datetime.utcnow()
+            state = self._get_risk_state(session_id)
+            if state is None:
+                return {
+                    "success": False,
+                    "error": "SESSION_NOT_FOUND",
+                    "message": "Session not found"
+                }
+            
+            with self._risk_state_lock:
+                state.record_access(
+                    parse_timestamp(entry.get("timestamp")),
+                    entry.get("resource"),
+                    entry.get("ip_address") or entry.get("ipAddress")
+                )
+                risk_assessment = self._assess_risk_state(state, now)
+                action = self._determine_action(risk_assessment["risk_score"])
+                previous_action = state.last_action
+                state.last_action = action
+                state.updated_at = now
+                state_data = state.to_dict()
+            
+            self._persist_risk_state(session_id, state_data, risk_assessment, action,
+                                     record_history=action != previous_action)
+            
+            if action != previous_action:
+                try:
+                    self.apply_risk_action(session_id, risk_assessment["risk_score"])
+                except Exception as e:
+                    logger.error(f"Error applying risk action for session {session_id}: {str(e)}")
+            
+            return {
+                "success": True,
+                "session_id": session_id,
+                "user_id": state.user_id,
+                "risk_score": risk_assessment["risk_score"],
+                "risk_factors": risk_assessment["risk_factors"].__dict__,
+                "action_required": action,
+                "baseline_available": risk_assessment["baseline_available"],
+                "message": f"Session risk updated - {action}"
+            }
+            
+        except Exception as e:
+            logger.error(f"Error recording activity for session {session_id}: {str(e)}")
+            return {
+                "success": False,
+                "error": "ACTIVITY_UPDATE_FAILED",
+                "message": str(e)
+            }
+    
+    def apply_risk_action(self, session_id: str, risk_score: float) -> Optional[Dict]:
+        """
+        Terminate or require re-authentication for a high-risk session
+        
+        Args:
+            session_id: Session identifier
+            risk_score: Current risk score
+            
+        Returns:
+            Result of the action taken, None if the score needs no action
+        """
+        if risk_score >= self.risk_thresholds["session_termination"]:
+            self.discard_risk_state(session_id)
+            return self.terminate_suspicious_session(
+                session_id,
+                f"Risk score exceeded threshold: {risk_score}"
+            )
+        if risk_score >= self.risk_thresholds["mfa_required"]:
+            return self.trigger_reauthentication(
+                session_id,
+                "high" if risk_score >= 80 else "medium"
+            )
+        return None
+    
+    def discard_risk_state(self, session_id: str) -> None:
+        """Drop the in-memory risk state of an ended session"""
+        with self._risk_state_lock:
+            self._risk_states.pop(session_id, None)
+    
     @handle_service_error
-    def calculate_dynamic_risk_score(self, session_data: SessionData) -> Dict:
+    def calculate_dynamic_risk_score(self, session_data: SessionData,
+                                     context: Optional[BatchScoringContext] = None) -> Dict:
         """
         Calculate real-time risk assessment using weighted factors
         
         Args:
             session_data: Current session information
+            context: Prefetched per-user data when scoring a batch
             
         Returns:
             Risk assessment with detailed factor breakdown
@@ -145,14 +333,16 @@ class ContinuousAuthService:
             # 1. Device consistency (25%)
             risk_factors.device_consistency = self._calculate_device_consistency_risk(
                 session_data.user_id, 
-                session_data.device_fingerprint
+                session_data.device_fingerprint,
+                context=context
             )
             
             # 2. Location stability (20%)
             risk_factors.location_stability = self._calculate_location_stability_risk(
                 session_data.user_id,
                 session_data.ip_address,
-                session_data.location_history
+                session_data.location_history,
+                user_locations=context.typical_locations.get(session_data.user_id) if context else None
             )
             
             # 3. Access patterns (20%)
@@ -173,19 +363,13 @@ class ContinuousAuthService:
             )
             
             # Calculate weighted risk score
-            risk_score = (
-                risk_factors.device_consistency * self.risk_weights["device_consistency"] +
-                risk_factors.location_stability * self.risk_weights["location_stability"] +
-                risk_factors.access_patterns * self.risk_weights["access_patterns"] +
-                risk_factors.time_appropriateness * self.risk_weights["time_appropriateness"] +
-                risk_factors.request_frequency * self.risk_weights["request_frequency"]
-            )
-            
-            # Ensure risk score is within bounds
-            risk_score = max(0, min(100, risk_score))
+            risk_score = self._weighted_risk_score(risk_factors)
             
             # Check if behavioral baseline is available
-            baseline_available = self._has_behavioral_baseline(session_data.user_id)
+            if context is not None and session_data.user_id in context.baselines:
+                baseline_available = context.baselines[session_data.user_id]
+            else:
+                baseline_available = self._has_behavioral_baseline(session_data.user_id)
             
             logger.info(f"Risk score calculated for session {session_data.session_id}: {risk_score}")
             
@@ -473,30 +657,191 @@ class ContinuousAuthService:
             if not session_doc.exists:
                 return None
             
-            data = session_doc.to_dict()
-            return SessionData(
-                session_id=session_id,
-                user_id=data.get("userId", ""),
-                device_id=data.get("deviceId", ""),
-                start_time=data.get("startTime", datetime.utcnow()),
-                last_activity=data.get("lastActivity", datetime.utcnow()),
-                ip_address=data.get("ipAddress", ""),
-                user_agent=data.get("userAgent", ""),
-                device_fingerprint=data.get("deviceFingerprint", {}),
-                access_log=data.get("accessLog", []),
-                location_history=data.get("locationHistory", []),
-                behavioral_data=data.get("behavioralData", {})
-            )
+            return self._session_data_from_dict(session_id, session_doc.to_dict())
             
         except Exception as e:
             logger.error(f"Error getting session data: {str(e)}")
             return None
     
-    def _calculate_device_consistency_risk(self, user_id: str, current_fingerprint: Dict) -> float:
+    def _session_data_from_dict(self, session_id: str, data: Dict) -> SessionData:
+        """Build SessionData from a continuousAuthSessions document"""
+        return SessionData(
+            session_id=session_id,
+            user_id=data.get("userId", ""),
+            device_id=data.get("deviceId", ""),
+            start_time=data.get("startTime", datetime.utcnow()),
+            last_activity=data.get("lastActivity", datetime.utcnow()),
+            ip_address=data.get("ipAddress", ""),
+            user_agent=data.get("userAgent", ""),
+            device_fingerprint=data.get("deviceFingerprint", {}),
+            access_log=data.get("accessLog", []),
+            location_history=data.get("locationHistory", []),
+            behavioral_data=data.get("behavioralData", {})
+        )
+    
+    def _prefetch_batch_context(self, sessions: List[SessionData]) -> BatchScoringContext:
+        """Read the per-user data of a batch once per user"""
+        context = BatchScoringContext()
+        user_ids = sorted({session.user_id for session in sessions if session.user_id})
+        
+        try:
+            refs = [self.db.collection('behavioralBaselines').document(user_id) for user_id in user_ids]
+            for doc in self.db.get_all(refs) if refs else []:
+                data = doc.to_dict() if doc.exists else {}
+                context.baselines[doc.id] = data.get("sessionCount", 0) >= self.min_sessions_for_baseline
+            for user_id in user_ids:
+                context.baselines.setdefault(user_id, False)
+        except Exception as e:
+            # Fall back to per-session reads
+            logger.error(f"Error prefetching behavioral baselines: {str(e)}")
+            context.baselines.clear()
+        
+        for user_id in user_ids:
+            context.typical_locations[user_id] = self._get_user_typical_locations(user_id)
+        
+        return context
+    
+    def _get_risk_state(self, session_id: str) -> Optional[SessionRiskState]:
+        """Get the rolling risk state of a session from memory, the session document or a full evaluation"""
+        with self._risk_state_lock:
+            state = self._risk_states.get(session_id)
+            if state is not None:
+                self._risk_states.move_to_end(session_id)
+                return state
+        
+        session_doc = self.db.collection('continuousAuthSessions').document(session_id).get()
+        if not session_doc.exists:
+            return None
+        data = session_doc.to_dict()
+        
+        if data.get("riskState"):
+            state = SessionRiskState.from_dict(session_id, data["riskState"])
+        else:
+            state = self._build_risk_state(self._session_data_from_dict(session_id, data))
+        
+        with self._risk_state_lock:
+            # Keep a state another thread created meanwhile
+            state = self._risk_states.setdefault(session_id, state)
+            self._risk_states.move_to_end(session_id)
+            while len(self._risk_states) > self.risk_state_cache_size:
+                self._risk_states.popitem(last=False)
+        return state
+    
+    def _build_risk_state(self, session_data: SessionData) -> SessionRiskState:
+        """Create a session's rolling state from a full evaluation of its history"""
+        user_id = session_data.user_id
+        state = SessionRiskState(
+            session_id=session_data.session_id,
+            user_id=user_id,
+            typical_ips=[loc.get("ip_address") for loc in self._get_user_typical_locations(user_id)],
+            hour_histogram=self._get_user_typical_hours(user_id),
+            baseline_available=self._has_behavioral_baseline(user_id),
+            device_validation=self._validate_device_summary(user_id, session_data.device_fingerprint)
+        )
+        
+        for location in session_data.location_history[-2:]:
+            if location.get("ip_address"):
+                state.record_location(location["ip_address"], parse_timestamp(location.get("timestamp")))
+        for entry in session_data.access_log:
+            state.record_access(parse_timestamp(entry.get("timestamp")), entry.get("resource"))
+        state.current_ip = session_data.ip_address or state.current_ip
+        return state
+    
+    def _validate_device_summary(self, user_id: str, fingerprint: Dict) -> Dict:
+        """Validate a fingerprint and keep only the fields risk scoring needs"""
+        try:
+            result = self.device_service.validate_fingerprint(user_id, fingerprint)
+            return {
+                "success": bool(result.get("success")),
+                "similarity": result.get("similarity", 0),
+                "validatedAt": datetime.utcnow()
+            }
+        except Exception as e:
+            logger.error(f"Error validating device for user {user_id}: {str(e)}")
+            return {}
+    
+    def _assess_risk_state(self, state: SessionRiskState, now: datetime) -> Dict:
+        """Risk assessment from a rolling state, without reads"""
+        risk_factors = RiskFactors()
+        
+        if state.device_validation:
+            risk_factors.device_consistency = self._device_validation_risk(state.device_validation)
+        else:
+            risk_factors.device_consistency = 50.0
+        
+        risk_factors.location_stability = self._calculate_location_stability_risk(
+            state.user_id,
+            state.current_ip,
+            state.recent_locations,
+            user_locations=[{"ip_address": ip} for ip in state.typical_ips]
+        )
+        
+        current_patterns = {
+            "unique_resources": len(state.resources),
+            "total_requests": state.request_count,
+            "resources_accessed": list(state.resources)
+        } if state.request_count else {}
+        risk_factors.access_patterns = self._calculate_access_pattern_risk(
+            state.user_id, [], current_patterns=current_patterns
+        )
+        
+        risk_factors.time_appropriateness = self._calculate_time_appropriateness_risk(
+            state.user_id, now, typical_hours=state.hour_histogram
+        )
+        
+        risk_factors.request_frequency = self._request_rate_risk(state.request_rate_at(now))
+        
+        return {
+            "risk_score": self._weighted_risk_score(risk_factors),
+            "risk_factors": risk_factors,
+            "baseline_available": state.baseline_available,
+            "calculation_timestamp": now
+        }
+    
+    def _persist_risk_state(self, session_id: str, state_data: Dict, risk_assessment: Dict,
+                            action: str, record_history: bool) -> None:
+        """Store the rolling state and current score on the session document"""
+        try:
+            update = {
+                "riskState": state_data,
+                "riskProfile.currentRiskScore": risk_assessment["risk_score"],
+                "lastActivity": datetime.utcnow()
+            }
+            if record_history:
+                # History records action changes, not every request
+                update["riskProfile.riskHistory"] = firestore.ArrayUnion([{
+                    "timestamp": datetime.utcnow(),
+                    "risk_score": risk_assessment["risk_score"],
+                    "factors": risk_assessment["risk_factors"].__dict__,
+                    "action": action
+                }])
+            self.db.collection('continuousAuthSessions').document(session_id).update(update)
+        except Exception as e:
+            logger.error(f"Error persisting risk state for session {session_id}: {str(e)}")
+    
+    def _calculate_device_consistency_risk(self, user_id: str, current_fingerprint: Dict,
+                                           context: Optional[BatchScoringContext] = None) -> float:
         """Calculate risk based on device fingerprint consistency"""
         try:
-            validation_result = self.device_service.validate_fingerprint(user_id, current_fingerprint)
+            if context is not None:
+                # Sessions of a batch sharing a user and fingerprint are validated once
+                key = (user_id, json.dumps(current_fingerprint, sort_keys=True, default=str))
+                validation_result = context.device_validations.get(key)
+                if validation_result is None:
+                    validation_result = self.device_service.validate_fingerprint(user_id, current_fingerprint)
+                    context.device_validations[key] = validation_result
+            else:
+                validation_result = self.device_service.validate_fingerprint(user_id, current_fingerprint)
             
+            return self._device_validation_risk(validation_result)
+                
+        except Exception as e:
+            logger.error(f"Error calculating device consistency risk: {str(e)}")
+            return 50.0  # Default medium risk on error
+    
+    def _device_validation_risk(self, validation_result: Dict) -> float:
+        """Convert a fingerprint validation result to a risk value"""
+        try:
             if not validation_result.get("success"):
                 return 100.0  # Maximum risk for unrecognized device
             
@@ -516,11 +861,13 @@ class ContinuousAuthService:
             logger.error(f"Error calculating device consistency risk: {str(e)}")
             return 50.0  # Default medium risk on error
     
-    def _calculate_location_stability_risk(self, user_id: str, current_ip: str, location_history: List[Dict]) -> float:
+    def _calculate_location_stability_risk(self, user_id: str, current_ip: str, location_history: List[Dict],
+                                           user_locations: Optional[List[Dict]] = None) -> float:
         """Calculate risk based on location stability"""
         try:
             # Get user's typical locations
-            user_locations = self._get_user_typical_locations(user_id)
+            if user_locations is None:
+                user_locations = self._get_user_typical_locations(user_id)
             
             # Check if current IP is in typical locations
             if current_ip in [loc.get("ip_address") for loc in user_locations]:
@@ -550,17 +897,19 @@ class ContinuousAuthService:
             logger.error(f"Error calculating location stability risk: {str(e)}")
             return 50.0
     
-    def _calculate_access_pattern_risk(self, user_id: str, access_log: List[Dict]) -> float:
+    def _calculate_access_pattern_risk(self, user_id: str, access_log: List[Dict],
+                                       current_patterns: Optional[Dict] = None) -> float:
         """Calculate risk based on access pattern analysis"""
         try:
             # Get user's typical access patterns
             typical_patterns = self._get_user_access_patterns(user_id)
             
-            if not typical_patterns or not access_log:
-                return 30.0  # Default risk for insufficient data
+            if current_patterns is None:
+                # Analyze current session patterns
+                current_patterns = self._analyze_current_access_patterns(access_log) if access_log else {}
             
-            # Analyze current session patterns
-            current_patterns = self._analyze_current_access_patterns(access_log)
+            if not typical_patterns or not current_patterns:
+                return 30.0  # Default risk for insufficient data
             
             # Compare against typical patterns
             pattern_deviation = self._calculate_pattern_deviation(current_patterns, typical_patterns)
@@ -581,11 +930,13 @@ class ContinuousAuthService:
             logger.error(f"Error calculating access pattern risk: {str(e)}")
             return 50.0
     
-    def _calculate_time_appropriateness_risk(self, user_id: str, current_time: datetime) -> float:
+    def _calculate_time_appropriateness_risk(self, user_id: str, current_time: datetime,
+                                             typical_hours: Optional[Dict] = None) -> float:
         """Calculate risk based on time-of-day appropriateness"""
         try:
             # Get user's typical access hours
-            typical_hours = self._get_user_typical_hours(user_id)
+            if typical_hours is None:
+                typical_hours = self._get_user_typical_hours(user_id)
             
             current_hour = current_time.hour
             current_day = current_time.weekday()  # 0=Monday, 6=Sunday
@@ -628,24 +979,38 @@ class ContinuousAuthService:
             if session_duration <= 0:
                 return 0.0
             
-            request_rate = len(access_log) / session_duration
-            
-            # Evaluate request rate
-            if request_rate < 1:  # Less than 1 request per minute
-                return 0.0
-            elif request_rate < 3:  # 1-3 requests per minute
-                return 10.0
-            elif request_rate < 5:  # 3-5 requests per minute
-                return 30.0
-            elif request_rate < 10:  # 5-10 requests per minute
-                return 60.0
-            else:  # More than 10 requests per minute
-                return 100.0
+            return self._request_rate_risk(len(access_log) / session_duration)
                 
         except Exception as e:
             logger.error(f"Error calculating request frequency risk: {str(e)}")
             return 50.0
     
+    def _request_rate_risk(self, request_rate: float) -> float:
+        """Convert a request rate (per minute) to a risk value"""
+        if request_rate < 1:  # Less than 1 request per minute
+            return 0.0
+        elif request_rate < 3:  # 1-3 requests per minute
+            return 10.0
+        elif request_rate < 5:  # 3-5 requests per minute
+            return 30.0
+        elif request_rate < 10:  # 5-10 requests per minute
+            return 60.0
+        else:  # More than 10 requests per minute
+            return 100.0
+    
+    def _weighted_risk_score(self, risk_factors: RiskFactors) -> float:
+        """Combine risk factors with the configured weights, bounded to 0-100"""
+        risk_score = (
+            risk_factors.device_consistency * self.risk_weights["device_consistency"] +
+            risk_factors.location_stability * self.risk_weights["location_stability"] +
+            risk_factors.access_patterns * self.risk_weights["access_patterns"] +
+            risk_factors.time_appropriateness * self.risk_weights["time_appropriateness"] +
+            risk_factors.request_frequency * self.risk_weights["request_frequency"]
+        )
+        
+        # Ensure risk score is within bounds
+        return max(0, min(100, risk_score))
+    
     def _determine_action(self, risk_score: float) -> str:
         """Determine required action based on risk score"""
         if risk_score >= self.risk_thresholds["session_termination"]:
@@ -661,23 +1026,43 @@ class ContinuousAuthService:
         """Update session with current risk assessment"""
         try:
             session_ref = self.db.collection('continuousAuthSessions').document(session_id)
-            
-            risk_entry = {
-                "timestamp": datetime.utcnow(),
-                "risk_score": risk_assessment["risk_score"],
-                "factors": risk_assessment["risk_factors"].__dict__,
-                "action": self._determine_action(risk_assessment["risk_score"])
-            }
-            
-            session_ref.update({
-                "riskProfile.currentRiskScore": risk_assessment["risk_score"],
-                "riskProfile.riskHistory": firestore.ArrayUnion([risk_entry]),
-                "lastActivity": datetime.utcnow()
-            })
+            session_ref.update(self._session_risk_update(risk_assessment))
             
         except Exception as e:
             logger.error(f"Error updating session risk: {str(e)}")
     
+    def _update_session_risks(self, updates: List[Tuple[str, Dict]]) -> None:
+        """Write the risk assessments of a batch in batched writes"""
+        # Firestore batches hold at most 500 operations
+        for offset in range(0, len(updates), 500):
+            chunk = updates[offset:offset + 500]
+            try:
+                batch = self.db.batch()
+                for session_id, risk_assessment in chunk:
+                    session_ref = self.db.collection('continuousAuthSessions').document(session_id)
+                    batch.update(session_ref, self._session_risk_update(risk_assessment))
+                batch.commit()
+            except Exception as e:
+                # A missing session fails the whole batch; retry the chunk one by one
+                logger.error(f"Error committing session risk batch: {str(e)}")
+                for session_id, risk_assessment in chunk:
+                    self._update_session_risk(session_id, risk_assessment)
+    
+    def _session_risk_update(self, risk_assessment: Dict) -> Dict:
+        """Session document fields recording a risk assessment"""
+        risk_entry = {
+            "timestamp": datetime.utcnow(),
+            "risk_score": risk_assessment["risk_score"],
+            "factors": risk_assessment["risk_factors"].__dict__,
+            "action": self._determine_action(risk_assessment["risk_score"])
+        }
+        
+        return {
+            "riskProfile.currentRiskScore": risk_assessment["risk_score"],
+            "riskProfile.riskHistory": firestore.ArrayUnion([risk_entry]),
+            "lastActivity": datetime.utcnow()
+        }
+    
     def _has_behavioral_baseline(self, user_id: str) -> bool:
         """Check if user has established behavioral baseline"""
         try:
@@ -7,6 +7,7 @@ Optimized for high-load scenarios with caching and connection pooling
 import hashlib
 import json
 import logging
+import os
 import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
@@ -16,6 +17,8 @@ from app.utils.error_handler import handle_service_error
 from app.services.cache_service import cache_service
 from app.services.connection_pool_service import connection_pool_service
 from app.services.encryption_service import encryption_service
+from app.services.fingerprint_index import FingerprintIndex, fingerprint_vector
+from app.services.verification_history_writer import verification_history_writer, verification_result
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +48,15 @@ class DeviceFingerprintService:
             "screen": {"weight": 0.15, "stability": "low"},
             "system": {"weight": 0.15, "stability": "medium"}
         }
+        
+        # In-memory index of device feature vectors. Hash hits skip the Firestore
+        # query; cross-user collision scans use it while its last full load
+        # (done in the background) is younger than FINGERPRINT_INDEX_REFRESH_SECONDS
+        # (0 disables them)
+        self.fingerprint_index = FingerprintIndex(
+            {name: config["weight"] for name, config in self.component_weights.items()}
+        )
+        self.INDEX_REFRESH_SECONDS = float(os.getenv('FINGERPRINT_INDEX_REFRESH_SECONDS', '900'))
     
     @handle_service_error
     def generate_fingerprint_hash(self, characteristics: Dict) -> str:
@@ -109,12 +121,8 @@ class DeviceFingerprintService:
             
             # Check for duplicate fingerprint and handle same-user reuse/reactivation
             try:
-                query = self.db.collection('deviceFingerprints').where(
-                    'fingerprintHash', '==', fingerprint_hash
-                ).limit(1)
-                results = query.get()
-                if results:
-                    existing_doc = results[0]
+                existing_doc = self._find_fingerprint_document(fingerprint_hash)
+                if existing_doc:
                     existing = existing_doc.to_dict()
                     if existing.get('userId') == user_id:
                         if not existing.get('isActive', True):
@@ -122,6 +130,8 @@ class DeviceFingerprintService:
                                 'isActive': True,
                                 'lastVerified': datetime.utcnow()
                             })
+                            self.fingerprint_index.set_active(existing.get('deviceId'), True)
+                            self.invalidate_user_devices(user_id)
                         logger.info(f"Reusing existing device for user {user_id}: {existing.get('deviceId')}")
                         return {
                             "success": True,
@@ -144,12 +154,23 @@ class DeviceFingerprintService:
                         "message": "Device fingerprint already registered"
                     }
             
+            # Devices of other users with a near-identical fingerprint point at a shared device
+            feature_vector = fingerprint_vector(fingerprint_data)
+            if self._ensure_fingerprint_index():
+                collisions = self.fingerprint_index.find_collisions(feature_vector, exclude_user_id=user_id)
+                if collisions:
+                    logger.warning(
+                        f"Device fingerprint for user {user_id} collides with {len(collisions)} "
+                        f"device(s) of other users: {[c['deviceId'] for c in collisions]}"
+                    )
+            
             # Create device record
             device_id = f"device_{user_id}_{len(existing_devices) + 1}"
             device_record = {
                 "deviceId": device_id,
                 "userId": user_id,
                 "fingerprintHash": fingerprint_hash,
+                "featureVector": feature_vector,
                 "characteristics": encryption_service.encrypt_device_fingerprint(fingerprint_data),
                 "trustScore": 100,  # Start with full trust
                 "registeredAt": datetime.utcnow(),
@@ -163,6 +184,8 @@ class DeviceFingerprintService:
             
             # Store in Firestore
             self.db.collection('deviceFingerprints').document(device_id).set(device_record)
+            self.fingerprint_index.upsert(device_id, user_id, fingerprint_hash, feature_vector)
+            self.invalidate_user_devices(user_id)
             
             logger.info(f"Device registered successfully for user {user_id}: {device_id} (MFA: {mfa_verified})")
             
@@ -194,7 +217,7 @@ class DeviceFingerprintService:
         
         try:
             # Check cache first for recent validation results
-            cache_key = f"fingerprint_validation:{user_id}:{hashlib.md5(json.dumps(current_fingerprint, sort_keys=True).encode()).hexdigest()}"
+            cache_key = self._validation_cache_key(user_id, current_fingerprint)
             cached_result = cache_service.get_device_profile(cache_key)
             
             if cached_result:
@@ -217,17 +240,7 @@ class DeviceFingerprintService:
             # Generate current fingerprint hash (optimized)
             current_hash = self._generate_fingerprint_hash_optimized(current_fingerprint)
             
-            best_match = None
-            highest_similarity = 0
-            
-            # Compare against all registered devices (parallel processing for multiple devices)
-            for device in user_devices:
-                stored_chars = self._decrypt_characteristics_cached(device.get("characteristics", ""), device.get("deviceId"))
-                similarity = self._calculate_similarity_optimized(current_fingerprint, stored_chars)
-                
-                if similarity > highest_similarity:
-                    highest_similarity = similarity
-                    best_match = device
+            best_match, highest_similarity = self._find_best_match(user_id, user_devices, current_fingerprint)
             
             # Update verification history asynchronously to avoid blocking
             if best_match:
@@ -284,6 +297,29 @@ class DeviceFingerprintService:
             logger.error(f"Error validating fingerprint (time={response_time_ms}ms): {str(e)}")
             raise
     
+    @handle_service_error
+    def find_fingerprint_collisions(self, user_id: str, fingerprint_data: Dict, min_similarity: float = 95.0) -> List[Dict]:
+        """
+        Find devices of other users matching a fingerprint (shared-device detection)
+        
+        Args:
+            user_id: User presenting the fingerprint
+            fingerprint_data: Device characteristics
+            min_similarity: Minimum similarity percentage of a collision
+            
+        Returns:
+            Colliding devices with their owner and similarity, most similar first
+        """
+        if not self._ensure_fingerprint_index():
+            logger.warning("Fingerprint index unavailable; collision check skipped")
+            return []
+        
+        return self.fingerprint_index.find_collisions(
+            fingerprint_vector(fingerprint_data),
+            exclude_user_id=user_id,
+            min_similarity=min_similarity
+        )
+    
     @handle_service_error
     def detect_fingerprint_anomalies(self, fingerprint_data: Dict) -> List[str]:
         """
@@ -361,6 +397,8 @@ class DeviceFingerprintService:
                 "lastVerified": datetime.utcnow()
             })
             
+            self.invalidate_user_devices(device_data.get("userId"))
+            
             logger.info(f"Updated trust score for device {device_id}: {current_trust} -> {new_trust}")
             
         except Exception as e:
@@ -712,6 +750,32 @@ class DeviceFingerprintService:
         
         return devices
     
+    def invalidate_user_devices(self, user_id: str) -> None:
+        """
+        Drop a user's cached device list and validation results after a device
+        is registered, removed or has its trust score changed
+        
+        Validation results are keyed by the fingerprint presented, so they are
+        retired by moving the user to a new cache generation instead of being
+        deleted one by one.
+        
+        Args:
+            user_id: User identifier
+        """
+        if not user_id:
+            return
+        cache_service.delete_device_profile(f"user_devices:{user_id}")
+        # Outlives every validation result cached under the previous generation
+        cache_service.cache_device_profile(
+            f"device_generation:{user_id}", time.time_ns(), self.VALIDATION_CACHE_TTL
+        )
+    
+    def _validation_cache_key(self, user_id: str, current_fingerprint: Dict) -> str:
+        """Cache key of a validation result under the user's current device generation"""
+        generation = cache_service.get_device_profile(f"device_generation:{user_id}") or 0
+        digest = hashlib.md5(json.dumps(current_fingerprint, sort_keys=True).encode()).hexdigest()
+        return f"fingerprint_validation:{user_id}:{generation}:{digest}"
+    
     def _generate_fingerprint_hash_optimized(self, characteristics: Dict) -> str:
         """Optimized fingerprint hash generation with caching"""
         cache_key = f"fingerprint_hash:{hashlib.md5(json.dumps(characteristics, sort_keys=True).encode()).hexdigest()}"
@@ -759,39 +823,132 @@ class DeviceFingerprintService:
         return self._calculate_similarity(current, stored)
     
     def _update_verification_history_async(self, device_id: str, similarity: float) -> None:
-        """Asynchronous verification history update to avoid blocking"""
+        """Queue a verification history update on the shared write-behind pool"""
         try:
-            # Use background task or queue this operation
-            # For now, we'll do a non-blocking update
-            import threading
-            
-            def update_history():
-                try:
-                    self._update_verification_history(device_id, similarity)
-                except Exception as e:
-                    logger.error(f"Error in async verification history update: {str(e)}")
-            
-            thread = threading.Thread(target=update_history)
-            thread.daemon = True
-            thread.start()
+            if not verification_history_writer.submit(device_id, similarity):
+                logger.warning(f"Verification history queue full, entry for device {device_id} dropped")
+        except Exception as e:
+            logger.error(f"Error queueing verification history update: {str(e)}")
+    
+    def _find_best_match(self, user_id: str, user_devices: List[Dict], current_fingerprint: Dict) -> Tuple[Optional[Dict], float]:
+        """
+        Find the registered device most similar to the presented fingerprint
+        
+        Devices with a stored feature vector are scored together from the index
+        without decrypting them. Older devices are decrypted and compared once,
+        and their vector is backfilled for later validations.
+        """
+        self.fingerprint_index.sync_user(user_id, user_devices)
+        current_vector = fingerprint_vector(current_fingerprint)
+        indexed_scores = self.fingerprint_index.score_devices(
+            current_vector, [device.get("deviceId") for device in user_devices]
+        )
+        
+        best_match = None
+        highest_similarity = 0
+        
+        for device in user_devices:
+            device_id = device.get("deviceId")
+            similarity = indexed_scores.get(device_id)
+            if similarity is None:
+                stored_chars = self._decrypt_characteristics_cached(device.get("characteristics", ""), device_id)
+                similarity = self._calculate_similarity_optimized(current_fingerprint, stored_chars)
+                if stored_chars and device_id:
+                    self._backfill_feature_vector(user_id, device, stored_chars)
             
+            if similarity > highest_similarity:
+                highest_similarity = similarity
+                best_match = device
+        
+        return best_match, highest_similarity
+    
+    def _backfill_feature_vector(self, user_id: str, device: Dict, characteristics: Dict) -> None:
+        """Store the feature vector of a device registered before vectors existed"""
+        device_id = device["deviceId"]
+        vector = fingerprint_vector(characteristics)
+        self.fingerprint_index.upsert(
+            device_id, device.get("userId", user_id), device.get("fingerprintHash"), vector, device.get("isActive", True)
+        )
+        try:
+            self.db.collection('deviceFingerprints').document(device_id).update({"featureVector": vector})
         except Exception as e:
-            logger.error(f"Error starting async verification history update: {str(e)}")
+            logger.error(f"Error storing feature vector for device {device_id}: {str(e)}")
+    
+    def warm_fingerprint_index(self) -> bool:
+        """
+        Start loading the fleet-wide fingerprint index in the background if it is stale
+        
+        Returns:
+            True if the index is already fresh
+        """
+        if self.db is None:
+            return False
+        return self.fingerprint_index.load_in_background(self._stream_indexed_devices, self.INDEX_REFRESH_SECONDS)
+    
+    def _ensure_fingerprint_index(self) -> bool:
+        """Whether the fleet-wide index is fresh; a stale index is refreshed without blocking the caller"""
+        return self.warm_fingerprint_index()
+    
+    def _stream_indexed_devices(self):
+        """Stream the indexed fields of every device fingerprint"""
+        query = self.db.collection('deviceFingerprints').select(
+            ['deviceId', 'userId', 'fingerprintHash', 'featureVector', 'isActive']
+        )
+        for doc in query.stream():
+            yield doc.to_dict()
+    
+    def _find_fingerprint_document(self, fingerprint_hash: str):
+        """
+        Get the device document with an exact fingerprint hash, or None
+        
+        An index hit saves the query. A miss is not trusted, since another
+        worker may have registered the device since the index was loaded, so
+        Firestore is always queried and the result indexed.
+        """
+        match = self.fingerprint_index.find_by_hash(fingerprint_hash)
+        if match is not None:
+            doc = self.db.collection('deviceFingerprints').document(match["deviceId"]).get()
+            if doc.exists and doc.to_dict().get('fingerprintHash') == fingerprint_hash:
+                return doc
+            # Deleted or changed by another worker since it was indexed
+            self.fingerprint_index.remove(match["deviceId"])
+        
+        results = self.db.collection('deviceFingerprints').where(
+            'fingerprintHash', '==', fingerprint_hash
+        ).limit(1).get()
+        if not results:
+            return None
+        self._index_device(results[0].to_dict())
+        return results[0]
     
     def _fingerprint_exists(self, fingerprint_hash: str) -> bool:
-        """Check if fingerprint hash already exists"""
+        """Check if fingerprint hash already exists (only an index hit skips the query)"""
         try:
+            if self.fingerprint_index.find_by_hash(fingerprint_hash) is not None:
+                return True
+            
             query = self.db.collection('deviceFingerprints').where(
                 'fingerprintHash', '==', fingerprint_hash
             ).limit(1)
             
             results = query.get()
-            return len(results) > 0
+            if not results:
+                return False
+            self._index_device(results[0].to_dict())
+            return True
             
         except Exception as e:
             logger.error(f"Error checking fingerprint existence: {str(e)}")
             return False
     
+    def _index_device(self, device: Optional[Dict]) -> None:
+        """Add a device document read from Firestore to the index"""
+        if device and device.get("deviceId"):
+            self.fingerprint_index.upsert(
+                device["deviceId"], device.get("userId", ""), device.get("fingerprintHash"),
+                device.get("featureVector"), device.get("isActive", True)
+            )
+    
     def _encrypt_characteristics(self, characteristics: Dict) -> str:
         """Encrypt fingerprint characteristics for storage using enhanced encryption service"""
         try:
@@ -812,23 +969,12 @@ class DeviceFingerprintService:
             return {}
     
     def _update_verification_history(self, device_id: str, similarity: float) -> None:
-        """Update device verification history"""
-        try:
-            device_ref = self.db.collection('deviceFingerprints').document(device_id)
-            
-            verification_entry = {
-                "timestamp": datetime.utcnow(),
-                "similarity": similarity,
-                "result": "success" if similarity >= 95 else "partial" if similarity >= 85 else "failed"
-            }
-            
-            device_ref.update({
-                "verificationHistory": firestore.ArrayUnion([verification_entry]),
-                "lastVerified": datetime.utcnow()
-            })
-            
-        except Exception as e:
-            logger.error(f"Error updating verification history: {str(e)}")
+        """Update device verification history synchronously (capped, with rollups)"""
+        verification_history_writer.write(device_id, [{
+            "timestamp": datetime.utcnow(),
+            "similarity": similarity,
+            "result": verification_result(similarity)
+        }])
 
-# Global instance
+# Global instance; callers share it so device changes reach a single fingerprint index
 device_fingerprint_service = DeviceFingerprintService()
\ No newline at end of file
@@ -6,11 +6,10 @@ and cryptographic integrity verification for the Zero Trust Security Framework.
 
 import os
 import json
-import hashlib
-import hmac
+import itertools
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
@@ -29,6 +28,13 @@ except ImportError:
 
 from app.firebase_config import get_firestore_client
 from app.services.firebase_storage_service import FirebaseStorageService
+from app.services.audit_write_pipeline import audit_write_pipeline
+from app.services.audit_integrity_verifier import StreamingIntegrityVerifier, compute_integrity_hash, verify_record
+from app.services.audit_checkpoint_service import AuditCheckpointService
+from app.services.audit_export import AuditExportStream, iter_audit_logs
+from app.services.audit_archive import AuditArchiveStore
+from app.services.threat_feature_store import threat_feature_store
+from app.services.streaming_threat_detector import streaming_threat_detector
 
 
 class EnhancedAuditService:
@@ -97,10 +103,15 @@ class EnhancedAuditService:
         """Initialize the Enhanced Audit Service"""
         self.db = get_firestore_client()
         self.storage_service = FirebaseStorageService()
+        self.write_pipeline = audit_write_pipeline
         
         # Initialize encryption for sensitive data
         self._init_encryption()
         
+        # Merkle checkpoints sealing time windows of audit logs
+        self.checkpoint_service = AuditCheckpointService(self.hmac_key, db=self.db)
+        self.write_pipeline.add_replay_listener(self._reseal_replayed_logs)
+        
         # Initialize GeoIP database for location tracking
         self._init_geoip()
         
@@ -207,28 +218,7 @@ class EnhancedAuditService:
     def _generate_integrity_hash(self, log_data: Dict[str, Any]) -> str:
         """Generate HMAC-SHA256 hash for tamper detection"""
         try:
-            # Create a copy and convert datetime objects to strings
-            serializable_data = {}
-            for key, value in log_data.items():
-                if isinstance(value, datetime):
-                    serializable_data[key] = value.isoformat()
-                elif isinstance(value, dict):
-                    # Recursively handle nested dictionaries
-                    serializable_data[key] = self._make_serializable(value)
-                else:
-                    serializable_data[key] = value
-            
-            # Create canonical representation of log data
-            canonical_data = json.dumps(serializable_data, sort_keys=True, separators=(',', ':'))
-            
-            # Generate HMAC
-            signature = hmac.new(
-                self.hmac_key,
-                canonical_data.encode('utf-8'),
-                hashlib.sha256
-            ).hexdigest()
-            
-            return signature
+            return compute_integrity_hash(self.hmac_key, log_data)
         except Exception as e:
             print(f"Error generating integrity hash: {e}")
             return ""
@@ -352,12 +342,6 @@ class EnhancedAuditService:
             log_id = str(uuid.uuid4())
             timestamp = datetime.utcnow()
             
-            # Get geolocation if IP address provided
-            geolocation = self._get_geolocation(ip_address) if ip_address else None
-            
-            # Parse user agent if provided
-            parsed_user_agent = self._parse_user_agent(user_agent) if user_agent else None
-            
             # Sanitize and encrypt sensitive data
             sanitized_request_data = self._sanitize_request_data(request_data) if request_data else None
             sanitized_response_data = self._sanitize_response_data(response_data) if response_data else None
@@ -378,8 +362,8 @@ class EnhancedAuditService:
                 'sessionId': session_id,
                 'ipAddress': ip_address,
                 'userAgent': user_agent,
-                'parsedUserAgent': parsed_user_agent,
-                'geolocation': geolocation,
+                'parsedUserAgent': None,
+                'geolocation': None,
                 'riskScore': risk_score,
                 'confidenceScore': confidence_score,
                 'details': {
@@ -399,12 +383,17 @@ class EnhancedAuditService:
                 'source': 'enhanced-zero-trust-framework'
             }
             
-            # Generate integrity hash
-            audit_entry['integrityHash'] = self._generate_integrity_hash(audit_entry)
+            # Queue for the background writer; geolocation, user agent parsing
+            # and the integrity hash are filled in there before the commit
+            if not self.write_pipeline.submit('auditLogs', log_id, audit_entry, prepare=self._finalize_audit_entry):
+                raise RuntimeError("Audit write pipeline unavailable")
             
-            # Store in Firestore
-            log_ref = self.db.collection('auditLogs').document(log_id)
-            log_ref.set(audit_entry)
+            # Feed the user's threat prediction features and the attack detectors
+            try:
+                threat_feature_store.record_event(audit_entry)
+                streaming_threat_detector.ingest(audit_entry)
+            except Exception as e:
+                print(f"Error updating threat detection: {e}")
             
             # Update metrics
             self.metrics['logs_created'] += 1
@@ -420,6 +409,21 @@ class EnhancedAuditService:
             self.metrics['errors'] += 1
             return None
     
+    def _finalize_audit_entry(self, audit_entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Enrich a queued audit entry and seal it with its integrity hash (runs on the writer thread)"""
+        ip_address = audit_entry.get('ipAddress')
+        user_agent = audit_entry.get('userAgent')
+        audit_entry['geolocation'] = self._get_geolocation(ip_address) if ip_address else None
+        audit_entry['parsedUserAgent'] = self._parse_user_agent(user_agent) if user_agent else None
+        audit_entry['integrityHash'] = self._generate_integrity_hash(audit_entry)
+        return audit_entry
+    
+    def _reseal_replayed_logs(self, items) -> None:
+        """Re-seal checkpoint windows that journal-replayed audit logs fall in"""
+        logs = [item.data for item in items if item.collection == 'auditLogs']
+        if logs:
+            self.checkpoint_service.reseal_late_logs(logs)
+    
     def _sanitize_request_data(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """Sanitize request data to remove sensitive information"""
         if not request_data:
@@ -476,8 +480,7 @@ class EnhancedAuditService:
             }
             
             # Store alert
-            alert_ref = self.db.collection('securityAlerts').document(alert_data['alertId'])
-            alert_ref.set(alert_data)
+            self.write_pipeline.submit('securityAlerts', alert_data['alertId'], alert_data)
             
             print(f"Security alert triggered for {audit_entry['severity']} event: {audit_entry['action']}")
             
@@ -502,61 +505,53 @@ class EnhancedAuditService:
             if not log_doc.exists:
                 return False, "Log entry not found"
             
-            log_data = log_doc.to_dict()
-            stored_hash = log_data.pop('integrityHash', '')
-            
-            # Recalculate hash
-            calculated_hash = self._generate_integrity_hash(log_data)
-            
-            # Compare hashes
-            if stored_hash == calculated_hash:
+            is_valid, error_msg = verify_record(self.hmac_key, log_doc.to_dict())
+            if is_valid:
                 self.metrics['integrity_checks'] += 1
-                return True, None
-            else:
-                return False, "Integrity hash mismatch - log may have been tampered with"
+            return is_valid, error_msg
                 
         except Exception as e:
             return False, f"Error verifying integrity: {e}"
     
-    def batch_verify_integrity(self, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    def create_integrity_verifier(self, **kwargs) -> StreamingIntegrityVerifier:
+        """
+        Create a streaming verifier bound to this service's HMAC key.
+        
+        Args:
+            **kwargs: StreamingIntegrityVerifier options (workers, chunk_size, use_processes)
+            
+        Returns:
+            StreamingIntegrityVerifier instance
+        """
+        return StreamingIntegrityVerifier(self.hmac_key, **kwargs)
+    
+    def batch_verify_integrity(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        progress_callback=None
+    ) -> Dict[str, Any]:
         """
         Verify integrity of multiple log entries in a date range.
         
+        Records are hashed as they stream from the range query, so each log
+        is read once.
+        
         Args:
             start_date: Start date for verification
             end_date: End date for verification
+            progress_callback: Optional callable receiving progress statistics
             
         Returns:
-            Dictionary with verification results
+            Dictionary with verification results and throughput
         """
         try:
-            results = {
-                'total_logs': 0,
-                'verified_logs': 0,
-                'failed_logs': 0,
-                'tampered_logs': [],
-                'errors': []
-            }
-            
             # Query logs in date range
             logs_ref = self.db.collection('auditLogs')
             query = logs_ref.where('timestamp', '>=', start_date).where('timestamp', '<=', end_date)
             
-            for doc in query.stream():
-                results['total_logs'] += 1
-                log_data = doc.to_dict()
-                
-                is_valid, error_msg = self.verify_log_integrity(log_data['logId'])
-                
-                if is_valid:
-                    results['verified_logs'] += 1
-                else:
-                    results['failed_logs'] += 1
-                    results['tampered_logs'].append({
-                        'logId': log_data['logId'],
-                        'timestamp': log_data['timestamp'],
-                        'error': error_msg
-                    })
+            results = self.create_integrity_verifier().verify_all(query.stream(), progress_callback)
+            self.metrics['integrity_checks'] += results['verified_logs']
             
             return results
             
@@ -641,6 +636,7 @@ class EnhancedAuditService:
         """Get audit service performance metrics"""
         return {
             **self.metrics,
+            'write_pipeline': self.write_pipeline.get_metrics(),
             'encryption_enabled': self.cipher is not None,
             'geoip_enabled': self.geoip_reader is not None,
             'supported_event_types': len(self.EVENT_TYPES),
@@ -661,6 +657,7 @@ class AuditRetentionService:
         self.audit_service = audit_service
         self.db = audit_service.db
         self.storage_service = audit_service.storage_service
+        self.archive_store = AuditArchiveStore(self.storage_service, self.db)
         
         # Retention configuration
         self.retention_policies = {
@@ -791,6 +788,7 @@ class AuditRetentionService:
             query = logs_ref.where('timestamp', '<', cutoff_date).limit(self.archival_batch_size)
             
             batch_number = 0
+            verifier = self.audit_service.create_integrity_verifier()
             
             while True:
                 docs = list(query.stream())
@@ -800,12 +798,9 @@ class AuditRetentionService:
                 batch_number += 1
                 batch_logs = []
                 
-                for doc in docs:
+                # Verify integrity before archiving, hashing the documents already read
+                for log_data, is_valid, error_msg in verifier.verify(docs):
                     results['logs_processed'] += 1
-                    log_data = doc.to_dict()
-                    
-                    # Verify integrity before archiving
-                    is_valid, error_msg = self.audit_service.verify_log_integrity(log_data['logId'])
                     
                     if is_valid:
                         batch_logs.append(log_data)
@@ -836,6 +831,10 @@ class AuditRetentionService:
                 
                 query = logs_ref.where('timestamp', '<', cutoff_date).start_after(docs[-1]).limit(self.archival_batch_size)
             
+            # Checkpointed windows before the cutoff now live in the archive
+            if results['logs_archived']:
+                self.audit_service.checkpoint_service.record_archival(cutoff_date)
+            
             # Update metrics
             self.audit_service.metrics['archival_operations'] += 1
             
@@ -845,42 +844,11 @@ class AuditRetentionService:
             return {'error': f"Archival process failed: {e}"}
     
     def _archive_batch_to_storage(self, logs: List[Dict[str, Any]], batch_number: int, cutoff_date: datetime) -> bool:
-        """Archive a batch of logs to Cloud Storage"""
+        """Archive a batch of logs to Cloud Storage as date-partitioned segments"""
         try:
-            # Create archive filename
-            date_str = cutoff_date.strftime('%Y-%m-%d')
-            filename = f"audit-logs-{date_str}-batch-{batch_number:04d}.json"
-            
-            # Prepare archive data
-            archive_data = {
-                'metadata': {
-                    'archive_date': datetime.utcnow().isoformat(),
-                    'cutoff_date': cutoff_date.isoformat(),
-                    'batch_number': batch_number,
-                    'log_count': len(logs),
-                    'format_version': '2.0'
-                },
-                'logs': logs
-            }
-            
-            # Convert to JSON
-            json_data = json.dumps(archive_data, default=str, indent=2)
-            
-            # Upload to Cloud Storage
-            blob_path = f"audit-archives/{date_str[:7]}/{filename}"  # Organize by year-month
-            
-            success = self.storage_service.upload_file_content(
-                content=json_data.encode('utf-8'),
-                blob_path=blob_path,
-                content_type='application/json'
-            )
-            
-            if success:
-                print(f"Archived {len(logs)} logs to {blob_path}")
-                return True
-            else:
-                print(f"Failed to upload archive {filename}")
-                return False
+            segments = self.archive_store.write_segments(logs)
+            print(f"Archived batch {batch_number} ({len(logs)} logs) into {len(segments)} segments")
+            return True
                 
         except Exception as e:
             print(f"Error archiving batch: {e}")
@@ -968,16 +936,16 @@ class AuditRetentionService:
                 if len(event_types) <= 10:
                     query = query.where('eventType', 'in', event_types)
             
-            # Process logs
-            for doc in query.stream():
-                log_data = doc.to_dict()
-                self._process_log_for_report(log_data, report, compliance_flags)
+            # Process logs, verifying integrity as they stream in
+            verifier = self.audit_service.create_integrity_verifier()
+            for log_data, is_valid, error_msg in verifier.verify(query.stream()):
+                self._process_log_for_report(log_data, report, compliance_flags, (is_valid, error_msg))
             
             # Include archived logs if requested
             if include_archived:
-                archived_logs = self._retrieve_archived_logs(start_date, end_date)
-                for log_data in archived_logs:
-                    self._process_log_for_report(log_data, report, compliance_flags)
+                archived_logs = self._retrieve_archived_logs(start_date, end_date, event_types)
+                for log_data, is_valid, error_msg in verifier.verify(archived_logs):
+                    self._process_log_for_report(log_data, report, compliance_flags, (is_valid, error_msg))
             
             # Finalize report
             report['summary']['unique_users'] = len(report['summary']['unique_users'])
@@ -1002,7 +970,8 @@ class AuditRetentionService:
         except Exception as e:
             return {'error': f"Compliance report generation failed: {e}"}
     
-    def _process_log_for_report(self, log_data: Dict[str, Any], report: Dict[str, Any], compliance_flags: List[str] = None):
+    def _process_log_for_report(self, log_data: Dict[str, Any], report: Dict[str, Any], compliance_flags: List[str] = None,
+                                integrity: Optional[Tuple[bool, Optional[str]]] = None):
         """Process individual log entry for compliance report"""
         try:
             # Update summary statistics
@@ -1068,8 +1037,10 @@ class AuditRetentionService:
                     'reason': log_data.get('details', {}).get('reason', 'Unknown')
                 })
             
-            # Verify integrity
-            is_valid, error_msg = self.audit_service.verify_log_integrity(log_data['logId'])
+            # Verify integrity (already computed when the log was streamed)
+            if integrity is None:
+                integrity = verify_record(self.audit_service.hmac_key, log_data)
+            is_valid, error_msg = integrity
             if is_valid:
                 report['integrity_status']['total_verified'] += 1
             else:
@@ -1083,36 +1054,18 @@ class AuditRetentionService:
         except Exception as e:
             print(f"Error processing log for report: {e}")
     
-    def _retrieve_archived_logs(self, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
-        """Retrieve archived logs for the specified date range"""
+    def _retrieve_archived_logs(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        event_types: List[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream archived logs for the specified date range from the overlapping segments only"""
         try:
-            archived_logs = []
-            
-            # List archive files in the date range
-            # This is a simplified implementation - in production, implement proper date-based filtering
-            archive_files = self.storage_service.list_files(f"audit-archives/")
-            
-            for file_path in archive_files:
-                try:
-                    # Download and parse archive file
-                    content = self.storage_service.download_file_content(file_path)
-                    if content:
-                        archive_data = json.loads(content.decode('utf-8'))
-                        
-                        # Filter logs by date range
-                        for log_data in archive_data.get('logs', []):
-                            log_timestamp = datetime.fromisoformat(log_data['timestamp'].replace('Z', '+00:00'))
-                            if start_date <= log_timestamp <= end_date:
-                                archived_logs.append(log_data)
-                
-                except Exception as e:
-                    print(f"Error processing archive file {file_path}: {e}")
-            
-            return archived_logs
+            yield from self.archive_store.read_range(start_date, end_date, event_types)
             
         except Exception as e:
             print(f"Error retrieving archived logs: {e}")
-            return []
     
     def _analyze_compliance_data(self, report: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze compliance data and generate insights"""
@@ -1217,17 +1170,23 @@ class AuditRetentionService:
         end_date: datetime,
         format_type: str = 'json',
         event_types: List[str] = None,
-        include_archived: bool = False
+        include_archived: bool = False,
+        compression: Optional[str] = 'gzip'
     ) -> Optional[str]:
         """
         Export audit data for compliance officers.
         
+        Logs are read page by page, encoded and compressed incrementally and
+        streamed to Cloud Storage with a resumable upload, so memory use does
+        not grow with the size of the range.
+        
         Args:
             start_date: Export start date
             end_date: Export end date
-            format_type: Export format ('json', 'csv')
+            format_type: Export format ('json', 'ndjson', 'csv')
             event_types: Filter by event types
             include_archived: Include archived logs
+            compression: 'gzip', 'zstd' or None
             
         Returns:
             File path of exported data or None if failed
@@ -1235,61 +1194,37 @@ class AuditRetentionService:
         try:
             export_id = str(uuid.uuid4())
             timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            filename = f"audit_export_{timestamp}_{export_id}.{format_type}"
             
-            # Collect data
-            export_data = {
-                'metadata': {
-                    'export_id': export_id,
-                    'generated_at': datetime.utcnow().isoformat(),
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat(),
-                    'format': format_type,
-                    'event_types_filter': event_types,
-                    'include_archived': include_archived
-                },
-                'logs': []
+            metadata = {
+                'export_id': export_id,
+                'generated_at': datetime.utcnow().isoformat(),
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'format': format_type,
+                'compression': compression,
+                'event_types_filter': event_types,
+                'include_archived': include_archived
             }
             
-            # Query active logs
-            logs_ref = self.db.collection('auditLogs')
-            query = logs_ref.where('timestamp', '>=', start_date).where('timestamp', '<=', end_date)
-            
-            if event_types and len(event_types) <= 10:
-                query = query.where('eventType', 'in', event_types)
-            
-            for doc in query.stream():
-                log_data = doc.to_dict()
-                # Convert timestamp to string for JSON serialization
-                if 'timestamp' in log_data:
-                    log_data['timestamp'] = log_data['timestamp'].isoformat()
-                export_data['logs'].append(log_data)
-            
-            # Include archived logs if requested
+            # Stream active logs, followed by archived logs if requested
+            records = iter_audit_logs(self.db, start_date, end_date, event_types)
             if include_archived:
-                archived_logs = self._retrieve_archived_logs(start_date, end_date)
-                export_data['logs'].extend(archived_logs)
-            
-            # Export to Cloud Storage
-            if format_type == 'json':
-                content = json.dumps(export_data, indent=2, default=str)
-                content_type = 'application/json'
-            elif format_type == 'csv':
-                content = self._convert_to_csv(export_data['logs'])
-                content_type = 'text/csv'
-            else:
-                raise ValueError(f"Unsupported format: {format_type}")
+                records = itertools.chain(records, self._retrieve_archived_logs(start_date, end_date, event_types))
             
-            # Upload to storage
+            stream = AuditExportStream(records, format_type, compression, metadata)
+            filename = f"audit_export_{timestamp}_{export_id}.{stream.file_extension}"
             blob_path = f"audit-exports/{filename}"
-            success = self.storage_service.upload_file_content(
-                content=content.encode('utf-8'),
-                blob_path=blob_path,
-                content_type=content_type
+            
+            result = self.storage_service.upload_stream(
+                blob_path,
+                stream,
+                content_type=stream.content_type,
+                metadata={'exportId': export_id, 'format': format_type, 'compression': str(compression)}
             )
             
-            if success:
-                print(f"Audit data exported to {blob_path}")
+            if result.get('success'):
+                print(f"Audit data exported to {blob_path} ({stream.stats['records']} logs, "
+                      f"{stream.stats['bytes_compressed']} bytes)")
                 return blob_path
             else:
                 print("Failed to upload export file")
@@ -1298,44 +1233,6 @@ class AuditRetentionService:
         except Exception as e:
             print(f"Error exporting audit data: {e}")
             return None
-    
-    def _convert_to_csv(self, logs: List[Dict[str, Any]]) -> str:
-        """Convert logs to CSV format"""
-        try:
-            import csv
-            from io import StringIO
-            
-            if not logs:
-                return ""
-            
-            output = StringIO()
-            
-            # Get all possible field names
-            fieldnames = set()
-            for log in logs:
-                fieldnames.update(log.keys())
-            
-            fieldnames = sorted(list(fieldnames))
-            
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for log in logs:
-                # Flatten nested objects for CSV
-                flattened_log = {}
-                for key, value in log.items():
-                    if isinstance(value, (dict, list)):
-                        flattened_log[key] = json.dumps(value)
-                    else:
-                        flattened_log[key] = value
-                
-                writer.writerow(flattened_log)
-            
-            return output.getvalue()
-            
-        except Exception as e:
-            print(f"Error converting to CSV: {e}")
-            return ""
 
 
 # Singleton instance
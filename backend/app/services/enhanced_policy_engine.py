@@ -19,8 +19,10 @@ import joblib
 import logging
 
 from app.firebase_config import get_firestore_client
-from app.services.device_fingerprint_service import DeviceFingerprintService
+from app.services.device_fingerprint_service import device_fingerprint_service
 from app.services.enhanced_audit_service import EnhancedAuditService
+from app.services.peer_cohort_store import peer_cohort_store
+from app.services.cache_service import cache_get, cache_set
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -38,9 +40,12 @@ class EnhancedPolicyEngine:
     - Temporal access modeling
     """
     
+    # Seconds a cohort's member list is reused before re-querying users
+    PEER_MEMBERSHIP_CACHE_TTL = 600
+    
     def __init__(self):
         self.db = get_firestore_client()
-        self.device_service = DeviceFingerprintService()
+        self.device_service = device_fingerprint_service
         self.audit_service = EnhancedAuditService()
         
         # ML Models
@@ -89,15 +94,20 @@ class EnhancedPolicyEngine:
             user_role = request_data.get('userRole')
             resource_type = request_data.get('requestedResource')
             
+            # Analyze peer behavior (shared with feature extraction); the user's
+            # aggregate is read once and reused for the peer comparison
+            user_doc = self._get_user_access_doc(user_id, resource_type)
+            user_stats = (peer_cohort_store.user_stats_from_doc(user_doc) if user_doc is not None
+                          else self._get_user_access_stats(user_id, resource_type))
+            peer_analysis = self.analyze_peer_behavior(user_id, resource_type, user_stats=user_stats,
+                                                       user_doc=user_doc)
+            
             # Extract features for ML models
-            features = self._extract_features(request_data)
+            features = self._extract_features(request_data, peer_analysis=peer_analysis, user_stats=user_stats)
             
             # Get ML predictions
             ml_predictions = self.apply_machine_learning_models(features)
             
-            # Analyze peer behavior
-            peer_analysis = self.analyze_peer_behavior(user_id, resource_type)
-            
             # Calculate contextual confidence
             contextual_confidence = self.calculate_contextual_confidence(
                 request_data, ml_predictions, peer_analysis
@@ -194,13 +204,21 @@ class EnhancedPolicyEngine:
                 'error': str(e)
             }
     
-    def analyze_peer_behavior(self, user_id: str, request_type: str) -> Dict[str, Any]:
+    def analyze_peer_behavior(
+        self,
+        user_id: str,
+        request_type: str,
+        user_stats: Optional[Dict[str, Any]] = None,
+        user_doc: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
         Compare user behavior against similar users (peer analysis)
         
         Args:
             user_id (str): User ID
             request_type (str): Type of access request
+            user_stats (dict): Pre-fetched user access statistics (optional)
+            user_doc (dict): Pre-fetched userAccessStats document (optional)
         
         Returns:
             dict: Peer behavior analysis results
@@ -222,11 +240,13 @@ class EnhancedPolicyEngine:
                     'peer_risk_level': 'medium'
                 }
             
-            # Analyze peer access patterns
-            peer_stats = self._analyze_peer_access_patterns(peer_users, request_type)
+            # Peer and user aggregates come from the cohort store in one read
+            peer_stats, stored_user_stats = peer_cohort_store.get_stats(
+                user_id, user_role, user_department, request_type, len(peer_users), user_doc=user_doc
+            )
             
             # Compare user against peers
-            user_stats = self._get_user_access_stats(user_id, request_type)
+            user_stats = user_stats or stored_user_stats
             comparison = self._compare_user_to_peers(user_stats, peer_stats)
             
             return {
@@ -457,8 +477,13 @@ class EnhancedPolicyEngine:
             logger.error(f"Error updating ML models: {str(e)}")
             return {'success': False, 'message': str(e)}
     
-    def _extract_features(self, request_data: Dict[str, Any]) -> np.ndarray:
-        """Extract feature vector from request data"""
+    def _extract_features(
+        self,
+        request_data: Dict[str, Any],
+        peer_analysis: Optional[Dict[str, Any]] = None,
+        user_stats: Optional[Dict[str, Any]] = None
+    ) -> np.ndarray:
+        """Extract feature vector from request data, reusing peer/user stats when supplied"""
         try:
             # Initialize feature vector
             features = np.zeros(len(self.feature_names))
@@ -504,12 +529,14 @@ class EnhancedPolicyEngine:
             
             # User historical data
             user_id = request_data.get('userId')
-            user_stats = self._get_user_access_stats(user_id, resource_type)
+            if user_stats is None:
+                user_stats = self._get_user_access_stats(user_id, resource_type)
             features[5] = user_stats.get('approval_rate', 0.5)
             features[6] = user_stats.get('recent_access_count', 0)
             
             # Peer comparison
-            peer_analysis = self.analyze_peer_behavior(user_id, resource_type)
+            if peer_analysis is None:
+                peer_analysis = self.analyze_peer_behavior(user_id, resource_type, user_stats=user_stats)
             features[7] = peer_analysis.get('peer_approval_rate', 0.5)
             
             # Request characteristics
@@ -551,105 +578,42 @@ class EnhancedPolicyEngine:
             return {}
     
     def _find_peer_users(self, role: str, department: str, exclude_user: str) -> List[str]:
-        """Find users with same role and department"""
+        """
+        Find users with same role and department (cohort membership is cached briefly)
+
+        The full membership is returned: peer figures come from whole-cohort
+        aggregates, so the per-request rate must be divided by the real
+        cohort size rather than a sample of it.
+        """
         try:
-            users_ref = self.db.collection('users')
-            query = users_ref.where('role', '==', role).where('department', '==', department)
+            cache_key = f"peer_users:{role}|{department}"
+            members = cache_get(cache_key)
             
-            peer_users = []
-            for doc in query.stream():
-                if doc.id != exclude_user:
-                    peer_users.append(doc.id)
+            if members is None:
+                users_ref = self.db.collection('users')
+                query = users_ref.where('role', '==', role).where('department', '==', department)
+                members = [doc.id for doc in query.stream()]
+                cache_set(cache_key, members, self.PEER_MEMBERSHIP_CACHE_TTL)
             
-            return peer_users[:50]  # Limit to 50 peers for performance
+            return [uid for uid in members if uid != exclude_user]
         except:
             return []
     
-    def _analyze_peer_access_patterns(self, peer_users: List[str], request_type: str) -> Dict[str, Any]:
-        """Analyze access patterns of peer users"""
+    def _get_user_access_stats(self, user_id: str, resource_type: str) -> Dict[str, Any]:
+        """Get user's access statistics from the incrementally maintained aggregates"""
         try:
-            if not peer_users:
-                return {'approval_rate': 0.5, 'avg_requests_per_month': 0}
-            
-            # Get access requests for peer users
-            requests_ref = self.db.collection('accessRequests')
-            
-            total_requests = 0
-            approved_requests = 0
-            monthly_requests = []
-            
-            for user_id in peer_users:
-                query = requests_ref.where('userId', '==', user_id).limit(100)
-                
-                user_requests = 0
-                for doc in query.stream():
-                    request_data = doc.to_dict()
-                    if request_data.get('requestedResource') == request_type:
-                        total_requests += 1
-                        user_requests += 1
-                        
-                        if request_data.get('decision') in ['granted', 'granted_with_mfa']:
-                            approved_requests += 1
-                
-                monthly_requests.append(user_requests)
-            
-            approval_rate = approved_requests / total_requests if total_requests > 0 else 0.5
-            avg_requests_per_month = np.mean(monthly_requests) if monthly_requests else 0
-            
-            return {
-                'approval_rate': approval_rate,
-                'avg_requests_per_month': avg_requests_per_month,
-                'total_peer_requests': total_requests
-            }
-            
+            return peer_cohort_store.get_user_stats(user_id, resource_type)
         except Exception as e:
-            logger.error(f"Error analyzing peer access patterns: {str(e)}")
-            return {'approval_rate': 0.5, 'avg_requests_per_month': 0}
+            logger.error(f"Error getting user access stats: {str(e)}")
+            return {'approval_rate': 0.5, 'recent_access_count': 0, 'request_frequency': 0}
     
-    def _get_user_access_stats(self, user_id: str, resource_type: str) -> Dict[str, Any]:
-        """Get user's access statistics"""
+    def _get_user_access_doc(self, user_id: str, resource_type: str) -> Optional[Dict[str, Any]]:
+        """Get the user's raw access aggregate, None if it could not be read"""
         try:
-            requests_ref = self.db.collection('accessRequests')
-            query = requests_ref.where('userId', '==', user_id).limit(100)
-            
-            total_requests = 0
-            approved_requests = 0
-            recent_requests = 0
-            
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            
-            for doc in query.stream():
-                request_data = doc.to_dict()
-                
-                if request_data.get('requestedResource') == resource_type:
-                    total_requests += 1
-                    
-                    if request_data.get('decision') in ['granted', 'granted_with_mfa']:
-                        approved_requests += 1
-                    
-                    # Check if recent
-                    timestamp = request_data.get('timestamp')
-                    if timestamp and isinstance(timestamp, str):
-                        try:
-                            timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                            if timestamp > thirty_days_ago:
-                                recent_requests += 1
-                        except:
-                            pass
-            
-            approval_rate = approved_requests / total_requests if total_requests > 0 else 0.5
-            request_frequency = recent_requests / 30.0  # requests per day
-            
-            return {
-                'approval_rate': approval_rate,
-                'recent_access_count': recent_requests,
-                'request_frequency': request_frequency,
-                'total_requests': total_requests
-            }
-            
+            return peer_cohort_store.get_user_doc(user_id, resource_type)
         except Exception as e:
             logger.error(f"Error getting user access stats: {str(e)}")
-            return {'approval_rate': 0.5, 'recent_access_count': 0, 'request_frequency': 0}
+            return None
     
     def _compare_user_to_peers(self, user_stats: Dict[str, Any], peer_stats: Dict[str, Any]) -> Dict[str, Any]:
         """Compare user behavior to peer behavior"""
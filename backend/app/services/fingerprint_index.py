@@ -0,0 +1,579 @@
+"""
+Fingerprint Index
+Precomputed device fingerprint vectors and an in-memory index for vectorized matching
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FEATURE_VECTOR_VERSION = 1
+
+COMPONENTS = ('canvas', 'webgl', 'audio', 'screen', 'system')
+DEFAULT_COMPONENT_WEIGHTS = {'canvas': 0.25, 'webgl': 0.25, 'audio': 0.20, 'screen': 0.15, 'system': 0.15}
+
+# Fields compared by equality, one token each. Canvas and audio compare their
+# hash even when it is missing; absent webgl/system fields are ABSENT_TOKEN
+# and only fields present on both sides count.
+TOKEN_FIELDS = (
+    ('canvas', 'hash'),
+    ('webgl', 'renderer'), ('webgl', 'vendor'), ('webgl', 'version'),
+    ('audio', 'hash'),
+    ('system', 'platform'), ('system', 'language'), ('system', 'timezone'),
+)
+SINGLE_FIELD_COMPONENTS = frozenset(('canvas', 'audio'))
+ABSENT_TOKEN = 0
+
+# Screen resolutions within this many pixels per axis count as a partial match
+SCREEN_TOLERANCE_PX = 100
+SCREEN_PARTIAL_MATCH = 0.8
+# Canvas mismatches with a webgl match below this are scored as 0
+WEBGL_MATCH_CUTOFF = 0.8
+
+_CANVAS, _WEBGL, _AUDIO, _SCREEN, _SYSTEM = range(len(COMPONENTS))
+_CANVAS_TOKEN, _AUDIO_TOKEN = 0, 4
+_WEBGL_FIELDS = range(1, 4)
+_SYSTEM_FIELDS = range(5, 8)
+
+
+def _token_key() -> bytes:
+    """Key of the field tokens, so stored vectors cannot be matched against guessed values"""
+    secret = os.getenv('FINGERPRINT_INDEX_KEY', '')
+    return hashlib.sha256(secret.encode('utf-8')).digest() if secret else b''
+
+
+_TOKEN_KEY = _token_key()
+
+
+def field_token(value: Any) -> int:
+    """Keyed signed 64-bit token of a fingerprint field value (never ABSENT_TOKEN)"""
+    data = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    digest = hashlib.blake2b(data, digest_size=8, key=_TOKEN_KEY).digest()
+    return int.from_bytes(digest, 'big', signed=True) or 1
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def fingerprint_vector(characteristics: Dict) -> Dict[str, Any]:
+    """
+    Compute the stored feature vector of a device fingerprint
+
+    Args:
+        characteristics (dict): Raw fingerprint characteristics
+
+    Returns:
+        dict: Component bitmask, field tokens and screen dimensions
+    """
+    components = 0
+    for bit, name in enumerate(COMPONENTS):
+        if isinstance(characteristics.get(name), dict):
+            components |= 1 << bit
+
+    tokens = []
+    for component, field in TOKEN_FIELDS:
+        data = characteristics.get(component)
+        if not isinstance(data, dict):
+            tokens.append(ABSENT_TOKEN)
+        elif component in SINGLE_FIELD_COMPONENTS:
+            tokens.append(field_token(data.get(field)))
+        else:
+            tokens.append(field_token(data[field]) if field in data else ABSENT_TOKEN)
+
+    screen = characteristics.get('screen')
+    screen = screen if isinstance(screen, dict) else {}
+
+    return {
+        'version': FEATURE_VECTOR_VERSION,
+        'components': components,
+        'tokens': tokens,
+        'screen': [_number(screen.get('width', 0)), _number(screen.get('height', 0))]
+    }
+
+
+def decode_vector(vector: Optional[Dict]) -> Optional[Tuple[np.ndarray, int, np.ndarray]]:
+    """Decode a stored feature vector; None if it is missing, malformed or of another version"""
+    if not isinstance(vector, dict) or vector.get('version') != FEATURE_VECTOR_VERSION:
+        return None
+    try:
+        tokens = np.array(vector['tokens'], dtype=np.int64)
+        screen = np.array(vector['screen'], dtype=np.float64)
+        components = int(vector['components'])
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None
+    if tokens.shape != (len(TOKEN_FIELDS),) or screen.shape != (2,):
+        return None
+    return tokens, components, screen
+
+
+def _field_share(tokens: np.ndarray, equal: np.ndarray, q_tokens: np.ndarray, fields: range) -> np.ndarray:
+    """Share of matching fields among the given fields present on both sides"""
+    present = [i for i in fields if q_tokens[i] != ABSENT_TOKEN]
+    if not present:
+        return np.zeros(tokens.shape[1])
+    counts = (tokens[present] != ABSENT_TOKEN).sum(axis=0)
+    return np.divide(equal[present].sum(axis=0), counts, out=np.zeros(counts.shape), where=counts > 0)
+
+
+def similarity_scores(
+    query: Tuple[np.ndarray, int, np.ndarray],
+    tokens: np.ndarray,
+    components: np.ndarray,
+    screen: np.ndarray,
+    weights: np.ndarray
+) -> np.ndarray:
+    """
+    Weighted similarity (0-100) of a query vector against many stored vectors
+
+    Mirrors the per-component rules of the dict-based comparison: canvas and
+    audio hashes must match, webgl and system score the share of matching
+    fields, screens within the pixel tolerance score a partial match, and only
+    components present on both sides are weighted. A canvas mismatch with a
+    weak webgl match scores 0. Stored arrays are field-major so every step is
+    a contiguous pass over the devices.
+
+    Args:
+        query (tuple): Decoded query vector
+        tokens (np.ndarray): (8, n) stored field tokens
+        components (np.ndarray): (n,) stored component bitmasks
+        screen (np.ndarray): (2, n) stored screen dimensions
+        weights (np.ndarray): Component weights in COMPONENTS order
+
+    Returns:
+        np.ndarray: (n,) similarity scores
+    """
+    q_tokens, q_components, q_screen = query
+    count = tokens.shape[1]
+    equal = tokens == q_tokens[:, None]
+
+    weighted = np.zeros(count)
+    total = np.zeros(count)
+    present = {}
+    webgl = None
+
+    for bit in range(len(COMPONENTS)):
+        if not q_components & (1 << bit) or not weights[bit]:
+            continue
+        present[bit] = (components & (1 << bit)) != 0
+
+        if bit == _CANVAS:
+            similarity = equal[_CANVAS_TOKEN]
+        elif bit == _AUDIO:
+            similarity = equal[_AUDIO_TOKEN]
+        elif bit == _WEBGL:
+            similarity = webgl = _field_share(tokens, equal, q_tokens, _WEBGL_FIELDS)
+        elif bit == _SYSTEM:
+            similarity = _field_share(tokens, equal, q_tokens, _SYSTEM_FIELDS)
+        else:
+            width_diff = np.abs(screen[0] - q_screen[0])
+            height_diff = np.abs(screen[1] - q_screen[1])
+            similarity = np.where(
+                (width_diff == 0) & (height_diff == 0), 1.0,
+                np.where((width_diff <= SCREEN_TOLERANCE_PX) & (height_diff <= SCREEN_TOLERANCE_PX),
+                         SCREEN_PARTIAL_MATCH, 0.0)
+            )
+
+        applied = present[bit] * weights[bit]
+        weighted += applied * similarity
+        total += applied
+
+    scores = np.divide(weighted, total, out=np.zeros(count), where=total > 0) * 100
+
+    if webgl is not None and _CANVAS in present:
+        scores[present[_CANVAS] & ~equal[_CANVAS_TOKEN] & present[_WEBGL] & (webgl < WEBGL_MATCH_CUTOFF)] = 0.0
+    return scores
+
+
+class FingerprintIndex:
+    """
+    Thread-safe in-memory index of device fingerprint vectors.
+
+    Vectors are kept in contiguous NumPy arrays so a user's devices or the
+    whole fleet are scored in a single vectorized pass. Devices are also
+    indexed by fingerprint hash and by user. Devices without a stored vector
+    are tracked for hash lookups but are not scored.
+
+    The index is filled per user as devices are validated, and fleet-wide by
+    ``ensure_loaded``, which streams every device once and then again after
+    ``max_age_seconds`` (``load_in_background`` runs it off the request path).
+    Other workers register devices too, so a hash lookup miss is never final
+    and collision scans are only trusted while the fleet-wide load is fresh.
+    """
+
+    def __init__(self, component_weights: Optional[Dict[str, float]] = None, initial_capacity: int = 64):
+        """
+        Initialize the index
+
+        Args:
+            component_weights (dict): Similarity weight per component
+            initial_capacity (int): Initial number of rows
+        """
+        weights = component_weights or DEFAULT_COMPONENT_WEIGHTS
+        self.weights = np.array([float(weights.get(name, 0.0)) for name in COMPONENTS])
+
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._load_thread: Optional[threading.Thread] = None
+
+        capacity = max(1, initial_capacity)
+        self._tokens = np.zeros((len(TOKEN_FIELDS), capacity), dtype=np.int64)
+        self._components = np.zeros(capacity, dtype=np.int64)
+        self._screen = np.zeros((2, capacity), dtype=np.float64)
+        self._owners = np.zeros(capacity, dtype=np.int64)
+        self._searchable = np.zeros(capacity, dtype=bool)
+        self._size = 0
+
+        self._device_ids: List[str] = []
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._by_hash: Dict[str, set] = {}
+        self._user_devices: Dict[str, set] = {}
+        self._user_codes: Dict[str, int] = {}
+        self._seq = 0
+
+        self.loaded_at: Optional[float] = None
+        self._retry_at = 0.0
+        self.stats = {
+            'scored_lookups': 0,
+            'hash_lookups': 0,
+            'collision_scans': 0,
+            'loads': 0,
+            'load_failures': 0
+        }
+
+    def __len__(self) -> int:
+        return self._size
+
+    def upsert(self, device_id: str, user_id: str, fingerprint_hash: Optional[str],
+               vector: Optional[Dict] = None, active: bool = True) -> bool:
+        """
+        Add or replace a device
+
+        Args:
+            device_id (str): Device identifier
+            user_id (str): Owning user
+            fingerprint_hash (str): Exact fingerprint hash
+            vector (dict): Stored feature vector (None if the device has none yet)
+            active (bool): Whether the device is active
+
+        Returns:
+            bool: True if the device has a usable vector
+        """
+        decoded = decode_vector(vector)
+
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                entry = {'row': self._append_row(device_id)}
+                self._entries[device_id] = entry
+            else:
+                self._unlink(device_id, entry)
+
+            self._seq += 1
+            entry.update({
+                'userId': user_id,
+                'fingerprintHash': fingerprint_hash,
+                'isActive': active,
+                'hasVector': decoded is not None,
+                'seq': self._seq
+            })
+            if fingerprint_hash:
+                self._by_hash.setdefault(fingerprint_hash, set()).add(device_id)
+            self._user_devices.setdefault(user_id, set()).add(device_id)
+
+            row = entry['row']
+            if decoded is not None:
+                self._tokens[:, row], self._components[row], self._screen[:, row] = decoded
+            self._owners[row] = self._user_codes.setdefault(user_id, len(self._user_codes))
+            self._searchable[row] = active and decoded is not None
+
+        return decoded is not None
+
+    def sync_user(self, user_id: str, devices: Iterable[Dict]) -> None:
+        """
+        Index a user's device documents, skipping devices already indexed unchanged
+
+        A vector indexed earlier (e.g. backfilled) is kept for a document that
+        does not carry one yet.
+        """
+        for device in devices:
+            device_id = device.get('deviceId')
+            if not device_id:
+                continue
+            owner = device.get('userId', user_id)
+            vector = device.get('featureVector')
+            with self._lock:
+                entry = self._entries.get(device_id)
+                if (entry is not None and entry['userId'] == owner and entry['isActive'] and
+                        entry['fingerprintHash'] == device.get('fingerprintHash') and
+                        (entry['hasVector'] or not vector)):
+                    continue
+            self.upsert(device_id, owner, device.get('fingerprintHash'), vector,
+                        device.get('isActive', True))
+
+    def set_active(self, device_id: str, active: bool) -> None:
+        """Mark a device active or inactive; inactive devices are not scored"""
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is not None:
+                entry['isActive'] = active
+                self._searchable[entry['row']] = active and entry['hasVector']
+
+    def remove(self, device_id: str) -> None:
+        """Drop a device from the index"""
+        with self._lock:
+            entry = self._entries.pop(device_id, None)
+            if entry is None:
+                return
+            self._unlink(device_id, entry)
+
+            row, last = entry['row'], self._size - 1
+            if row != last:
+                moved = self._device_ids[last]
+                for array in (self._tokens, self._components, self._screen, self._owners, self._searchable):
+                    array[..., row] = array[..., last]
+                self._device_ids[row] = moved
+                self._entries[moved]['row'] = row
+            self._device_ids.pop()
+            self._searchable[last] = False
+            self._size = last
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Indexed metadata of a device"""
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                return None
+            return {
+                'deviceId': device_id,
+                'userId': entry['userId'],
+                'fingerprintHash': entry['fingerprintHash'],
+                'isActive': entry['isActive'],
+                'hasVector': entry['hasVector']
+            }
+
+    def find_by_hash(self, fingerprint_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a device with an exact fingerprint hash
+
+        Returns:
+            dict: Metadata of the matching device (active devices first), or None
+        """
+        with self._lock:
+            self.stats['hash_lookups'] += 1
+            device_ids = sorted(self._by_hash.get(fingerprint_hash, ()))
+            matches = [self.get(device_id) for device_id in device_ids]
+        if not matches:
+            return None
+        return next((match for match in matches if match['isActive']), matches[0])
+
+    def score_devices(self, vector: Dict, device_ids: Iterable[str]) -> Dict[str, float]:
+        """
+        Score a fingerprint vector against specific devices
+
+        Args:
+            vector (dict): Feature vector of the presented fingerprint
+            device_ids (iterable): Devices to compare against
+
+        Returns:
+            dict: Similarity (0-100) per device that has an indexed vector
+        """
+        query = decode_vector(vector)
+        if query is None:
+            return {}
+
+        with self._lock:
+            self.stats['scored_lookups'] += 1
+            scored = [(device_id, self._entries[device_id]['row']) for device_id in device_ids
+                      if device_id in self._entries and self._entries[device_id]['hasVector']]
+            if not scored:
+                return {}
+            rows = np.fromiter((row for _, row in scored), dtype=np.int64, count=len(scored))
+            scores = self._scores(query, rows)
+
+        return {device_id: float(score) for (device_id, _), score in zip(scored, scores)}
+
+    def find_collisions(self, vector: Dict, exclude_user_id: Optional[str] = None,
+                        min_similarity: float = 95.0, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Find active devices of other users that match a fingerprint vector
+
+        Args:
+            vector (dict): Feature vector of the presented fingerprint
+            exclude_user_id (str): User whose own devices are ignored
+            min_similarity (float): Minimum similarity (0-100) of a collision
+            limit (int): Maximum number of collisions returned
+
+        Returns:
+            list: Colliding devices, most similar first
+        """
+        query = decode_vector(vector)
+        if query is None:
+            return []
+
+        with self._lock:
+            self.stats['collision_scans'] += 1
+            if not self._size:
+                return []
+            # Scoring every row in place is cheaper than gathering the candidates first
+            scores = self._scores(query)
+            candidates = self._searchable[:self._size] & (scores >= min_similarity)
+            exclude_code = self._user_codes.get(exclude_user_id) if exclude_user_id else None
+            if exclude_code is not None:
+                candidates &= self._owners[:self._size] != exclude_code
+
+            hits = np.flatnonzero(candidates)
+            hits = hits[np.argsort(-scores[hits], kind='stable')][:limit]
+
+            return [{
+                'deviceId': self._device_ids[row],
+                'userId': self._entries[self._device_ids[row]]['userId'],
+                'similarity': float(scores[row])
+            } for row in hits]
+
+    def is_fresh(self, max_age_seconds: float) -> bool:
+        """Whether a fleet-wide load completed within the last max_age_seconds"""
+        return (self.loaded_at is not None and max_age_seconds > 0 and
+                time.monotonic() - self.loaded_at < max_age_seconds)
+
+    def ensure_loaded(self, loader: Callable[[], Iterable[Dict]], max_age_seconds: float) -> bool:
+        """
+        Load every device unless a fresh fleet-wide load exists
+
+        Only one thread loads at a time; other callers get False and should
+        fall back to querying storage. A failed load is retried after at most
+        a minute.
+
+        Args:
+            loader (callable): Returns an iterable of device documents
+            max_age_seconds (float): Age after which the index is reloaded (0 disables loading)
+
+        Returns:
+            bool: True if the index holds a fresh fleet-wide view
+        """
+        if self.is_fresh(max_age_seconds):
+            return True
+        if max_age_seconds <= 0 or time.monotonic() < self._retry_at:
+            return False
+        if not self._load_lock.acquire(blocking=False):
+            return False
+
+        try:
+            start_seq = self._seq
+            seen = set()
+            for device in loader():
+                device_id = device.get('deviceId')
+                if not device_id:
+                    continue
+                seen.add(device_id)
+                self.upsert(device_id, device.get('userId', ''), device.get('fingerprintHash'),
+                            device.get('featureVector'), device.get('isActive', True))
+
+            # Devices gone from storage, unless indexed by this process since the load started
+            with self._lock:
+                stale = [device_id for device_id, entry in self._entries.items()
+                         if device_id not in seen and entry['seq'] <= start_seq]
+                for device_id in stale:
+                    self.remove(device_id)
+
+            self.loaded_at = time.monotonic()
+            self.stats['loads'] += 1
+            logger.info(f"Fingerprint index loaded: {len(seen)} devices")
+            return True
+
+        except Exception as e:
+            self.stats['load_failures'] += 1
+            self._retry_at = time.monotonic() + min(max_age_seconds, 60)
+            logger.error(f"Error loading fingerprint index: {str(e)}")
+            return False
+
+        finally:
+            self._load_lock.release()
+
+    def load_in_background(self, loader: Callable[[], Iterable[Dict]], max_age_seconds: float) -> bool:
+        """
+        Start a fleet-wide load on a daemon thread unless the index is fresh
+
+        Args:
+            loader (callable): Returns an iterable of device documents
+            max_age_seconds (float): Age after which the index is reloaded (0 disables loading)
+
+        Returns:
+            bool: True if the index already holds a fresh fleet-wide view
+        """
+        if self.is_fresh(max_age_seconds):
+            return True
+        if max_age_seconds <= 0 or time.monotonic() < self._retry_at:
+            return False
+
+        with self._lock:
+            if self._load_thread is None or not self._load_thread.is_alive():
+                self._load_thread = threading.Thread(
+                    target=self.ensure_loaded, args=(loader, max_age_seconds),
+                    name='fingerprint-index-load', daemon=True
+                )
+                self._load_thread.start()
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Index size and lookup counters"""
+        with self._lock:
+            return {
+                **self.stats,
+                'devices': self._size,
+                'vectors': int(np.count_nonzero(self._searchable[:self._size])),
+                'users': len(self._user_devices),
+                'loaded': self.loaded_at is not None,
+                'load_age_seconds': round(time.monotonic() - self.loaded_at, 1) if self.loaded_at else None
+            }
+
+    def _scores(self, query: Tuple[np.ndarray, int, np.ndarray], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Scores of the given rows, or of every row"""
+        if rows is None:
+            return similarity_scores(query, self._tokens[:, :self._size], self._components[:self._size],
+                                     self._screen[:, :self._size], self.weights)
+        return similarity_scores(query, self._tokens[:, rows], self._components[rows], self._screen[:, rows],
+                                 self.weights)
+
+    def _append_row(self, device_id: str) -> int:
+        if self._size == self._components.shape[0]:
+            self._tokens, self._components, self._screen, self._owners, self._searchable = (
+                self._grown(array) for array in
+                (self._tokens, self._components, self._screen, self._owners, self._searchable)
+            )
+
+        row = self._size
+        self._device_ids.append(device_id)
+        self._searchable[row] = False
+        self._size += 1
+        return row
+
+    def _grown(self, array: np.ndarray) -> np.ndarray:
+        """Copy of a row-indexed array (rows on the last axis) with double the capacity"""
+        grown = np.zeros(array.shape[:-1] + (array.shape[-1] * 2,), dtype=array.dtype)
+        grown[..., :self._size] = array[..., :self._size]
+        return grown
+
+    def _unlink(self, device_id: str, entry: Dict[str, Any]) -> None:
+        """Remove a device from the hash and user maps"""
+        hashed = self._by_hash.get(entry.get('fingerprintHash'))
+        if hashed is not None:
+            hashed.discard(device_id)
+            if not hashed:
+                del self._by_hash[entry['fingerprintHash']]
+        owned = self._user_devices.get(entry.get('userId'))
+        if owned is not None:
+            owned.discard(device_id)
+            if not owned:
+                del self._user_devices[entry['userId']]
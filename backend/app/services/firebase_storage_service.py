@@ -7,7 +7,7 @@ import logging
 import json
 import os
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, BinaryIO
+from typing import Dict, Iterable, List, Optional, Any, BinaryIO
 from firebase_admin import storage
 from firebase_admin.exceptions import FirebaseError
 from app.utils.error_handler import handle_service_error
@@ -84,6 +84,60 @@ class FirebaseStorageService:
             logger.error(f"Error uploading file: {str(e)}")
             raise
     
+    @handle_service_error
+    def upload_stream(self, file_path: str, chunks: Iterable[bytes], content_type: str = 'application/octet-stream',
+                      metadata: Dict = None, chunk_size: int = 8 * 1024 * 1024) -> Dict:
+        """
+        Upload a stream of byte chunks to Cloud Storage with a resumable upload
+        
+        Data is sent in chunk_size pieces as it is produced, so the full file
+        never has to be held in memory.
+        
+        Args:
+            file_path: Storage path for the file
+            chunks: Iterable of byte chunks
+            content_type: MIME type of the file
+            metadata: Additional metadata
+            chunk_size: Upload chunk size (rounded up to a multiple of 256 KB)
+        
+        Returns:
+            Upload result with file info
+        """
+        try:
+            blob = self.bucket.blob(file_path)
+            
+            if metadata:
+                blob.metadata = metadata
+            
+            # Resumable uploads require chunk sizes in multiples of 256 KB
+            quantum = 256 * 1024
+            chunk_size = max(quantum, -(-chunk_size // quantum) * quantum)
+            
+            total_bytes = 0
+            with blob.open('wb', chunk_size=chunk_size, content_type=content_type) as writer:
+                for chunk in chunks:
+                    if chunk:
+                        writer.write(chunk)
+                        total_bytes += len(chunk)
+            
+            logger.info(f"Streamed {total_bytes} bytes to Cloud Storage: {file_path}")
+            return {
+                'success': True,
+                'filePath': file_path,
+                'fileInfo': {
+                    'name': blob.name,
+                    'size': total_bytes,
+                    'contentType': content_type
+                }
+            }
+        
+        except FirebaseError as e:
+            logger.error(f"Firebase error streaming upload: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming upload: {str(e)}")
+            raise
+    
     @handle_service_error
     def download_file(self, file_path: str) -> bytes:
         """
@@ -113,6 +167,37 @@ class FirebaseStorageService:
             logger.error(f"Error downloading file: {str(e)}")
             raise
     
+    @handle_service_error
+    def open_read_stream(self, file_path: str, chunk_size: int = 4 * 1024 * 1024) -> BinaryIO:
+        """
+        Open a file in Cloud Storage for streaming reads
+
+        The content is fetched in chunk_size ranges as it is read instead of
+        being downloaded in full.
+
+        Args:
+            file_path: Storage path of the file
+            chunk_size: Bytes fetched per request
+
+        Returns:
+            Binary file-like object (use as a context manager)
+        """
+        try:
+            blob = self.bucket.blob(file_path)
+
+            if not blob.exists():
+                raise FileNotFoundError(f"File not found: {file_path}")
+
+            # Raw bytes: compressed archives are decoded by the caller
+            return blob.open('rb', chunk_size=chunk_size, raw_download=True)
+
+        except FirebaseError as e:
+            logger.error(f"Firebase error opening file: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Error opening file: {str(e)}")
+            raise
+
     @handle_service_error
     def delete_file(self, file_path: str) -> bool:
         """
@@ -13,6 +13,9 @@ import validators
 import bleach
 from app.config.security_config import get_security_config
 from app.services.audit_logger import audit_logger
+from app.services.threat_pattern_scanner import (
+    PATH_TRAVERSAL, PATH_TRAVERSAL_SIGNATURES, SQL_INJECTION, XSS, ThreatPatternScanner, signatures_for
+)
 from flask import request, g
 import sys
 
@@ -26,6 +29,15 @@ class InputValidator:
         self.sql_patterns = self.security_config.SQL_INJECTION_PATTERNS
         self.allowed_tags = self.security_config.ALLOWED_HTML_TAGS
         self.allowed_attributes = self.security_config.ALLOWED_HTML_ATTRIBUTES
+        self.scanner = ThreatPatternScanner(
+            signatures_for(self.sql_patterns, SQL_INJECTION)
+            + signatures_for(self.dangerous_patterns, XSS)
+            + PATH_TRAVERSAL_SIGNATURES
+        )
+        self.control_characters = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+    
+    def _matched_patterns(self, matches, category: str) -> List[str]:
+        return [self.scanner.pattern(signature_id) for signature_id in self.scanner.in_category(matches, category)]
     
     def detect_sql_injection(self, value: str) -> Tuple[bool, List[str]]:
         """
@@ -37,16 +49,7 @@ class InputValidator:
         Returns:
             Tuple of (is_suspicious, matched_patterns)
         """
-        if not isinstance(value, str):
-            return False, []
-        
-        matched_patterns = []
-        value_lower = value.lower()
-        
-        for pattern in self.sql_patterns:
-            if re.search(pattern, value_lower, re.IGNORECASE):
-                matched_patterns.append(pattern)
-        
+        matched_patterns = self._matched_patterns(self.scanner.scan(value), SQL_INJECTION)
         return len(matched_patterns) > 0, matched_patterns
     
     def detect_xss_attempt(self, value: str) -> Tuple[bool, List[str]]:
@@ -59,15 +62,7 @@ class InputValidator:
         Returns:
             Tuple of (is_suspicious, matched_patterns)
         """
-        if not isinstance(value, str):
-            return False, []
-        
-        matched_patterns = []
-        
-        for pattern in self.dangerous_patterns:
-            if re.search(pattern, value, re.IGNORECASE | re.DOTALL):
-                matched_patterns.append(pattern)
-        
+        matched_patterns = self._matched_patterns(self.scanner.scan(value), XSS)
         return len(matched_patterns) > 0, matched_patterns
     
     def detect_path_traversal(self, value: str) -> bool:
@@ -80,24 +75,7 @@ class InputValidator:
         Returns:
             True if path traversal detected
         """
-        if not isinstance(value, str):
-            return False
-        
-        # Common path traversal patterns
-        traversal_patterns = [
-            r'\.\./+',  # ../
-            r'\.\.\\+',  # ..\
-            r'%2e%2e%2f',  # URL encoded ../
-            r'%2e%2e%5c',  # URL encoded ..\
-            r'\.\.%2f',  # Mixed encoding
-            r'\.\.%5c',  # Mixed encoding
-        ]
-        
-        for pattern in traversal_patterns:
-            if re.search(pattern, value, re.IGNORECASE):
-                return True
-        
-        return False
+        return PATH_TRAVERSAL in self.scanner.categories(self.scanner.scan(value))
     
     def sanitize_string(self, value: str, allow_html: bool = False, max_length: int = 10000) -> str:
         """
@@ -118,10 +96,14 @@ class InputValidator:
         if len(value) > max_length:
             value = value[:max_length]
         
-        # Log security violations
-        sql_detected, sql_patterns = self.detect_sql_injection(value)
-        xss_detected, xss_patterns = self.detect_xss_attempt(value)
-        path_traversal_detected = self.detect_path_traversal(value)
+        # Log security violations, all signatures are matched in one scan
+        matches = self.scanner.scan(value)
+        sql_patterns = self._matched_patterns(matches, SQL_INJECTION)
+        xss_ids = self.scanner.in_category(matches, XSS)
+        xss_patterns = [self.scanner.pattern(signature_id) for signature_id in xss_ids]
+        sql_detected = bool(sql_patterns)
+        xss_detected = bool(xss_ids)
+        path_traversal_detected = bool(self.scanner.in_category(matches, PATH_TRAVERSAL))
         
         if sql_detected or xss_detected or path_traversal_detected:
             try:
@@ -149,8 +131,8 @@ class InputValidator:
         if xss_detected and not allow_html:
             # Check if the content has any legitimate parts
             # Remove the malicious parts and keep safe content
-            for pattern in xss_patterns:
-                value = re.sub(pattern, '', value, flags=re.IGNORECASE | re.DOTALL)
+            for signature_id in xss_ids:
+                value = self.scanner.regex(signature_id).sub('', value)
         
         # Return empty string for SQL injection attempts
         if sql_detected:
@@ -176,12 +158,10 @@ class InputValidator:
             pass  # Keep original if URL decoding fails
         
         # Remove null bytes and control characters
-        sanitized = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', sanitized)
+        sanitized = sanitized.translate(self.control_characters)
         
         # Normalize whitespace
-        sanitized = re.sub(r'\s+', ' ', sanitized).strip()
-        
-        return sanitized
+        return ' '.join(sanitized.split())
     
     def validate_email(self, email: str) -> Tuple[bool, str]:
         """
@@ -374,22 +354,33 @@ class InputValidator:
         Returns:
             Sanitized data structure
         """
+        # Repeated keys and values are sanitized once
+        return self._sanitize_value(data, allow_html, {})
+    
+    def _sanitize_value(self, data: Any, allow_html: bool, cache: Dict[tuple, str]) -> Any:
         if isinstance(data, dict):
             sanitized = {}
             for key, value in data.items():
                 # Sanitize keys as well
-                clean_key = self.sanitize_string(str(key), allow_html=False, max_length=100)
-                sanitized[clean_key] = self.sanitize_dict(value, allow_html)
+                clean_key = self._sanitize_cached(str(key), False, 100, cache)
+                sanitized[clean_key] = self._sanitize_value(value, allow_html, cache)
             return sanitized
         elif isinstance(data, list):
-            return [self.sanitize_dict(item, allow_html) for item in data]
+            return [self._sanitize_value(item, allow_html, cache) for item in data]
         elif isinstance(data, str):
-            return self.sanitize_string(data, allow_html)
+            return self._sanitize_cached(data, allow_html, 10000, cache)
         elif isinstance(data, (int, float, bool)) or data is None:
             return data
         else:
             # Convert unknown types to string and sanitize
-            return self.sanitize_string(str(data), allow_html=False)
+            return self._sanitize_cached(str(data), False, 10000, cache)
+    
+    def _sanitize_cached(self, value: str, allow_html: bool, max_length: int, cache: Dict[tuple, str]) -> str:
+        key = (value, allow_html, max_length)
+        sanitized = cache.get(key)
+        if sanitized is None:
+            sanitized = cache[key] = self.sanitize_string(value, allow_html, max_length)
+        return sanitized
     
     def validate_file_upload(self, file_data: bytes, filename: str, 
                            allowed_extensions: List[str] = None,
@@ -0,0 +1,225 @@
+"""
+Local Cache
+Bounded in-process LRU/TTL cache partitioned by key namespace
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class LocalCache:
+    """
+    Thread-safe in-process cache with per-namespace LRU bounds and TTL expiry.
+
+    The namespace of a key is the part before the first ``:`` (for example
+    ``device_profile`` for ``device_profile:abc``). Each namespace keeps its
+    own LRU ordering and size limit so one busy key family cannot evict
+    another. Values are stored by reference; CacheService stores JSON
+    payloads here so reads never share mutable objects between callers.
+    """
+
+    DEFAULT_NAMESPACE = 'default'
+
+    def __init__(
+        self,
+        default_max_entries: int = 1000,
+        namespace_limits: Optional[Dict[str, int]] = None,
+        default_ttl: Optional[float] = None
+    ):
+        """
+        Initialize local cache
+
+        Args:
+            default_max_entries (int): Size limit for namespaces without an explicit limit
+            namespace_limits (dict): Per-namespace size limits
+            default_ttl (float): TTL in seconds used when a set() passes none
+        """
+        self.default_max_entries = default_max_entries
+        self.namespace_limits = dict(namespace_limits or {})
+        self.default_ttl = default_ttl
+
+        self._lock = threading.Lock()
+        # namespace -> OrderedDict(key -> (expires_at, value))
+        self._namespaces: Dict[str, OrderedDict] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def get(self, key: str) -> Any:
+        """
+        Get a value, refreshing its LRU position
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            Cached value or None if missing/expired
+        """
+        namespace = self._namespace(key)
+        now = time.monotonic()
+
+        with self._lock:
+            counters = self._counters_for(namespace)
+            entries = self._namespaces.get(namespace)
+            item = entries.get(key) if entries is not None else None
+
+            if item is None:
+                counters['misses'] += 1
+                return None
+
+            expires_at, value = item
+            if expires_at is not None and expires_at <= now:
+                del entries[key]
+                counters['expirations'] += 1
+                counters['misses'] += 1
+                return None
+
+            entries.move_to_end(key)
+            counters['hits'] += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Store a value, evicting the least recently used entry of the namespace if full
+
+        Args:
+            key (str): Cache key
+            value: Value to store (None deletes the key)
+            ttl (float): Time to live in seconds
+
+        Returns:
+            bool: Success status
+        """
+        if value is None:
+            self.delete(key)
+            return True
+
+        namespace = self._namespace(key)
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        limit = self.namespace_limits.get(namespace, self.default_max_entries)
+
+        with self._lock:
+            counters = self._counters_for(namespace)
+            entries = self._namespaces.setdefault(namespace, OrderedDict())
+
+            entries[key] = (expires_at, value)
+            entries.move_to_end(key)
+            counters['sets'] += 1
+
+            while len(entries) > limit:
+                entries.popitem(last=False)
+                counters['evictions'] += 1
+
+        return True
+
+    def delete(self, key: str) -> bool:
+        """
+        Delete a key
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            bool: True if the key was present
+        """
+        namespace = self._namespace(key)
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if entries is None or key not in entries:
+                return False
+            del entries[key]
+            return True
+
+    def exists(self, key: str) -> bool:
+        """Check whether a live key exists without touching LRU order or counters"""
+        namespace = self._namespace(key)
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            item = entries.get(key) if entries is not None else None
+            return item is not None and (item[0] is None or item[0] > time.monotonic())
+
+    def touch(self, key: str, ttl: float) -> bool:
+        """
+        Reset the TTL of an existing key
+
+        Args:
+            key (str): Cache key
+            ttl (float): New time to live in seconds
+
+        Returns:
+            bool: True if the key was present
+        """
+        namespace = self._namespace(key)
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            item = entries.get(key) if entries is not None else None
+            if item is None:
+                return False
+            entries[key] = (time.monotonic() + ttl if ttl else None, item[1])
+            return True
+
+    def purge_expired(self) -> int:
+        """
+        Drop all expired entries
+
+        Returns:
+            int: Number of entries removed
+        """
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            for namespace, entries in self._namespaces.items():
+                expired = [k for k, (expires_at, _) in entries.items()
+                           if expires_at is not None and expires_at <= now]
+                for key in expired:
+                    del entries[key]
+                if expired:
+                    self._counters_for(namespace)['expirations'] += len(expired)
+                    removed += len(expired)
+        return removed
+
+    def clear(self) -> None:
+        """Remove all entries and reset counters"""
+        with self._lock:
+            self._namespaces.clear()
+            self._counters.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss/eviction counters overall and per namespace
+
+        Returns:
+            dict: Cache statistics
+        """
+        with self._lock:
+            namespaces = {}
+            totals = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0, 'entries': 0}
+            for namespace, counters in self._counters.items():
+                entry_count = len(self._namespaces.get(namespace, ()))
+                namespaces[namespace] = dict(
+                    counters,
+                    entries=entry_count,
+                    maxEntries=self.namespace_limits.get(namespace, self.default_max_entries)
+                )
+                for name in counters:
+                    totals[name] += counters[name]
+                totals['entries'] += entry_count
+
+            lookups = totals['hits'] + totals['misses']
+            totals['hitRate'] = round(totals['hits'] / lookups, 4) if lookups else 0.0
+            totals['namespaces'] = namespaces
+            return totals
+
+    def _namespace(self, key: str) -> str:
+        """Derive the namespace from the key prefix"""
+        namespace, sep, _ = str(key).partition(':')
+        return namespace if sep else self.DEFAULT_NAMESPACE
+
+    def _counters_for(self, namespace: str) -> Dict[str, int]:
+        """Get (creating if needed) the counters for a namespace (caller holds the lock)"""
+        counters = self._counters.get(namespace)
+        if counters is None:
+            counters = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0}
+            self._counters[namespace] = counters
+        return counters
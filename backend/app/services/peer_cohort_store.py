@@ -0,0 +1,400 @@
+"""
+Peer Cohort Store
+Incrementally maintained access-request aggregates per peer cohort and per user
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from firebase_admin import firestore
+
+from app.firebase_config import get_firestore_client
+
+logger = logging.getLogger(__name__)
+
+
+class PeerCohortStore:
+    """
+    Aggregate store backing peer behavior analysis.
+
+    A cohort is (role, department, resourceType). Each cohort document in
+    ``peerCohortStats`` holds approval counters and a monthly request
+    histogram; each ``userAccessStats`` document holds the same counters for
+    one (user, resourceType) plus a daily histogram for recent activity.
+    Both are updated with atomic increments when an access request is
+    decided, so peer analysis reads two documents instead of scanning every
+    peer's request history.
+    """
+
+    COHORT_COLLECTION = 'peerCohortStats'
+    USER_COLLECTION = 'userAccessStats'
+
+    APPROVED_DECISIONS = ('granted', 'granted_with_mfa')
+    FINAL_DECISIONS = ('granted', 'granted_with_mfa', 'denied')
+
+    # Months of cohort history used for the per-peer request rate
+    PEER_RATE_MONTHS = 3
+    # Days of per-user history used for recent activity
+    RECENT_DAYS = 30
+    # Daily buckets older than this are deleted by the next write to the user document
+    DAILY_RETENTION_DAYS = 40
+    # User documents whose stale buckets are remembered until their next write
+    MAX_PENDING_PRUNES = 10000
+
+    def __init__(self, db=None):
+        self.db = db or get_firestore_client()
+        self._stale_days = OrderedDict()  # user document path -> stale daily keys seen on read
+        self._stale_lock = threading.Lock()
+
+    def record_decision(
+        self,
+        user_id: str,
+        role: Optional[str],
+        department: Optional[str],
+        resource_type: str,
+        decision: str,
+        timestamp: Optional[datetime] = None
+    ) -> bool:
+        """
+        Fold a decided access request into the cohort and user aggregates
+
+        Args:
+            user_id (str): Requesting user ID
+            role (str): User role
+            department (str): User department
+            resource_type (str): Requested resource type
+            decision (str): Final decision
+            timestamp (datetime): Request time (defaults to now)
+
+        Returns:
+            bool: True if the aggregates were updated
+        """
+        if decision not in self.FINAL_DECISIONS or not self.db:
+            return False
+
+        try:
+            timestamp = timestamp or datetime.utcnow()
+            month = timestamp.strftime('%Y-%m')
+            day = timestamp.strftime('%Y-%m-%d')
+            expired_day = (timestamp - timedelta(days=self.DAILY_RETENTION_DAYS)).strftime('%Y-%m-%d')
+            approved = 1 if decision in self.APPROVED_DECISIONS else 0
+
+            counters = {
+                'totalRequests': firestore.Increment(1),
+                'approvedRequests': firestore.Increment(approved),
+                'deniedRequests': firestore.Increment(1 - approved),
+                'monthly': {month: firestore.Increment(1)},
+                'updatedAt': firestore.SERVER_TIMESTAMP
+            }
+
+            user_ref = self._user_ref(user_id, resource_type)
+            daily = {day: firestore.Increment(1), expired_day: firestore.DELETE_FIELD}
+            for stale_day in self._take_stale_days(user_ref.path):
+                daily.setdefault(stale_day, firestore.DELETE_FIELD)
+
+            batch = self.db.batch()
+            batch.set(
+                self._cohort_ref(role, department, resource_type),
+                dict(counters, role=role or 'unknown', department=department or 'unknown',
+                     resourceType=resource_type),
+                merge=True
+            )
+            batch.set(
+                user_ref,
+                dict(counters, userId=user_id, resourceType=resource_type, daily=daily),
+                merge=True
+            )
+            batch.commit()
+            return True
+
+        except Exception as e:
+            logger.error(f"Error recording peer cohort decision: {str(e)}")
+            return False
+
+    def get_stats(
+        self,
+        user_id: str,
+        role: Optional[str],
+        department: Optional[str],
+        resource_type: str,
+        peer_count: int,
+        user_doc: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Read peer and user statistics in a single round-trip
+
+        Args:
+            user_id (str): User being evaluated (excluded from peer figures)
+            role (str): User role
+            department (str): User department
+            resource_type (str): Requested resource type
+            peer_count (int): Full cohort membership, excluding the user
+            user_doc (dict): User aggregate already read with get_user_doc();
+                only the cohort document is read then
+
+        Returns:
+            tuple: (peer_stats, user_stats) in the shape used by EnhancedPolicyEngine
+        """
+        cohort_ref = self._cohort_ref(role, department, resource_type)
+
+        if user_doc is not None:
+            snapshot = cohort_ref.get()
+            cohort_data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            user_data = user_doc
+        else:
+            user_ref = self._user_ref(user_id, resource_type)
+            cohort_data, user_data = {}, {}
+            for snapshot in self.db.get_all([cohort_ref, user_ref]):
+                if not snapshot.exists:
+                    continue
+                if snapshot.reference.path == cohort_ref.path:
+                    cohort_data = snapshot.to_dict() or {}
+                else:
+                    user_data = snapshot.to_dict() or {}
+            self._note_stale_days(user_ref.path, user_data)
+
+        return (
+            self._peer_stats(cohort_data, user_data, peer_count),
+            self.user_stats_from_doc(user_data)
+        )
+
+    def get_user_stats(self, user_id: str, resource_type: str) -> Dict[str, Any]:
+        """
+        Read a user's access statistics for one resource type
+
+        Args:
+            user_id (str): User ID
+            resource_type (str): Resource type
+
+        Returns:
+            dict: User access statistics
+        """
+        return self.user_stats_from_doc(self.get_user_doc(user_id, resource_type))
+
+    def get_user_doc(self, user_id: str, resource_type: str) -> Dict[str, Any]:
+        """
+        Read a user's raw aggregate for one resource type
+
+        The document can be handed to get_stats() so it is not read twice.
+
+        Args:
+            user_id (str): User ID
+            resource_type (str): Resource type
+
+        Returns:
+            dict: userAccessStats document (empty if the user has no history)
+        """
+        user_ref = self._user_ref(user_id, resource_type)
+        snapshot = user_ref.get()
+        user_data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+        self._note_stale_days(user_ref.path, user_data)
+        return user_data
+
+    def rebuild_from_history(self, page_size: int = 500) -> Dict[str, int]:
+        """
+        Recompute all aggregates from the accessRequests collection
+
+        Used to backfill the store or repair drift. Reads the collection once
+        in pages and overwrites every aggregate document.
+
+        Args:
+            page_size (int): Documents per page
+
+        Returns:
+            dict: Counts of requests folded and documents written
+        """
+        departments: Dict[str, Optional[str]] = {}
+        cohorts: Dict[Tuple, Dict[str, Any]] = {}
+        users: Dict[Tuple, Dict[str, Any]] = {}
+        folded = 0
+
+        query = self.db.collection('accessRequests').order_by('__name__').limit(page_size)
+        last_doc = None
+        while True:
+            page = (query.start_after(last_doc) if last_doc else query).stream()
+            count = 0
+            for doc in page:
+                count += 1
+                last_doc = doc
+                data = doc.to_dict() or {}
+                decision = data.get('decision')
+                resource_type = data.get('requestedResource')
+                user_id = data.get('userId')
+                if decision not in self.FINAL_DECISIONS or not resource_type or not user_id:
+                    continue
+
+                if user_id not in departments:
+                    user_doc = self.db.collection('users').document(user_id).get()
+                    departments[user_id] = (user_doc.to_dict() or {}).get('department') if user_doc.exists else None
+
+                timestamp = self._parse_timestamp(data.get('timestamp')) or datetime.utcnow()
+                approved = 1 if decision in self.APPROVED_DECISIONS else 0
+
+                cohort_key = (data.get('userRole'), departments[user_id], resource_type)
+                user_key = (user_id, resource_type)
+                self._fold(cohorts.setdefault(cohort_key, {}), timestamp, approved, daily=False)
+                self._fold(users.setdefault(user_key, {}), timestamp, approved, daily=True)
+                folded += 1
+
+            if count < page_size:
+                break
+
+        written = 0
+        batch = self.db.batch()
+        pending = 0
+        for (role, department, resource_type), aggregate in cohorts.items():
+            batch.set(self._cohort_ref(role, department, resource_type), dict(
+                aggregate, role=role or 'unknown', department=department or 'unknown',
+                resourceType=resource_type, updatedAt=firestore.SERVER_TIMESTAMP
+            ))
+            pending += 1
+            if pending >= 500:
+                batch.commit()
+                written += pending
+                batch, pending = self.db.batch(), 0
+        for (user_id, resource_type), aggregate in users.items():
+            batch.set(self._user_ref(user_id, resource_type), dict(
+                aggregate, userId=user_id, resourceType=resource_type,
+                updatedAt=firestore.SERVER_TIMESTAMP
+            ))
+            pending += 1
+            if pending >= 500:
+                batch.commit()
+                written += pending
+                batch, pending = self.db.batch(), 0
+        if pending:
+            batch.commit()
+            written += pending
+
+        return {'requestsFolded': folded, 'documentsWritten': written}
+
+    def user_stats_from_doc(self, data: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Convert a userAccessStats document into user access statistics"""
+        total = data.get('totalRequests', 0) or 0
+        approved = data.get('approvedRequests', 0) or 0
+
+        cutoff = ((now or datetime.utcnow()) - timedelta(days=self.RECENT_DAYS)).strftime('%Y-%m-%d')
+        recent = sum(count for day, count in (data.get('daily') or {}).items() if day > cutoff)
+
+        return {
+            'approval_rate': approved / total if total > 0 else 0.5,
+            'recent_access_count': recent,
+            'request_frequency': recent / float(self.RECENT_DAYS),  # requests per day
+            'total_requests': total
+        }
+
+    def _peer_stats(
+        self,
+        cohort: Dict[str, Any],
+        user: Dict[str, Any],
+        peer_count: int,
+        now: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Derive peer statistics from the cohort aggregate minus the user's own share"""
+        total = max(0, (cohort.get('totalRequests', 0) or 0) - (user.get('totalRequests', 0) or 0))
+        approved = max(0, (cohort.get('approvedRequests', 0) or 0) - (user.get('approvedRequests', 0) or 0))
+
+        months = self._recent_months(now or datetime.utcnow(), self.PEER_RATE_MONTHS)
+        cohort_monthly = cohort.get('monthly') or {}
+        user_monthly = user.get('monthly') or {}
+        recent = sum(
+            max(0, (cohort_monthly.get(m, 0) or 0) - (user_monthly.get(m, 0) or 0))
+            for m in months
+        )
+
+        return {
+            'approval_rate': approved / total if total > 0 else 0.5,
+            'avg_requests_per_month': recent / len(months) / peer_count if peer_count > 0 else 0,
+            'total_peer_requests': total
+        }
+
+    def _note_stale_days(self, path: str, data: Dict[str, Any], now: Optional[datetime] = None) -> int:
+        """
+        Remember daily buckets older than the retention window for the next write
+
+        record_decision only clears the bucket exactly DAILY_RETENTION_DAYS
+        old, so days skipped by a quiet user would otherwise accumulate. The
+        document has just been read, so the stale keys are known without an
+        extra round-trip; they are deleted in the batch of the next decision
+        instead of issuing a write from the read path. Stale buckets never
+        count as recent activity, so leaving them until then is harmless.
+
+        Returns:
+            int: Number of stale buckets remembered
+        """
+        cutoff = ((now or datetime.utcnow()) - timedelta(days=self.DAILY_RETENTION_DAYS)).strftime('%Y-%m-%d')
+        stale = [day for day in (data.get('daily') or {}) if day <= cutoff]
+        if not stale:
+            return 0
+
+        with self._stale_lock:
+            self._stale_days[path] = stale
+            self._stale_days.move_to_end(path)
+            while len(self._stale_days) > self.MAX_PENDING_PRUNES:
+                self._stale_days.popitem(last=False)
+        return len(stale)
+
+    def _take_stale_days(self, path: str):
+        """Stale daily keys remembered for a user document, forgetting them"""
+        with self._stale_lock:
+            return self._stale_days.pop(path, [])
+
+    def _fold(self, aggregate: Dict[str, Any], timestamp: datetime, approved: int, daily: bool) -> None:
+        """Add one decided request to an in-memory aggregate"""
+        aggregate['totalRequests'] = aggregate.get('totalRequests', 0) + 1
+        aggregate['approvedRequests'] = aggregate.get('approvedRequests', 0) + approved
+        aggregate['deniedRequests'] = aggregate.get('deniedRequests', 0) + (1 - approved)
+        monthly = aggregate.setdefault('monthly', {})
+        month = timestamp.strftime('%Y-%m')
+        monthly[month] = monthly.get(month, 0) + 1
+        if daily and timestamp > datetime.utcnow() - timedelta(days=self.DAILY_RETENTION_DAYS):
+            days = aggregate.setdefault('daily', {})
+            day = timestamp.strftime('%Y-%m-%d')
+            days[day] = days.get(day, 0) + 1
+
+    def _cohort_ref(self, role: Optional[str], department: Optional[str], resource_type: str):
+        """Document reference for a cohort aggregate"""
+        key = f"{role or 'unknown'}|{department or 'unknown'}|{resource_type}"
+        return self.db.collection(self.COHORT_COLLECTION).document(self._doc_id(key))
+
+    def _user_ref(self, user_id: str, resource_type: str):
+        """Document reference for a user aggregate"""
+        key = f"{user_id}|{resource_type}"
+        return self.db.collection(self.USER_COLLECTION).document(self._doc_id(key))
+
+    @staticmethod
+    def _doc_id(key: str) -> str:
+        """Stable Firestore-safe document ID for an aggregate key"""
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:40]
+
+    @staticmethod
+    def _recent_months(now: datetime, count: int):
+        """The last `count` calendar months as YYYY-MM keys, current month included"""
+        months = []
+        year, month = now.year, now.month
+        for _ in range(count):
+            months.append(f"{year:04d}-{month:02d}")
+            month -= 1
+            if month == 0:
+                year, month = year - 1, 12
+        return months
+
+    @staticmethod
+    def _parse_timestamp(value) -> Optional[datetime]:
+        """Parse stored timestamps into naive UTC datetimes"""
+        if isinstance(value, datetime):
+            return value.replace(tzinfo=None)
+        if isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+            except ValueError:
+                return None
+        return None
+
+
+# Singleton instance
+peer_cohort_store = PeerCohortStore()
@@ -6,6 +6,7 @@ Evaluates access requests against defined policies and calculates confidence sco
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 from app.firebase_config import get_firestore_client
+from app.services.policy_index import PolicyIndex
 import os
 
 
@@ -30,6 +31,7 @@ class PolicyEngine:
     
     def __init__(self):
         self.db = get_firestore_client()
+        self.policy_index = PolicyIndex(self.db)
     
     def evaluate_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -135,45 +137,9 @@ class PolicyEngine:
             list: List of applicable policies sorted by priority (highest first)
         """
         try:
-            policies_ref = self.db.collection('policies')
-            
-            # Query active policies
-            query = policies_ref.where('isActive', '==', True)
-            policies = query.stream()
-            
-            applicable_policies = []
-            
-            for policy_doc in policies:
-                policy_data = policy_doc.to_dict()
-                policy_data['policyId'] = policy_doc.id
-                
-                # Check if policy applies to this resource and role
-                rules = policy_data.get('rules', [])
-                for rule in rules:
-                    rule_resource = rule.get('resourceType', '')
-                    allowed_roles = rule.get('allowedRoles', [])
-                    
-                    # Match resource type (exact match or wildcard)
-                    resource_match = (
-                        rule_resource == resource_type or 
-                        rule_resource == '*' or
-                        resource_type.startswith(rule_resource)
-                    )
-                    
-                    # Match role
-                    role_match = user_role in allowed_roles or '*' in allowed_roles
-                    
-                    if resource_match and role_match:
-                        applicable_policies.append(policy_data)
-                        break  # Policy matches, no need to check other rules
-            
-            # Sort by priority (higher priority first)
-            applicable_policies.sort(
-                key=lambda p: p.get('priority', 0), 
-                reverse=True
-            )
-            
-            return applicable_policies
+            # Served from the in-memory index; it is built on first use and
+            # kept current by a snapshot listener or periodic refresh
+            return self.policy_index.lookup(resource_type, user_role)
         
         except Exception as e:
             print(f"Error matching policies: {str(e)}")
@@ -0,0 +1,355 @@
+"""
+Policy Index
+In-memory compiled index of active policies for fast policy matching
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PolicyIndex:
+    """
+    In-process index of active policies keyed by resource type and role.
+
+    Rules are compiled into ``resource key -> role -> policy ids``. Because a
+    rule matches when the requested resource starts with the rule's
+    resourceType (which includes the exact match), a lookup only probes the
+    prefixes of the requested resource whose lengths actually occur in the
+    index, plus the ``*`` wildcard bucket. The index is kept current either
+    through a Firestore snapshot listener or, when listening is unavailable,
+    by re-reading the collection once the version stamp is older than the
+    refresh interval.
+    """
+
+    WILDCARD = '*'
+
+    def __init__(
+        self,
+        db=None,
+        refresh_interval: Optional[float] = None,
+        use_listener: Optional[bool] = None
+    ):
+        """
+        Initialize policy index
+
+        Args:
+            db: Firestore client
+            refresh_interval (float): Seconds before a polled index is considered stale
+            use_listener (bool): Keep the index current via a snapshot listener
+        """
+        self.db = db
+        self.refresh_interval = refresh_interval if refresh_interval is not None else float(
+            os.getenv('POLICY_INDEX_REFRESH_SECONDS', '60')
+        )
+        self.use_listener = use_listener if use_listener is not None else (
+            os.getenv('POLICY_INDEX_LISTENER_ENABLED', 'true').lower() == 'true'
+        )
+
+        self._lock = threading.RLock()
+        self._policies: Dict[str, Dict[str, Any]] = {}
+        self._order: Dict[str, int] = {}
+        self._entries: Dict[str, List[Tuple[str, str]]] = {}
+        self._by_resource: Dict[str, Dict[str, Set[str]]] = {}
+        self._prefix_lengths: Dict[int, int] = {}
+        self._sequence = 0
+
+        self._built = False
+        self._stale = False
+        self._listener = None
+        self._version = 0
+        self._built_at = 0.0
+        self._stats = {
+            'lookups': 0,
+            'fullBuilds': 0,
+            'incrementalUpdates': 0,
+            'lastBuildMs': 0.0,
+            'lastChangeLagMs': None,
+            'lastRefreshAt': None
+        }
+
+    # ------------------------------------------------------------------ lookup
+
+    def lookup(self, resource_type: str, user_role: str) -> List[Dict[str, Any]]:
+        """
+        Find applicable policies based on resource type and user role
+
+        Args:
+            resource_type (str): Type of resource being requested
+            user_role (str): Role of the requesting user
+
+        Returns:
+            list: List of applicable policies sorted by priority (highest first)
+        """
+        self._ensure_fresh()
+
+        with self._lock:
+            self._stats['lookups'] += 1
+
+            keys = [self.WILDCARD]
+            if resource_type is not None:
+                resource_length = len(resource_type)
+                for length in self._prefix_lengths:
+                    if length <= resource_length:
+                        keys.append(resource_type[:length])
+
+            roles = (user_role, self.WILDCARD)
+            matched: Set[str] = set()
+            for key in keys:
+                role_map = self._by_resource.get(key)
+                if not role_map:
+                    continue
+                for role in roles:
+                    policy_ids = role_map.get(role)
+                    if policy_ids:
+                        matched.update(policy_ids)
+
+            ordered = sorted(
+                matched,
+                key=lambda pid: (-self._priority(self._policies[pid]), self._order[pid])
+            )
+            return [self._policies[pid] for pid in ordered]
+
+    # ---------------------------------------------------------------- updates
+
+    def build(self, documents) -> None:
+        """
+        Rebuild the whole index from policy document snapshots
+
+        Args:
+            documents: Iterable of Firestore document snapshots
+        """
+        started = time.perf_counter()
+        snapshots = list(documents)
+
+        with self._lock:
+            self._policies = {}
+            self._order = {}
+            self._entries = {}
+            self._by_resource = {}
+            self._prefix_lengths = {}
+
+            for doc in snapshots:
+                self._upsert_locked(doc.id, doc.to_dict() or {})
+
+            self._built = True
+            self._stale = False
+            self._mark_refreshed(started)
+            self._stats['fullBuilds'] += 1
+
+    def upsert(self, policy_id: str, policy_data: Dict[str, Any]) -> None:
+        """
+        Insert or replace a single policy in the index
+
+        Args:
+            policy_id (str): Policy document ID
+            policy_data (dict): Policy document data
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self._upsert_locked(policy_id, policy_data)
+            self._mark_refreshed(started)
+            self._stats['incrementalUpdates'] += 1
+
+    def remove(self, policy_id: str) -> None:
+        """
+        Remove a single policy from the index
+
+        Args:
+            policy_id (str): Policy document ID
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self._remove_locked(policy_id)
+            self._mark_refreshed(started)
+            self._stats['incrementalUpdates'] += 1
+
+    def invalidate(self) -> None:
+        """Mark the index stale so the next lookup re-reads the collection"""
+        with self._lock:
+            self._stale = True
+
+    def refresh(self) -> bool:
+        """
+        Re-read all active policies from Firestore and rebuild the index
+
+        Returns:
+            bool: True if the index was rebuilt
+        """
+        if not self.db:
+            return False
+
+        try:
+            query = self.db.collection('policies').where('isActive', '==', True)
+            self.build(query.stream())
+            return True
+        except Exception as e:
+            logger.error(f"Error refreshing policy index: {str(e)}")
+            return False
+
+    def start_listener(self) -> bool:
+        """
+        Attach a Firestore snapshot listener that applies policy changes incrementally
+
+        Returns:
+            bool: True if the listener is active
+        """
+        if self._listener is not None:
+            return True
+        if not self.db or not self.use_listener:
+            return False
+
+        try:
+            query = self.db.collection('policies').where('isActive', '==', True)
+            self._listener = query.on_snapshot(self._on_snapshot)
+            return True
+        except Exception as e:
+            logger.warning(f"Policy index listener unavailable, falling back to polling: {str(e)}")
+            self.use_listener = False
+            return False
+
+    def stop_listener(self) -> None:
+        """Detach the snapshot listener if one is running"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            try:
+                listener.unsubscribe()
+            except Exception as e:
+                logger.warning(f"Error stopping policy index listener: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics including refresh latency
+
+        Returns:
+            dict: Index statistics
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'version': self._version,
+                'policyCount': len(self._policies),
+                'resourceKeys': len(self._by_resource),
+                'listenerActive': self._listener is not None,
+                'ageSeconds': round(time.time() - self._built_at, 3) if self._built else None
+            })
+            return stats
+
+    # --------------------------------------------------------------- internal
+
+    def _ensure_fresh(self) -> None:
+        """Build the index on first use and poll for changes when not listening"""
+        if self._listener is None and self.use_listener and self.db:
+            if self.start_listener() and not self._built:
+                # The first snapshot is delivered asynchronously; build now
+                # so the very first lookup does not see an empty index.
+                self.refresh()
+                return
+
+        with self._lock:
+            needs_refresh = (
+                not self._built or
+                self._stale or
+                (self._listener is None and time.time() - self._built_at > self.refresh_interval)
+            )
+
+        if needs_refresh:
+            self.refresh()
+
+    def _on_snapshot(self, col_snapshot, changes, read_time) -> None:
+        """Apply a batch of policy changes delivered by the snapshot listener"""
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == 'REMOVED':
+                        self._remove_locked(doc.id)
+                    else:
+                        self._upsert_locked(doc.id, doc.to_dict() or {})
+
+                self._built = True
+                self._stale = False
+                self._mark_refreshed(started)
+                self._stats['incrementalUpdates'] += 1
+
+                if read_time is not None:
+                    read_at = read_time if read_time.tzinfo else read_time.replace(tzinfo=timezone.utc)
+                    lag = (datetime.now(timezone.utc) - read_at).total_seconds() * 1000
+                    self._stats['lastChangeLagMs'] = round(max(0.0, lag), 3)
+        except Exception as e:
+            logger.error(f"Error applying policy snapshot: {str(e)}")
+            self.invalidate()
+
+    def _upsert_locked(self, policy_id: str, policy_data: Dict[str, Any]) -> None:
+        """Compile a policy's rules into the index (caller holds the lock)"""
+        self._remove_locked(policy_id, keep_order=True)
+
+        if not policy_data.get('isActive', True):
+            return
+
+        policy = dict(policy_data)
+        policy['policyId'] = policy_id
+
+        entries = []
+        for rule in policy.get('rules', []) or []:
+            rule_resource = rule.get('resourceType', '') or ''
+            for role in rule.get('allowedRoles', []) or []:
+                entries.append((rule_resource, role))
+
+        if policy_id not in self._order:
+            self._sequence += 1
+            self._order[policy_id] = self._sequence
+
+        self._policies[policy_id] = policy
+        self._entries[policy_id] = entries
+
+        for rule_resource, role in entries:
+            role_map = self._by_resource.setdefault(rule_resource, {})
+            if not role_map and rule_resource != self.WILDCARD:
+                length = len(rule_resource)
+                self._prefix_lengths[length] = self._prefix_lengths.get(length, 0) + 1
+            role_map.setdefault(role, set()).add(policy_id)
+
+    def _remove_locked(self, policy_id: str, keep_order: bool = False) -> None:
+        """Drop a policy's compiled rules from the index (caller holds the lock)"""
+        for rule_resource, role in self._entries.pop(policy_id, []):
+            role_map = self._by_resource.get(rule_resource)
+            if not role_map:
+                continue
+            policy_ids = role_map.get(role)
+            if policy_ids is not None:
+                policy_ids.discard(policy_id)
+                if not policy_ids:
+                    del role_map[role]
+            if not role_map:
+                del self._by_resource[rule_resource]
+                if rule_resource != self.WILDCARD:
+                    length = len(rule_resource)
+                    remaining = self._prefix_lengths.get(length, 0) - 1
+                    if remaining > 0:
+                        self._prefix_lengths[length] = remaining
+                    else:
+                        self._prefix_lengths.pop(length, None)
+
+        self._policies.pop(policy_id, None)
+        if not keep_order:
+            self._order.pop(policy_id, None)
+
+    def _mark_refreshed(self, started: float) -> None:
+        """Bump the version stamp and record refresh latency (caller holds the lock)"""
+        self._version += 1
+        self._built_at = time.time()
+        self._stats['lastBuildMs'] = round((time.perf_counter() - started) * 1000, 3)
+        self._stats['lastRefreshAt'] = datetime.utcnow().isoformat()
+
+    @staticmethod
+    def _priority(policy: Dict[str, Any]) -> float:
+        """Get a sortable policy priority"""
+        priority = policy.get('priority', 0)
+        return priority if isinstance(priority, (int, float)) else 0
@@ -0,0 +1,357 @@
+"""
+Rate Limit Engine
+Atomic GCRA (token bucket) rate limiting with a Redis script backend and a local fallback
+"""
+
+import math
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class RateLimit:
+    """
+    A single token bucket.
+
+    ``limit`` requests are allowed per ``period`` seconds and up to ``limit``
+    may be spent at once; capacity refills continuously. Buckets passed
+    together that share a ``group`` are alternatives: a request consumes
+    from the first bucket in the group that has capacity (e.g. an hourly
+    allowance with a burst overflow). Every group must have capacity for
+    the request to be allowed.
+    """
+    key: str
+    limit: int
+    period: float
+    group: str = 'default'
+
+    @property
+    def emission_ms(self) -> float:
+        """Milliseconds one request occupies in the bucket"""
+        return (self.period * 1000.0) / max(1, self.limit)
+
+
+@dataclass
+class BucketState:
+    """Per-bucket outcome of a rate limit check"""
+    key: str
+    remaining: int
+    reset_after: float   # seconds until the bucket is full again
+    retry_after: float   # seconds until one more request fits
+    consumed: bool = False
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of checking a set of buckets"""
+    allowed: bool
+    buckets: List[BucketState] = field(default_factory=list)
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until a denied request could be allowed (0 when allowed)"""
+        if self.allowed:
+            return 0.0
+        return max((b.retry_after for b in self.buckets if b.remaining <= 0), default=0.0)
+
+
+# Check-and-consume for every bucket in one server-side call.
+# KEYS[i]: bucket key; ARGV: emission_ms, capacity, group for each bucket.
+# Returns {allowed, remaining_1, reset_ms_1, retry_ms_1, consumed_1, ...}.
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local n = #KEYS
+local tats = {}
+local chosen = {}
+for i = 1, n do
+  local emission = tonumber(ARGV[(i - 1) * 3 + 1])
+  local capacity = tonumber(ARGV[(i - 1) * 3 + 2])
+  local group = ARGV[(i - 1) * 3 + 3]
+  local tat = tonumber(redis.call('GET', KEYS[i])) or now
+  if tat < now then tat = now end
+  tats[i] = tat
+  if chosen[group] == nil then chosen[group] = 0 end
+  if chosen[group] == 0 and (tat + emission - now) <= emission * capacity then
+    chosen[group] = i
+  end
+end
+local allowed = 1
+for _, i in pairs(chosen) do
+  if i == 0 then allowed = 0 end
+end
+local result = {allowed}
+for i = 1, n do
+  local emission = tonumber(ARGV[(i - 1) * 3 + 1])
+  local capacity = tonumber(ARGV[(i - 1) * 3 + 2])
+  local group = ARGV[(i - 1) * 3 + 3]
+  local tat = tats[i]
+  local consumed = 0
+  if allowed == 1 and chosen[group] == i then
+    tat = tat + emission
+    consumed = 1
+    redis.call('SET', KEYS[i], string.format('%.3f', tat), 'PX', math.ceil(tat - now))
+  end
+  local retry = tat + emission - now - emission * capacity
+  if retry < 0 then retry = 0 end
+  result[#result + 1] = math.floor((emission * capacity - (tat - now)) / emission)
+  result[#result + 1] = string.format('%.3f', tat - now)
+  result[#result + 1] = string.format('%.3f', retry)
+  result[#result + 1] = consumed
+end
+return result
+"""
+
+
+def _script_args(limits: Sequence[RateLimit]) -> Tuple[List[str], List[str]]:
+    """Flatten buckets into script KEYS/ARGV"""
+    keys = [limit.key for limit in limits]
+    args = []
+    for limit in limits:
+        args.extend([repr(limit.emission_ms), str(max(1, limit.limit)), str(limit.group)])
+    return keys, args
+
+
+def _parse_script_result(limits: Sequence[RateLimit], raw: Sequence) -> RateLimitResult:
+    """Turn the flat script reply into a RateLimitResult"""
+    buckets = []
+    for i, limit in enumerate(limits):
+        offset = 1 + i * 4
+        buckets.append(BucketState(
+            key=limit.key,
+            remaining=max(0, int(raw[offset])),
+            reset_after=float(raw[offset + 1]) / 1000.0,
+            retry_after=float(raw[offset + 2]) / 1000.0,
+            consumed=int(raw[offset + 3]) == 1
+        ))
+    return RateLimitResult(allowed=int(raw[0]) == 1, buckets=buckets)
+
+
+class RedisRateLimitEngine:
+    """Rate limit engine that checks and consumes in a single Redis round-trip"""
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._script = redis_client.register_script(GCRA_SCRIPT)
+
+    def check(self, limits: Sequence[RateLimit]) -> RateLimitResult:
+        """
+        Atomically check and consume all buckets
+
+        Args:
+            limits (list): Buckets to check together
+
+        Returns:
+            RateLimitResult: Decision and per-bucket state
+        """
+        keys, args = _script_args(limits)
+        return _parse_script_result(limits, self._script(keys=keys, args=args))
+
+    def check_many(self, limit_sets: Sequence[Sequence[RateLimit]]) -> List[RateLimitResult]:
+        """
+        Evaluate several independent checks in one pipelined round-trip
+
+        Args:
+            limit_sets (list): One list of buckets per check
+
+        Returns:
+            list: One RateLimitResult per check
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        for limits in limit_sets:
+            keys, args = _script_args(limits)
+            self._script(keys=keys, args=args, client=pipe)
+        replies = pipe.execute()
+        return [_parse_script_result(limits, raw) for limits, raw in zip(limit_sets, replies)]
+
+
+class LocalRateLimitEngine:
+    """
+    In-process rate limit engine with the same GCRA semantics as the Redis script.
+
+    State is one float (theoretical arrival time) per bucket, spread over
+    lock-striped shards. A bucket whose arrival time is in the past is
+    indistinguishable from an absent one, so idle keys are evicted without
+    changing any decision and memory stays proportional to active clients.
+    """
+
+    def __init__(self, shards: int = 64, sweep_interval: float = 60.0):
+        self._shard_count = shards
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._tats: List[Dict[str, float]] = [{} for _ in range(shards)]
+        self._next_sweep = [0.0] * shards
+        self.sweep_interval = sweep_interval
+
+    def check(self, limits: Sequence[RateLimit], now: Optional[float] = None) -> RateLimitResult:
+        """
+        Atomically check and consume all buckets
+
+        Args:
+            limits (list): Buckets to check together
+            now (float): Current time in seconds (defaults to time.time())
+
+        Returns:
+            RateLimitResult: Decision and per-bucket state
+        """
+        now_ms = (now if now is not None else time.time()) * 1000.0
+
+        # Acquire the shards involved in a fixed order so multi-bucket
+        # checks stay atomic without risking lock-order deadlocks
+        shard_ids = sorted({self._shard(limit.key) for limit in limits})
+        for shard_id in shard_ids:
+            self._locks[shard_id].acquire()
+        try:
+            for shard_id in shard_ids:
+                if now_ms >= self._next_sweep[shard_id]:
+                    self._sweep(shard_id, now_ms)
+
+            tats = []
+            chosen: Dict[str, int] = {}
+            for i, limit in enumerate(limits):
+                tat = max(self._tats[self._shard(limit.key)].get(limit.key, now_ms), now_ms)
+                tats.append(tat)
+                emission = limit.emission_ms
+                if limit.group not in chosen:
+                    chosen[limit.group] = -1
+                if chosen[limit.group] < 0 and tat + emission - now_ms <= emission * max(1, limit.limit):
+                    chosen[limit.group] = i
+
+            allowed = all(i >= 0 for i in chosen.values())
+            buckets = []
+            for i, limit in enumerate(limits):
+                emission = limit.emission_ms
+                capacity = max(1, limit.limit)
+                tat = tats[i]
+                consumed = allowed and chosen[limit.group] == i
+                if consumed:
+                    tat += emission
+                    self._tats[self._shard(limit.key)][limit.key] = tat
+
+                buckets.append(BucketState(
+                    key=limit.key,
+                    remaining=max(0, math.floor((emission * capacity - (tat - now_ms)) / emission)),
+                    reset_after=(tat - now_ms) / 1000.0,
+                    retry_after=max(0.0, tat + emission - now_ms - emission * capacity) / 1000.0,
+                    consumed=consumed
+                ))
+
+            return RateLimitResult(allowed=allowed, buckets=buckets)
+        finally:
+            for shard_id in reversed(shard_ids):
+                self._locks[shard_id].release()
+
+    def check_many(self, limit_sets: Sequence[Sequence[RateLimit]]) -> List[RateLimitResult]:
+        """Evaluate several independent checks"""
+        return [self.check(limits) for limits in limit_sets]
+
+    def reset(self, key: str) -> None:
+        """Forget a bucket"""
+        shard_id = self._shard(key)
+        with self._locks[shard_id]:
+            self._tats[shard_id].pop(key, None)
+
+    def size(self) -> int:
+        """Number of tracked (non-idle or not yet swept) buckets"""
+        return sum(len(tats) for tats in self._tats)
+
+    def _shard(self, key: str) -> int:
+        """Stable shard index for a key"""
+        return zlib.crc32(key.encode('utf-8')) % self._shard_count
+
+    def _sweep(self, shard_id: int, now_ms: float) -> None:
+        """Drop idle buckets from a shard (caller holds the shard lock)"""
+        tats = self._tats[shard_id]
+        idle = [key for key, tat in tats.items() if tat <= now_ms]
+        for key in idle:
+            del tats[key]
+        self._next_sweep[shard_id] = now_ms + self.sweep_interval * 1000.0
+
+
+class SlidingWindowCounterLimiter:
+    """
+    Fixed-memory sliding-window limiter for in-process request throttling.
+
+    Each key keeps three numbers: the start of the current fixed window and
+    the counts of the current and previous windows. The trailing-window count
+    is estimated as ``previous * (1 - elapsed / window) + current``, so a
+    check is O(1) regardless of the limit. Keys are spread over lock-striped
+    shards; a key untouched for two full windows carries no state and is
+    evicted, and each shard is additionally capped at ``max_keys_per_shard``
+    (least recently used keys go first).
+    """
+
+    def __init__(self, shards: int = 64, max_keys_per_shard: int = 10000, sweep_interval: float = 60.0):
+        self._shard_count = shards
+        self.max_keys_per_shard = max_keys_per_shard
+        self.sweep_interval = sweep_interval
+        self._locks = [threading.Lock() for _ in range(shards)]
+        # key -> [window_start, current_count, previous_count, window_seconds]
+        self._windows: List[Dict[str, list]] = [{} for _ in range(shards)]
+        self._next_sweep = [0.0] * shards
+
+    def hit(self, key: str, limit: int, window: float, now: Optional[float] = None) -> Tuple[bool, int]:
+        """
+        Count a request against a key if it is within the limit
+
+        Args:
+            key (str): Limiter key
+            limit (int): Maximum requests per trailing window
+            window (float): Window length in seconds
+            now (float): Current time in seconds (defaults to time.time())
+
+        Returns:
+            tuple: (allowed, estimated requests in the trailing window)
+        """
+        now = now if now is not None else time.time()
+        shard_id = zlib.crc32(key.encode('utf-8')) % self._shard_count
+        windows = self._windows[shard_id]
+
+        with self._locks[shard_id]:
+            if now >= self._next_sweep[shard_id]:
+                self._sweep(shard_id, now)
+
+            state = windows.pop(key, None)
+            window_start = now - (now % window)
+            if state is None or state[0] <= window_start - 2 * window:
+                state = [window_start, 0, 0, window]
+            elif state[0] < window_start:
+                # Roll forward; if more than one window passed, previous is empty
+                state[2] = state[1] if state[0] == window_start - window else 0
+                state[1] = 0
+                state[0] = window_start
+
+            elapsed_fraction = (now - window_start) / window
+            estimated = state[2] * (1.0 - elapsed_fraction) + state[1]
+
+            allowed = estimated < limit
+            if allowed:
+                state[1] += 1
+                estimated += 1
+
+            # Re-inserting keeps dict order as least-recently-used first
+            windows[key] = state
+            if len(windows) > self.max_keys_per_shard:
+                windows.pop(next(iter(windows)))
+
+            return allowed, int(math.ceil(estimated))
+
+    def size(self) -> int:
+        """Number of tracked keys"""
+        return sum(len(windows) for windows in self._windows)
+
+    def clear(self) -> None:
+        """Forget all keys"""
+        for shard_id in range(self._shard_count):
+            with self._locks[shard_id]:
+                self._windows[shard_id].clear()
+
+    def _sweep(self, shard_id: int, now: float) -> None:
+        """Drop keys idle for two full windows (caller holds the shard lock)"""
+        windows = self._windows[shard_id]
+        idle = [key for key, state in windows.items() if state[0] + 2 * state[3] <= now]
+        for key in idle:
+            del windows[key]
+        self._next_sweep[shard_id] = now + self.sweep_interval
@@ -5,152 +5,216 @@ Implements rate limiting with burst allowances and API usage tracking
 
 import time
 import json
-from typing import Dict, Optional, Tuple
+import threading
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from flask import current_app, request, g
 from functools import wraps
 from app.services.audit_logger import audit_logger
+from app.services.rate_limit_engine import (
+    RateLimit,
+    RateLimitResult,
+    RedisRateLimitEngine,
+    LocalRateLimitEngine
+)
 from app.utils.error_handler import AppError
 
 
 class RateLimiter:
-    """Rate limiting service with Redis backend"""
+    """Rate limiting service with Redis backend and an in-process fallback"""
+    
+    # Seconds the emergency-mode lookup is reused between requests
+    EMERGENCY_CHECK_INTERVAL = 5
     
     def __init__(self):
         self.default_limits = {
             'requests_per_hour': 1000,
             'burst_allowance': 50,  # Additional requests allowed in burst
             'burst_window': 60,     # Burst window in seconds
-            'emergency_multiplier': 2.0  # Emergency situations get 2x limits
+            'emergency_multiplier': 2.0,  # Emergency situations get 2x limits
+            'client_requests_per_hour': None  # Optional cap across all endpoints
         }
+        
+        self._local_engine = LocalRateLimitEngine()
+        self._redis_engine = None
+        self._redis_engine_client = None
+        self._engine_lock = threading.Lock()
+        
+        self._emergency_cached = False
+        self._emergency_checked_at = 0.0
     
-    def _get_redis_client(self):
+    def _get_redis_client(self, required: bool = True):
         """Get Redis client from app config"""
         redis_client = current_app.config.get('REDIS_CLIENT')
-        if not redis_client:
+        if not redis_client and required:
             raise AppError('REDIS_UNAVAILABLE', 'Rate limiting service unavailable', 503)
         return redis_client
     
+    def _get_engine(self):
+        """Get the Redis script engine, or the local engine when Redis is not configured"""
+        redis_client = self._get_redis_client(required=False)
+        if not redis_client:
+            return self._local_engine
+        
+        if self._redis_engine_client is not redis_client:
+            with self._engine_lock:
+                if self._redis_engine_client is not redis_client:
+                    self._redis_engine = RedisRateLimitEngine(redis_client)
+                    self._redis_engine_client = redis_client
+        return self._redis_engine
+    
     def _get_client_key(self, client_id: str, endpoint: str = None) -> str:
         """Generate Redis key for client rate limiting"""
-        base_key = f"rate_limit:{client_id}"
+        # The client id is wrapped in a hash tag so all of a client's
+        # buckets map to the same Redis Cluster slot for the script
+        base_key = f"rate_limit:{{{client_id}}}"
         if endpoint:
             base_key += f":{endpoint}"
         return base_key
     
     def _get_burst_key(self, client_id: str) -> str:
         """Generate Redis key for burst tracking"""
-        return f"rate_limit_burst:{client_id}"
+        return f"rate_limit_burst:{{{client_id}}}"
     
     def _is_emergency_situation(self) -> bool:
         """Check if current request is during emergency situation"""
-        # Check for active break-glass sessions or system alerts
-        redis_client = self._get_redis_client()
+        now = time.time()
+        if now - self._emergency_checked_at < self.EMERGENCY_CHECK_INTERVAL:
+            return self._emergency_cached
         
-        # Check for active emergency sessions
-        emergency_keys = redis_client.keys("break_glass_session:*")
-        if emergency_keys:
-            return True
+        # Check for active break-glass sessions or system alerts
+        redis_client = self._get_redis_client(required=False)
+        emergency = False
         
-        # Check for system-wide emergency flag
-        emergency_flag = redis_client.get("system_emergency_mode")
-        if emergency_flag:
-            return True
+        if redis_client:
+            # Check for system-wide emergency flag
+            if redis_client.get("system_emergency_mode"):
+                emergency = True
+            else:
+                # Check for active emergency sessions without a blocking KEYS scan
+                for _ in redis_client.scan_iter(match="break_glass_session:*", count=100):
+                    emergency = True
+                    break
         
-        return False
+        self._emergency_cached = emergency
+        self._emergency_checked_at = now
+        return emergency
     
-    def check_rate_limit(self, client_id: str, endpoint: str = None, 
-                        custom_limits: Dict = None) -> Tuple[bool, Dict]:
+    def _build_limits(self, client_id: str, endpoint: str, limits: Dict) -> List[RateLimit]:
         """
-        Check if request is within rate limits
+        Translate limit settings into token buckets checked in one call
         
-        Returns:
-            Tuple of (allowed: bool, limit_info: Dict)
+        The hourly allowance and the burst allowance share a group, so the
+        burst bucket is only spent once the hourly one is exhausted.
         """
-        redis_client = self._get_redis_client()
+        buckets = [
+            RateLimit(
+                key=self._get_client_key(client_id, endpoint),
+                limit=int(limits['requests_per_hour']),
+                period=3600,
+                group='hourly'
+            ),
+            RateLimit(
+                key=self._get_burst_key(client_id),
+                limit=int(limits['burst_allowance']),
+                period=limits['burst_window'],
+                group='hourly'
+            )
+        ]
         
-        # Use custom limits or defaults
-        limits = custom_limits or self.default_limits.copy()
+        client_limit = limits.get('client_requests_per_hour')
+        if client_limit and endpoint:
+            buckets.append(RateLimit(
+                key=self._get_client_key(client_id),
+                limit=int(client_limit),
+                period=3600,
+                group='client'
+            ))
         
-        # Apply emergency multiplier if needed
-        if self._is_emergency_situation():
+        return buckets
+    
+    def _build_limit_info(self, limits: Dict, result: RateLimitResult, emergency: bool) -> Dict:
+        """Summarise a rate limit result in the limit_info format"""
+        now = time.time()
+        hourly, burst = result.buckets[0], result.buckets[1]
+        
+        limit_info = {
+            'requests_per_hour': limits['requests_per_hour'],
+            'hourly_remaining': hourly.remaining,
+            'burst_allowance': limits['burst_allowance'],
+            'burst_remaining': burst.remaining,
+            'reset_time': int(now + hourly.reset_after),
+            'burst_reset_time': int(now + burst.reset_after),
+            'retry_after': round(result.retry_after, 3),
+            'emergency_mode': emergency
+        }
+        
+        if len(result.buckets) > 2:
+            limit_info['client_requests_per_hour'] = limits['client_requests_per_hour']
+            limit_info['client_remaining'] = result.buckets[2].remaining
+        
+        return limit_info
+    
+    def _resolve_limits(self, custom_limits: Dict = None) -> Tuple[Dict, bool]:
+        """Merge custom limits over the defaults and apply the emergency multiplier"""
+        limits = self.default_limits.copy()
+        limits.update(custom_limits or {})
+        
+        emergency = self._is_emergency_situation()
+        if emergency:
             limits['requests_per_hour'] = int(limits['requests_per_hour'] * limits['emergency_multiplier'])
             limits['burst_allowance'] = int(limits['burst_allowance'] * limits['emergency_multiplier'])
+            if limits.get('client_requests_per_hour'):
+                limits['client_requests_per_hour'] = int(
+                    limits['client_requests_per_hour'] * limits['emergency_multiplier']
+                )
         
-        # Generate keys
-        rate_key = self._get_client_key(client_id, endpoint)
-        burst_key = self._get_burst_key(client_id)
+        return limits, emergency
+    
+    def check_rate_limit(self, client_id: str, endpoint: str = None, 
+                        custom_limits: Dict = None) -> Tuple[bool, Dict]:
+        """
+        Check if request is within rate limits
         
-        current_time = int(time.time())
-        hour_start = current_time - (current_time % 3600)  # Start of current hour
+        The hourly, burst and optional per-client buckets are checked and
+        consumed atomically in a single round-trip.
         
-        # Check hourly limit
-        hourly_key = f"{rate_key}:{hour_start}"
-        current_count = redis_client.get(hourly_key)
-        current_count = int(current_count) if current_count else 0
+        Returns:
+            Tuple of (allowed: bool, limit_info: Dict)
+        """
+        limits, emergency = self._resolve_limits(custom_limits)
         
-        # Check burst limit
-        burst_data = redis_client.get(burst_key)
-        if burst_data:
-            try:
-                burst_info = json.loads(burst_data)
-                burst_count = burst_info.get('count', 0)
-                burst_start = burst_info.get('start_time', current_time)
-                
-                # Reset burst if window expired
-                if current_time - burst_start > limits['burst_window']:
-                    burst_count = 0
-                    burst_start = current_time
-            except (json.JSONDecodeError, KeyError):
-                burst_count = 0
-                burst_start = current_time
-        else:
-            burst_count = 0
-            burst_start = current_time
+        result = self._get_engine().check(self._build_limits(client_id, endpoint, limits))
         
-        # Calculate available limits
-        hourly_remaining = max(0, limits['requests_per_hour'] - current_count)
-        burst_remaining = max(0, limits['burst_allowance'] - burst_count)
+        return result.allowed, self._build_limit_info(limits, result, emergency)
+    
+    def check_rate_limits(self, checks: List[Tuple[str, Optional[str], Optional[Dict]]]) -> List[Tuple[bool, Dict]]:
+        """
+        Check several independent rate limits in one pipelined round-trip
         
-        # Check if request is allowed
-        allowed = False
-        if hourly_remaining > 0:
-            allowed = True
-        elif burst_remaining > 0:
-            allowed = True
+        Args:
+            checks: List of (client_id, endpoint, custom_limits) tuples
         
-        # Prepare limit info
-        limit_info = {
-            'requests_per_hour': limits['requests_per_hour'],
-            'hourly_remaining': hourly_remaining,
-            'burst_allowance': limits['burst_allowance'],
-            'burst_remaining': burst_remaining,
-            'reset_time': hour_start + 3600,  # Next hour
-            'burst_reset_time': burst_start + limits['burst_window'],
-            'emergency_mode': self._is_emergency_situation()
-        }
+        Returns:
+            List of (allowed, limit_info) tuples in the same order
+        """
+        resolved = [self._resolve_limits(custom_limits) for _, _, custom_limits in checks]
+        limit_sets = [
+            self._build_limits(client_id, endpoint, limits)
+            for (client_id, endpoint, _), (limits, _) in zip(checks, resolved)
+        ]
         
-        if allowed:
-            # Increment counters
-            if hourly_remaining > 0:
-                # Use hourly allowance
-                redis_client.incr(hourly_key)
-                redis_client.expire(hourly_key, 3600)  # Expire at end of hour
-            else:
-                # Use burst allowance
-                burst_count += 1
-                burst_data = {
-                    'count': burst_count,
-                    'start_time': burst_start
-                }
-                redis_client.setex(burst_key, limits['burst_window'], json.dumps(burst_data))
-        
-        return allowed, limit_info
+        results = self._get_engine().check_many(limit_sets)
+        
+        return [
+            (result.allowed, self._build_limit_info(limits, result, emergency))
+            for result, (limits, emergency) in zip(results, resolved)
+        ]
     
     def log_api_usage(self, client_id: str, endpoint: str, method: str, 
                      status_code: int, response_time: float, user_id: str = None):
         """Log API usage for audit and analytics"""
-        redis_client = self._get_redis_client()
+        redis_client = self._get_redis_client(required=False)
         
         # Create usage log entry
         usage_entry = {
@@ -167,10 +231,13 @@ class RateLimiter:
         }
         
         # Store in Redis list (keep last 10000 entries per client)
-        usage_key = f"api_usage:{client_id}"
-        redis_client.lpush(usage_key, json.dumps(usage_entry))
-        redis_client.ltrim(usage_key, 0, 9999)  # Keep only last 10000 entries
-        redis_client.expire(usage_key, 30 * 24 * 3600)  # 30 days retention
+        if redis_client:
+            usage_key = f"api_usage:{client_id}"
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.lpush(usage_key, json.dumps(usage_entry))
+            pipe.ltrim(usage_key, 0, 9999)  # Keep only last 10000 entries
+            pipe.expire(usage_key, 30 * 24 * 3600)  # 30 days retention
+            pipe.execute()
         
         # Log to audit system
         audit_logger.log_event(
@@ -261,6 +328,9 @@ class RateLimiter:
         """Enable/disable emergency mode for increased rate limits"""
         redis_client = self._get_redis_client()
         
+        # Drop the cached emergency lookup so the change applies immediately
+        self._emergency_checked_at = 0.0
+        
         if enabled:
             redis_client.setex("system_emergency_mode", duration_minutes * 60, "true")
             audit_logger.log_event(
@@ -6,17 +6,19 @@ Requirements: 7.3
 """
 
 import logging
+import os
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import json
 import uuid
-from collections import defaultdict, deque
+from collections import OrderedDict, defaultdict, deque
+from queue import Queue, Empty, Full
 import threading
 import time
 
 from app.firebase_config import db
 from app.services.audit_logger import audit_logger
-from websocket_config import socketio, emit_admin_notification
+from websocket_config import schedule_broadcast, emit_admin_notification
 
 logger = logging.getLogger(__name__)
 
@@ -24,15 +26,29 @@ class RealTimeEventProcessor:
     """
     Real-time event processor for security events and heatmap updates
     Processes events within 10 seconds and broadcasts to administrators
+    
+    All in-memory state is bounded so memory and per-event work stay flat
+    over long uptimes: the heatmap cache evicts whole minute buckets past
+    the retention window (and the oldest entries beyond its size cap),
+    failed-login times per device are deques pruned from the left, idle
+    devices are dropped from the front of a recency-ordered map, and hourly
+    metric counters beyond the retained hours are discarded.
     """
     
     def __init__(self):
-        self.event_queue = deque()
+        self.max_queued_events = int(os.getenv('REALTIME_EVENT_QUEUE_SIZE', '10000'))
+        self.heatmap_cache_size = int(os.getenv('REALTIME_HEATMAP_CACHE_SIZE', '2000'))
+        self.heatmap_retention_minutes = int(os.getenv('REALTIME_HEATMAP_RETENTION_MINUTES', '60'))
+        self.metrics_retention_hours = int(os.getenv('REALTIME_METRICS_RETENTION_HOURS', '168'))
+        self.heatmap_cell_size = max(1, int(os.getenv('REALTIME_HEATMAP_CELL_SIZE', '50')))
+        
+        self.event_queue = Queue(maxsize=self.max_queued_events)
         self.processing_lock = threading.Lock()
-        self.heatmap_cache = {}
+        self.heatmap_cache = OrderedDict()  # eventId -> (minute bucket, heatmap item), oldest first
         self.activity_metrics = defaultdict(int)
+        self.metric_hours = deque()  # Hours with hourly_* counters, oldest first
         self.alert_history = deque(maxlen=1000)  # Keep last 1000 alerts
-        self.coordinated_attack_tracker = defaultdict(list)
+        self.coordinated_attack_tracker = OrderedDict()  # deviceId -> deque of failure times, least recently active first
         self.processing_thread = None
         self.is_running = False
         
@@ -71,6 +87,10 @@ class RealTimeEventProcessor:
     def stop_processing(self):
         """Stop the background event processing"""
         self.is_running = False
+        try:
+            self.event_queue.put_nowait(None)  # Wake the consumer
+        except Full:
+            pass
         if self.processing_thread:
             self.processing_thread.join(timeout=5)
         logger.info("Real-time event processor stopped")
@@ -90,8 +110,11 @@ class RealTimeEventProcessor:
             enriched_event = self._enrich_event_data(event_data)
             
             # Add to processing queue
-            with self.processing_lock:
-                self.event_queue.append(enriched_event)
+            try:
+                self.event_queue.put_nowait(enriched_event)
+            except Full:
+                with self.processing_lock:
+                    self.activity_metrics['dropped_events'] += 1
             
             # Update real-time metrics
             self._update_activity_metrics(enriched_event)
@@ -251,14 +274,19 @@ class RealTimeEventProcessor:
         event_type = event_data.get('eventType')
         severity = event_data.get('severity')
         
-        # Update counters
-        self.activity_metrics['total_events'] += 1
-        self.activity_metrics[f'events_{severity}'] += 1
-        self.activity_metrics[f'type_{event_type}'] += 1
-        
-        # Update hourly metrics
-        current_hour = datetime.utcnow().strftime('%Y-%m-%d-%H')
-        self.activity_metrics[f'hourly_{current_hour}'] += 1
+        with self.processing_lock:
+            # Update counters
+            self.activity_metrics['total_events'] += 1
+            self.activity_metrics[f'events_{severity}'] += 1
+            self.activity_metrics[f'type_{event_type}'] += 1
+            
+            # Update hourly metrics, dropping hours past the retention
+            current_hour = datetime.utcnow().strftime('%Y-%m-%d-%H')
+            if not self.metric_hours or self.metric_hours[-1] != current_hour:
+                self.metric_hours.append(current_hour)
+                while len(self.metric_hours) > self.metrics_retention_hours:
+                    self.activity_metrics.pop(f'hourly_{self.metric_hours.popleft()}', None)
+            self.activity_metrics[f'hourly_{current_hour}'] += 1
     
     def _should_generate_alert(self, event_data: Dict[str, Any]) -> bool:
         """Determine if an alert should be generated for the event"""
@@ -410,7 +438,18 @@ class RealTimeEventProcessor:
         }
         
         # Cache heatmap data
-        self.heatmap_cache[event_data['eventId']] = heatmap_data
+        bucket = int(time.time() // 60)
+        oldest_bucket = bucket - self.heatmap_retention_minutes
+        with self.processing_lock:
+            self.heatmap_cache.pop(event_data['eventId'], None)
+            self.heatmap_cache[event_data['eventId']] = (bucket, heatmap_data)
+            
+            # Entries are in insertion order: evict expired buckets and overflow from the front
+            while self.heatmap_cache:
+                entry_bucket, _ = next(iter(self.heatmap_cache.values()))
+                if entry_bucket >= oldest_bucket and len(self.heatmap_cache) <= self.heatmap_cache_size:
+                    break
+                self.heatmap_cache.popitem(last=False)
         
         return heatmap_data
     
@@ -440,26 +479,33 @@ class RealTimeEventProcessor:
     def _broadcast_to_administrators(self, event_data: Dict[str, Any], heatmap_data: Dict[str, Any]):
         """Broadcast event and heatmap updates to administrators"""
         try:
-            if socketio:
-                # Broadcast heatmap update
-                socketio.emit('heatmap_update', heatmap_data, room='admin_room')
-                
-                # Broadcast security event
-                socketio.emit('security_event', {
-                    'eventId': event_data['eventId'],
-                    'eventType': event_data['eventType'],
-                    'severity': event_data['severity'],
-                    'timestamp': event_data['timestamp'],
-                    'userId': event_data.get('userId'),
-                    'heatmapData': event_data['heatmapData'],
-                    'eventData': event_data['eventData']
-                }, room='admin_room')
-                
-                logger.info(f"Broadcasted event {event_data['eventId']} to administrators")
+            # Both updates go out in the next admin_room frame, on every worker.
+            # Heatmap points in the same cell replace each other until the frame is sent
+            schedule_broadcast('heatmap_update', heatmap_data, 'admin_room',
+                               key=self._heatmap_cell(heatmap_data))
+            
+            # Every security event is sent, so it is queued without a key
+            schedule_broadcast('security_event', {
+                'eventId': event_data['eventId'],
+                'eventType': event_data['eventType'],
+                'severity': event_data['severity'],
+                'timestamp': event_data['timestamp'],
+                'userId': event_data.get('userId'),
+                'heatmapData': event_data['heatmapData'],
+                'eventData': event_data['eventData']
+            }, 'admin_room')
+            
+            logger.debug(f"Queued event {event_data['eventId']} for administrators")
             
         except Exception as e:
             logger.error(f"Error broadcasting to administrators: {str(e)}")
     
+    def _heatmap_cell(self, heatmap_data: Dict[str, Any]) -> str:
+        """Heatmap grid cell of a point, used as its broadcast key"""
+        coordinates = heatmap_data['coordinates']
+        return (f"{heatmap_data['category']}:{coordinates['x'] // self.heatmap_cell_size}:"
+                f"{coordinates['y'] // self.heatmap_cell_size}")
+    
     def _check_coordinated_attacks(self, event_data: Dict[str, Any]):
         """Check for coordinated attack patterns"""
         try:
@@ -468,47 +514,48 @@ class RealTimeEventProcessor:
             user_id = event_data.get('userId')
             timestamp = datetime.fromisoformat(event_data['timestamp'].replace('Z', '+00:00'))
             
-            # Track failed login attempts by device
-            if event_type == 'failed_login' and device_id:
-                self.coordinated_attack_tracker[device_id].append(timestamp)
-                
-                # Check for multiple failures within 10 minutes
-                recent_failures = [
-                    t for t in self.coordinated_attack_tracker[device_id]
-                    if timestamp - t <= timedelta(minutes=10)
-                ]
-                
-                if len(recent_failures) >= 5:
-                    # Generate coordinated attack event
-                    attack_event = {
-                        'eventType': 'coordinated_attack',
-                        'severity': 'critical',
-                        'deviceId': device_id,
-                        'userId': user_id,
-                        'eventData': {
-                            'description': f'Multiple failed login attempts detected from device {device_id}',
-                            'failure_count': len(recent_failures),
-                            'time_window': '10 minutes'
-                        }
-                    }
+            attack_event = None
+            
+            with self.processing_lock:
+                # Track failed login attempts by device
+                if event_type == 'failed_login' and device_id:
+                    failures = self.coordinated_attack_tracker.pop(device_id, None) or deque()
+                    self.coordinated_attack_tracker[device_id] = failures  # Most recently active last
+                    failures.append(timestamp)
                     
-                    # Process the attack event
-                    self.process_security_event(attack_event)
+                    # Keep failures within 10 minutes
+                    window_start = timestamp - timedelta(minutes=10)
+                    while failures and failures[0] < window_start:
+                        failures.popleft()
                     
-                    # Clear the tracker for this device
-                    self.coordinated_attack_tracker[device_id].clear()
-            
-            # Clean up old entries (older than 1 hour)
-            cutoff_time = timestamp - timedelta(hours=1)
-            for device_id in list(self.coordinated_attack_tracker.keys()):
-                self.coordinated_attack_tracker[device_id] = [
-                    t for t in self.coordinated_attack_tracker[device_id]
-                    if t > cutoff_time
-                ]
+                    if len(failures) >= 5:
+                        # Generate coordinated attack event
+                        attack_event = {
+                            'eventType': 'coordinated_attack',
+                            'severity': 'critical',
+                            'deviceId': device_id,
+                            'userId': user_id,
+                            'eventData': {
+                                'description': f'Multiple failed login attempts detected from device {device_id}',
+                                'failure_count': len(failures),
+                                'time_window': '10 minutes'
+                            }
+                        }
+                        
+                        # Clear the tracker for this device
+                        failures.clear()
                 
-                # Remove empty entries
-                if not self.coordinated_attack_tracker[device_id]:
-                    del self.coordinated_attack_tracker[device_id]
+                # Drop devices without failures in the last hour (least recently active are first)
+                cutoff_time = timestamp - timedelta(hours=1)
+                while self.coordinated_attack_tracker:
+                    failures = next(iter(self.coordinated_attack_tracker.values()))
+                    if failures and failures[-1] > cutoff_time:
+                        break
+                    self.coordinated_attack_tracker.popitem(last=False)
+            
+            # Process the attack event
+            if attack_event:
+                self.process_security_event(attack_event)
                     
         except Exception as e:
             logger.error(f"Error checking coordinated attacks: {str(e)}")
@@ -517,18 +564,19 @@ class RealTimeEventProcessor:
         """Background thread for processing events"""
         while self.is_running:
             try:
-                with self.processing_lock:
-                    if self.event_queue:
-                        event = self.event_queue.popleft()
-                        # Additional processing can be done here
-                        logger.debug(f"Processed event {event.get('eventId')}")
-                
-                # Sleep to prevent excessive CPU usage
-                time.sleep(0.1)
+                # Block until an event arrives instead of polling
+                event = self.event_queue.get(timeout=1.0)
+            except Empty:
+                continue
+            
+            try:
+                if event is None:
+                    continue
+                # Additional processing can be done here
+                logger.debug(f"Processed event {event.get('eventId')}")
                 
             except Exception as e:
                 logger.error(f"Error in event processing loop: {str(e)}")
-                time.sleep(1)  # Wait longer on error
     
     def get_heatmap_data(self, time_range: str = '1h', user_role: str = None, severity: str = None) -> Dict[str, Any]:
         """
@@ -644,7 +692,8 @@ class RealTimeEventProcessor:
     
     def get_activity_metrics(self) -> Dict[str, Any]:
         """Get current activity metrics"""
-        return dict(self.activity_metrics)
+        with self.processing_lock:
+            return dict(self.activity_metrics)
     
     def get_alert_history(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get recent alert history"""
@@ -0,0 +1,138 @@
+"""
+Session Risk State
+Compact rolling per-session state for incremental continuous authentication
+"""
+
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Time constant of the request-rate EWMA (minutes)
+REQUEST_RATE_TAU_MINUTES = 5.0
+# Distinct resources remembered per session
+MAX_TRACKED_RESOURCES = 256
+
+
+def parse_timestamp(value: Any) -> datetime:
+    """Parse an access-log timestamp (datetime or ISO string), defaulting to now"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return parsed.replace(tzinfo=None) if parsed.tzinfo else parsed
+        except ValueError:
+            pass
+    return datetime.utcnow()
+
+
+class SessionRiskState:
+    """
+    Rolling risk inputs of one continuous-auth session.
+
+    Updated in O(1) per access-log entry: an exponentially weighted request
+    rate, the set of resources touched, the last two location observations and
+    the latest device validation. Per-user context (typical IPs and the hour
+    histogram) is captured once when the state is created. The state is small
+    enough to live on the session document as ``riskState``.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        user_id: str,
+        typical_ips: Optional[List[str]] = None,
+        hour_histogram: Optional[Dict[str, float]] = None,
+        baseline_available: bool = False,
+        device_validation: Optional[Dict] = None
+    ):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.typical_ips = list(typical_ips or [])
+        self.hour_histogram = dict(hour_histogram or {})
+        self.baseline_available = baseline_available
+        self.device_validation = device_validation or {}
+
+        self.request_rate = 0.0
+        self.request_count = 0
+        self.last_request_at: Optional[datetime] = None
+        self.resources: set = set()
+        self.current_ip = ''
+        self.recent_locations: List[Dict] = []
+        self.last_action: Optional[str] = None
+        self.updated_at: Optional[datetime] = None
+
+    def record_access(self, timestamp: datetime, resource: Optional[str] = None,
+                      ip_address: Optional[str] = None) -> None:
+        """
+        Fold one access-log entry into the state
+
+        Args:
+            timestamp (datetime): Access time
+            resource (str): Accessed resource
+            ip_address (str): Client IP of the request
+        """
+        self.request_rate = self.request_rate_at(timestamp) + 1.0 / REQUEST_RATE_TAU_MINUTES
+        if self.last_request_at is None or timestamp > self.last_request_at:
+            self.last_request_at = timestamp
+        self.request_count += 1
+
+        if resource is not None and len(self.resources) < MAX_TRACKED_RESOURCES:
+            self.resources.add(resource)
+
+        if ip_address:
+            self.record_location(ip_address, timestamp)
+
+    def record_location(self, ip_address: str, timestamp: datetime) -> None:
+        """Track the current IP and keep the last two location observations"""
+        self.current_ip = ip_address
+        self.recent_locations = (self.recent_locations + [{
+            'ip_address': ip_address,
+            'timestamp': timestamp.isoformat()
+        }])[-2:]
+
+    def request_rate_at(self, now: datetime) -> float:
+        """Request rate (per minute) decayed to the given time"""
+        if self.last_request_at is None:
+            return 0.0
+        elapsed = max(0.0, (now - self.last_request_at).total_seconds() / 60)
+        return self.request_rate * math.exp(-elapsed / REQUEST_RATE_TAU_MINUTES)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for the session document"""
+        return {
+            'userId': self.user_id,
+            'typicalIps': self.typical_ips,
+            'hourHistogram': self.hour_histogram,
+            'baselineAvailable': self.baseline_available,
+            'deviceValidation': self.device_validation,
+            'requestRate': self.request_rate,
+            'requestCount': self.request_count,
+            'lastRequestAt': self.last_request_at,
+            'resources': sorted(self.resources),
+            'currentIp': self.current_ip,
+            'recentLocations': self.recent_locations,
+            'lastAction': self.last_action,
+            'updatedAt': self.updated_at
+        }
+
+    @classmethod
+    def from_dict(cls, session_id: str, data: Dict[str, Any]) -> 'SessionRiskState':
+        """Restore a state stored with to_dict"""
+        state = cls(
+            session_id=session_id,
+            user_id=data.get('userId', ''),
+            typical_ips=data.get('typicalIps'),
+            hour_histogram=data.get('hourHistogram'),
+            baseline_available=data.get('baselineAvailable', False),
+            device_validation=data.get('deviceValidation')
+        )
+        state.request_rate = float(data.get('requestRate', 0.0))
+        state.request_count = int(data.get('requestCount', 0))
+        state.last_request_at = parse_timestamp(data['lastRequestAt']) if data.get('lastRequestAt') else None
+        state.resources = set(data.get('resources') or [])
+        state.current_ip = data.get('currentIp', '')
+        state.recent_locations = list(data.get('recentLocations') or [])[-2:]
+        state.last_action = data.get('lastAction')
+        state.updated_at = parse_timestamp(data['updatedAt']) if data.get('updatedAt') else None
+        return state
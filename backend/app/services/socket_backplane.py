@@ -0,0 +1,380 @@
+"""
+Socket Backplane
+Cross-worker fan-out and connection presence for the WebSocket server
+"""
+
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CHANNEL = 'ws:broadcast'
+PRESENCE_NODES_KEY = 'ws:nodes'
+PRESENCE_NODE_PREFIX = 'ws:presence:'
+
+PRESENCE_TTL_SECONDS = int(os.getenv('WEBSOCKET_PRESENCE_TTL_SECONDS', '90'))
+HEARTBEAT_SECONDS = int(os.getenv('WEBSOCKET_HEARTBEAT_SECONDS', '30'))
+
+
+def default_node_id() -> str:
+    """Identifier of this worker, unique across hosts and processes"""
+    return os.getenv('WEBSOCKET_NODE_ID') or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class LocalPubSub:
+    """
+    In-process stand-in for the Redis message queue.
+
+    Every backplane attached to the same instance behaves like a separate
+    worker subscribed to the same Redis channel, which lets tests and
+    single-process deployments exercise the multi-worker paths.
+    """
+
+    def __init__(self):
+        self._handlers = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> int:
+        """Deliver a message to every subscriber of the channel and return how many received it"""
+        with self._lock:
+            handlers = list(self._handlers.get(channel, ()))
+        payload = json.dumps(message)
+        for handler in handlers:
+            try:
+                handler(json.loads(payload))
+            except Exception as e:
+                logger.error(f"Backplane subscriber failed on {channel}: {e}")
+        return len(handlers)
+
+    def subscribe(self, channel: str, handler: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            self._handlers[channel].append(handler)
+
+    def unsubscribe(self, channel: str, handler: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            if handler in self._handlers.get(channel, ()):
+                self._handlers[channel].remove(handler)
+
+    def close(self):
+        with self._lock:
+            self._handlers.clear()
+
+
+class LocalPresenceStore:
+    """In-process presence store with the same per-node TTL semantics as RedisPresenceStore"""
+
+    def __init__(self):
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def put(self, node_id: str, sid: str, record: Dict[str, Any], ttl: int):
+        with self._lock:
+            expires_at, records = self._nodes.get(node_id, (0, {}))
+            records[sid] = json.dumps(record)
+            self._nodes[node_id] = (time.time() + ttl, records)
+
+    def remove(self, node_id: str, sid: str):
+        with self._lock:
+            entry = self._nodes.get(node_id)
+            if entry:
+                entry[1].pop(sid, None)
+
+    def touch(self, node_id: str, ttl: int):
+        with self._lock:
+            _, records = self._nodes.get(node_id, (0, {}))
+            self._nodes[node_id] = (time.time() + ttl, records)
+
+    def drop_node(self, node_id: str):
+        with self._lock:
+            self._nodes.pop(node_id, None)
+
+    def node_counts(self) -> Dict[str, int]:
+        now = time.time()
+        with self._lock:
+            for node_id in [n for n, (expires_at, _) in self._nodes.items() if expires_at <= now]:
+                del self._nodes[node_id]
+            return {node_id: len(records) for node_id, (_, records) in self._nodes.items()}
+
+    def records(self, node_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        counts = self.node_counts()
+        with self._lock:
+            return [
+                json.loads(raw)
+                for node in ([node_id] if node_id else counts)
+                if node in self._nodes
+                for raw in self._nodes[node][1].values()
+            ]
+
+
+class RedisPresenceStore:
+    """
+    Presence kept in Redis: one hash of connections per node, expired by
+    Redis when the node stops heart-beating, plus a sorted set of live
+    nodes scored by their expiry time
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def _key(self, node_id: str) -> str:
+        return f"{PRESENCE_NODE_PREFIX}{node_id}"
+
+    def put(self, node_id: str, sid: str, record: Dict[str, Any], ttl: int):
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(node_id), sid, json.dumps(record))
+        pipe.expire(self._key(node_id), ttl)
+        pipe.zadd(PRESENCE_NODES_KEY, {node_id: time.time() + ttl})
+        pipe.execute()
+
+    def remove(self, node_id: str, sid: str):
+        self.client.hdel(self._key(node_id), sid)
+
+    def touch(self, node_id: str, ttl: int):
+        pipe = self.client.pipeline()
+        pipe.expire(self._key(node_id), ttl)
+        pipe.zadd(PRESENCE_NODES_KEY, {node_id: time.time() + ttl})
+        pipe.execute()
+
+    def drop_node(self, node_id: str):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(node_id))
+        pipe.zrem(PRESENCE_NODES_KEY, node_id)
+        pipe.execute()
+
+    def _live_nodes(self) -> List[str]:
+        now = time.time()
+        self.client.zremrangebyscore(PRESENCE_NODES_KEY, 0, now)
+        return list(self.client.zrangebyscore(PRESENCE_NODES_KEY, now, '+inf'))
+
+    def node_counts(self) -> Dict[str, int]:
+        nodes = self._live_nodes()
+        pipe = self.client.pipeline()
+        for node_id in nodes:
+            pipe.hlen(self._key(node_id))
+        return dict(zip(nodes, pipe.execute()))
+
+    def records(self, node_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        nodes = [node_id] if node_id else self._live_nodes()
+        pipe = self.client.pipeline()
+        for node in nodes:
+            pipe.hvals(self._key(node))
+        return [json.loads(raw) for values in pipe.execute() for raw in values]
+
+
+class SocketBackplane:
+    """
+    Fans broadcasts out to every worker and tracks which connections live where.
+
+    ``publish`` sends a broadcast over the pub/sub transport; every
+    subscribed backplane, including the sender, hands it to its ``deliver``
+    callback which emits to the clients connected to that worker. Without a
+    transport (Flask-SocketIO configured with a Redis ``message_queue``
+    already fans ``socketio.emit`` out to all workers) broadcasts are
+    delivered directly.
+
+    Connections are mirrored into a shared presence store so any worker can
+    count connections per node and see which users are online. Entries are
+    grouped per node and expire together when a node stops heart-beating, so
+    a crashed worker's connections disappear after the presence TTL.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[str, Any, Optional[str]], None],
+        pubsub=None,
+        presence=None,
+        node_id: Optional[str] = None,
+        presence_ttl: int = PRESENCE_TTL_SECONDS,
+        heartbeat_interval: int = HEARTBEAT_SECONDS
+    ):
+        """
+        Initialize socket backplane
+
+        Args:
+            deliver (callable): Emits (event, data, room) to this worker's clients
+            pubsub: Transport with publish/subscribe, or None to deliver directly
+            presence: Presence store shared between workers
+            node_id (str): Identifier of this worker
+            presence_ttl (int): Seconds a node's connections survive without a heartbeat
+            heartbeat_interval (int): Seconds between presence refreshes
+        """
+        self.deliver = deliver
+        self.pubsub = pubsub
+        self.presence = presence or LocalPresenceStore()
+        self.node_id = node_id or default_node_id()
+        self.presence_ttl = presence_ttl
+        self.heartbeat_interval = heartbeat_interval
+
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.metrics = {
+            'published': 0,
+            'delivered': 0,
+            'delivery_errors': 0,
+            'presence_errors': 0,
+            'heartbeats': 0
+        }
+
+        if self.pubsub is not None:
+            self.pubsub.subscribe(BROADCAST_CHANNEL, self._on_message)
+
+    def publish(self, event: str, data: Any, room: Optional[str] = None) -> bool:
+        """
+        Broadcast an event to a room on every worker
+
+        Args:
+            event (str): Socket.IO event name
+            data: JSON-serializable payload
+            room (str): Target room, or None for all clients
+
+        Returns:
+            bool: True if the broadcast was handed to the transport
+        """
+        message = {'event': event, 'data': data, 'room': room, 'origin': self.node_id,
+                   'sent_at': time.time()}
+        self.metrics['published'] += 1
+        if self.pubsub is None:
+            self._on_message(message)
+            return True
+        try:
+            self.pubsub.publish(BROADCAST_CHANNEL, message)
+            return True
+        except Exception as e:
+            logger.error(f"Backplane publish of {event} failed, delivering locally: {e}")
+            self._on_message(message)
+            return False
+
+    def _on_message(self, message: Dict[str, Any]):
+        try:
+            self.deliver(message['event'], message['data'], message.get('room'))
+            self.metrics['delivered'] += 1
+        except Exception as e:
+            self.metrics['delivery_errors'] += 1
+            logger.error(f"Backplane delivery of {message.get('event')} failed: {e}")
+
+    def register(self, sid: str, **fields) -> Dict[str, Any]:
+        """Record a connection of this worker in the shared presence"""
+        record = {'sid': sid, 'node': self.node_id, 'user_id': None, 'role': None,
+                  'rooms': [], 'connected_at': time.time(), **fields}
+        with self._lock:
+            self._connections[sid] = record
+        self._put(sid, record)
+        self._ensure_started()
+        return record
+
+    def update(self, sid: str, **fields) -> Optional[Dict[str, Any]]:
+        """Merge fields into a registered connection"""
+        with self._lock:
+            record = self._connections.get(sid)
+            if record is None:
+                return None
+            record.update(fields)
+            record = dict(record)
+        self._put(sid, record)
+        return record
+
+    def unregister(self, sid: str):
+        """Remove a connection from the shared presence"""
+        with self._lock:
+            self._connections.pop(sid, None)
+        try:
+            self.presence.remove(self.node_id, sid)
+        except Exception as e:
+            self.metrics['presence_errors'] += 1
+            logger.warning(f"Failed to remove presence of {sid}: {e}")
+
+    def _put(self, sid: str, record: Dict[str, Any]):
+        try:
+            self.presence.put(self.node_id, sid, record, self.presence_ttl)
+        except Exception as e:
+            self.metrics['presence_errors'] += 1
+            logger.warning(f"Failed to record presence of {sid}: {e}")
+
+    def heartbeat(self):
+        """Extend the TTL of this worker's connections, re-adding any the store lost"""
+        with self._lock:
+            records = list(self._connections.items())
+        try:
+            if self.presence.node_counts().get(self.node_id) != len(records):
+                for sid, record in records:
+                    self.presence.put(self.node_id, sid, record, self.presence_ttl)
+            self.presence.touch(self.node_id, self.presence_ttl)
+            self.metrics['heartbeats'] += 1
+        except Exception as e:
+            self.metrics['presence_errors'] += 1
+            logger.warning(f"Presence heartbeat failed: {e}")
+
+    def connections_per_node(self) -> Dict[str, int]:
+        """Live connection count of every worker"""
+        try:
+            return self.presence.node_counts()
+        except Exception as e:
+            self.metrics['presence_errors'] += 1
+            logger.warning(f"Failed to read presence: {e}")
+            return {self.node_id: len(self._connections)}
+
+    def connections(self, node_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Connection records of all workers, or of one"""
+        try:
+            return self.presence.records(node_id)
+        except Exception as e:
+            self.metrics['presence_errors'] += 1
+            logger.warning(f"Failed to read presence: {e}")
+            with self._lock:
+                return [dict(r) for r in self._connections.values()]
+
+    def online_users(self, role: Optional[str] = None) -> List[str]:
+        """Authenticated users connected to any worker"""
+        return sorted({
+            record['user_id'] for record in self.connections()
+            if record.get('user_id') and (role is None or record.get('role') == role)
+        })
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='socket-backplane', daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self.heartbeat()
+
+    def shutdown(self):
+        """Stop heart-beating and withdraw this worker's connections"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self.pubsub is not None:
+            self.pubsub.unsubscribe(BROADCAST_CHANNEL, self._on_message)
+        try:
+            self.presence.drop_node(self.node_id)
+        except Exception as e:
+            logger.warning(f"Failed to withdraw presence of {self.node_id}: {e}")
+        with self._lock:
+            self._connections.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            local = len(self._connections)
+        return {
+            **self.metrics,
+            'node_id': self.node_id,
+            'local_connections': local,
+            'transport': type(self.pubsub).__name__ if self.pubsub is not None else 'direct'
+        }
@@ -0,0 +1,494 @@
+"""
+Streaming Threat Detector
+Sliding-window counters over audit events for brute force and coordinated attack detection
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.firebase_config import get_firestore_client
+from app.services.session_risk_state import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Windows
+LOGIN_FAILURES_BY_IP = 'login_failures_by_ip'
+LOGIN_FAILURES_BY_USER = 'login_failures_by_user'
+FAILURES_BY_DEVICE = 'failures_by_device'
+FAILURES_BY_PATTERN = 'failures_by_pattern'
+FAILURES_BY_PATTERN_LONG = 'failures_by_pattern_long'
+
+# Audit collections replayed on restart (threat services read the first, audit loggers write the second)
+REBUILD_COLLECTIONS = ('audit_logs', 'auditLogs')
+FAILURE_RESULTS = ('failure', 'denied')
+REBUILD_RETRY_SECONDS = 60
+EPOCH = datetime(1970, 1, 1)
+
+
+def detection_event(record: Dict) -> Optional[Dict[str, Any]]:
+    """
+    Normalize an audit record into the fields the detectors key on
+
+    Accepts both the ``audit_logs`` shape (user_id, ip_address,
+    device_fingerprint, resource_type) and AuditLog documents (userId,
+    ipAddress, deviceId, eventType, details).
+
+    Args:
+        record (dict): Audit record
+
+    Returns:
+        dict: Normalized event, or None if the record is not a failed or denied attempt
+    """
+    result = record.get('result')
+    if result not in FAILURE_RESULTS:
+        return None
+
+    details = record.get('details') if isinstance(record.get('details'), dict) else {}
+    user_id = record.get('user_id') or record.get('userId')
+
+    return {
+        'timestamp': parse_timestamp(record.get('timestamp')),
+        'result': result,
+        'login_failure': result == 'failure' and (
+            record.get('action') == 'login' or record.get('eventType') == 'authentication'
+        ),
+        'user_id': user_id if user_id != 'anonymous' else None,
+        'ip_address': record.get('ip_address') or record.get('ipAddress'),
+        'device_fingerprint': (record.get('device_fingerprint') or record.get('deviceFingerprint') or
+                               record.get('deviceId') or details.get('device_fingerprint') or
+                               details.get('deviceId')),
+        'resource_type': (record.get('resource_type') or details.get('resource_type') or
+                          details.get('resourceType') or record.get('resource') or 'unknown'),
+        'action': record.get('action') or 'unknown',
+        'record': record
+    }
+
+
+class _KeyWindow:
+    """Bucketed counts of one key"""
+
+    __slots__ = ('buckets', 'count', 'members', 'samples', 'last_bucket')
+
+    def __init__(self, max_samples: int):
+        self.buckets = deque()
+        self.count = 0
+        self.members: Dict[str, Dict[str, int]] = {}
+        self.samples = deque(maxlen=max_samples) if max_samples else None
+        self.last_bucket = None
+
+    def add(self, bucket: int, members: Dict[str, Optional[str]]) -> None:
+        if not self.buckets or self.buckets[-1][0] != bucket:
+            self.buckets.append((bucket, [0], {}))
+        _, count, bucket_members = self.buckets[-1]
+        count[0] += 1
+        self.count += 1
+        for dim, value in members.items():
+            if value is None:
+                continue
+            per_bucket = bucket_members.setdefault(dim, {})
+            per_bucket[value] = per_bucket.get(value, 0) + 1
+            totals = self.members.setdefault(dim, {})
+            totals[value] = totals.get(value, 0) + 1
+        self.last_bucket = bucket
+
+    def expire(self, oldest_bucket: int) -> None:
+        """Drop buckets before oldest_bucket"""
+        while self.buckets and self.buckets[0][0] < oldest_bucket:
+            _, count, bucket_members = self.buckets.popleft()
+            self.count -= count[0]
+            for dim, values in bucket_members.items():
+                totals = self.members[dim]
+                for value, n in values.items():
+                    remaining = totals[value] - n
+                    if remaining:
+                        totals[value] = remaining
+                    else:
+                        del totals[value]
+
+
+class SlidingWindowCounter:
+    """
+    Per-key event counts over a sliding window of fixed-width time buckets.
+
+    Each key holds a deque of buckets plus running totals, so adding an event
+    and expiring old ones are O(1) amortized. Along with the count, each key
+    tracks how often each member (user, IP address, device) occurs in the
+    window and optionally keeps its most recent records. Keys are ordered by
+    their last event, so idle keys are dropped from the front without
+    scanning the rest.
+
+    Events older than the newest bucket of their key are counted in that
+    bucket, so late events expire slightly later than their timestamp says.
+    """
+
+    def __init__(self, window_seconds: float, bucket_seconds: float = 10, max_samples: int = 0):
+        """
+        Initialize the counter
+
+        Args:
+            window_seconds (float): Window length
+            bucket_seconds (float): Bucket width (the window's time resolution)
+            max_samples (int): Most recent records kept per key
+        """
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.max_samples = max_samples
+        self._buckets_per_window = max(1, int(round(window_seconds / bucket_seconds)))
+        self._keys: 'OrderedDict[str, _KeyWindow]' = OrderedDict()
+
+    def add(self, key: str, timestamp: float, members: Optional[Dict[str, Optional[str]]] = None,
+            sample: Any = None) -> Optional[_KeyWindow]:
+        """
+        Count an event
+
+        Args:
+            key (str): Key the event is counted under
+            timestamp (float): Event time (epoch seconds)
+            members (dict): Member per dimension, e.g. {'users': 'u1'}
+            sample: Record kept among the key's recent samples
+
+        Returns:
+            _KeyWindow: The key's window, or None if the event is already outside the window
+        """
+        bucket = int(timestamp // self.bucket_seconds)
+        window = self._keys.get(key)
+        if window is None:
+            if bucket < self._oldest_bucket(time.time()):
+                return None
+            window = self._keys[key] = _KeyWindow(self.max_samples)
+        else:
+            self._keys.move_to_end(key)
+            bucket = max(bucket, window.last_bucket)
+
+        window.expire(bucket - self._buckets_per_window + 1)
+        window.add(bucket, members or {})
+        if window.samples is not None and sample is not None:
+            window.samples.append((timestamp, sample))
+        return window
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[_KeyWindow]:
+        """
+        Get a key's window with old buckets expired
+
+        Returns:
+            _KeyWindow: The window, or None if the key has no events in it
+        """
+        window = self._keys.get(key)
+        if window is None:
+            return None
+        window.expire(self._oldest_bucket(now))
+        if not window.count:
+            del self._keys[key]
+            return None
+        return window
+
+    def items(self, now: Optional[float] = None) -> Iterator:
+        """Iterate (key, window) over keys with events in the window"""
+        self.expire(now)
+        oldest = self._oldest_bucket(now)
+        for key, window in list(self._keys.items()):
+            window.expire(oldest)
+            if window.count:
+                yield key, window
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        Drop keys whose last event left the window
+
+        Returns:
+            int: Number of keys dropped
+        """
+        oldest = self._oldest_bucket(now)
+        dropped = 0
+        while self._keys:
+            key, window = next(iter(self._keys.items()))
+            if window.last_bucket >= oldest:
+                break
+            del self._keys[key]
+            dropped += 1
+        return dropped
+
+    def clear(self) -> None:
+        self._keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _oldest_bucket(self, now: Optional[float]) -> int:
+        current = int((now if now is not None else time.time()) // self.bucket_seconds)
+        return current - self._buckets_per_window + 1
+
+
+class StreamingThreatDetector:
+    """
+    In-memory detection engine fed by the audit write path.
+
+    Failed and denied attempts are counted in sliding windows keyed by IP
+    address, user, device and resource:action, with the users, addresses and
+    devices involved tracked per key. Detectors read the windows instead of
+    querying ``audit_logs``, and every ingested event is checked against the
+    firing thresholds of the keys it touched, so subscribers hear about a
+    brute force, device or coordinated attack as soon as the threshold is
+    crossed. A detection fires once and re-arms when the key falls back
+    below its threshold.
+
+    Windows live in memory per process. On first use after a restart they
+    are rebuilt from the audit logs of the long window; events ingested
+    since the detector started are skipped during the rebuild so nothing is
+    counted twice.
+    """
+
+    def __init__(
+        self,
+        db=None,
+        bucket_seconds: Optional[float] = None,
+        short_window_seconds: Optional[float] = None,
+        long_window_seconds: Optional[float] = None,
+        max_samples: Optional[int] = None
+    ):
+        """
+        Initialize the detector
+
+        Args:
+            db: Firestore client used for the rebuild (defaults to the shared client)
+            bucket_seconds (float): Time resolution of the windows
+            short_window_seconds (float): Window of device and coordinated attack detection
+            long_window_seconds (float): Window of brute force detection
+            max_samples (int): Recent failure records kept per device
+        """
+        self._db = db
+        self.bucket_seconds = bucket_seconds or float(os.getenv('THREAT_DETECTION_BUCKET_SECONDS', '10'))
+        self.short_window_seconds = short_window_seconds or float(
+            os.getenv('THREAT_DETECTION_SHORT_WINDOW_SECONDS', '600')
+        )
+        self.long_window_seconds = long_window_seconds or float(
+            os.getenv('THREAT_DETECTION_LONG_WINDOW_SECONDS', '3600')
+        )
+        max_samples = max_samples if max_samples is not None else int(
+            os.getenv('THREAT_DETECTION_MAX_SAMPLES', '50')
+        )
+
+        # Firing thresholds (same criteria as the detectors that read the windows)
+        self.brute_force_threshold = 10
+        self.device_failure_threshold = 10
+        self.coordinated_min_users = 3
+        self.coordinated_attempts_per_user = 5
+
+        self.windows = {
+            LOGIN_FAILURES_BY_IP: SlidingWindowCounter(self.long_window_seconds, self.bucket_seconds),
+            LOGIN_FAILURES_BY_USER: SlidingWindowCounter(self.long_window_seconds, self.bucket_seconds),
+            FAILURES_BY_DEVICE: SlidingWindowCounter(self.short_window_seconds, self.bucket_seconds, max_samples),
+            FAILURES_BY_PATTERN: SlidingWindowCounter(self.short_window_seconds, self.bucket_seconds),
+            FAILURES_BY_PATTERN_LONG: SlidingWindowCounter(self.long_window_seconds, self.bucket_seconds)
+        }
+
+        self._lock = threading.RLock()
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._active = set()
+        self._started_at = datetime.utcnow()
+        self._rebuilt = False
+        self._rebuild_lock = threading.Lock()
+        self._rebuild_retry_at = 0.0
+        self.recent_detections = deque(maxlen=100)
+
+        self.metrics = {
+            'events': 0,
+            'detections': 0,
+            'rebuilt_events': 0,
+            'rebuild_failures': 0
+        }
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_firestore_client()
+        return self._db
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        Register a callback for detections
+
+        Callbacks run on the thread that logged the triggering event and must not block.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def ingest(self, record: Dict, notify: bool = True) -> List[Dict[str, Any]]:
+        """
+        Count an audit record and check the thresholds it touches
+
+        Args:
+            record (dict): Audit record (audit_logs or AuditLog shape)
+            notify (bool): Call subscribers for detections that fire
+
+        Returns:
+            list: Detections fired by this record
+        """
+        event = detection_event(record)
+        if event is None:
+            return []
+
+        ts = (event['timestamp'] - EPOCH).total_seconds()
+        user, ip, device = event['user_id'], event['ip_address'], event['device_fingerprint']
+        pattern = f"{event['resource_type']}:{event['action']}"
+        fired = []
+
+        with self._lock:
+            self.metrics['events'] += 1
+            now = time.time()
+            for counter in self.windows.values():
+                counter.expire(now)
+
+            if event['login_failure']:
+                window = self.windows[LOGIN_FAILURES_BY_IP].add(ip or 'unknown', ts, {'users': user})
+                if window is not None:
+                    self._check(fired, 'brute_force_attack', ip or 'unknown', window,
+                                window.count >= self.brute_force_threshold)
+                if user:
+                    self.windows[LOGIN_FAILURES_BY_USER].add(user, ts, {'ips': ip})
+
+            if event['result'] == 'failure' and device:
+                window = self.windows[FAILURES_BY_DEVICE].add(
+                    device, ts, {'users': user, 'ips': ip}, sample=event['record']
+                )
+                if window is not None:
+                    self._check(fired, 'multiple_failed_attempts', device, window,
+                                window.count >= self.device_failure_threshold)
+
+            window = self.windows[FAILURES_BY_PATTERN].add(
+                pattern, ts, {'users': user, 'ips': ip, 'devices': device}
+            )
+            if window is not None:
+                users = len(window.members.get('users', ()))
+                self._check(fired, 'coordinated_attack', pattern, window,
+                            users >= self.coordinated_min_users and
+                            window.count >= self.coordinated_attempts_per_user * users)
+            self.windows[FAILURES_BY_PATTERN_LONG].add(pattern, ts, {'users': user})
+
+            self.metrics['detections'] += len(fired)
+            self.recent_detections.extend(fired)
+            subscribers = list(self._subscribers) if notify else []
+
+        for detection in fired:
+            for callback in subscribers:
+                try:
+                    callback(detection)
+                except Exception as e:
+                    logger.error(f"Threat detection subscriber error: {e}")
+        return fired
+
+    def snapshot(self, name: str, key: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Current state of a window
+
+        Args:
+            name (str): Window name
+            key (str): Only this key
+
+        Returns:
+            list: One entry per key with its count, members and recent samples
+        """
+        self.ensure_rebuilt()
+        window_counter = self.windows[name]
+        cutoff = time.time() - window_counter.window_seconds
+        with self._lock:
+            if key is not None:
+                window = window_counter.get(key)
+                items = [(key, window)] if window is not None else []
+            else:
+                items = list(window_counter.items())
+            return [
+                {
+                    'key': k,
+                    'count': window.count,
+                    'members': {dim: dict(values) for dim, values in window.members.items()},
+                    'samples': [sample for ts, sample in window.samples or () if ts >= cutoff]
+                }
+                for k, window in items
+            ]
+
+    def ensure_rebuilt(self) -> bool:
+        """
+        Rebuild the windows from recent audit logs once after startup
+
+        Returns:
+            bool: True if the windows hold the recent history
+        """
+        if self._rebuilt:
+            return True
+        if time.monotonic() < self._rebuild_retry_at or not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            if not self._rebuilt:
+                self.metrics['rebuilt_events'] += self._rebuild()
+                self._rebuilt = True
+            return True
+        except Exception as e:
+            self.metrics['rebuild_failures'] += 1
+            self._rebuild_retry_at = time.monotonic() + REBUILD_RETRY_SECONDS
+            logger.error(f"Error rebuilding threat detection windows: {e}")
+            return False
+        finally:
+            self._rebuild_lock.release()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get event and detection counters
+
+        Returns:
+            dict: Detector metrics
+        """
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics['keys'] = {name: len(counter) for name, counter in self.windows.items()}
+            metrics['active_detections'] = len(self._active)
+        metrics['rebuilt'] = self._rebuilt
+        return metrics
+
+    def _check(self, fired: List[Dict[str, Any]], threat_type: str, key: str, window: _KeyWindow,
+               crossed: bool) -> None:
+        """Fire a detection when a key crosses its threshold, re-arm it when it falls back"""
+        active_key = (threat_type, key)
+        if not crossed:
+            self._active.discard(active_key)
+            return
+        if active_key in self._active:
+            return
+        self._active.add(active_key)
+        fired.append({
+            'threat_type': threat_type,
+            'key': key,
+            'count': window.count,
+            'members': {dim: sorted(values) for dim, values in window.members.items()},
+            'detected_at': datetime.utcnow().isoformat()
+        })
+
+    def _rebuild(self) -> int:
+        """Replay failed and denied attempts of the long window logged before this detector started"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.long_window_seconds)
+        records = []
+        for collection in REBUILD_COLLECTIONS:
+            docs = self.db.collection(collection).where('timestamp', '>=', cutoff).stream()
+            for doc in docs:
+                record = doc.to_dict() or {}
+                if record.get('result') not in FAILURE_RESULTS:
+                    continue
+                timestamp = parse_timestamp(record.get('timestamp'))
+                if timestamp < self._started_at:
+                    records.append((timestamp, record))
+
+        # Windows expect events roughly in time order
+        records.sort(key=lambda item: item[0])
+        for _, record in records:
+            self.ingest(record, notify=False)
+        logger.info(f"Threat detection windows rebuilt from {len(records)} audit events")
+        return len(records)
+
+
+# Singleton instance
+streaming_threat_detector = StreamingThreatDetector()
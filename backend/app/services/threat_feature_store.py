@@ -0,0 +1,498 @@
+"""
+Threat Feature Store
+Incrementally maintained per-user aggregates behind the threat prediction features
+"""
+
+import atexit
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from firebase_admin import firestore
+
+from app.firebase_config import get_firestore_client
+from app.services.session_risk_state import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'threatFeatureStats'
+FEATURE_COUNT = 7
+
+# Feature windows, in hourly buckets
+RECENT_HOURS = 24
+BASELINE_HOURS = 7 * 24
+# Expired buckets within this many hours past the baseline are deleted on every write
+PRUNE_LOOKBACK_HOURS = 24
+OFF_HOURS = range(2, 6)
+
+# Firestore rejects batches with more than 500 operations, get_all is chunked as well
+MAX_BATCH_SIZE = 500
+READ_CHUNK_SIZE = 100
+
+# Login actions as written to audit_logs and by AuditLogger.log_authentication
+LOGIN_ACTIONS = ('login', 'Login failed')
+
+COUNTERS = ('total', 'failedLogins', 'offHours', 'denied')
+LAST_SEEN_MAPS = ('resourceSuccess', 'locationSuccess', 'devices')
+
+
+def hour_key(timestamp: datetime) -> str:
+    """Hourly bucket of a timestamp"""
+    return timestamp.strftime('%Y%m%d%H')
+
+
+def value_key(value: Any) -> str:
+    """Short, field-path-safe key of a resource type, location or device ID"""
+    return hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:16]
+
+
+def threat_event(record: Dict) -> Optional[Dict[str, Any]]:
+    """
+    Normalize an audit record into the fields the threat features use
+
+    Accepts both the ``audit_logs`` shape (user_id, resource_type, device_id,
+    location) and AuditLog documents (userId, eventType, details).
+
+    Args:
+        record (dict): Audit record
+
+    Returns:
+        dict: Normalized event, or None if the record has no user
+    """
+    user_id = record.get('user_id') or record.get('userId')
+    if not user_id or user_id == 'anonymous':
+        return None
+
+    details = record.get('details') if isinstance(record.get('details'), dict) else {}
+    result = record.get('result')
+
+    return {
+        'user_id': user_id,
+        'timestamp': parse_timestamp(record.get('timestamp')),
+        'result': result,
+        'login_failure': result == 'failure' and record.get('action') in LOGIN_ACTIONS,
+        'resource_type': (record.get('resource_type') or details.get('resource_type') or
+                          details.get('resourceType') or record.get('resource') or 'unknown'),
+        'location': record.get('location') or details.get('location'),
+        'device_id': record.get('device_id') or details.get('device_id') or details.get('deviceId')
+    }
+
+
+def _empty_bucket() -> Dict[str, Any]:
+    return {'total': 0, 'failedLogins': 0, 'offHours': 0, 'denied': 0, 'resources': {}, 'locations': {}}
+
+
+def _empty_aggregates() -> Dict[str, Any]:
+    return {'hours': {}, 'resourceSuccess': {}, 'locationSuccess': {}, 'devices': {}}
+
+
+def _add_event(aggregates: Dict[str, Any], event: Dict[str, Any]) -> None:
+    """Fold a normalized event into aggregates"""
+    timestamp = event['timestamp']
+    bucket = aggregates['hours'].setdefault(hour_key(timestamp), _empty_bucket())
+    bucket['total'] += 1
+    bucket['failedLogins'] += 1 if event['login_failure'] else 0
+    bucket['offHours'] += 1 if timestamp.hour in OFF_HOURS else 0
+    bucket['denied'] += 1 if event['result'] == 'denied' else 0
+
+    resource = value_key(event['resource_type'])
+    bucket['resources'][resource] = bucket['resources'].get(resource, 0) + 1
+
+    location = value_key(event['location']) if event['location'] else None
+    if location:
+        bucket['locations'][location] = bucket['locations'].get(location, 0) + 1
+
+    if event['result'] == 'success':
+        _touch(aggregates['resourceSuccess'], resource, timestamp)
+        if location:
+            _touch(aggregates['locationSuccess'], location, timestamp)
+    if event['device_id']:
+        _touch(aggregates['devices'], value_key(event['device_id']), timestamp)
+
+
+def _touch(last_seen: Dict[str, datetime], key: str, timestamp: datetime) -> None:
+    if key not in last_seen or timestamp > last_seen[key]:
+        last_seen[key] = timestamp
+
+
+def _add_bucket(target: Dict[str, Any], bucket: Dict[str, Any]) -> None:
+    """Add the counters of an hourly bucket into another"""
+    for name in COUNTERS:
+        target[name] += bucket.get(name) or 0
+    for name in ('resources', 'locations'):
+        for key, count in (bucket.get(name) or {}).items():
+            target[name][key] = target[name].get(key, 0) + (count or 0)
+
+
+def _merge(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+    """Add the counters and last-seen times of source into target"""
+    for hour, bucket in (source.get('hours') or {}).items():
+        _add_bucket(target['hours'].setdefault(hour, _empty_bucket()), bucket)
+    for name in LAST_SEEN_MAPS:
+        for key, seen in (source.get(name) or {}).items():
+            _touch(target[name], key, parse_timestamp(seen))
+
+
+def features_from_aggregates(aggregates: Dict[str, Any], now: Optional[datetime] = None) -> np.ndarray:
+    """
+    Compute the 7 threat features from aggregates
+
+    Windows are hour aligned: "last 24 hours" is the current hourly bucket and
+    the 23 before it, the 7-day baseline the last 168 buckets.
+
+    Args:
+        aggregates (dict): Stored aggregates of one user
+        now (datetime): Evaluation time (defaults to now)
+
+    Returns:
+        np.ndarray: Features in ThreatPredictor.extract_threat_features order
+    """
+    now = now or datetime.utcnow()
+    recent_start = hour_key(now - timedelta(hours=RECENT_HOURS - 1))
+    baseline_start = hour_key(now - timedelta(hours=BASELINE_HOURS - 1))
+    current = hour_key(now)
+
+    recent = _empty_bucket()
+    baseline_total = 0
+    for hour, bucket in aggregates['hours'].items():
+        if not baseline_start <= hour <= current:
+            continue
+        baseline_total += bucket['total']
+        if hour >= recent_start:
+            _add_bucket(recent, bucket)
+
+    baseline_cutoff = now - timedelta(hours=BASELINE_HOURS)
+    recent_cutoff = now - timedelta(hours=RECENT_HOURS)
+    typical_resources = {k for k, seen in aggregates['resourceSuccess'].items() if seen >= baseline_cutoff}
+    typical_locations = {k for k, seen in aggregates['locationSuccess'].items() if seen >= baseline_cutoff}
+
+    total = recent['total']
+    scope_deviations = sum(n for k, n in recent['resources'].items() if k not in typical_resources)
+    geo_anomalies = sum(n for k, n in recent['locations'].items() if k not in typical_locations)
+    devices = sum(1 for seen in aggregates['devices'].values() if seen >= recent_cutoff)
+    avg_daily = baseline_total / 7
+
+    return np.array([
+        recent['failedLogins'],
+        recent['offHours'] / total if total else 0,
+        scope_deviations / total if total else 0,
+        (total - avg_daily) / (avg_daily + 1),
+        geo_anomalies / total if total else 0,
+        devices,
+        recent['denied'] / total if total else 0
+    ], dtype=np.float32)
+
+
+class ThreatFeatureStore:
+    """
+    Per-user rolling aggregates behind the 7 threat prediction features.
+
+    Each ``threatFeatureStats`` document holds hourly buckets (event count,
+    failed logins, off-hours events, denials, and per-bucket resource and
+    location counts) plus the last successful use of each resource type and
+    location and the last use of each device. The features of a user are
+    computed from that one document, so prediction no longer reads and
+    rescans the audit history.
+
+    The store follows two audit streams: ``audit_logs`` and ``auditLogs``.
+    Users are seeded from both, and every writer of either collection
+    (AuditLogger, EnhancedAuditService, create_audit_log, the visitor
+    service) passes its records to ``record_event``, so stored features stay
+    in step with what a fresh read of the history would compute.
+
+    ``record_event`` runs as audit events are written. It folds the event into
+    an in-memory delta and returns. A background thread flushes the deltas of
+    all users every ``flush_interval`` seconds as batched merge writes with
+    atomic increments, so concurrent workers add up correctly. Reads include
+    this process's unflushed deltas. Buckets older than the 7-day baseline
+    are deleted as users are written and read.
+    """
+
+    def __init__(
+        self,
+        db=None,
+        flush_interval: Optional[float] = None,
+        max_pending_users: Optional[int] = None
+    ):
+        """
+        Initialize the store
+
+        Args:
+            db: Firestore client (defaults to the shared client on first use)
+            flush_interval (float): Seconds between background flushes
+            max_pending_users (int): Users with unflushed deltas before events are dropped
+        """
+        self._db = db
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv('THREAT_FEATURE_FLUSH_INTERVAL', '5')
+        )
+        self.max_pending_users = max_pending_users or int(os.getenv('THREAT_FEATURE_MAX_PENDING_USERS', '10000'))
+
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._expired: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.metrics = {
+            'events': 0,
+            'dropped': 0,
+            'flushes': 0,
+            'users_written': 0,
+            'failed_commits': 0,
+            'reads': 0
+        }
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_firestore_client()
+        return self._db
+
+    def record_event(self, record: Dict) -> bool:
+        """
+        Fold an audit record into its user's aggregates
+
+        Args:
+            record (dict): Audit record (audit_logs or AuditLog shape)
+
+        Returns:
+            bool: True if the event was recorded
+        """
+        event = threat_event(record)
+        if event is None:
+            return False
+
+        with self._lock:
+            aggregates = self._pending.get(event['user_id'])
+            if aggregates is None:
+                if len(self._pending) >= self.max_pending_users:
+                    self.metrics['dropped'] += 1
+                    return False
+                aggregates = self._pending[event['user_id']] = _empty_aggregates()
+            _add_event(aggregates, event)
+            self.metrics['events'] += 1
+
+        self._ensure_started()
+        return True
+
+    def get_features(self, user_id: str, now: Optional[datetime] = None) -> Optional[np.ndarray]:
+        """
+        Get a user's threat features with a single document read
+
+        Args:
+            user_id (str): User ID
+            now (datetime): Evaluation time (defaults to now)
+
+        Returns:
+            np.ndarray: The 7 features, or None if the user has not been seeded
+        """
+        return self.get_features_many([user_id], now).get(user_id)
+
+    def get_features_many(self, user_ids: Iterable[str], now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """
+        Get threat features of many users with batched document reads
+
+        Args:
+            user_ids (iterable): User IDs
+            now (datetime): Evaluation time (defaults to now)
+
+        Returns:
+            dict: Features per user the store has been seeded for
+        """
+        now = now or datetime.utcnow()
+        user_ids = list(dict.fromkeys(user_ids))
+        stored = self._read(user_ids)
+
+        features = {}
+        for user_id in user_ids:
+            # Deltas alone lack the baseline of a user that was never seeded
+            if user_id not in stored:
+                continue
+
+            aggregates = _empty_aggregates()
+            _merge(aggregates, stored[user_id])
+            with self._lock:
+                pending = self._pending.get(user_id)
+                if pending is not None:
+                    _merge(aggregates, pending)
+
+            self._note_expired(user_id, aggregates['hours'], now)
+            features[user_id] = features_from_aggregates(aggregates, now)
+        return features
+
+    def rebuild_from_history(self, user_id: str, access_history: List[Dict],
+                             now: Optional[datetime] = None) -> np.ndarray:
+        """
+        Replace a user's aggregates with ones computed from their audit history
+
+        Used to seed users that have no aggregates yet, from their records in
+        both audit collections. Deltas recorded while the history
+        was read stay pending, so events logged in that moment may be counted
+        twice.
+
+        Args:
+            user_id (str): User ID
+            access_history (list): Audit records of the user covering the 7-day baseline
+            now (datetime): Evaluation time of the returned features (defaults to now)
+
+        Returns:
+            np.ndarray: Features of the rebuilt aggregates (also when the write failed)
+        """
+        aggregates = _empty_aggregates()
+        for record in access_history:
+            event = threat_event(dict(record, user_id=user_id))
+            if event is not None:
+                _add_event(aggregates, event)
+
+        try:
+            self.db.collection(COLLECTION).document(user_id).set(
+                dict(aggregates, userId=user_id, updatedAt=firestore.SERVER_TIMESTAMP)
+            )
+        except Exception as e:
+            logger.error(f"Error rebuilding threat features for {user_id}: {str(e)}")
+        return features_from_aggregates(aggregates, now)
+
+    def flush(self) -> int:
+        """
+        Write all pending deltas
+
+        Returns:
+            int: Number of users written
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                expired, self._expired = self._expired, {}
+            if not pending and not expired:
+                return 0
+
+            now = datetime.utcnow()
+            user_ids = list(pending.keys() | expired.keys())
+            written = 0
+            for start in range(0, len(user_ids), MAX_BATCH_SIZE):
+                chunk = user_ids[start:start + MAX_BATCH_SIZE]
+                try:
+                    batch = self.db.batch()
+                    for user_id in chunk:
+                        batch.set(
+                            self.db.collection(COLLECTION).document(user_id),
+                            self._write_fields(user_id, pending.get(user_id), expired.get(user_id, ()), now),
+                            merge=True
+                        )
+                    batch.commit()
+                    written += len(chunk)
+                except Exception as e:
+                    self.metrics['failed_commits'] += 1
+                    logger.error(f"Error flushing threat features for {len(chunk)} users: {str(e)}")
+                    self._restore(pending, chunk)
+
+            with self._lock:
+                self.metrics['flushes'] += 1
+                self.metrics['users_written'] += written
+            return written
+
+    def shutdown(self) -> None:
+        """Stop the flusher and write what is pending"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.flush_interval * 2, 1.0))
+        self.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get event, flush and read counters
+
+        Returns:
+            dict: Store metrics
+        """
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics['pending_users'] = len(self._pending)
+        metrics['flusher_running'] = self._thread is not None and self._thread.is_alive()
+        return metrics
+
+    def _write_fields(self, user_id: str, delta: Optional[Dict[str, Any]], expired: Iterable[str],
+                      now: datetime) -> Dict[str, Any]:
+        """Merge-write fields applying a delta as increments and deleting expired buckets"""
+        hours: Dict[str, Any] = {}
+        oldest = now - timedelta(hours=BASELINE_HOURS)
+        for offset in range(PRUNE_LOOKBACK_HOURS):
+            hours[hour_key(oldest - timedelta(hours=offset))] = firestore.DELETE_FIELD
+        for hour in expired:
+            hours[hour] = firestore.DELETE_FIELD
+
+        fields: Dict[str, Any] = {'userId': user_id, 'updatedAt': firestore.SERVER_TIMESTAMP}
+        if delta:
+            for hour, bucket in delta['hours'].items():
+                hours[hour] = {
+                    **{name: firestore.Increment(bucket[name]) for name in COUNTERS},
+                    'resources': {k: firestore.Increment(n) for k, n in bucket['resources'].items()},
+                    'locations': {k: firestore.Increment(n) for k, n in bucket['locations'].items()}
+                }
+            for name in LAST_SEEN_MAPS:
+                if delta[name]:
+                    fields[name] = dict(delta[name])
+        fields['hours'] = hours
+        return fields
+
+    def _read(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Read stored aggregates in chunks"""
+        stored = {}
+        for start in range(0, len(user_ids), READ_CHUNK_SIZE):
+            chunk = user_ids[start:start + READ_CHUNK_SIZE]
+            try:
+                refs = [self.db.collection(COLLECTION).document(user_id) for user_id in chunk]
+                for doc in self.db.get_all(refs):
+                    data = doc.to_dict() if doc.exists else None
+                    if isinstance(data, dict):
+                        stored[doc.id] = data
+            except Exception as e:
+                logger.error(f"Error reading threat features: {str(e)}")
+        with self._lock:
+            self.metrics['reads'] += len(user_ids)
+        return stored
+
+    def _note_expired(self, user_id: str, hours: Dict[str, Any], now: datetime) -> None:
+        """Remember buckets past the baseline so the next flush deletes them"""
+        oldest = hour_key(now - timedelta(hours=BASELINE_HOURS))
+        stale = [hour for hour in hours if hour < oldest]
+        if stale:
+            with self._lock:
+                self._expired.setdefault(user_id, set()).update(stale)
+
+    def _restore(self, pending: Dict[str, Dict[str, Any]], user_ids: List[str]) -> None:
+        """Put deltas of a failed commit back so the next flush retries them"""
+        with self._lock:
+            for user_id in user_ids:
+                if user_id in pending:
+                    _merge(self._pending.setdefault(user_id, _empty_aggregates()), pending[user_id])
+
+    def _ensure_started(self) -> None:
+        """Start the background flusher on first use"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._stop_event.is_set() or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name='threat-feature-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self) -> None:
+        """Flusher loop"""
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:  # pragma: no cover - flush handles its own errors
+                logger.error(f"Threat feature flusher error: {e}")
+
+
+# Singleton instance
+threat_feature_store = ThreatFeatureStore()
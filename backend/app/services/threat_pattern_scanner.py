@@ -0,0 +1,195 @@
+"""
+Threat Pattern Scanner
+Precompiled single-pass detection of SQL injection, XSS and path traversal signatures
+"""
+
+import re
+from collections import namedtuple
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+Signature = namedtuple('Signature', ['id', 'category', 'pattern'])
+
+SQL_INJECTION = 'sql_injection'
+XSS = 'xss'
+PATH_TRAVERSAL = 'path_traversal'
+
+SQL_INJECTION_SIGNATURES = (
+    Signature('sqli_keyword', SQL_INJECTION, r'(\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|UNION)\b)'),
+    Signature('sqli_numeric_tautology', SQL_INJECTION, r'(\b(OR|AND)\s+\d+\s*=\s*\d+)'),
+    Signature('sqli_string_tautology', SQL_INJECTION, r'(\b(OR|AND)\s+[\'"][^\'"]*[\'"])'),
+    Signature('sqli_comment', SQL_INJECTION, r'(--|#|/\*|\*/)'),
+    Signature('sqli_xp_cmdshell', SQL_INJECTION, r'(\bxp_cmdshell\b)'),
+    Signature('sqli_sp_executesql', SQL_INJECTION, r'(\bsp_executesql\b)'),
+)
+
+XSS_SIGNATURES = (
+    Signature('xss_script_tag', XSS, r'<script[^>]*>.*?</script>'),
+    Signature('xss_javascript_uri', XSS, r'javascript:'),
+    Signature('xss_vbscript_uri', XSS, r'vbscript:'),
+    Signature('xss_data_html', XSS, r'data:text/html'),
+    Signature('xss_event_handler', XSS, r'on\w+\s*='),
+    Signature('xss_css_expression', XSS, r'expression\s*\('),
+    Signature('xss_css_import', XSS, r'@import'),
+    Signature('xss_iframe', XSS, r'<iframe[^>]*>'),
+    Signature('xss_object', XSS, r'<object[^>]*>'),
+    Signature('xss_embed', XSS, r'<embed[^>]*>'),
+    Signature('xss_form', XSS, r'<form[^>]*>'),
+    Signature('xss_input', XSS, r'<input[^>]*>'),
+    Signature('xss_alert_call', XSS, r'[\'"];?\s*alert\s*\('),
+    Signature('xss_eval_call', XSS, r'[\'"];?\s*eval\s*\('),
+)
+
+PATH_TRAVERSAL_SIGNATURES = (
+    Signature('traversal_dot_slash', PATH_TRAVERSAL, r'\.\./+'),
+    Signature('traversal_dot_backslash', PATH_TRAVERSAL, r'\.\.\\+'),
+    Signature('traversal_encoded_slash', PATH_TRAVERSAL, r'%2e%2e%2f'),
+    Signature('traversal_encoded_backslash', PATH_TRAVERSAL, r'%2e%2e%5c'),
+    Signature('traversal_mixed_slash', PATH_TRAVERSAL, r'\.\.%2f'),
+    Signature('traversal_mixed_backslash', PATH_TRAVERSAL, r'\.\.%5c'),
+)
+
+DEFAULT_SIGNATURES = SQL_INJECTION_SIGNATURES + XSS_SIGNATURES + PATH_TRAVERSAL_SIGNATURES
+
+NO_MATCHES: FrozenSet[str] = frozenset()
+
+
+def signatures_for(patterns: Iterable[str], category: str) -> Tuple[Signature, ...]:
+    """
+    Signatures of a list of pattern strings, e.g. from the security config
+
+    Patterns of the built-in signatures keep their IDs, other patterns are
+    numbered within the category.
+
+    Args:
+        patterns: Regex pattern strings
+        category (str): Category of the signatures
+
+    Returns:
+        tuple: Signatures in pattern order
+    """
+    known = {s.pattern: s.id for s in DEFAULT_SIGNATURES if s.category == category}
+    return tuple(
+        Signature(known.get(pattern, f'{category}_{index}'), category, pattern)
+        for index, pattern in enumerate(patterns)
+    )
+
+
+class ThreatPatternScanner:
+    """
+    Matches every signature against a string in one pass.
+
+    All signatures are compiled into a single alternation of named groups.
+    Clean input, which is nearly all input, costs one ``finditer`` pass that
+    finds nothing. When something matches, the IDs found by that pass are
+    completed by checking only the signatures it did not report, since an
+    alternation cannot report two signatures matching overlapping text.
+    The result is the same set of signatures as searching each pattern on
+    its own, case-insensitively.
+    """
+
+    def __init__(self, signatures: Iterable[Signature] = DEFAULT_SIGNATURES, flags: int = re.IGNORECASE | re.DOTALL):
+        """
+        Initialize scanner
+
+        Args:
+            signatures: Signatures to match; IDs must be valid identifiers
+            flags (int): Regex flags applied to every signature
+        """
+        self.signatures: Tuple[Signature, ...] = tuple(signatures)
+        self._by_id: Dict[str, Signature] = {s.id: s for s in self.signatures}
+        self._compiled = {s.id: re.compile(s.pattern, flags) for s in self.signatures}
+        self._combined = re.compile(
+            '|'.join(f'(?P<{s.id}>{s.pattern})' for s in self.signatures), flags
+        )
+
+    def scan(self, value: Any, cache: Optional[Dict[str, FrozenSet[str]]] = None) -> FrozenSet[str]:
+        """
+        Signature IDs matching a string
+
+        Args:
+            value: String to scan; other types match nothing
+            cache (dict): Results by string, shared while walking one payload
+
+        Returns:
+            frozenset: IDs of all matching signatures
+        """
+        if not isinstance(value, str) or not value:
+            return NO_MATCHES
+        if cache is not None:
+            matches = cache.get(value)
+            if matches is None:
+                matches = cache[value] = self.scan(value)
+            return matches
+
+        found = {m.lastgroup for m in self._combined.finditer(value)}
+        if not found:
+            return NO_MATCHES
+
+        for signature in self.signatures:
+            if signature.id not in found and self._compiled[signature.id].search(value):
+                found.add(signature.id)
+        return frozenset(found)
+
+    def category_of(self, signature_id: str) -> str:
+        return self._by_id[signature_id].category
+
+    def pattern(self, signature_id: str) -> str:
+        return self._by_id[signature_id].pattern
+
+    def regex(self, signature_id: str):
+        """Compiled pattern of one signature"""
+        return self._compiled[signature_id]
+
+    def categories(self, matches: Iterable[str]) -> Set[str]:
+        """Categories of matched IDs"""
+        return {self._by_id[signature_id].category for signature_id in matches}
+
+    def in_category(self, matches: Iterable[str], category: str) -> List[str]:
+        """Matched IDs of one category, in signature order"""
+        if not matches:
+            return []
+        return [s.id for s in self.signatures if s.category == category and s.id in matches]
+
+    def walk(self, data: Any, path: Tuple = ()) -> Iterator[Tuple[Tuple, str, FrozenSet[str]]]:
+        """
+        Yield the strings of a nested payload that match any signature
+
+        Keys and values of dicts, list items and other scalars converted to
+        strings are scanned. Repeated strings, such as the keys of a list of
+        records, are scanned once.
+
+        Args:
+            data: Nested dicts, lists and scalars, e.g. a decoded JSON body
+            path (tuple): Path prefix for the yielded locations
+
+        Yields:
+            tuple: (path, string, matched IDs); a key's path ends with the key itself
+        """
+        seen: Dict[str, FrozenSet[str]] = {}
+        stack = [(path, data)]
+        while stack:
+            location, item = stack.pop()
+            if isinstance(item, dict):
+                for key, value in item.items():
+                    key_text = str(key)
+                    matches = self.scan(key_text, seen)
+                    if matches:
+                        yield location + (key,), key_text, matches
+                    stack.append((location + (key,), value))
+            elif isinstance(item, (list, tuple)):
+                stack.extend((location + (i,), value) for i, value in enumerate(item))
+            elif item is None or isinstance(item, (bool, int, float)):
+                continue
+            else:
+                text = item if isinstance(item, str) else str(item)
+                matches = self.scan(text, seen)
+                if matches:
+                    yield location, text, matches
+
+    def scan_payload(self, data: Any) -> Dict[Tuple, FrozenSet[str]]:
+        """All matching locations of a nested payload, by path"""
+        return {location: matches for location, _, matches in self.walk(data)}
+
+
+# Singleton instance
+threat_scanner = ThreatPatternScanner()
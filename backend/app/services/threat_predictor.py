@@ -5,6 +5,8 @@ Analyzes patterns and predicts potential security threats using ML
 
 import numpy as np
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import pickle
@@ -20,6 +22,10 @@ except ImportError:
     SKLEARN_AVAILABLE = False
 
 from app.firebase_config import db
+from app.services.threat_feature_store import threat_feature_store
+from app.services.streaming_threat_detector import (
+    streaming_threat_detector, LOGIN_FAILURES_BY_IP, FAILURES_BY_PATTERN_LONG
+)
 
 
 class ThreatPredictor:
@@ -32,6 +38,10 @@ class ThreatPredictor:
         self.scaler = StandardScaler() if SKLEARN_AVAILABLE else None
         self.model = None
         
+        # Fleet scans: concurrent history fetches for users missing from the feature store
+        self.fleet_concurrency = max(1, int(os.getenv('THREAT_PREDICTION_CONCURRENCY', '8')))
+        self.last_fleet_scan = {}
+        
         # Ensure models directory exists
         os.makedirs(self.models_path, exist_ok=True)
     
@@ -127,84 +137,17 @@ class ThreatPredictor:
             Dict with pattern analysis results
         """
         try:
-            # Get user's access history
-            access_history = self._get_user_access_history(user_id, days=self.lookback_days)
+            features = self._get_threat_features(user_id)
             
-            if not access_history:
+            if features is None:
                 return {
                     'patterns_found': False,
                     'message': 'No access history available',
                     'indicators': []
                 }
             
-            # Extract features
-            features = self.extract_threat_features(user_id, access_history)
-            
             # Analyze each feature for threats
-            indicators = []
-            
-            # Failed attempts
-            if features[0] >= 5:
-                indicators.append({
-                    'type': 'excessive_failed_attempts',
-                    'severity': 'high' if features[0] >= 10 else 'medium',
-                    'value': int(features[0]),
-                    'description': f'{int(features[0])} failed login attempts in last 24 hours'
-                })
-            
-            # Unusual time access
-            if features[1] > 0.3:
-                indicators.append({
-                    'type': 'unusual_time_access',
-                    'severity': 'medium',
-                    'value': round(features[1], 2),
-                    'description': f'{round(features[1]*100, 1)}% of access during unusual hours (2-6 AM)'
-                })
-            
-            # Scope deviation
-            if features[2] > 0.4:
-                indicators.append({
-                    'type': 'scope_deviation',
-                    'severity': 'high',
-                    'value': round(features[2], 2),
-                    'description': f'{round(features[2]*100, 1)}% of requests outside normal scope'
-                })
-            
-            # Frequency change
-            if features[3] > 2.0:
-                indicators.append({
-                    'type': 'frequency_spike',
-                    'severity': 'medium',
-                    'value': round(features[3], 2),
-                    'description': f'Request frequency increased by {round(features[3]*100, 1)}%'
-                })
-            
-            # Geographic anomaly
-            if features[4] > 0.3:
-                indicators.append({
-                    'type': 'geographic_anomaly',
-                    'severity': 'high',
-                    'value': round(features[4], 2),
-                    'description': f'{round(features[4]*100, 1)}% of access from unusual locations'
-                })
-            
-            # Device changes
-            if features[5] >= 3:
-                indicators.append({
-                    'type': 'multiple_devices',
-                    'severity': 'medium',
-                    'value': int(features[5]),
-                    'description': f'Access from {int(features[5])} different devices in 24 hours'
-                })
-            
-            # Denial ratio
-            if features[6] > 0.5:
-                indicators.append({
-                    'type': 'high_denial_rate',
-                    'severity': 'high',
-                    'value': round(features[6], 2),
-                    'description': f'{round(features[6]*100, 1)}% of requests denied'
-                })
+            indicators = self._build_indicators(features)
             
             return {
                 'patterns_found': len(indicators) > 0,
@@ -221,6 +164,114 @@ class ThreatPredictor:
                 'error': str(e)
             }
     
+    def _get_threat_features(self, user_id: str) -> Optional[np.ndarray]:
+        """
+        Get a user's threat features from the feature store
+        
+        Users the store has not been seeded for are computed from their access
+        history once, and the store is seeded with that history.
+        
+        Returns:
+            np.ndarray of the 7 features, or None if the user has no access history
+        """
+        features = threat_feature_store.get_features(user_id)
+        if features is not None:
+            return features
+        
+        return self._load_history_features(user_id)
+    
+    def _indicator_flags(self, feature_matrix: np.ndarray) -> np.ndarray:
+        """
+        Evaluate the indicator thresholds for many users at once
+        
+        Args:
+            feature_matrix: (n_users, 7) threat features
+            
+        Returns:
+            (n_users, 7) boolean matrix, column i set when feature i indicates a threat
+        """
+        X = np.asarray(feature_matrix, dtype=np.float32).reshape(-1, 7)
+        return np.column_stack([
+            X[:, 0] >= 5,    # Failed attempts
+            X[:, 1] > 0.3,   # Unusual time access
+            X[:, 2] > 0.4,   # Scope deviation
+            X[:, 3] > 2.0,   # Frequency change
+            X[:, 4] > 0.3,   # Geographic anomaly
+            X[:, 5] >= 3,    # Device changes
+            X[:, 6] > 0.5    # Denial ratio
+        ])
+    
+    def _build_indicators(self, features: np.ndarray, flags: Optional[np.ndarray] = None) -> List[Dict]:
+        """Describe the threat indicators of one user's features"""
+        if flags is None:
+            flags = self._indicator_flags(features)[0]
+        indicators = []
+        
+        # Failed attempts
+        if flags[0]:
+            indicators.append({
+                'type': 'excessive_failed_attempts',
+                'severity': 'high' if features[0] >= 10 else 'medium',
+                'value': int(features[0]),
+                'description': f'{int(features[0])} failed login attempts in last 24 hours'
+            })
+        
+        # Unusual time access
+        if flags[1]:
+            indicators.append({
+                'type': 'unusual_time_access',
+                'severity': 'medium',
+                'value': round(features[1], 2),
+                'description': f'{round(features[1]*100, 1)}% of access during unusual hours (2-6 AM)'
+            })
+        
+        # Scope deviation
+        if flags[2]:
+            indicators.append({
+                'type': 'scope_deviation',
+                'severity': 'high',
+                'value': round(features[2], 2),
+                'description': f'{round(features[2]*100, 1)}% of requests outside normal scope'
+            })
+        
+        # Frequency change
+        if flags[3]:
+            indicators.append({
+                'type': 'frequency_spike',
+                'severity': 'medium',
+                'value': round(features[3], 2),
+                'description': f'Request frequency increased by {round(features[3]*100, 1)}%'
+            })
+        
+        # Geographic anomaly
+        if flags[4]:
+            indicators.append({
+                'type': 'geographic_anomaly',
+                'severity': 'high',
+                'value': round(features[4], 2),
+                'description': f'{round(features[4]*100, 1)}% of access from unusual locations'
+            })
+        
+        # Device changes
+        if flags[5]:
+            indicators.append({
+                'type': 'multiple_devices',
+                'severity': 'medium',
+                'value': int(features[5]),
+                'description': f'Access from {int(features[5])} different devices in 24 hours'
+            })
+        
+        # Denial ratio
+        if flags[6]:
+            indicators.append({
+                'type': 'high_denial_rate',
+                'severity': 'high',
+                'value': round(features[6], 2),
+                'description': f'{round(features[6]*100, 1)}% of requests denied'
+            })
+        
+        return indicators
+    
     # ==================== Threat Prediction ====================
     
     def predict_threats(self, user_id: str = None) -> List[Dict]:
@@ -243,11 +294,7 @@ class ThreatPredictor:
                     predictions.append(prediction)
             else:
                 # Predict for all users with suspicious patterns
-                users = self._get_users_with_suspicious_activity()
-                for uid in users:
-                    prediction = self._predict_user_threat(uid)
-                    if prediction:
-                        predictions.append(prediction)
+                predictions = self.predict_fleet_threats()['predictions']
             
             # Filter by confidence threshold
             high_confidence_predictions = [
@@ -271,46 +318,7 @@ class ThreatPredictor:
                 return None
             
             indicators = pattern_analysis.get('indicators', [])
-            
-            # Calculate threat score based on indicators
-            threat_score = 0
-            severity_weights = {'low': 1, 'medium': 2, 'high': 3}
-            
-            for indicator in indicators:
-                severity = indicator.get('severity', 'low')
-                threat_score += severity_weights.get(severity, 1)
-            
-            # Normalize to 0-1 range
-            max_possible_score = len(indicators) * 3
-            confidence = min(threat_score / max_possible_score, 1.0) if max_possible_score > 0 else 0
-            
-            # Determine threat type
-            threat_types = [ind.get('type') for ind in indicators]
-            
-            if 'excessive_failed_attempts' in threat_types:
-                primary_threat = 'brute_force_attack'
-            elif 'scope_deviation' in threat_types:
-                primary_threat = 'privilege_escalation'
-            elif 'geographic_anomaly' in threat_types:
-                primary_threat = 'account_compromise'
-            elif 'frequency_spike' in threat_types:
-                primary_threat = 'automated_attack'
-            else:
-                primary_threat = 'suspicious_activity'
-            
-            # Generate preventive measures
-            preventive_measures = self._generate_preventive_measures(threat_types)
-            
-            prediction = {
-                'user_id': user_id,
-                'threat_type': primary_threat,
-                'confidence': round(confidence, 2),
-                'threat_score': threat_score,
-                'indicators': indicators,
-                'preventive_measures': preventive_measures,
-                'predicted_at': datetime.utcnow().isoformat(),
-                'status': 'pending'
-            }
+            prediction = self._build_prediction(user_id, indicators)
             
             # Save prediction
             self._save_prediction(prediction)
@@ -321,6 +329,148 @@ class ThreatPredictor:
             print(f"Error predicting threat for user {user_id}: {e}")
             return None
     
+    def predict_fleet_threats(self, user_ids: Optional[List[str]] = None) -> Dict:
+        """
+        Predict threats for many users in one pass
+        
+        Features come from one batched feature store read; histories of users
+        missing from the store are fetched concurrently on a bounded thread
+        pool. All feature vectors are stacked into one matrix so thresholds,
+        scaler and model run once, and predictions are saved in batched commits.
+        
+        Args:
+            user_ids: Users to scan (defaults to users with suspicious activity)
+            
+        Returns:
+            Dict with all predictions, scan counts and per-stage timings in ms
+        """
+        timings = {}
+        started = time.perf_counter()
+        
+        def lap(stage):
+            nonlocal started
+            now = time.perf_counter()
+            timings[stage] = round((now - started) * 1000, 3)
+            started = now
+        
+        if user_ids is None:
+            user_ids = self._get_users_with_suspicious_activity()
+        user_ids = list(dict.fromkeys(user_ids))
+        lap('candidates')
+        
+        features = threat_feature_store.get_features_many(user_ids)
+        lap('feature_store')
+        
+        missing = [uid for uid in user_ids if uid not in features]
+        if missing:
+            workers = min(self.fleet_concurrency, len(missing))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='threat-history') as executor:
+                for uid, user_features in zip(missing, executor.map(self._load_history_features, missing)):
+                    if user_features is not None:
+                        features[uid] = user_features
+        lap('history_fetch')
+        
+        scanned = [uid for uid in user_ids if uid in features]
+        X = np.vstack([features[uid] for uid in scanned]) if scanned else np.zeros((0, 7), dtype=np.float32)
+        flags = self._indicator_flags(X)
+        flagged = np.flatnonzero(flags.any(axis=1))
+        predictions = [
+            self._build_prediction(scanned[i], self._build_indicators(X[i], flags[i]))
+            for i in flagged
+        ]
+        lap('scoring')
+        
+        if predictions and self.model is not None and self.scaler is not None:
+            try:
+                probabilities = self.model.predict_proba(self.scaler.transform(X[flagged]))
+                best = probabilities.argmax(axis=1)
+                for prediction, label, probability in zip(predictions, self.model.classes_[best],
+                                                          probabilities.max(axis=1)):
+                    prediction['model_threat_type'] = str(label)
+                    prediction['model_confidence'] = round(float(probability), 2)
+            except Exception as e:
+                print(f"Error scoring threat model: {e}")
+        lap('model')
+        
+        self._save_predictions(predictions)
+        lap('write')
+        
+        high_confidence_predictions = [
+            p for p in predictions
+            if p.get('confidence', 0) >= self.confidence_threshold
+        ]
+        
+        self.last_fleet_scan = {
+            'users_requested': len(user_ids),
+            'users_scanned': len(scanned),
+            'history_fetches': len(missing),
+            'users_flagged': len(predictions),
+            'high_confidence': len(high_confidence_predictions),
+            'concurrency': self.fleet_concurrency,
+            'timings_ms': timings,
+            'total_ms': round(sum(timings.values()), 3),
+            'completed_at': datetime.utcnow().isoformat()
+        }
+        
+        return dict(self.last_fleet_scan, predictions=high_confidence_predictions)
+    
+    def _load_history_features(self, user_id: str) -> Optional[np.ndarray]:
+        """Fetch one user's history from every audit collection the feature store follows and seed it"""
+        try:
+            access_history = self._get_feature_history(user_id, days=self.lookback_days)
+            if not access_history:
+                return None
+            
+            return threat_feature_store.rebuild_from_history(user_id, access_history)
+            
+        except Exception as e:
+            print(f"Error loading threat features for user {user_id}: {e}")
+            return None
+    
+    def _build_prediction(self, user_id: str, indicators: List[Dict]) -> Dict:
+        """Score threat indicators into a prediction"""
+        # Calculate threat score based on indicators
+        threat_score = 0
+        severity_weights = {'low': 1, 'medium': 2, 'high': 3}
+        
+        for indicator in indicators:
+            severity = indicator.get('severity', 'low')
+            threat_score += severity_weights.get(severity, 1)
+        
+        # Normalize to 0-1 range
+        max_possible_score = len(indicators) * 3
+        confidence = min(threat_score / max_possible_score, 1.0) if max_possible_score > 0 else 0
+        
+        # Determine threat type
+        threat_types = [ind.get('type') for ind in indicators]
+        
+        if 'excessive_failed_attempts' in threat_types:
+            primary_threat = 'brute_force_attack'
+        elif 'scope_deviation' in threat_types:
+            primary_threat = 'privilege_escalation'
+        elif 'geographic_anomaly' in threat_types:
+            primary_threat = 'account_compromise'
+        elif 'frequency_spike' in threat_types:
+            primary_threat = 'automated_attack'
+        else:
+            primary_threat = 'suspicious_activity'
+        
+        # Generate preventive measures
+        preventive_measures = self._generate_preventive_measures(threat_types)
+        
+        prediction = {
+            'user_id': user_id,
+            'threat_type': primary_threat,
+            'confidence': round(confidence, 2),
+            'threat_score': threat_score,
+            'indicators': indicators,
+            'preventive_measures': preventive_measures,
+            'predicted_at': datetime.utcnow().isoformat(),
+            'status': 'pending'
+        }
+        
+        return prediction
+    
     def _generate_preventive_measures(self, threat_types: List[str]) -> List[str]:
         """Generate preventive measure recommendations"""
         measures = []
@@ -463,6 +613,21 @@ class ThreatPredictor:
             print(f"Error getting access history: {e}")
             return []
     
+    def _get_feature_history(self, user_id: str, days: int = 30) -> List[Dict]:
+        """Get a user's audit_logs and auditLogs records, the two streams the threat feature store follows"""
+        history = list(self._get_user_access_history(user_id, days=days))
+        try:
+            cutoff_date = datetime.utcnow() - timedelta(days=days)
+            query = db.collection('auditLogs')\
+                     .where('userId', '==', user_id)\
+                     .where('timestamp', '>=', cutoff_date)\
+                     .order_by('timestamp', direction='DESCENDING')\
+                     .limit(1000)
+            history.extend(doc.to_dict() for doc in query.stream())
+        except Exception as e:
+            print(f"Error getting audit log history: {e}")
+        return history
+    
     def _get_users_with_suspicious_activity(self) -> List[str]:
         """Get list of users with suspicious activity patterns"""
         try:
@@ -502,6 +667,22 @@ class ThreatPredictor:
         except Exception as e:
             print(f"Error saving prediction: {e}")
     
+    def _save_predictions(self, predictions: List[Dict]):
+        """Save threat predictions to Firestore in batched commits"""
+        # Firestore rejects batches with more than 500 operations
+        for start in range(0, len(predictions), 500):
+            chunk = predictions[start:start + 500]
+            try:
+                batch = db.batch()
+                for prediction in chunk:
+                    doc_ref = db.collection('threat_predictions').document()
+                    prediction['prediction_id'] = doc_ref.id
+                    batch.set(doc_ref, prediction)
+                batch.commit()
+                
+            except Exception as e:
+                print(f"Error saving {len(chunk)} predictions: {e}")
+    
     def _get_training_data(self) -> List[Dict]:
         """Get historical data for model training"""
         # This would query historical threat data
@@ -523,30 +704,16 @@ class ThreatPredictor:
             Dict with detection results or None
         """
         try:
-            cutoff_time = datetime.utcnow() - timedelta(hours=1)
-            
-            # Query failed login attempts
-            query = db.collection('audit_logs')\
-                     .where('action', '==', 'login')\
-                     .where('result', '==', 'failure')\
-                     .where('timestamp', '>=', cutoff_time)
-            
-            if user_id:
-                query = query.where('user_id', '==', user_id)
-            
-            docs = query.stream()
-            
-            # Group by IP address
+            # Failed logins per IP address over the last hour, kept current by the audit write path
             ip_failures = {}
-            user_failures = {}
             
-            for doc in docs:
-                data = doc.to_dict()
-                ip = data.get('ip_address', 'unknown')
-                uid = data.get('user_id', 'unknown')
-                
-                ip_failures[ip] = ip_failures.get(ip, 0) + 1
-                user_failures[uid] = user_failures.get(uid, 0) + 1
+            for window in streaming_threat_detector.snapshot(LOGIN_FAILURES_BY_IP, key=ip_address):
+                if user_id:
+                    count = window['members'].get('users', {}).get(user_id, 0)
+                else:
+                    count = window['count']
+                if count:
+                    ip_failures[window['key']] = count
             
             # Check for brute force patterns
             brute_force_detected = False
@@ -658,37 +825,17 @@ class ThreatPredictor:
             Dict with detection results or None
         """
         try:
-            cutoff_time = datetime.utcnow() - timedelta(hours=1)
-            
-            # Get recent suspicious activity
-            query = db.collection('audit_logs')\
-                     .where('result', 'in', ['failure', 'denied'])\
-                     .where('timestamp', '>=', cutoff_time)\
-                     .limit(500)
-            
-            docs = query.stream()
-            
-            # Group by resource and action
+            # Failed and denied attempts per resource and action over the last hour
             attack_patterns = {}
             
-            for doc in docs:
-                data = doc.to_dict()
-                resource = data.get('resource_type', 'unknown')
-                action = data.get('action', 'unknown')
-                user_id = data.get('user_id', 'unknown')
-                
-                pattern_key = f"{resource}:{action}"
-                
-                if pattern_key not in attack_patterns:
-                    attack_patterns[pattern_key] = {
-                        'users': set(),
-                        'count': 0,
-                        'resource': resource,
-                        'action': action
-                    }
-                
-                attack_patterns[pattern_key]['users'].add(user_id)
-                attack_patterns[pattern_key]['count'] += 1
+            for window in streaming_threat_detector.snapshot(FAILURES_BY_PATTERN_LONG):
+                resource, action = window['key'].split(':', 1)
+                attack_patterns[window['key']] = {
+                    'users': set(window['members'].get('users', {})),
+                    'count': window['count'],
+                    'resource': resource,
+                    'action': action
+                }
             
             # Check for coordinated patterns
             coordinated_attacks = []
@@ -997,6 +1144,7 @@ class ThreatPredictor:
                 'accuracy_30_days': accuracy_30d.get('accuracy', 0),
                 'false_positive_rate': accuracy_30d.get('false_positive_rate', 0),
                 'threat_type_distribution': threat_types,
+                'last_fleet_scan': self.last_fleet_scan,
                 'generated_at': datetime.utcnow().isoformat()
             }
             
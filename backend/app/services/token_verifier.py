@@ -0,0 +1,316 @@
+"""
+Token Verifier
+Shared JWT verification with a bounded cache of verified claims, key rotation and revocation
+"""
+
+import calendar
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import jwt
+
+import redis_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SECRET = 'dev_jwt_secret'
+
+TOKEN_CACHE_SIZE = int(os.getenv('JWT_VERIFIED_CACHE_SIZE', '10000'))
+# Upper bound on how long verified claims are reused, also for tokens without exp.
+# Shared revocations are read when a token is (re)verified, so this is also the
+# longest a worker keeps accepting a token revoked by another worker
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv('JWT_VERIFIED_CACHE_TTL_SECONDS', '30'))
+
+# Redis keys of revocations shared between workers
+REVOKED_TOKEN_PREFIX = 'jwt_revoked:'
+REVOKED_USER_PREFIX = 'jwt_revoked_user:'
+
+
+class TokenError(Exception):
+    """Token rejected; ``code`` is one of expired, invalid, revoked or inactive"""
+
+    def __init__(self, message: str, code: str = 'invalid'):
+        super().__init__(message)
+        self.code = code
+
+
+def load_signing_keys() -> List[str]:
+    """
+    Keys accepted for verification, the signing key first
+
+    JWT_SECRET_KEY signs new tokens. JWT_PREVIOUS_SECRET_KEYS (comma-separated)
+    lists retired keys whose tokens are still accepted until they expire.
+    """
+    current = os.getenv('JWT_SECRET_KEY') or DEFAULT_SECRET
+    previous = [k.strip() for k in os.getenv('JWT_PREVIOUS_SECRET_KEYS', '').split(',') if k.strip()]
+    return [current] + [k for k in previous if k != current]
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8') if isinstance(token, str) else token).hexdigest()
+
+
+def _epoch(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if value.tzinfo is not None:
+        return value.timestamp()
+    # Naive timestamps in tokens are UTC (datetime.utcnow())
+    return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+
+
+def _user_revocation_seconds() -> int:
+    # Every token issued before a cutoff has expired once the longest token lifetime has passed
+    return int(os.getenv('REFRESH_TOKEN_EXPIRATION_DAYS', 7)) * 86400
+
+
+class TokenVerifier:
+    """
+    Verifies JWTs once and serves repeat requests from a cache of claims.
+
+    Claims are cached by the SHA-256 digest of the token, in LRU order and up
+    to ``max_entries``. A cached entry is only used until the token's ``exp``
+    (and at most ``cache_ttl`` seconds), so the cache never extends a
+    token's life. Inactivity limits are checked on every call against the
+    ``last_activity`` claim parsed when the token was first verified.
+
+    Revocation covers single tokens by digest until they would have expired,
+    and all tokens of a user issued before a cutoff. Both checks are
+    dictionary lookups. Revocations are also written to Redis, and a token
+    being verified picks up the ones other workers made, so another worker
+    rejects a revoked token at the latest when its cached claims expire
+    (``cache_ttl``). Without Redis, revocation only reaches the worker that
+    made it. Tokens issued in the same second as a user cutoff are also
+    rejected because ``iat`` has one-second resolution.
+    """
+
+    def __init__(
+        self,
+        keys: Optional[List[str]] = None,
+        algorithm: Optional[str] = None,
+        max_entries: int = TOKEN_CACHE_SIZE,
+        cache_ttl: int = TOKEN_CACHE_TTL_SECONDS
+    ):
+        """
+        Initialize token verifier
+
+        Args:
+            keys (list): Accepted keys, signing key first; read from the environment if omitted
+            algorithm (str): JWT algorithm; JWT_ALGORITHM or HS256 if omitted
+            max_entries (int): Verified tokens kept in the cache
+            cache_ttl (int): Seconds a verified token is reused without decoding it again,
+                bounding how late revocations by other workers take effect
+        """
+        self._fixed_keys = keys
+        self.keys = list(keys) if keys else load_signing_keys()
+        self.algorithm = algorithm or os.getenv('JWT_ALGORITHM', 'HS256')
+        self.max_entries = max_entries
+        self.cache_ttl = cache_ttl
+
+        self._cache = OrderedDict()  # digest -> (valid_until, exp, last_activity epoch, claims)
+        self._revoked_tokens = {}  # digest -> epoch after which the token expires anyway
+        self._revoked_users = {}  # user_id -> epoch cutoff for iat
+        self._lock = threading.Lock()
+        self.metrics = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'rejected': 0,
+            'revoked_rejections': 0
+        }
+
+    @property
+    def signing_key(self) -> str:
+        return self.keys[0]
+
+    def reload_keys(self, keys: Optional[List[str]] = None) -> bool:
+        """
+        Re-read the key set, e.g. after rotating JWT_SECRET_KEY
+
+        Returns:
+            bool: True if the accepted keys changed; cached claims are then dropped
+        """
+        new_keys = list(keys) if keys else (list(self._fixed_keys) if self._fixed_keys else load_signing_keys())
+        with self._lock:
+            if new_keys == self.keys:
+                return False
+            self.keys = new_keys
+            self._cache.clear()
+        logger.info(f"JWT keys reloaded, {len(new_keys)} accepted")
+        return True
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        """Sign a payload with the current signing key"""
+        token = jwt.encode(payload, self.signing_key, algorithm=self.algorithm)
+        return token.decode('utf-8') if isinstance(token, bytes) else token
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """
+        Fully verify a token against the accepted keys, without the cache
+
+        Raises:
+            TokenError: If the token is expired or no accepted key verifies it
+        """
+        if not token:
+            raise TokenError("Missing token")
+        for key in self.keys:
+            try:
+                return jwt.decode(token, key, algorithms=[self.algorithm])
+            except jwt.ExpiredSignatureError:
+                raise TokenError("Token has expired", code='expired')
+            except jwt.InvalidSignatureError:
+                continue
+            except jwt.InvalidTokenError as e:
+                raise TokenError(f"Invalid token: {e}")
+        raise TokenError("Invalid token signature")
+
+    def verify(self, token: str, max_inactivity: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Verify a token, from the cache when it was verified before
+
+        Args:
+            token (str): Encoded JWT
+            max_inactivity (float): Seconds allowed since the last_activity claim, None to skip
+
+        Returns:
+            dict: Token claims (a copy callers may modify)
+
+        Raises:
+            TokenError: If the token is expired, invalid, revoked or inactive
+        """
+        if not token:
+            raise TokenError("Missing token")
+
+        digest = token_digest(token)
+        now = time.time()
+
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is not None:
+                if entry[1] is not None and entry[1] <= now:
+                    del self._cache[digest]
+                    raise TokenError("Token has expired", code='expired')
+                if entry[0] > now:
+                    self._cache.move_to_end(digest)
+                    self.metrics['hits'] += 1
+                else:
+                    del self._cache[digest]
+                    entry = None
+            if entry is None:
+                self.metrics['misses'] += 1
+
+        if entry is None:
+            try:
+                claims = self.decode(token)
+            except TokenError:
+                self.metrics['rejected'] += 1
+                raise
+            self._load_shared_revocations(digest, claims)
+            exp = _epoch(claims.get('exp'))
+            valid_until = min(exp, now + self.cache_ttl) if exp is not None else now + self.cache_ttl
+            entry = (valid_until, exp, _epoch(claims.get('last_activity')), claims)
+            with self._lock:
+                self._cache[digest] = entry
+                self._cache.move_to_end(digest)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+                    self.metrics['evictions'] += 1
+
+        _, _, last_activity, claims = entry
+        self._check_revoked(digest, claims)
+
+        if max_inactivity is not None and last_activity is not None and now - last_activity > max_inactivity:
+            raise TokenError("Session timeout due to inactivity", code='inactive')
+
+        return dict(claims)
+
+    def _check_revoked(self, digest: str, claims: Dict[str, Any]):
+        if not self._revoked_tokens and not self._revoked_users:
+            return
+        revoked = digest in self._revoked_tokens
+        if not revoked:
+            cutoff = self._revoked_users.get(claims.get('user_id') or claims.get('userId'))
+            issued = _epoch(claims.get('iat'))
+            revoked = cutoff is not None and (issued is None or issued < cutoff)
+        if revoked:
+            self.metrics['revoked_rejections'] += 1
+            raise TokenError("Token has been revoked", code='revoked')
+
+    def _load_shared_revocations(self, digest: str, claims: Dict[str, Any]):
+        """Merge the revocations other workers made for a token being verified"""
+        user_id = claims.get('user_id') or claims.get('userId')
+        expires_at = redis_config.cache_get(f"{REVOKED_TOKEN_PREFIX}{digest}")
+        cutoff = redis_config.cache_get(f"{REVOKED_USER_PREFIX}{user_id}") if user_id else None
+        if expires_at is None and cutoff is None:
+            return
+        with self._lock:
+            if expires_at is not None:
+                self._revoked_tokens[digest] = float(expires_at)
+            if cutoff is not None:
+                self._revoked_users[user_id] = max(float(cutoff), self._revoked_users.get(user_id, 0.0))
+
+    def revoke(self, token: str):
+        """Reject a single token from now on, e.g. on logout"""
+        digest = token_digest(token)
+        try:
+            expires_at = _epoch(self.decode(token).get('exp')) or time.time() + self.cache_ttl
+        except TokenError:
+            expires_at = time.time() + self.cache_ttl
+        with self._lock:
+            self._prune_revocations()
+            self._revoked_tokens[digest] = expires_at
+            self._cache.pop(digest, None)
+        remaining = expires_at - time.time()
+        if remaining > 0:
+            redis_config.cache_set(f"{REVOKED_TOKEN_PREFIX}{digest}", expires_at, ttl=remaining)
+
+    def revoke_user(self, user_id: str):
+        """Reject every token of a user issued before now"""
+        if not user_id:
+            return
+        cutoff = time.time()
+        with self._lock:
+            self._prune_revocations()
+            self._revoked_users[user_id] = cutoff
+        redis_config.cache_set(f"{REVOKED_USER_PREFIX}{user_id}", cutoff, ttl=_user_revocation_seconds())
+
+    def _prune_revocations(self):
+        now = time.time()
+        for digest in [d for d, expires_at in self._revoked_tokens.items() if expires_at <= now]:
+            del self._revoked_tokens[digest]
+        horizon = now - _user_revocation_seconds()
+        for user_id in [u for u, cutoff in self._revoked_users.items() if cutoff <= horizon]:
+            del self._revoked_users[user_id]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.metrics['hits'] + self.metrics['misses']
+            return {
+                **self.metrics,
+                'cached_tokens': len(self._cache),
+                'revoked_tokens': len(self._revoked_tokens),
+                'revoked_users': len(self._revoked_users),
+                'hit_rate': self.metrics['hits'] / lookups if lookups else 0.0,
+                'accepted_keys': len(self.keys)
+            }
+
+
+# Singleton instance
+token_verifier = TokenVerifier()
@@ -0,0 +1,364 @@
+"""
+Verification History Writer
+Write-behind queue that coalesces device verification history updates
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from queue import Queue, Empty
+from typing import Any, Dict, List, Optional
+
+from firebase_admin import firestore
+
+from app.firebase_config import get_firestore_client
+
+logger = logging.getLogger(__name__)
+
+DEVICE_COLLECTION = 'deviceFingerprints'
+ROLLUP_COLLECTION = 'verificationRollups'
+UNDATED_ROLLUP = 'undated'
+
+
+def verification_result(similarity: float) -> str:
+    """Outcome bucket of a verification similarity"""
+    return "success" if similarity >= 95 else "partial" if similarity >= 85 else "failed"
+
+
+def _empty_rollup() -> Dict[str, float]:
+    return {'total': 0, 'success': 0, 'partial': 0, 'failed': 0, 'similaritySum': 0.0}
+
+
+def _roll_up(rollups: Dict[str, Dict[str, float]], entries: List[Dict[str, Any]]) -> None:
+    """Add verification entries to per-day counters"""
+    for entry in entries:
+        timestamp = entry.get('timestamp')
+        day = timestamp.strftime('%Y-%m-%d') if isinstance(timestamp, datetime) else UNDATED_ROLLUP
+        counters = rollups.setdefault(day, _empty_rollup())
+        similarity = float(entry.get('similarity') or 0)
+        result = entry.get('result') or verification_result(similarity)
+        counters['total'] += 1
+        counters[result if result in counters else 'failed'] += 1
+        counters['similaritySum'] += similarity
+
+
+class _PendingDevice:
+    """Verifications of one device waiting to be written"""
+
+    __slots__ = ('entries', 'rollups', 'count')
+
+    def __init__(self):
+        self.entries: List[Dict[str, Any]] = []
+        self.rollups: Dict[str, Dict[str, float]] = {}
+        self.count = 0
+
+
+class VerificationHistoryWriter:
+    """
+    Bounded write-behind queue for device verification history.
+
+    ``submit()`` records a verification in memory and returns immediately. A
+    fixed pool of worker threads writes each device at most once per
+    ``flush_delay``: all verifications of a device submitted in the meantime
+    are coalesced into a single Firestore transaction.
+
+    The ``verificationHistory`` array on a device document keeps only the last
+    ``history_limit`` entries. Entries pushed out of it are folded into daily
+    counters in the device's ``verificationRollups`` subcollection, and the
+    device document carries a running ``verificationCount``, so device
+    documents (and every read of them) stay small while no verification goes
+    uncounted. Legacy documents with long arrays are trimmed the same way on
+    their next write.
+
+    At most ``max_pending_devices`` devices wait at a time; verifications of
+    further devices are dropped and counted in the metrics.
+    """
+
+    def __init__(
+        self,
+        db=None,
+        workers: Optional[int] = None,
+        history_limit: Optional[int] = None,
+        flush_delay: Optional[float] = None,
+        max_pending_devices: Optional[int] = None
+    ):
+        """
+        Initialize the writer
+
+        Args:
+            db: Firestore client (defaults to the shared client on first write)
+            workers (int): Worker threads writing to Firestore
+            history_limit (int): Entries kept in verificationHistory on the device document
+            flush_delay (float): Seconds a device's verifications are collected before writing
+            max_pending_devices (int): Devices that may wait to be written at once
+        """
+        self._db = db
+        self.workers = max(1, workers or int(os.getenv('VERIFICATION_HISTORY_WORKERS', '2')))
+        self.history_limit = max(1, history_limit or int(os.getenv('VERIFICATION_HISTORY_LIMIT', '20')))
+        self.flush_delay = flush_delay if flush_delay is not None else float(
+            os.getenv('VERIFICATION_HISTORY_FLUSH_DELAY', '1.0')
+        )
+        self.max_pending_devices = max_pending_devices or int(
+            os.getenv('VERIFICATION_HISTORY_MAX_PENDING', '10000')
+        )
+
+        self._pending: Dict[str, _PendingDevice] = {}
+        self._queue: Queue = Queue()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        self.metrics = {
+            'submitted': 0,
+            'coalesced': 0,
+            'written': 0,
+            'transactions': 0,
+            'rolled_up': 0,
+            'failed': 0,
+            'dropped': 0,
+            'max_pending_devices': 0
+        }
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_firestore_client()
+        return self._db
+
+    def submit(self, device_id: str, similarity: float, timestamp: Optional[datetime] = None) -> bool:
+        """
+        Queue a verification of a device
+
+        Args:
+            device_id (str): Verified device
+            similarity (float): Fingerprint similarity percentage
+            timestamp (datetime): Verification time (defaults to now)
+
+        Returns:
+            bool: True if the verification was queued
+        """
+        entry = {
+            "timestamp": timestamp or datetime.utcnow(),
+            "similarity": similarity,
+            "result": verification_result(similarity)
+        }
+
+        with self._lock:
+            self.metrics['submitted'] += 1
+            pending = self._pending.get(device_id)
+            if pending is None:
+                if len(self._pending) >= self.max_pending_devices:
+                    self.metrics['dropped'] += 1
+                    return False
+                pending = self._pending[device_id] = _PendingDevice()
+                schedule = True
+            else:
+                self.metrics['coalesced'] += 1
+                schedule = False
+
+            pending.entries.append(entry)
+            pending.count += 1
+            # Only the newest entries can survive in the capped array
+            if len(pending.entries) > self.history_limit:
+                _roll_up(pending.rollups, pending.entries[:-self.history_limit])
+                del pending.entries[:-self.history_limit]
+
+            self.metrics['max_pending_devices'] = max(self.metrics['max_pending_devices'], len(self._pending))
+
+        if schedule:
+            if self._stop_event.is_set():
+                # Shut down: write on the caller's thread
+                self._write_pending(device_id)
+            else:
+                self._ensure_started()
+                self._queue.put((time.monotonic() + self.flush_delay, device_id))
+        return True
+
+    def write(self, device_id: str, entries: List[Dict[str, Any]]) -> bool:
+        """
+        Write verifications of a device synchronously
+
+        Args:
+            device_id (str): Verified device
+            entries (list): Verification entries with timestamp, similarity and result
+
+        Returns:
+            bool: True if the device document was updated
+        """
+        pending = _PendingDevice()
+        pending.entries = list(entries)
+        pending.count = len(entries)
+        return self._write(device_id, pending)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until every queued verification has been written
+
+        Args:
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            bool: True if the queue drained within the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if not any(thread.is_alive() for thread in self._threads):
+                self._drain_inline()
+                break
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Write what is pending without waiting for the flush delay, then stop the workers"""
+        self._stop_event.set()
+        self.flush(timeout)
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get queue and write metrics
+
+        Returns:
+            dict: Writer metrics
+        """
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics['pending_devices'] = len(self._pending)
+        metrics['workers'] = self.workers
+        metrics['workers_running'] = sum(1 for thread in self._threads if thread.is_alive())
+        metrics['avg_coalesced'] = round(metrics['written'] / metrics['transactions'], 2) if metrics['transactions'] else 0.0
+        return metrics
+
+    def _ensure_started(self) -> None:
+        """Start the worker pool on first use"""
+        if self._threads and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._start_lock:
+            if self._stop_event.is_set():
+                return
+            alive = [thread for thread in self._threads if thread.is_alive()]
+            first_start = not self._threads
+            while len(alive) < self.workers:
+                thread = threading.Thread(
+                    target=self._run, name=f'verification-history-{len(alive)}', daemon=True
+                )
+                thread.start()
+                alive.append(thread)
+            self._threads = alive
+            if first_start:
+                atexit.register(self.shutdown)
+
+    def _run(self) -> None:
+        """Worker loop: write each scheduled device once its flush delay has passed"""
+        while True:
+            try:
+                due, device_id = self._queue.get(timeout=0.5)
+            except Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+
+            try:
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._stop_event.wait(wait)
+                self._write_pending(device_id)
+            except Exception as e:  # pragma: no cover - _write handles its own errors
+                logger.error(f"Verification history worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _drain_inline(self) -> None:
+        """Write queued devices on the calling thread (no worker running)"""
+        while True:
+            try:
+                _, device_id = self._queue.get_nowait()
+            except Empty:
+                return
+            try:
+                self._write_pending(device_id)
+            finally:
+                self._queue.task_done()
+
+    def _write_pending(self, device_id: str) -> None:
+        """Take a device's pending verifications and write them"""
+        with self._lock:
+            pending = self._pending.pop(device_id, None)
+        if pending is not None:
+            self._write(device_id, pending)
+
+    def _write(self, device_id: str, pending: _PendingDevice) -> bool:
+        """Apply pending verifications to a device in one transaction"""
+        try:
+            device_ref = self.db.collection(DEVICE_COLLECTION).document(device_id)
+            transaction = self.db.transaction()
+            rolled_up = firestore.transactional(self._apply)(transaction, device_ref, pending)
+            if rolled_up is None:
+                return False
+
+            with self._lock:
+                self.metrics['transactions'] += 1
+                self.metrics['written'] += pending.count
+                self.metrics['rolled_up'] += rolled_up
+            return True
+
+        except Exception as e:
+            with self._lock:
+                self.metrics['failed'] += 1
+            logger.error(f"Error updating verification history for device {device_id}: {str(e)}")
+            return False
+
+    def _apply(self, transaction, device_ref, pending: _PendingDevice) -> Optional[int]:
+        """
+        Transaction body: append to the capped history and roll up what falls out of it
+
+        Runs again when the transaction is retried, so it must not modify ``pending``.
+
+        Returns:
+            int: Number of entries rolled up, or None if the device does not exist
+        """
+        snapshot = device_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            logger.warning(f"Verification history for unknown device {device_ref.id} dropped")
+            return None
+
+        device = snapshot.to_dict() or {}
+        history = list(device.get('verificationHistory') or [])
+        count = device.get('verificationCount')
+        if count is None:
+            count = len(history)
+
+        history.extend(pending.entries)
+        rollups = {day: dict(counters) for day, counters in pending.rollups.items()}
+        overflow = len(history) - self.history_limit
+        if overflow > 0:
+            _roll_up(rollups, history[:overflow])
+            history = history[overflow:]
+
+        transaction.update(device_ref, {
+            'verificationHistory': history,
+            'verificationCount': count + pending.count,
+            'lastVerified': pending.entries[-1]['timestamp'] if pending.entries else datetime.utcnow()
+        })
+
+        rolled_up = 0
+        for day, counters in rollups.items():
+            rolled_up += int(counters['total'])
+            transaction.set(device_ref.collection(ROLLUP_COLLECTION).document(day), {
+                'day': day,
+                **{name: firestore.Increment(value) for name, value in counters.items()},
+                'updatedAt': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+
+        return rolled_up
+
+
+# Singleton instance
+verification_history_writer = VerificationHistoryWriter()
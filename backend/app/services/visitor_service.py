@@ -29,6 +29,8 @@ from ..models.visitor import Visitor, VisitorRegistrationRequest, VisitorCredent
 from ..services.firebase_admin_service import FirebaseAdminService
 from ..services.enhanced_firebase_service import EnhancedFirebaseService
 from ..utils.error_handler import ValidationError, NotFoundError, AuthorizationError
+from ..services.threat_feature_store import threat_feature_store
+from ..services.streaming_threat_detector import streaming_threat_detector
 
 logger = logging.getLogger(__name__)
 
@@ -831,6 +833,9 @@ class VisitorService:
             }
             
             self.db.collection('audit_logs').add(log_entry)
+            # audit_logs feeds the threat feature store and the attack detectors
+            threat_feature_store.record_event(log_entry)
+            streaming_threat_detector.ingest(log_entry)
             
         except Exception as e:
             logger.error(f"Error logging visitor event: {str(e)}")
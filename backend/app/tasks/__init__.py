@@ -18,7 +18,8 @@ from app.tasks.policy_tasks import (
     track_policy_outcome,
     simulate_policy_change,
     rollback_policy,
-    check_policy_health
+    check_policy_health,
+    rebuild_peer_cohort_stats
 )
 
 from app.tasks.automated_threat_detection_tasks import (
@@ -33,6 +34,11 @@ from app.tasks.session_monitoring_tasks import (
 )
 
 
+from app.tasks.audit_tasks import (
+    build_audit_checkpoints,
+    verify_audit_checkpoints
+)
+
 from app.tasks.cleanup_tasks import (
     cleanup_expired_sessions,
     cleanup_old_behavioral_data,
@@ -57,6 +63,7 @@ __all__ = [
     'simulate_policy_change',
     'rollback_policy',
     'check_policy_health',
+    'rebuild_peer_cohort_stats',
     
     # Automated Threat Detection Tasks
     'run_automated_threat_detection_cycle',
@@ -68,6 +75,10 @@ __all__ = [
     'check_session_risk',
     
     
+    # Audit Tasks
+    'build_audit_checkpoints',
+    'verify_audit_checkpoints',
+    
     # Cleanup Tasks
     'cleanup_expired_sessions',
     'cleanup_old_behavioral_data',
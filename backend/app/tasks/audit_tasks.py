@@ -0,0 +1,70 @@
+"""
+Celery Tasks for Audit Log Integrity
+Background tasks for sealing and verifying audit log checkpoints
+"""
+
+from celery_config import celery_app
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name='app.tasks.audit_tasks.build_audit_checkpoints')
+def build_audit_checkpoints():
+    """
+    Seal completed windows of audit logs into chained Merkle checkpoints
+    Intended to run every few minutes
+    """
+    try:
+        from app.services.enhanced_audit_service import enhanced_audit_service
+        
+        result = enhanced_audit_service.checkpoint_service.build_checkpoints()
+        
+        return {
+            'status': 'success',
+            **result,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in build_audit_checkpoints task: {e}")
+        return {'status': 'error', 'error': str(e)}
+
+
+@celery_app.task(name='app.tasks.audit_tasks.verify_audit_checkpoints')
+def verify_audit_checkpoints(hours=24):
+    """
+    Verify the checkpoint chain and window roots for recent audit logs
+    
+    Args:
+        hours: Size of the verified range ending now
+    """
+    try:
+        logger.info(f"Verifying audit checkpoints for the last {hours} hours...")
+        
+        from app.services.enhanced_audit_service import enhanced_audit_service
+        
+        end = datetime.utcnow()
+        result = enhanced_audit_service.checkpoint_service.verify_range(end - timedelta(hours=hours), end)
+        
+        if result['status'] != 'intact':
+            logger.error(
+                f"Audit checkpoint verification failed: {len(result['chain_errors'])} chain errors, "
+                f"{len(result['windows_mismatched'])} mismatched windows"
+            )
+        
+        return {
+            'status': 'success',
+            'integrity': result['status'],
+            'checkpoints_checked': result['checkpoints_checked'],
+            'windows_verified': result['windows_verified'],
+            'windows_mismatched': len(result['windows_mismatched']),
+            'chain_errors': len(result['chain_errors']),
+            'unsealed_logs': result['unsealed_logs'],
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in verify_audit_checkpoints task: {e}")
+        return {'status': 'error', 'error': str(e)}
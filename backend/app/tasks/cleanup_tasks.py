@@ -168,19 +168,13 @@ def cleanup_cache():
         logger.info("Starting cache cleanup...")
         
         from app.services.cache_service import cache_service
-        from redis_config import get_redis_client
-        
-        if not cache_service.is_available():
-            logger.warning("Redis not available, skipping cache cleanup")
-            return {'status': 'skipped', 'reason': 'Redis not available'}
-        
-        redis_client = get_redis_client()
         
         # Get cache statistics before cleanup
         stats_before = cache_service.get_cache_stats()
         
-        # Redis automatically handles TTL expiration
-        # But we can manually clean up specific patterns if needed
+        # Redis automatically handles TTL expiration; the local tier only
+        # drops expired entries lazily, so sweep them here
+        purged = cache_service.purge_expired()
         
         # Get statistics after
         stats_after = cache_service.get_cache_stats()
@@ -191,6 +185,7 @@ def cleanup_cache():
             'status': 'success',
             'stats_before': stats_before,
             'stats_after': stats_after,
+            'local_entries_purged': purged,
             'timestamp': datetime.utcnow().isoformat()
         }
         
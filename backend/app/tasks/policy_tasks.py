@@ -299,3 +299,32 @@ def check_policy_health():
     except Exception as e:
         logger.error(f"Error in check_policy_health task: {e}")
         return {'status': 'error', 'error': str(e)}
+
+
+@celery_app.task(name='app.tasks.policy_tasks.rebuild_peer_cohort_stats')
+def rebuild_peer_cohort_stats():
+    """
+    Recompute peer cohort and per-user access aggregates from history
+    Run once to backfill the store, or on demand to repair drift
+    """
+    try:
+        logger.info("Rebuilding peer cohort aggregates...")
+        
+        from app.services.peer_cohort_store import peer_cohort_store
+        
+        result = peer_cohort_store.rebuild_from_history()
+        
+        logger.info(
+            f"Peer cohort rebuild completed: {result['requestsFolded']} requests, "
+            f"{result['documentsWritten']} aggregates"
+        )
+        
+        return {
+            'status': 'success',
+            **result,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in rebuild_peer_cohort_stats task: {e}")
+        return {'status': 'error', 'error': str(e)}
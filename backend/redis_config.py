@@ -1,91 +1,241 @@
-# Simple Redis configuration stub
-# This is a placeholder since Redis is not being used in the current setup
+# Redis configuration
+# Redis is optional: when ENABLE_REDIS_CACHING is not set, or the server cannot
+# be reached, every helper below degrades to a no-op and callers fall back to
+# the in-process cache tier in app/services/cache_service.py
+
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Configuration constants
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', '6379'))
+REDIS_DB = int(os.getenv('REDIS_DB', '0'))
+REDIS_PASSWORD = os.getenv('REDIS_PASSWORD') or None
+REDIS_TIMEOUT = float(os.getenv('REDIS_TIMEOUT', '2'))
+REDIS_ENABLED = os.getenv('ENABLE_REDIS_CACHING', 'false').lower() == 'true'
+
+# Seconds to wait before retrying after a failed connection attempt
+REDIS_RETRY_INTERVAL = 30
+
+SESSION_PREFIX = "session:"
+
+_client = None
+_client_lock = threading.Lock()
+_last_failure = 0.0
+
 
 def get_redis_client():
-    """Return None since Redis is not configured"""
-    return None
+    """Return a connected Redis client, or None if Redis is not configured or unreachable"""
+    global _client, _last_failure
+
+    if not REDIS_ENABLED or redis is None:
+        return None
+
+    if _client is not None:
+        return _client
+
+    if time.time() - _last_failure < REDIS_RETRY_INTERVAL:
+        return None
+
+    with _client_lock:
+        if _client is not None:
+            return _client
+        try:
+            client = redis.Redis(
+                host=REDIS_HOST,
+                port=REDIS_PORT,
+                db=REDIS_DB,
+                password=REDIS_PASSWORD,
+                socket_timeout=REDIS_TIMEOUT,
+                socket_connect_timeout=REDIS_TIMEOUT,
+                decode_responses=True
+            )
+            client.ping()
+            _client = client
+            logger.info(f"Connected to Redis at {REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}")
+        except Exception as e:
+            _last_failure = time.time()
+            logger.warning(f"Redis unavailable, using local cache only: {e}")
+            return None
+
+    return _client
+
+
+def _handle_error(operation, error):
+    """Drop the client after a connection error so the next call reconnects"""
+    global _client, _last_failure
+    logger.warning(f"Redis {operation} failed: {error}")
+    if redis is not None and isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+        _client = None
+        _last_failure = time.time()
+
 
 def is_redis_available():
-    """Return False since Redis is not configured"""
-    return False
+    """Check whether the Redis tier is configured and reachable"""
+    return get_redis_client() is not None
+
 
 def get_redis_stats():
-    """Return empty stats since Redis is not configured"""
-    return {
-        "connected": False,
-        "memory_usage": 0,
-        "keys": 0,
-        "hits": 0,
-        "misses": 0
-    }
-
-# Cache function stubs
+    """Return Redis server statistics"""
+    client = get_redis_client()
+    if client is None:
+        return {
+            "connected": False,
+            "memory_usage": 0,
+            "keys": 0,
+            "hits": 0,
+            "misses": 0
+        }
+
+    try:
+        info = client.info()
+        return {
+            "connected": True,
+            "memory_usage": info.get('used_memory', 0),
+            "keys": client.dbsize(),
+            "hits": info.get('keyspace_hits', 0),
+            "misses": info.get('keyspace_misses', 0)
+        }
+    except Exception as e:
+        _handle_error('info', e)
+        return {
+            "connected": False,
+            "memory_usage": 0,
+            "keys": 0,
+            "hits": 0,
+            "misses": 0
+        }
+
+
+# Cache functions
+# Values are stored as JSON; anything that is not JSON-native is stringified.
+
 def cache_set(key, value, ttl=None):
-    """Stub cache set function"""
-    return False
+    """Store a value in Redis"""
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        payload = json.dumps(value, default=str)
+        if ttl:
+            client.setex(key, int(max(1, ttl)), payload)
+        else:
+            client.set(key, payload)
+        return True
+    except Exception as e:
+        _handle_error('set', e)
+        return False
+
 
 def cache_get(key):
-    """Stub cache get function"""
-    return None
+    """Fetch a value from Redis"""
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        payload = client.get(key)
+        return json.loads(payload) if payload is not None else None
+    except Exception as e:
+        _handle_error('get', e)
+        return None
+
 
 def cache_delete(key):
-    """Stub cache delete function"""
-    return False
+    """Delete a value from Redis"""
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        return bool(client.delete(key))
+    except Exception as e:
+        _handle_error('delete', e)
+        return False
+
 
 def cache_exists(key):
-    """Stub cache exists function"""
-    return False
+    """Check whether a key exists in Redis"""
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        return bool(client.exists(key))
+    except Exception as e:
+        _handle_error('exists', e)
+        return False
+
 
 def cache_behavioral_profile(user_id, data, ttl=None):
-    """Stub behavioral profile cache function"""
-    return False
+    """Cache a behavioral profile"""
+    return cache_set(f"behavioral_profile:{user_id}", data, ttl)
+
 
 def get_cached_behavioral_profile(user_id):
-    """Stub get behavioral profile function"""
-    return None
+    """Get a cached behavioral profile"""
+    return cache_get(f"behavioral_profile:{user_id}")
+
 
 def cache_context_score(request_id, data, ttl=None):
-    """Stub context score cache function"""
-    return False
+    """Cache a contextual intelligence score"""
+    return cache_set(f"context_score:{request_id}", data, ttl)
+
 
 def get_cached_context_score(request_id):
-    """Stub get context score function"""
-    return None
+    """Get a cached contextual intelligence score"""
+    return cache_get(f"context_score:{request_id}")
+
 
 def cache_threat_predictions(predictions, ttl=None):
-    """Stub threat predictions cache function"""
-    return False
+    """Cache the current threat predictions"""
+    return cache_set("threat_predictions:current", predictions, ttl)
+
 
 def get_cached_threat_predictions():
-    """Stub get threat predictions function"""
-    return None
+    """Get the cached threat predictions"""
+    return cache_get("threat_predictions:current")
+
 
 def cache_model(model_id, model_data, ttl=None):
-    """Stub model cache function"""
-    return False
+    """Cache model data"""
+    return cache_set(f"model:{model_id}", model_data, ttl)
+
 
 def get_cached_model(model_id):
-    """Stub get model function"""
-    return None
+    """Get cached model data"""
+    return cache_get(f"model:{model_id}")
+
 
 def session_set(key, value, ttl=None):
-    """Stub session set function"""
-    return False
+    """Store session data"""
+    return cache_set(f"{SESSION_PREFIX}{key}", value, ttl)
+
 
 def session_get(key):
-    """Stub session get function"""
-    return None
+    """Fetch session data"""
+    return cache_get(f"{SESSION_PREFIX}{key}")
+
 
 def session_delete(key):
-    """Stub session delete function"""
-    return False
+    """Delete session data"""
+    return cache_delete(f"{SESSION_PREFIX}{key}")
 
-def session_update_ttl(key, ttl):
-    """Stub session update TTL function"""
-    return False
 
-# Configuration constants
-REDIS_HOST = "localhost"
-REDIS_PORT = 6379
-REDIS_DB = 0
-REDIS_PASSWORD = None
\ No newline at end of file
+def session_update_ttl(key, ttl):
+    """Update the TTL of session data"""
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        return bool(client.expire(f"{SESSION_PREFIX}{key}", int(max(1, ttl))))
+    except Exception as e:
+        _handle_error('expire', e)
+        return False
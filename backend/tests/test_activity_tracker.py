@@ -0,0 +1,162 @@
+"""
+Unit tests for the Activity Tracker
+Tests coalescing of last-activity writes, batching, the bounded dirty set and shutdown flushing
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+from app.services.activity_tracker import ActivityTracker
+
+
+class NotFound(Exception):
+    """Stands in for google.api_core.exceptions.NotFound"""
+
+
+class FakeBatch:
+
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(('set', ref, data))
+
+    def update(self, ref, data):
+        self.ops.append(('update', ref, data))
+
+    def commit(self):
+        if self.db.fail_commits:
+            self.db.fail_commits -= 1
+            raise Exception("UNAVAILABLE")
+        for op, ref, _ in self.ops:
+            if op == 'update' and ref.doc_id not in self.db.docs:
+                raise NotFound(ref.doc_id)
+        for _, ref, data in self.ops:
+            self.db.docs.setdefault(ref.doc_id, {}).update(data)
+        self.db.commits.append(len(self.ops))
+
+
+class FakeDb:
+
+    def __init__(self, docs=None):
+        self.docs = docs or {}
+        self.commits = []
+        self.fail_commits = 0
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def collection(self, name):
+        collection = Mock()
+
+        def document(doc_id):
+            ref = Mock(doc_id=doc_id)
+
+            def update(data):
+                if doc_id not in self.docs:
+                    raise NotFound(doc_id)
+                self.docs[doc_id].update(data)
+            ref.update.side_effect = update
+            return ref
+
+        collection.document.side_effect = document
+        return collection
+
+
+def make_tracker(db, **kwargs):
+    tracker = ActivityTracker('users', db=db, **kwargs)
+    tracker._ensure_started = Mock()
+    return tracker
+
+
+class TestCoalescing:
+    """One write per user per flush"""
+
+    def test_many_touches_one_write_with_latest_time(self):
+        """A busy user's requests collapse into one write of the latest timestamp"""
+        db = FakeDb()
+        tracker = make_tracker(db)
+        start = datetime(2024, 3, 4, 12, 0)
+        for second in (5, 1, 9, 3):
+            tracker.touch('u1', start + timedelta(seconds=second))
+
+        assert tracker.get_last_activity('u1') == start + timedelta(seconds=9)
+        assert tracker.flush() == 1
+        assert db.docs['u1'] == {'lastActivity': start + timedelta(seconds=9)}
+        assert db.commits == [1]
+        assert tracker.get_metrics()['coalesced'] == 3
+
+    def test_users_written_in_batches_of_500(self):
+        db = FakeDb()
+        tracker = make_tracker(db)
+        for i in range(1200):
+            tracker.touch(f'u{i}')
+
+        assert tracker.flush() == 1200
+        assert db.commits == [500, 500, 200]
+        assert tracker.flush() == 0
+
+    def test_failed_commit_keeps_newest_value(self):
+        """A failed write is retried without overwriting newer activity"""
+        db = FakeDb()
+        db.fail_commits = 1
+        tracker = make_tracker(db)
+        old, new = datetime(2024, 3, 4, 12, 0), datetime(2024, 3, 4, 12, 5)
+        tracker.touch('u1', old)
+
+        assert tracker.flush() == 0
+        tracker.touch('u1', new)
+        assert tracker.flush() == 1
+
+        assert db.docs['u1']['lastActivity'] == new
+        assert tracker.get_metrics()['failed_commits'] == 1
+
+
+class TestSessions:
+    """Update-only tracking of session documents"""
+
+    def test_deleted_sessions_not_recreated(self):
+        """A missing document does not fail the batch for the other sessions"""
+        db = FakeDb({'u1': {}, 'u3': {}})
+        tracker = ActivityTracker('sessions', db=db, create_missing=False)
+        tracker._ensure_started = Mock()
+        for user_id in ('u1', 'u2', 'u3'):
+            tracker.touch(user_id)
+
+        assert tracker.flush() == 2
+        assert 'u2' not in db.docs
+        assert tracker.get_metrics()['missing'] == 1
+
+
+class TestBounds:
+    """Dirty set limit and shutdown"""
+
+    def test_dirty_set_bounded(self):
+        """Activity of new users is dropped when the dirty set is full and the flusher is woken"""
+        tracker = make_tracker(FakeDb(), max_dirty=2)
+
+        assert tracker.touch('u1') and tracker.touch('u2')
+        assert tracker.touch('u1') is True
+        assert tracker.touch('u3') is False
+        assert tracker._wake_event.is_set()
+        assert tracker.get_metrics()['dropped'] == 1
+
+    def test_flusher_writes_periodically_and_on_shutdown(self):
+        """The background thread writes after the interval and shutdown writes the rest"""
+        db = FakeDb()
+        tracker = ActivityTracker('users', db=db, flush_interval=0.05)
+        tracker.touch('u1')
+
+        deadline = datetime.utcnow() + timedelta(seconds=2)
+        while 'u1' not in db.docs and datetime.utcnow() < deadline:
+            tracker._stop_event.wait(0.01)
+        assert 'u1' in db.docs
+
+        tracker.touch('u2')
+        tracker.shutdown()
+        assert 'u2' in db.docs
+        assert not tracker._thread.is_alive()
+
+        tracker.touch('u3')
+        assert 'u3' in db.docs
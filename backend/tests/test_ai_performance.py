@@ -116,7 +116,7 @@ class TestAIPerformance:
     # ==================== ML Model Inference Latency ====================
     
     @patch.object(BehavioralBiometricsService, 'load_user_model')
-    @patch.object(BehavioralBiometricsService, 'extract_all_features')
+    @patch.object(BehavioralBiometricsService, 'extract_feature_groups')
     def test_ml_model_inference_latency(self, mock_features, mock_load):
         """Test ML model inference latency"""
         try:
@@ -129,7 +129,11 @@ class TestAIPerformance:
             mock_scaler = Mock()
             mock_scaler.transform = Mock(return_value=np.random.randn(1, 35))
             mock_load.return_value = (mock_model, mock_scaler)
-            mock_features.return_value = np.random.randn(35).astype(np.float32)
+            mock_features.return_value = (
+                {f'k{i}': v for i, v in enumerate(np.random.randn(15))},
+                {f'm{i}': v for i, v in enumerate(np.random.randn(12))},
+                {f'n{i}': v for i, v in enumerate(np.random.randn(8))}
+            )
             
             service = BehavioralBiometricsService()
             session = Mock()
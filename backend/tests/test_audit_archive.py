@@ -0,0 +1,124 @@
+"""
+Unit tests for the Audit Archive Store
+Tests date partitioning, manifest entries and range pruning on reads
+"""
+
+import io
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+from app.services.audit_archive import AuditArchiveStore
+from app.services.audit_integrity_verifier import compute_integrity_hash, verify_record
+
+KEY = b'test-hmac-key'
+T0 = datetime(2024, 5, 10, 22, 0, 0)
+
+
+class FakeStorage:
+    """In-memory stand-in for FirebaseStorageService"""
+
+    def __init__(self):
+        self.files = {}
+        self.reads = []
+
+    def upload_stream(self, file_path, chunks, content_type=None, metadata=None):
+        self.files[file_path] = b''.join(chunks)
+        return {'success': True, 'filePath': file_path}
+
+    def open_read_stream(self, file_path):
+        self.reads.append(file_path)
+        return io.BytesIO(self.files[file_path])
+
+    def delete_file(self, file_path):
+        return self.files.pop(file_path, None) is not None
+
+
+class FakeManifest:
+    """Firestore stand-in for the manifest collection"""
+
+    def __init__(self):
+        self.docs = {}
+        self.filters = []
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return Mock(set=lambda data: self.docs.__setitem__(doc_id, dict(data)))
+
+    def where(self, field, op, value):
+        self.filters.append((field, op, value))
+        return self
+
+    def order_by(self, field):
+        return self
+
+    def stream(self):
+        low = next(v for f, op, v in self.filters if op == '>=')
+        high = next(v for f, op, v in self.filters if op == '<=')
+        self.filters = []
+        return [Mock(to_dict=Mock(return_value=dict(d))) for d in self.docs.values()
+                if low <= d['partitionDate'] <= high]
+
+
+def make_log(i, hours, event_type='authentication'):
+    log = {'logId': f'log-{i}', 'eventType': event_type,
+           'timestamp': (T0 + timedelta(hours=hours)).replace(tzinfo=timezone.utc)}
+    log['integrityHash'] = compute_integrity_hash(KEY, log)
+    return log
+
+
+class TestAuditArchiveStore:
+    """Tests for AuditArchiveStore"""
+
+    @pytest.fixture
+    def store(self):
+        return AuditArchiveStore(FakeStorage(), FakeManifest())
+
+    @pytest.fixture
+    def archived(self, store):
+        logs = [make_log(0, 0), make_log(1, 1), make_log(2, 3, 'admin_action'), make_log(3, 30)]
+        return store.write_segments(logs)
+
+    def test_segments_partitioned_by_day(self, store, archived):
+        """One segment per UTC day with manifest statistics"""
+        assert [s['partitionDate'] for s in archived] == ['2024-05-10', '2024-05-11', '2024-05-12']
+        first = archived[0]
+        assert first['rowCount'] == 2
+        assert first['eventTypes'] == ['authentication']
+        assert first['path'].startswith('audit-archives/date=2024-05-10/')
+        assert first['minTimestamp'] == T0
+        assert set(store.db.docs) == {s['segmentId'] for s in archived}
+
+    def test_range_read_prunes_segments(self, store, archived):
+        """Only segments overlapping the range are downloaded"""
+        logs = list(store.read_range(T0 + timedelta(hours=2), T0 + timedelta(hours=6)))
+
+        assert [log['logId'] for log in logs] == ['log-2']
+        assert store.storage_service.reads == [archived[1]['path']]
+
+    def test_event_type_pruning(self, store, archived):
+        """Segments without a requested event type are skipped"""
+        logs = list(store.read_range(T0, T0 + timedelta(days=3), event_types=['admin_action']))
+
+        assert [log['logId'] for log in logs] == ['log-2']
+        assert store.storage_service.reads == [archived[1]['path']]
+
+    def test_archived_logs_still_verify(self, store, archived):
+        """Round-tripped records recompute to their original integrity hash"""
+        logs = list(store.read_range(T0, T0 + timedelta(days=3)))
+
+        assert len(logs) == 4
+        assert all(verify_record(KEY, log)[0] for log in logs)
+
+    def test_manifest_failure_removes_segment(self):
+        """A segment that cannot be indexed is deleted and the error propagates"""
+        storage = FakeStorage()
+        db = Mock()
+        db.collection.return_value.document.return_value.set.side_effect = Exception("unavailable")
+        store = AuditArchiveStore(storage, db)
+
+        with pytest.raises(Exception):
+            store.write_segments([make_log(0, 0)])
+        assert storage.files == {}
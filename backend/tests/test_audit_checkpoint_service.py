@@ -0,0 +1,276 @@
+"""
+Unit tests for the Audit Checkpoint Service
+Tests Merkle roots and proofs, checkpoint chaining and tamper/deletion detection
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from app.services.audit_checkpoint_service import (
+    AuditCheckpointService, inclusion_proof, leaf_hash, merkle_root, verify_inclusion
+)
+from app.services.audit_integrity_verifier import compute_integrity_hash
+
+KEY = b'test-hmac-key'
+T0 = datetime(2024, 3, 1, 12, 0, 0)
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.doc_id = doc_id
+
+    def get(self):
+        return FakeSnapshot(self.doc_id, self.store.get(self.doc_id))
+
+    def set(self, data, merge=False):
+        if merge and self.doc_id in self.store:
+            self.store[self.doc_id].update(data)
+        else:
+            self.store[self.doc_id] = dict(data)
+
+
+class FakeQuery:
+    """Supports the where/order_by/limit/select/stream subset used by the service"""
+
+    def __init__(self, store, filters=(), order=None, descending=False, limit=None):
+        self.store = store
+        self.filters = list(filters)
+        self.order = order
+        self.descending = descending
+        self._limit = limit
+
+    def _copy(self, **changes):
+        query = FakeQuery(self.store, self.filters, self.order, self.descending, self._limit)
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    def where(self, field, op, value):
+        return self._copy(filters=self.filters + [(field, op, value)])
+
+    def order_by(self, field, direction=None):
+        return self._copy(order=field, descending=direction is not None and 'DESC' in str(direction))
+
+    def limit(self, count):
+        return self._copy(_limit=count)
+
+    def select(self, fields):
+        return self
+
+    def stream(self):
+        ops = {'>=': lambda a, b: a >= b, '<': lambda a, b: a < b, '<=': lambda a, b: a <= b}
+        items = [
+            (doc_id, data) for doc_id, data in self.store.items()
+            if all(f in data and ops[op](data[f], v) for f, op, v in self.filters)
+        ]
+        if self.order:
+            items = [i for i in items if self.order in i[1]]
+            items.sort(key=lambda i: i[1][self.order], reverse=self.descending)
+        if self._limit:
+            items = items[:self._limit]
+        return iter([FakeSnapshot(doc_id, data) for doc_id, data in items])
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id):
+        return FakeDocument(self.store, doc_id)
+
+
+class FakeBatch:
+    def __init__(self):
+        self.ops = []
+
+    def set(self, ref, data):
+        self.ops.append((ref, data))
+
+    def commit(self):
+        for ref, data in self.ops:
+            ref.set(data)
+
+
+class FakeDb:
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        return FakeCollection(self.collections.setdefault(name, {}))
+
+    def batch(self):
+        return FakeBatch()
+
+
+def add_log(db, log_id, timestamp):
+    """Store a sealed audit log"""
+    log = {'logId': log_id, 'eventType': 'authentication', 'timestamp': timestamp}
+    log['integrityHash'] = compute_integrity_hash(KEY, log)
+    db.collection('auditLogs').document(log_id).set(log)
+    return log
+
+
+class TestMerkleTree:
+    """Tests for the Merkle helpers"""
+
+    @pytest.mark.parametrize('size', [1, 2, 3, 5, 8, 13])
+    def test_every_leaf_has_a_valid_proof(self, size):
+        """Proofs verify for every position, including odd promoted nodes"""
+        leaves = [leaf_hash(f'log-{i}', f'h{i}') for i in range(size)]
+        root = merkle_root(leaves).hex()
+
+        for index, leaf in enumerate(leaves):
+            assert verify_inclusion(leaf, inclusion_proof(leaves, index), root)
+
+    def test_proof_rejects_other_leaf(self):
+        """A proof does not validate a different leaf"""
+        leaves = [leaf_hash(f'log-{i}', f'h{i}') for i in range(4)]
+        proof = inclusion_proof(leaves, 1)
+        assert not verify_inclusion(leaf_hash('log-9', 'h9'), proof, merkle_root(leaves).hex())
+
+
+class TestAuditCheckpointService:
+    """Tests for AuditCheckpointService"""
+
+    @pytest.fixture
+    def db(self):
+        db = FakeDb()
+        for minute in range(3):
+            for i in range(4):
+                add_log(db, f'log-{minute}-{i}', T0 + timedelta(minutes=minute, seconds=i * 10))
+        return db
+
+    @pytest.fixture
+    def service(self, db):
+        with patch('app.services.audit_checkpoint_service.firestore'):
+            yield AuditCheckpointService(KEY, db=db, window_seconds=60, settle_seconds=0)
+
+    def test_build_seals_windows_into_a_chain(self, service, db):
+        """One checkpoint per populated window, each linked to the previous"""
+        result = service.build_checkpoints(until=T0 + timedelta(minutes=5))
+
+        assert result['checkpoints_created'] == 3
+        assert result['logs_sealed'] == 12
+        checkpoints = sorted(db.collections['auditCheckpoints'].values(), key=lambda c: c['windowStart'])
+        assert checkpoints[0]['previousCheckpointId'] is None
+        assert checkpoints[1]['previousCheckpointId'] == checkpoints[0]['checkpointId']
+        assert checkpoints[2]['previousChainHash'] == checkpoints[1]['chainHash']
+
+        # Nothing new to seal on the next run
+        assert service.build_checkpoints(until=T0 + timedelta(minutes=5))['checkpoints_created'] == 0
+
+    def test_intact_range_verifies(self, service):
+        """An untouched range verifies by root comparison alone"""
+        service.build_checkpoints(until=T0 + timedelta(minutes=5))
+
+        result = service.verify_range(T0, T0 + timedelta(minutes=5))
+
+        assert result['status'] == 'intact'
+        assert result['windows_verified'] == 3
+        assert result['chain_valid']
+
+    def test_modified_and_deleted_logs_detected(self, service, db):
+        """A modified record is pinpointed and a deleted record is counted as missing"""
+        service.build_checkpoints(until=T0 + timedelta(minutes=5))
+        logs = db.collections['auditLogs']
+        logs['log-0-1']['eventType'] = 'admin_action'
+        logs['log-0-1']['integrityHash'] = 'forged'
+        del logs['log-2-3']
+
+        result = service.verify_range(T0, T0 + timedelta(minutes=5))
+
+        assert result['status'] == 'compromised'
+        mismatched = {w['checkpointId']: w for w in result['windows_mismatched']}
+        assert [t['logId'] for t in mismatched['20240301T120000']['tamperedLogs']] == ['log-0-1']
+        assert mismatched['20240301T120200']['missingLogs'] == 1
+
+    def test_rewritten_checkpoint_breaks_chain(self, service, db):
+        """Recomputing a window root without the chain key breaks the chain"""
+        service.build_checkpoints(until=T0 + timedelta(minutes=5))
+        db.collections['auditCheckpoints']['20240301T120100']['merkleRoot'] = '00' * 32
+
+        result = service.verify_chain(T0, T0 + timedelta(minutes=5))
+
+        assert not result['chain_valid']
+        assert result['chain_errors'][0]['checkpointId'] == '20240301T120100'
+
+    def test_inclusion_proof_for_log(self, service):
+        """A log's inclusion proof verifies against its window checkpoint"""
+        service.build_checkpoints(until=T0 + timedelta(minutes=5))
+
+        proof = service.get_inclusion_proof('log-1-2')
+
+        assert proof['checkpointId'] == '20240301T120100'
+        assert AuditCheckpointService.verify_inclusion_proof(proof)
+        assert not AuditCheckpointService.verify_inclusion_proof(dict(proof, integrityHash='forged'))
+
+    def test_archived_windows_skipped(self, service, db):
+        """Windows before the archival watermark are not reported missing"""
+        service.build_checkpoints(until=T0 + timedelta(minutes=5))
+        for log_id in [k for k in db.collections['auditLogs'] if k.startswith('log-0-')]:
+            del db.collections['auditLogs'][log_id]
+        service.record_archival(T0 + timedelta(minutes=1))
+
+        result = service.verify_range(T0, T0 + timedelta(minutes=5))
+
+        assert result['status'] == 'intact'
+        assert result['windows_verified'] == 2
+
+    def test_late_replayed_log_reseals_window(self, service, db):
+        """A journal-replayed record in a sealed window re-seals it instead of reading as tampering"""
+        service.build_checkpoints(until=T0 + timedelta(minutes=5))
+        late = add_log(db, 'log-late', T0 + timedelta(minutes=1, seconds=45))
+        assert service.verify_range(T0, T0 + timedelta(minutes=5))['status'] == 'compromised'
+
+        result = service.reseal_late_logs([late])
+
+        assert result == {'checkpoints_resealed': 1, 'windows_refused': []}
+        checkpoint = db.collections['auditCheckpoints']['20240301T120100']
+        assert checkpoint['leafCount'] == 5
+        assert checkpoint['reseal']['lateLogs'] == ['log-late']
+        assert checkpoint['reseal']['previousLeafCount'] == 4
+        verified = service.verify_range(T0, T0 + timedelta(minutes=5))
+        assert verified['status'] == 'intact'
+        assert verified['windows_verified'] == 3
+        assert service.get_inclusion_proof('log-late')['checkpointId'] == '20240301T120100'
+
+    def test_late_log_in_empty_window_joins_chain(self, service, db):
+        """A late record in a window sealed without logs gets a checkpoint linked into the chain"""
+        add_log(db, 'log-5-0', T0 + timedelta(minutes=5))
+        service.build_checkpoints(until=T0 + timedelta(minutes=7))
+        late = add_log(db, 'log-late', T0 + timedelta(minutes=3, seconds=5))
+
+        assert service.reseal_late_logs([late])['checkpoints_resealed'] == 1
+
+        checkpoints = db.collections['auditCheckpoints']
+        assert checkpoints['20240301T120300']['previousCheckpointId'] == '20240301T120200'
+        assert checkpoints['20240301T120500']['previousCheckpointId'] == '20240301T120300'
+        assert service.verify_range(T0, T0 + timedelta(minutes=7))['status'] == 'intact'
+
+    def test_reseal_refuses_tampered_window(self, service, db):
+        """A window whose other records no longer match its seal is left mismatched"""
+        service.build_checkpoints(until=T0 + timedelta(minutes=5))
+        db.collections['auditLogs']['log-1-0']['integrityHash'] = 'forged'
+        late = add_log(db, 'log-late', T0 + timedelta(minutes=1, seconds=45))
+
+        result = service.reseal_late_logs([late])
+
+        assert result == {'checkpoints_resealed': 0, 'windows_refused': ['20240301T120100']}
+        assert 'reseal' not in db.collections['auditCheckpoints']['20240301T120100']
+        assert service.verify_range(T0, T0 + timedelta(minutes=5))['status'] == 'compromised'
+
+    def test_logs_after_sealed_range_left_for_next_build(self, service, db):
+        """Records beyond the latest checkpoint are sealed by the regular build"""
+        service.build_checkpoints(until=T0 + timedelta(minutes=3))
+        late = add_log(db, 'log-late', T0 + timedelta(minutes=4))
+
+        assert service.reseal_late_logs([late]) == {'checkpoints_resealed': 0, 'windows_refused': []}
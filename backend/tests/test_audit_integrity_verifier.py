@@ -0,0 +1,129 @@
+"""
+Unit tests for the streaming Audit Integrity Verifier
+Tests hash compatibility, tamper detection, ordering, progress and single-read behavior
+"""
+
+import hashlib
+import hmac
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+from app.services.audit_integrity_verifier import (
+    StreamingIntegrityVerifier, compute_integrity_hash, verify_record
+)
+
+KEY = b'test-hmac-key'
+
+
+def make_log(i, tamper=False):
+    """Build a sealed audit record"""
+    log = {
+        'logId': f'log-{i}',
+        'eventType': 'authentication',
+        'timestamp': datetime(2024, 1, 1, 0, 0, i % 60),
+        'details': {'attempt': i, 'at': datetime(2024, 1, 1)},
+        'complianceFlags': ['SOX']
+    }
+    log['integrityHash'] = compute_integrity_hash(KEY, log)
+    if tamper:
+        log['eventType'] = 'admin_action'
+    return log
+
+
+def make_snapshot(log):
+    """Wrap a record in a fake Firestore document snapshot"""
+    doc = Mock()
+    doc.to_dict.return_value = dict(log)
+    return doc
+
+
+class TestIntegrityHash:
+    """Tests for the integrity hash helpers"""
+
+    def test_hash_matches_canonical_form(self):
+        """The hash is HMAC-SHA256 over sorted, compact JSON with ISO datetimes"""
+        log = {'b': 1, 'a': datetime(2024, 1, 1), 'n': {'at': datetime(2024, 1, 2)}}
+        canonical = json.dumps(
+            {'a': '2024-01-01T00:00:00', 'b': 1, 'n': {'at': '2024-01-02T00:00:00'}},
+            sort_keys=True, separators=(',', ':')
+        )
+        expected = hmac.new(KEY, canonical.encode('utf-8'), hashlib.sha256).hexdigest()
+        assert compute_integrity_hash(KEY, log) == expected
+
+    def test_verify_record(self):
+        """Intact records verify, modified or unsealed records do not"""
+        assert verify_record(KEY, make_log(1)) == (True, None)
+        assert verify_record(KEY, make_log(1, tamper=True))[0] is False
+
+        unsealed = make_log(1)
+        del unsealed['integrityHash']
+        assert verify_record(KEY, unsealed)[0] is False
+
+
+class TestStreamingIntegrityVerifier:
+    """Tests for StreamingIntegrityVerifier"""
+
+    def test_results_in_input_order(self):
+        """Results come back in stream order across many chunks"""
+        logs = [make_log(i, tamper=(i % 7 == 0)) for i in range(230)]
+        verifier = StreamingIntegrityVerifier(KEY, workers=4, chunk_size=16, use_processes=False)
+
+        results = list(verifier.verify(make_snapshot(log) for log in logs))
+
+        assert [r[0]['logId'] for r in results] == [log['logId'] for log in logs]
+        assert [r[1] for r in results] == [i % 7 != 0 for i in range(230)]
+
+    def test_each_document_read_once(self):
+        """Documents are hashed from the streamed snapshot, not re-fetched"""
+        docs = [make_snapshot(make_log(i)) for i in range(50)]
+        verifier = StreamingIntegrityVerifier(KEY, workers=2, chunk_size=10, use_processes=False)
+
+        summary = verifier.verify_all(iter(docs))
+
+        assert summary['total_logs'] == 50
+        assert summary['verified_logs'] == 50
+        assert all(doc.to_dict.call_count == 1 for doc in docs)
+
+    def test_progress_and_summary(self):
+        """Progress is reported per chunk and the summary lists failures"""
+        logs = [make_log(i, tamper=(i == 3)) for i in range(25)]
+        progress = []
+        verifier = StreamingIntegrityVerifier(KEY, workers=2, chunk_size=10, use_processes=False)
+
+        summary = verifier.verify_all(logs, progress_callback=progress.append)
+
+        assert [p['processed'] for p in progress] == [10, 20, 25]
+        assert progress[-1]['failed'] == 1
+        assert summary['failed_logs'] == 1
+        assert summary['tampered_logs'][0]['logId'] == 'log-3'
+        assert 'logs_per_second' in summary
+
+    def test_small_input_verified_inline(self):
+        """A single chunk is verified without starting a worker pool"""
+        verifier = StreamingIntegrityVerifier(KEY, workers=4, chunk_size=100)
+        verifier._create_executor = Mock(side_effect=AssertionError("pool should not start"))
+
+        results = list(verifier.verify([make_log(i) for i in range(5)]))
+
+        assert all(valid for _, valid, _ in results)
+
+    def test_threads_by_default_and_processes_spawned(self):
+        """The web worker is never forked: threads unless processes are opted in, which are spawned"""
+        with patch.dict('os.environ', {}, clear=False) as env:
+            env.pop('AUDIT_VERIFY_EXECUTOR', None)
+            assert not StreamingIntegrityVerifier(KEY, workers=4).use_processes
+
+        verifier = StreamingIntegrityVerifier(KEY, workers=2, use_processes=True)
+        with patch('app.services.audit_integrity_verifier.ProcessPoolExecutor') as pool:
+            verifier._create_executor()
+        assert pool.call_args.kwargs['mp_context'].get_start_method() == 'spawn'
+
+    @pytest.mark.slow
+    def test_process_pool(self):
+        """Process workers produce the same results as threads"""
+        logs = [make_log(i, tamper=(i % 5 == 0)) for i in range(400)]
+        verifier = StreamingIntegrityVerifier(KEY, workers=2, chunk_size=50, use_processes=True)
+
+        assert [valid for _, valid, _ in verifier.verify(logs)] == [i % 5 != 0 for i in range(400)]
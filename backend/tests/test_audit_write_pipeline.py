@@ -0,0 +1,168 @@
+"""
+Unit tests for the Audit Write Pipeline
+Tests batching, backpressure spill-to-journal, journal replay, flush and metrics
+"""
+
+import pytest
+from datetime import datetime
+from unittest.mock import Mock
+
+from app.services.audit_write_pipeline import AuditWritePipeline
+
+
+class FakeBatch:
+    """Records set() calls and forwards commits to the owning fake db"""
+
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append((ref.path, data))
+
+    def commit(self):
+        if self.db.fail_commits:
+            self.db.fail_commits -= 1
+            raise Exception("unavailable")
+        self.db.commits.append(list(self.writes))
+
+
+class FakeDb:
+    """Minimal Firestore stand-in supporting batch writes"""
+
+    def __init__(self, fail_commits=0):
+        self.commits = []
+        self.fail_commits = fail_commits
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def collection(self, name):
+        collection = Mock()
+        collection.document.side_effect = lambda doc_id: Mock(path=f"{name}/{doc_id}")
+        return collection
+
+    @property
+    def written(self):
+        return [path for commit in self.commits for path, _ in commit]
+
+
+class TestAuditWritePipeline:
+    """Unit tests for AuditWritePipeline"""
+
+    @pytest.fixture
+    def journal(self, tmp_path):
+        return str(tmp_path / 'audit_journal.jsonl')
+
+    def test_writes_are_batched(self, journal):
+        """Queued writes are committed together, never more than batch_size per commit"""
+        db = FakeDb()
+        pipeline = AuditWritePipeline(db=db, batch_size=10, flush_interval=0.05,
+                                      journal_path=journal, async_enabled=True)
+
+        for i in range(25):
+            assert pipeline.submit('auditLogs', f'log-{i}', {'n': i})
+        assert pipeline.flush(timeout=5)
+
+        assert len(db.written) == 25
+        assert all(len(commit) <= 10 for commit in db.commits)
+        metrics = pipeline.get_metrics()
+        assert metrics['written'] == 25
+        assert metrics['queue_depth'] == 0
+        assert metrics['max_batch_size'] <= 10
+        pipeline.shutdown()
+
+    def test_prepare_runs_before_commit(self, journal):
+        """The prepare hook output is what gets written"""
+        db = FakeDb()
+        pipeline = AuditWritePipeline(db=db, journal_path=journal, async_enabled=False)
+
+        pipeline.submit('auditLogs', 'log-1', {'a': 1}, prepare=lambda d: dict(d, sealed=True))
+
+        assert db.commits[0][0] == ('auditLogs/log-1', {'a': 1, 'sealed': True})
+
+    def test_full_queue_spills_to_journal_and_replays(self, journal):
+        """Writes beyond queue capacity are journaled and replayed later"""
+        db = FakeDb()
+        pipeline = AuditWritePipeline(db=db, max_queue_size=2, enqueue_timeout=0,
+                                      journal_path=journal, async_enabled=True)
+        # Keep the writer from draining so the queue fills up
+        pipeline._ensure_started = Mock()
+
+        when = datetime(2024, 1, 2, 3, 4, 5)
+        for i in range(5):
+            assert pipeline.submit('auditLogs', f'log-{i}', {'timestamp': when})
+
+        metrics = pipeline.get_metrics()
+        assert metrics['spilled'] == 3
+        assert metrics['journal_pending'] == 3
+
+        assert pipeline.replay_journal() == 3
+        assert db.commits[0][0] == ('auditLogs/log-2', {'timestamp': when})
+        assert pipeline.get_metrics()['journal_pending'] == 0
+
+        # The queued writes are committed inline when no writer is running
+        assert pipeline.flush(timeout=1)
+        assert sorted(db.written) == [f'auditLogs/log-{i}' for i in range(5)]
+
+    def test_failed_batch_is_journaled(self, journal):
+        """A batch that keeps failing is journaled instead of lost"""
+        db = FakeDb(fail_commits=2)
+        pipeline = AuditWritePipeline(db=db, journal_path=journal, async_enabled=False, max_retries=2)
+
+        assert pipeline.submit('auditLogs', 'log-1', {'a': 1})
+        assert pipeline.get_metrics()['journal_pending'] == 1
+
+        assert pipeline.replay_journal() == 1
+        assert db.written == ['auditLogs/log-1']
+
+    def test_replay_keeps_records_until_committed(self, journal):
+        """Records whose replay commit fails stay journaled for the next attempt"""
+        db = FakeDb(fail_commits=2)
+        pipeline = AuditWritePipeline(db=db, journal_path=journal, async_enabled=False, max_retries=2)
+        assert pipeline.submit('auditLogs', 'log-1', {'a': 1})
+        replayed = []
+        pipeline.add_replay_listener(lambda items: replayed.extend((i.collection, i.doc_id) for i in items))
+
+        db.fail_commits = 2
+        assert pipeline.replay_journal() == 0
+        assert pipeline.get_metrics()['journal_pending'] == 1
+        assert replayed == []
+
+        assert pipeline.replay_journal() == 1
+        assert db.written == ['auditLogs/log-1']
+        assert pipeline.get_metrics()['journal_pending'] == 0
+        assert replayed == [('auditLogs', 'log-1')]
+
+    def test_failed_spill_reports_drop(self, tmp_path):
+        """submit() returns False and counts the drop when the journal cannot be written"""
+        blocker = tmp_path / 'not-a-directory'
+        blocker.write_text('')
+        pipeline = AuditWritePipeline(db=FakeDb(), max_queue_size=1, enqueue_timeout=0,
+                                      journal_path=str(blocker / 'audit_journal.jsonl'),
+                                      async_enabled=True)
+        pipeline._ensure_started = Mock()
+
+        assert pipeline.submit('auditLogs', 'log-1', {})
+        assert pipeline.submit('auditLogs', 'log-2', {}) is False
+        assert pipeline.get_metrics()['dropped'] == 1
+
+    def test_shutdown_flushes_pending_writes(self, journal):
+        """Shutdown drains the queue before stopping"""
+        db = FakeDb()
+        pipeline = AuditWritePipeline(db=db, flush_interval=0.05, journal_path=journal, async_enabled=True)
+
+        for i in range(50):
+            pipeline.submit('auditLogs', f'log-{i}', {'n': i})
+        pipeline.shutdown(timeout=5)
+
+        assert len(db.written) == 50
+        assert pipeline.get_metrics()['writer_running'] is False
+
+    def test_without_firestore_writes_are_dropped(self, journal):
+        """Without a Firestore client submit reports failure"""
+        pipeline = AuditWritePipeline(db=None, journal_path=journal)
+        pipeline.db = None
+
+        assert pipeline.submit('auditLogs', 'log-1', {}) is False
+        assert pipeline.get_metrics()['dropped'] == 1
@@ -389,6 +389,45 @@ class TestBehavioralBiometrics:
             
             print("✓ Model predictions are consistent")
     
+    def test_batch_scores_match_single_scoring(self, service, sample_behavioral_session):
+        """Batched scoring runs one forward pass per user model and matches per-session scoring"""
+        import copy
+        torch = pytest.importorskip('torch')
+        from sklearn.preprocessing import StandardScaler
+        from app.services.behavioral_biometrics import LSTMBehavioralModel
+        
+        torch.manual_seed(7)
+        model = LSTMBehavioralModel()
+        model.eval()
+        scaler = StandardScaler().fit(np.random.RandomState(7).randn(50, 35) * 10 + 50)
+        
+        sessions = []
+        for i in range(4):
+            session = copy.copy(sample_behavioral_session)
+            session.keystroke_data = sample_behavioral_session.keystroke_data[:8 + i * 4]
+            session.mouse_data = sample_behavioral_session.mouse_data[:10 + i * 10]
+            sessions.append(session)
+        items = [('test_user_123', s) for s in sessions[:3]] + [('new_user', sessions[3])]
+        
+        forward_calls = []
+        model.register_forward_hook(lambda module, args, output: forward_calls.append(args[0].shape[0]))
+        models = {'test_user_123': (model, scaler)}
+        with patch.object(service, 'load_user_model', side_effect=models.get):
+            batched = service.calculate_risk_scores_batch(items)
+            assert forward_calls == [3]
+            single = [service.calculate_risk_score(user_id, session) for user_id, session in items]
+        
+        assert len(batched) == len(single) == 4
+        for batch_result, single_result in zip(batched[:3], single[:3]):
+            assert batch_result['risk_score'] == pytest.approx(single_result['risk_score'], abs=1e-3)
+            assert batch_result['ml_prediction'] == pytest.approx(single_result['ml_prediction'], abs=1e-3)
+            assert batch_result['component_scores'] == single_result['component_scores']
+            assert batch_result['risk_level'] == single_result['risk_level']
+        assert batched[3] == single[3]
+        assert batched[3]['baseline_available'] is False
+        
+        print("✓ Batched scoring matches single-session scoring")
+    
     def test_feature_normalization(self, service, sample_behavioral_session):
         """Test that features are properly normalized"""
         features = service.extract_all_features(sample_behavioral_session)
@@ -0,0 +1,143 @@
+"""
+Unit tests for columnar Behavioral Feature extraction
+Tests keydown/keyup pairing, derived ratios and extraction throughput on large sessions
+"""
+
+import random
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from app.services import behavioral_features
+
+
+def make_keystrokes(count, seed=7):
+    """Generate a chronologically ordered keydown/keyup stream"""
+    rng = random.Random(seed)
+    events = []
+    timestamp = 0
+    for _ in range(count):
+        timestamp += rng.choice([40, 90, 150, 300, 1500])
+        key = rng.choice('abcdefghij') if rng.random() > 0.05 else 'Backspace'
+        code = key if key == 'Backspace' else f'Key{key.upper()}'
+        events.append({'eventType': 'keydown', 'key': key, 'code': code, 'timestamp': timestamp,
+                       'shiftKey': rng.random() < 0.1, 'ctrlKey': False, 'altKey': False})
+        events.append({'eventType': 'keyup', 'key': key, 'code': code,
+                       'timestamp': timestamp + rng.choice([60, 100, 220])})
+    events.sort(key=lambda event: event['timestamp'])
+    return events
+
+
+def make_mouse(count, seed=7):
+    rng = random.Random(seed)
+    return [{'x': rng.randint(0, 1920), 'y': rng.randint(0, 1080), 'velocity': rng.random() * 3,
+             'timeDelta': 16, 'timestamp': i * 16} for i in range(count)]
+
+
+class TestKeystrokeFeatures:
+    """Tests for keystroke_features"""
+
+    def test_hold_durations_pair_with_next_release(self):
+        """Each keydown pairs with the earliest later keyup of the same code"""
+        events = [
+            {'eventType': 'keydown', 'code': 'KeyA', 'timestamp': 0},
+            {'eventType': 'keydown', 'code': 'KeyB', 'timestamp': 50},
+            {'eventType': 'keyup', 'code': 'KeyA', 'timestamp': 100},
+            {'eventType': 'keyup', 'code': 'KeyB', 'timestamp': 250},
+            {'eventType': 'keydown', 'code': 'KeyA', 'timestamp': 300},
+            {'eventType': 'keyup', 'code': 'KeyA', 'timestamp': 300},
+        ]
+        features = behavioral_features.keystroke_features(events)
+
+        # A@0 -> 100, B@50 -> 250; A@300 has no strictly later release
+        assert features['avg_hold_duration'] == pytest.approx(150)
+        assert features['std_hold_duration'] == pytest.approx(50)
+        assert features['avg_inter_key_time'] == pytest.approx(150)
+
+    def test_ratios_and_rates(self):
+        """Modifier, correction and timing ratios are computed over keydowns"""
+        events = [
+            {'eventType': 'keydown', 'key': 'a', 'code': 'KeyA', 'timestamp': 0, 'shiftKey': True},
+            {'eventType': 'keydown', 'key': 'Backspace', 'code': 'Backspace', 'timestamp': 80},
+            {'eventType': 'keydown', 'key': 'b', 'code': 'KeyB', 'timestamp': 1580},
+            {'eventType': 'keydown', 'key': 'b', 'code': 'KeyB', 'timestamp': 1580},
+        ]
+        features = behavioral_features.keystroke_features(events)
+
+        assert features['shift_usage'] == 0.25
+        assert features['error_rate'] == 0.25
+        assert features['pause_frequency'] == pytest.approx(1 / 3)
+        assert features['burst_frequency'] == pytest.approx(2 / 3)
+        assert features['key_repetition_rate'] == 0.5
+        assert features['typing_speed'] == pytest.approx(4 / 1580 * 60000)
+
+    def test_too_few_keydowns(self):
+        """Sessions with fewer than two keydowns use the default features"""
+        events = [{'eventType': 'keydown', 'code': 'KeyA', 'timestamp': 0},
+                  {'eventType': 'keyup', 'code': 'KeyA', 'timestamp': 90}]
+        assert behavioral_features.keystroke_features(events) == behavioral_features.default_keystroke_features()
+
+
+class TestMouseAndNavigationFeatures:
+    """Tests for mouse_features and navigation_features"""
+
+    def test_mouse_geometry(self):
+        """Distances and heading changes follow the movement path"""
+        points = [{'x': 0, 'y': 0, 'velocity': 1, 'timestamp': 0},
+                  {'x': 3, 'y': 4, 'velocity': 2, 'timestamp': 500},
+                  {'x': 3, 'y': 10, 'velocity': 0, 'timeDelta': 0, 'timestamp': 1000}]
+        features = behavioral_features.mouse_features(points)
+
+        assert features['avg_distance'] == pytest.approx(5.5)
+        assert features['avg_acceleration'] == pytest.approx(1.0)
+        assert features['max_velocity'] == 2
+        assert features['movement_frequency'] == pytest.approx(3.0)
+        assert features['avg_angle_change'] == pytest.approx(abs(np.pi / 2 - np.arctan2(4, 3)))
+
+    def test_navigation_rates(self):
+        """Navigation rates are relative to the navigation time span"""
+        navigation = [{'timestamp': 0}, {'timestamp': 30000}, {'timestamp': 60000}]
+        scrolls = [{'scrollY': 0}, {'scrollY': 400}, {'scrollY': 100}]
+        features = behavioral_features.navigation_features(navigation, [{}] * 6, scrolls)
+
+        assert features['page_visit_frequency'] == 3
+        assert features['avg_dwell_time'] == 30000
+        assert features['avg_scroll_distance'] == 350
+        assert features['click_to_nav_ratio'] == 2
+
+    def test_feature_vector(self):
+        """Feature groups concatenate into the 35-value float32 model input"""
+        vector = behavioral_features.feature_vector(
+            behavioral_features.keystroke_features(make_keystrokes(50)),
+            behavioral_features.mouse_features(make_mouse(50)),
+            behavioral_features.default_navigation_features()
+        )
+        assert vector.shape == (35,)
+        assert vector.dtype == np.float32
+        assert np.isfinite(vector).all()
+
+
+class TestFeatureExtractionBenchmark:
+    """Extraction throughput on large sessions"""
+
+    def test_large_session_extraction(self):
+        """Sessions with 10k+ events are extracted well within a scoring budget"""
+        keystrokes = make_keystrokes(10000)
+        mouse = make_mouse(20000)
+
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            behavioral_features.keystroke_features(keystrokes)
+            behavioral_features.mouse_features(mouse)
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        events = len(keystrokes) + len(mouse)
+        assert best < 1.0
+
+        print(f"✓ Feature extraction benchmark: {events} events")
+        print(f"  - Best of 5: {best * 1000:.1f}ms")
+        print(f"  - Throughput: {events / best:,.0f} events/sec")
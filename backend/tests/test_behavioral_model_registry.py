@@ -0,0 +1,142 @@
+"""
+Unit tests for the Behavioral Model Registry
+Tests LRU bounds, version-based reloads, negative caching and single-flight loads
+"""
+
+import threading
+import time
+
+from app.services.behavioral_model_registry import BehavioralModelRegistry
+
+
+class FakeModelStore:
+    """Versioned model storage that counts loads"""
+
+    def __init__(self):
+        self.versions = {}
+        self.loads = []
+        self.resolves = 0
+        self.delay = 0
+
+    def resolve(self, user_id):
+        self.resolves += 1
+        return self.versions.get(user_id)
+
+    def load(self, user_id, version):
+        if self.delay:
+            time.sleep(self.delay)
+        self.loads.append((user_id, version))
+        return ('model', user_id, version)
+
+
+def make_registry(store, **kwargs):
+    return BehavioralModelRegistry(store.load, store.resolve, **kwargs)
+
+
+class TestBehavioralModelRegistry:
+    """Tests for BehavioralModelRegistry"""
+
+    def test_repeat_lookups_served_from_memory(self):
+        """Only the first lookup of a version loads from storage"""
+        store = FakeModelStore()
+        store.versions['u1'] = 'v1'
+        registry = make_registry(store, revalidate_seconds=None)
+
+        for _ in range(5):
+            assert registry.get('u1') == ('model', 'u1', 'v1')
+
+        assert store.loads == [('u1', 'v1')]
+        stats = registry.get_stats()
+        assert stats['hits'] == 4
+        assert stats['misses'] == 1
+        assert stats['hit_ratio'] == 0.8
+        assert stats['loads'] == 1
+
+    def test_lru_eviction(self):
+        """The least recently used user is evicted when the registry is full"""
+        store = FakeModelStore()
+        store.versions.update({'u1': 'v1', 'u2': 'v1', 'u3': 'v1'})
+        registry = make_registry(store, max_models=2, revalidate_seconds=None)
+
+        registry.get('u1')
+        registry.get('u2')
+        registry.get('u1')
+        registry.get('u3')
+        registry.get('u1')
+        registry.get('u2')
+
+        assert store.loads.count(('u2', 'v1')) == 2
+        assert store.loads.count(('u1', 'v1')) == 1
+        assert registry.get_stats()['evictions'] == 2
+
+    def test_new_version_reloaded_after_revalidation(self):
+        """A retrained model is picked up once the cached version is re-checked"""
+        store = FakeModelStore()
+        store.versions['u1'] = 'v1'
+        registry = make_registry(store, revalidate_seconds=0)
+
+        registry.get('u1')
+        registry.get('u1')
+        store.versions['u1'] = 'v2'
+
+        assert registry.get('u1') == ('model', 'u1', 'v2')
+        assert store.loads == [('u1', 'v1'), ('u1', 'v2')]
+
+    def test_publish_and_invalidate(self):
+        """Published models are served without loading; invalidation forces a reload"""
+        store = FakeModelStore()
+        store.versions['u1'] = 'v2'
+        registry = make_registry(store, revalidate_seconds=None)
+
+        registry.publish('u1', 'trained', 'v2')
+        assert registry.get('u1') == 'trained'
+        assert store.loads == []
+
+        registry.invalidate('u1')
+        assert registry.get('u1') == ('model', 'u1', 'v2')
+        assert registry.get_stats()['invalidations'] == 1
+
+    def test_missing_model_cached_negatively(self):
+        """Users without a model do not hit storage on every lookup"""
+        store = FakeModelStore()
+        registry = make_registry(store, revalidate_seconds=60)
+
+        assert registry.get('u1') is None
+        assert registry.get('u1') is None
+        assert store.resolves == 1
+        assert registry.get_stats()['models'] == 0
+
+    def test_failed_load_not_cached(self):
+        """A load failure is retried on the next lookup"""
+        store = FakeModelStore()
+        store.versions['u1'] = 'v1'
+        calls = []
+
+        def flaky_load(user_id, version):
+            calls.append(version)
+            if len(calls) == 1:
+                raise IOError("truncated file")
+            return 'model'
+
+        registry = BehavioralModelRegistry(flaky_load, store.resolve, revalidate_seconds=None)
+
+        assert registry.get('u1') is None
+        assert registry.get('u1') == 'model'
+        assert registry.get_stats()['load_failures'] == 1
+
+    def test_concurrent_misses_load_once(self):
+        """Concurrent lookups of the same user share one load"""
+        store = FakeModelStore()
+        store.versions['u1'] = 'v1'
+        store.delay = 0.05
+        registry = make_registry(store, revalidate_seconds=None)
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(registry.get('u1'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(store.loads) == 1
+        assert results == [('model', 'u1', 'v1')] * 8
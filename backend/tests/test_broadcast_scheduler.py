@@ -0,0 +1,178 @@
+"""
+Unit tests for the Broadcast Scheduler
+Tests per-room frames, superseded updates, deltas, bounded queues and dropped frames
+"""
+
+from unittest.mock import Mock
+
+import pytest
+
+from app.services.broadcast_scheduler import FRAME_EVENT, BroadcastScheduler, diff
+
+
+@pytest.fixture
+def send():
+    return Mock(return_value=True)
+
+
+def make_scheduler(send, **kwargs):
+    scheduler = BroadcastScheduler(send, **kwargs)
+    scheduler._ensure_started = Mock()
+    return scheduler
+
+
+def frames(send):
+    return [c[0][1] for c in send.call_args_list]
+
+
+class TestFrames:
+    """Coalescing into frames"""
+
+    def test_updates_coalesced_into_one_frame_per_room(self, send):
+        """A burst of events produces one frame per room per flush"""
+        scheduler = make_scheduler(send)
+        for i in range(20):
+            scheduler.enqueue('heatmap_update', {'id': f'e{i}'}, 'admin_room', key=f'security:{i % 4}:0')
+            scheduler.enqueue('security_event', {'eventId': f'e{i}'}, 'admin_room')
+        scheduler.enqueue('risk_score_update', {'risk_score': 10}, 'risk_score_s1', key='s1')
+
+        assert scheduler.flush() == 2
+
+        assert {c[0][0] for c in send.call_args_list} == {FRAME_EVENT}
+        admin = next(f for f in frames(send) if f['room'] == 'admin_room')
+        heatmap = [u for u in admin['updates'] if u['event'] == 'heatmap_update']
+        events = [u for u in admin['updates'] if u['event'] == 'security_event']
+        assert [u['data']['id'] for u in heatmap] == ['e16', 'e17', 'e18', 'e19']
+        assert len(events) == 20
+        assert events[0] == {'event': 'security_event', 'key': None, 'data': {'eventId': 'e0'}}
+        assert scheduler.get_room_metrics('admin_room')['tracked_keys'] == 4
+        assert {c[0][2] for c in send.call_args_list} == {'admin_room', 'risk_score_s1'}
+
+    def test_superseded_risk_updates_dropped(self, send):
+        """Only the latest pending score of a session is sent"""
+        scheduler = make_scheduler(send)
+        for score in (40, 55, 70):
+            scheduler.enqueue('risk_score_update', {'session_id': 's1', 'risk_score': score},
+                              'risk_score_s1', key='s1')
+
+        scheduler.flush()
+
+        (frame,) = frames(send)
+        assert frame['updates'] == [{'event': 'risk_score_update', 'key': 's1',
+                                     'data': {'session_id': 's1', 'risk_score': 70}}]
+        assert scheduler.get_metrics()['rooms']['risk_score_s1']['superseded'] == 2
+
+    def test_unkeyed_updates_are_all_sent(self, send):
+        """Updates without a key never replace each other"""
+        scheduler = make_scheduler(send)
+        scheduler.enqueue('admin_notification', {'n': 1}, 'admin_room')
+        scheduler.enqueue('admin_notification', {'n': 1}, 'admin_room')
+
+        scheduler.flush()
+
+        assert len(frames(send)[0]['updates']) == 2
+
+    def test_empty_flush_sends_nothing(self, send):
+        scheduler = make_scheduler(send)
+        assert scheduler.flush() == 0
+        send.assert_not_called()
+
+
+class TestDeltas:
+    """Changed fields only"""
+
+    def test_later_frames_carry_deltas(self, send):
+        """After a full value, a key's next update only carries the fields that changed"""
+        scheduler = make_scheduler(send)
+        scheduler.enqueue('risk_score_update', {'risk_score': 40, 'risk_level': 'medium', 'details': {'a': 1}},
+                          'risk_score_s1', key='s1')
+        scheduler.flush()
+        scheduler.enqueue('risk_score_update', {'risk_score': 85, 'risk_level': 'high'},
+                          'risk_score_s1', key='s1')
+        scheduler.flush()
+
+        first, second = frames(send)
+        assert first['full'] is True and 'data' in first['updates'][0]
+        assert second['full'] is False
+        assert second['updates'] == [{'event': 'risk_score_update', 'key': 's1',
+                                      'delta': {'risk_score': 85, 'risk_level': 'high'},
+                                      'removed': ['details']}]
+
+    def test_unchanged_update_skipped(self, send):
+        """Re-sending the value clients already have produces no frame"""
+        scheduler = make_scheduler(send)
+        scheduler.enqueue('risk_score_update', {'risk_score': 40}, 'r', key='s1')
+        scheduler.flush()
+        scheduler.enqueue('risk_score_update', {'risk_score': 40}, 'r', key='s1')
+
+        assert scheduler.flush() == 0
+        assert scheduler.get_metrics()['rooms']['r']['unchanged'] == 1
+
+    def test_periodic_full_sync(self, send):
+        """Every full_sync_frames frames the room's values are sent in full again"""
+        scheduler = make_scheduler(send, full_sync_frames=3)
+        for score in range(5):
+            scheduler.enqueue('risk_score_update', {'risk_score': score}, 'r', key='s1')
+            scheduler.flush()
+
+        assert [f['full'] for f in frames(send)] == [True, False, False, True, False]
+        assert 'data' in frames(send)[3]['updates'][0]
+
+    def test_reset_room_sends_full_values(self, send):
+        """A room reset after a client joins makes the next update a full value"""
+        scheduler = make_scheduler(send)
+        scheduler.enqueue('risk_score_update', {'risk_score': 1}, 'r', key='s1')
+        scheduler.flush()
+        scheduler.reset_room('r')
+        scheduler.enqueue('risk_score_update', {'risk_score': 2}, 'r', key='s1')
+        scheduler.flush()
+
+        assert frames(send)[1]['updates'][0]['data'] == {'risk_score': 2}
+
+    def test_diff_of_non_dicts(self):
+        assert diff([1], [2]) is None
+        assert diff({'a': 1, 'b': 2}, {'a': 1, 'c': 3}) == {'delta': {'c': 3}, 'removed': ['b']}
+
+
+class TestBackpressure:
+    """Bounded queues and dropped frames"""
+
+    def test_room_queue_bounded(self, send):
+        """The oldest updates are dropped when a room falls behind, and the frame reports it"""
+        scheduler = make_scheduler(send, max_queue_per_room=10)
+        results = [scheduler.enqueue('security_event', {'n': i}, 'admin_room') for i in range(15)]
+
+        assert results.count(False) == 5
+        assert scheduler.get_room_metrics('admin_room')['queue_depth'] == 10
+
+        scheduler.flush()
+        frame = frames(send)[0]
+        assert frame['dropped'] == 5
+        assert frame['updates'][0]['data'] == {'n': 5}
+        assert scheduler.get_room_metrics('admin_room')['queue_depth'] == 0
+
+    def test_failed_send_counted_and_state_resent(self, send):
+        """A frame that could not be sent is counted and the next one carries full values"""
+        scheduler = make_scheduler(send)
+        scheduler.enqueue('risk_score_update', {'risk_score': 1, 'level': 'low'}, 'r', key='s1')
+        scheduler.flush()
+        send.return_value = False
+        scheduler.enqueue('risk_score_update', {'risk_score': 2, 'level': 'low'}, 'r', key='s1')
+        assert scheduler.flush() == 0
+        send.return_value = True
+        scheduler.enqueue('risk_score_update', {'risk_score': 3, 'level': 'low'}, 'r', key='s1')
+        scheduler.flush()
+
+        metrics = scheduler.get_metrics()
+        assert metrics['dropped_frames'] == 1
+        assert metrics['rooms']['r']['dropped_frames'] == 1
+        assert frames(send)[2]['seq'] == 3
+        assert frames(send)[2]['updates'][0]['data'] == {'risk_score': 3, 'level': 'low'}
+
+    def test_shutdown_flushes_pending(self, send):
+        scheduler = make_scheduler(send)
+        scheduler.enqueue('security_event', {}, 'admin_room')
+
+        scheduler.shutdown()
+
+        assert send.call_count == 1
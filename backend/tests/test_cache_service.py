@@ -0,0 +1,121 @@
+"""
+Unit tests for the two-tier Cache Service
+Tests the local LRU/TTL tier, namespace limits and statistics
+"""
+
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+
+from app.services.local_cache import LocalCache
+from app.services import cache_service as cache_module
+from app.services.cache_service import CacheService
+
+
+class TestLocalCache:
+    """Unit tests for LocalCache"""
+
+    def test_get_set_and_counters(self):
+        """Values round-trip and hits/misses are counted"""
+        cache = LocalCache(default_max_entries=10)
+        assert cache.get('device_profile:a') is None
+        cache.set('device_profile:a', {'trusted': True}, ttl=60)
+        assert cache.get('device_profile:a') == {'trusted': True}
+
+        stats = cache.get_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['namespaces']['device_profile']['entries'] == 1
+
+    def test_per_namespace_lru_eviction(self):
+        """Eviction in one namespace does not affect another"""
+        cache = LocalCache(default_max_entries=10, namespace_limits={'threat_score': 2})
+        cache.set('geolocation:1.1.1.1', 'x')
+        cache.set('threat_score:u1', 1)
+        cache.set('threat_score:u2', 2)
+        cache.get('threat_score:u1')  # u1 becomes most recently used
+        cache.set('threat_score:u3', 3)
+
+        assert cache.get('threat_score:u2') is None
+        assert cache.get('threat_score:u1') == 1
+        assert cache.get('geolocation:1.1.1.1') == 'x'
+        assert cache.get_stats()['namespaces']['threat_score']['evictions'] == 1
+
+    def test_ttl_expiry(self):
+        """Expired entries are treated as misses"""
+        cache = LocalCache()
+        with patch('app.services.local_cache.time.monotonic', return_value=1000.0):
+            cache.set('context_score:r1', {'score': 80}, ttl=5)
+        with patch('app.services.local_cache.time.monotonic', return_value=1006.0):
+            assert cache.get('context_score:r1') is None
+        assert cache.get_stats()['expirations'] == 1
+
+    def test_set_none_deletes(self):
+        """Storing None removes the key"""
+        cache = LocalCache()
+        cache.set('device_profile:a', 1)
+        cache.set('device_profile:a', None)
+        assert not cache.exists('device_profile:a')
+
+
+class TestCacheService:
+    """Unit tests for CacheService without Redis"""
+
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self):
+        """Use a fresh local tier and disable Redis"""
+        with patch.object(cache_module, '_local_cache', LocalCache()), \
+             patch.object(cache_module, 'is_redis_available', return_value=False):
+            yield
+
+    def test_device_profile_cached_locally(self):
+        """Device profiles are served from the local tier when Redis is absent"""
+        assert CacheService.is_available()
+        CacheService.cache_device_profile('dev1', {'os': 'linux'})
+        assert CacheService.get_device_profile('dev1') == {'os': 'linux'}
+
+    def test_threat_score_and_invalidation(self):
+        """User cache invalidation clears local entries"""
+        CacheService.cache_user_threat_score('u1', 42)
+        assert CacheService.get_user_threat_score('u1') == 42
+        assert CacheService.invalidate_user_cache('u1') == 1
+        assert CacheService.get_user_threat_score('u1') is None
+
+    def test_cache_stats_counters(self):
+        """get_cache_stats surfaces hit/miss/eviction counters"""
+        CacheService.cache_contextual_score('r1', {'overall_context_score': 70})
+        CacheService.get_contextual_score('r1')
+        CacheService.get_contextual_score('missing')
+
+        stats = CacheService.get_cache_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert 'evictions' in stats
+        assert stats['redis']['connected'] is False
+
+    def test_local_tier_matches_redis_types(self):
+        """Values come back JSON-normalized, like the Redis tier returns them"""
+        created = datetime(2024, 1, 2, 3, 4, 5)
+        CacheService.cache_device_profile('dev1', {'created': created, 'tags': ('a', 'b')})
+        assert CacheService.get_device_profile('dev1') == {'created': str(created), 'tags': ['a', 'b']}
+
+    def test_cached_values_are_copies(self):
+        """Mutating a returned value does not change the cached entry"""
+        profile = {'os': 'linux', 'tags': ['corp']}
+        CacheService.cache_device_profile('dev1', profile)
+        profile['tags'].append('changed-after-set')
+
+        first = CacheService.get_device_profile('dev1')
+        first['tags'].append('changed-after-get')
+        assert CacheService.get_device_profile('dev1') == {'os': 'linux', 'tags': ['corp']}
+
+    def test_device_decisions_skip_local_tier(self):
+        """Validation results and device lists are only cached in the shared Redis tier"""
+        with patch.object(cache_module.redis_config, 'cache_set', return_value=False) as redis_set:
+            assert not CacheService.cache_device_profile('user_devices:u1', [{'deviceId': 'd1'}])
+            assert not CacheService.cache_device_profile('fingerprint_validation:u1:0:abc', {'approved': True})
+        assert redis_set.call_count == 2
+
+        assert CacheService.get_device_profile('user_devices:u1') is None
+        assert CacheService.get_device_profile('fingerprint_validation:u1:0:abc') is None
+        assert cache_module._local_cache.get_stats()['entries'] == 0
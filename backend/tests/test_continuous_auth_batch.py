@@ -0,0 +1,96 @@
+"""
+Unit tests for batched continuous authentication scoring
+Tests shared per-user prefetching, batched risk writes and parity with per-session scoring
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+from app.services.continuous_auth_service import ContinuousAuthService
+
+
+def make_session(user_id, ip='10.0.0.1', fingerprint=None):
+    return {
+        'userId': user_id,
+        'deviceId': f'device-{user_id}',
+        'startTime': datetime.utcnow() - timedelta(minutes=30),
+        'lastActivity': datetime.utcnow(),
+        'ipAddress': ip,
+        'deviceFingerprint': fingerprint or {'canvas': {'hash': user_id}},
+        'accessLog': [{'timestamp': (datetime.utcnow() - timedelta(minutes=20)).isoformat(), 'resource': 'dashboard'}],
+        'locationHistory': []
+    }
+
+
+def make_baseline(user_id, session_count):
+    doc = Mock(id=user_id, exists=session_count is not None)
+    doc.to_dict.return_value = {'sessionCount': session_count or 0}
+    return doc
+
+
+@pytest.fixture
+def service():
+    service = ContinuousAuthService()
+    service.db = Mock()
+    service.db.get_all.return_value = [make_baseline('u1', 8), make_baseline('u2', None)]
+    service.device_service = Mock()
+    service.device_service.validate_fingerprint.return_value = {'success': True, 'similarity': 90}
+    service._get_user_typical_locations = Mock(return_value=[{'ip_address': '10.0.0.1', 'frequency': 4}])
+    return service
+
+
+class TestMonitorSessionsBatch:
+    """Tests for ContinuousAuthService.monitor_sessions_batch"""
+
+    @patch('app.services.continuous_auth_service.log_audit_event')
+    def test_per_user_data_read_once(self, mock_audit, service):
+        """Baselines, locations and device validations are shared across a user's sessions"""
+        sessions = [('s1', make_session('u1')), ('s2', make_session('u1')), ('s3', make_session('u2'))]
+
+        batch = service.monitor_sessions_batch(sessions)
+
+        assert [r['session_id'] for r in batch['results']] == ['s1', 's2', 's3']
+        assert batch['sessions_scored'] == 3
+        assert batch['sessions_per_second'] > 0
+        assert service.db.get_all.call_count == 1
+        assert service._get_user_typical_locations.call_count == 2
+        assert service.device_service.validate_fingerprint.call_count == 2
+        assert [r['baseline_available'] for r in batch['results']] == [True, True, False]
+        assert mock_audit.call_count == 3
+
+    @patch('app.services.continuous_auth_service.log_audit_event')
+    def test_risk_updates_written_in_one_batch(self, mock_audit, service):
+        """Risk assessments are committed with a single batched write"""
+        service.monitor_sessions_batch([('s1', make_session('u1')), ('s2', make_session('u2'))])
+
+        write_batch = service.db.batch.return_value
+        assert write_batch.update.call_count == 2
+        assert write_batch.commit.call_count == 1
+        fields = write_batch.update.call_args_list[0][0][1]
+        assert 'riskProfile.currentRiskScore' in fields
+
+    @patch('app.services.continuous_auth_service.log_audit_event')
+    def test_results_match_single_session_scoring(self, mock_audit, service):
+        """Batch results carry the same score and action as monitor_user_session"""
+        data = make_session('u1', ip='203.0.113.9')
+        service.db.collection.return_value.document.return_value.get.return_value = Mock(
+            exists=True, to_dict=Mock(return_value=data)
+        )
+        service._has_behavioral_baseline = Mock(return_value=True)
+
+        single = service.monitor_user_session('s1')
+        batch = service.monitor_sessions_batch([('s1', data)])['results'][0]
+
+        for key in ('risk_score', 'risk_factors', 'action_required', 'baseline_available'):
+            assert batch[key] == single[key]
+
+    @patch('app.services.continuous_auth_service.log_audit_event')
+    def test_failed_batch_commit_falls_back(self, mock_audit, service):
+        """A failed batch commit is retried session by session"""
+        service.db.batch.return_value.commit.side_effect = Exception("NOT_FOUND")
+
+        batch = service.monitor_sessions_batch([('s1', make_session('u1')), ('s2', make_session('u1'))])
+
+        assert batch['sessions_scored'] == 2
+        assert service.db.collection.return_value.document.return_value.update.call_count == 2
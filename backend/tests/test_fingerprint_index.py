@@ -0,0 +1,298 @@
+"""
+Unit tests for the device Fingerprint Index
+Tests vectorized similarity parity, index maintenance and index-backed validation and registration
+"""
+
+import copy
+import random
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from app.services.device_fingerprint_service import DeviceFingerprintService
+from app.services.fingerprint_index import FingerprintIndex, fingerprint_vector
+
+BASE_FINGERPRINT = {
+    "canvas": {"hash": "abc123def456", "confidence": 100},
+    "webgl": {"renderer": "ANGLE (Intel HD Graphics 620)", "vendor": "Google Inc.", "version": "WebGL 1.0"},
+    "audio": {"hash": "def456ghi789", "sampleRate": 44100, "bufferSize": 4096},
+    "screen": {"width": 1920, "height": 1080, "colorDepth": 24, "pixelRatio": 1.0},
+    "system": {"platform": "Win32", "language": "en-US", "timezone": "America/New_York", "hardwareConcurrency": 8}
+}
+
+
+def make_variant(rng):
+    """Randomly perturb, drop or blank fingerprint components and fields"""
+    fingerprint = copy.deepcopy(BASE_FINGERPRINT)
+    for component in list(fingerprint):
+        if rng.random() < 0.15:
+            del fingerprint[component]
+            continue
+        fields = fingerprint[component]
+        for field in list(fields):
+            roll = rng.random()
+            if roll < 0.1:
+                del fields[field]
+            elif roll < 0.3:
+                if isinstance(fields[field], str):
+                    fields[field] = rng.choice(['other', 'MacIntel', 'fr-FR', 'zzz'])
+                else:
+                    fields[field] = fields[field] + rng.choice([0, 40, 90, 150, 600])
+    return fingerprint
+
+
+@pytest.fixture
+def service():
+    with patch('app.services.device_fingerprint_service.firestore.client'):
+        service = DeviceFingerprintService()
+    service.db = Mock()
+    return service
+
+
+class TestVectorSimilarity:
+    """Parity of vectorized scoring with the dict-based comparison"""
+
+    def test_matches_dict_similarity(self, service):
+        """Scores equal _calculate_similarity_optimized across random variants"""
+        rng = random.Random(11)
+        stored = [make_variant(rng) for _ in range(200)]
+        index = FingerprintIndex()
+        for i, fingerprint in enumerate(stored):
+            index.upsert(f"d{i}", "u1", f"h{i}", fingerprint_vector(fingerprint))
+
+        for _ in range(30):
+            current = make_variant(rng)
+            scores = index.score_devices(fingerprint_vector(current), [f"d{i}" for i in range(len(stored))])
+            for i, fingerprint in enumerate(stored):
+                expected = service._calculate_similarity_optimized(current, fingerprint)
+                assert scores[f"d{i}"] == pytest.approx(expected, abs=1e-9)
+
+    def test_stored_vector_version_checked(self):
+        """Vectors of another version are treated as missing"""
+        vector = dict(fingerprint_vector(BASE_FINGERPRINT), version=0)
+        index = FingerprintIndex()
+        assert index.upsert("d1", "u1", "h1", vector) is False
+        assert index.score_devices(fingerprint_vector(BASE_FINGERPRINT), ["d1"]) == {}
+
+
+class TestFingerprintIndex:
+    """Index maintenance"""
+
+    def test_remove_keeps_rows_consistent(self):
+        """Removing a device moves the last row into its place"""
+        index = FingerprintIndex(initial_capacity=2)
+        vectors = {}
+        for i in range(5):
+            fingerprint = copy.deepcopy(BASE_FINGERPRINT)
+            fingerprint["canvas"]["hash"] = f"canvas{i}"
+            vectors[f"d{i}"] = fingerprint_vector(fingerprint)
+            index.upsert(f"d{i}", f"u{i % 2}", f"h{i}", vectors[f"d{i}"])
+
+        index.remove("d1")
+
+        assert len(index) == 4
+        assert index.find_by_hash("h1") is None
+        assert index.find_by_hash("h4")["userId"] == "u0"
+        assert index.score_devices(vectors["d4"], ["d4"]) == {"d4": 100.0}
+
+    def test_collisions_exclude_own_and_inactive_devices(self):
+        """Only active devices of other users are reported"""
+        index = FingerprintIndex()
+        vector = fingerprint_vector(BASE_FINGERPRINT)
+        index.upsert("own", "u1", "h1", vector)
+        index.upsert("shared", "u2", "h2", vector)
+        index.upsert("removed", "u3", "h3", vector)
+        index.set_active("removed", False)
+
+        collisions = index.find_collisions(vector, exclude_user_id="u1")
+
+        assert [c["deviceId"] for c in collisions] == ["shared"]
+        assert collisions[0]["userId"] == "u2"
+        assert collisions[0]["similarity"] == 100.0
+
+    def test_load_drops_devices_gone_from_storage(self):
+        """A reload removes devices that are no longer stored"""
+        index = FingerprintIndex()
+        index.upsert("gone", "u1", "h1", None)
+        loader = Mock(return_value=[{"deviceId": "d2", "userId": "u2", "fingerprintHash": "h2"}])
+
+        assert index.ensure_loaded(loader, 60) is True
+        assert index.ensure_loaded(loader, 60) is True
+        assert loader.call_count == 1
+        assert index.find_by_hash("h1") is None
+        assert index.find_by_hash("h2")["deviceId"] == "d2"
+
+    def test_background_load(self):
+        """load_in_background reports stale, then the index becomes fresh"""
+        index = FingerprintIndex()
+        loader = Mock(return_value=[{"deviceId": "d1", "userId": "u1", "fingerprintHash": "h1"}])
+
+        assert index.load_in_background(loader, 60) is False
+        index._load_thread.join(timeout=5)
+        assert index.load_in_background(loader, 60) is True
+        assert index.find_by_hash("h1")["deviceId"] == "d1"
+        assert loader.call_count == 1
+
+    def test_failed_load_is_not_retried_immediately(self):
+        """A failing loader is backed off"""
+        index = FingerprintIndex()
+        loader = Mock(side_effect=Exception("UNAVAILABLE"))
+
+        assert index.ensure_loaded(loader, 60) is False
+        assert index.ensure_loaded(loader, 60) is False
+        assert loader.call_count == 1
+
+
+class TestIndexedValidation:
+    """Index-backed DeviceFingerprintService paths"""
+
+    @patch('app.services.device_fingerprint_service.cache_service')
+    def test_validation_skips_decryption(self, mock_cache, service):
+        """Devices with a stored vector are matched without decrypting them"""
+        mock_cache.get_device_profile.return_value = None
+        other = copy.deepcopy(BASE_FINGERPRINT)
+        other["canvas"]["hash"] = "zzz"
+        other["webgl"]["renderer"] = "other"
+        service._get_user_devices_cached = Mock(return_value=[
+            {"deviceId": "d1", "userId": "u1", "fingerprintHash": "h1", "featureVector": fingerprint_vector(other)},
+            {"deviceId": "d2", "userId": "u1", "fingerprintHash": "h2", "featureVector": fingerprint_vector(BASE_FINGERPRINT)}
+        ])
+        service._decrypt_characteristics_cached = Mock()
+        service._update_verification_history_async = Mock()
+
+        result = service.validate_fingerprint("u1", BASE_FINGERPRINT)
+
+        assert result["approved"] is True
+        assert result["deviceId"] == "d2"
+        assert result["similarity"] == 100.0
+        service._decrypt_characteristics_cached.assert_not_called()
+
+    @patch('app.services.device_fingerprint_service.cache_service')
+    def test_legacy_device_backfilled(self, mock_cache, service):
+        """Devices without a vector are decrypted once and get a vector stored"""
+        mock_cache.get_device_profile.return_value = None
+        service._get_user_devices_cached = Mock(return_value=[
+            {"deviceId": "d1", "userId": "u1", "fingerprintHash": "h1", "characteristics": "encrypted"}
+        ])
+        service._decrypt_characteristics_cached = Mock(return_value=BASE_FINGERPRINT)
+        service._update_verification_history_async = Mock()
+
+        first = service.validate_fingerprint("u1", BASE_FINGERPRINT)
+        second = service.validate_fingerprint("u1", BASE_FINGERPRINT)
+
+        assert first["similarity"] == second["similarity"] == 100.0
+        assert service._decrypt_characteristics_cached.call_count == 1
+        service.db.collection.return_value.document.return_value.update.assert_called_once_with(
+            {"featureVector": fingerprint_vector(BASE_FINGERPRINT)}
+        )
+
+    def test_device_change_retires_cached_validations(self, service):
+        """Registering, removing or re-scoring a device invalidates the user's cached decisions"""
+        shared = {}
+        with patch('app.services.device_fingerprint_service.cache_service') as mock_cache:
+            mock_cache.get_device_profile.side_effect = shared.get
+            mock_cache.cache_device_profile.side_effect = lambda key, value, ttl=None: shared.__setitem__(key, value)
+            mock_cache.delete_device_profile.side_effect = lambda key: shared.pop(key, None) is not None
+            service._get_user_devices_cached = Mock(return_value=[
+                {"deviceId": "d1", "userId": "u1", "fingerprintHash": "h1",
+                 "featureVector": fingerprint_vector(BASE_FINGERPRINT)}
+            ])
+            service._update_verification_history_async = Mock()
+
+            assert service.validate_fingerprint("u1", BASE_FINGERPRINT)["approved"] is True
+            shared["user_devices:u1"] = ["d1"]
+            service.invalidate_user_devices("u1")
+            service._get_user_devices_cached.return_value = []
+
+            assert "user_devices:u1" not in shared
+            assert service.validate_fingerprint("u1", BASE_FINGERPRINT)["error"] == "NO_REGISTERED_DEVICES"
+
+    @patch('app.services.device_fingerprint_service.encryption_service')
+    def test_registration_uses_loaded_index(self, mock_encryption, service):
+        """Collision checks come from the loaded index; a hash miss still queries Firestore"""
+        mock_encryption.encrypt_device_fingerprint.return_value = "encrypted"
+        service._get_user_devices = Mock(return_value=[])
+        service.db.collection.return_value.where.return_value.limit.return_value.get.return_value = []
+        service.fingerprint_index.ensure_loaded(Mock(return_value=[
+            {"deviceId": "device_u2_1", "userId": "u2", "fingerprintHash": "other",
+             "featureVector": fingerprint_vector(BASE_FINGERPRINT), "isActive": True}
+        ]), 60)
+
+        with patch('app.services.device_fingerprint_service.logger') as mock_logger:
+            result = service.register_device("u1", BASE_FINGERPRINT)
+
+        assert result["success"] is True
+        service.db.collection.return_value.where.assert_called_once()
+        assert "collides with 1 device(s)" in mock_logger.warning.call_args[0][0]
+        stored = service.db.collection.return_value.document.return_value.set.call_args[0][0]
+        assert stored["featureVector"] == fingerprint_vector(BASE_FINGERPRINT)
+        assert service._fingerprint_exists(stored["fingerprintHash"]) is True
+        service.db.collection.return_value.where.assert_called_once()
+        assert service.find_fingerprint_collisions("u3", BASE_FINGERPRINT)[0]["similarity"] == 100.0
+
+    def test_hash_miss_falls_back_to_firestore(self, service):
+        """A device registered by another worker after the index loaded is still found"""
+        service.fingerprint_index.ensure_loaded(Mock(return_value=[]), 60)
+        doc = Mock()
+        doc.to_dict.return_value = {"deviceId": "device_u2_1", "userId": "u2", "fingerprintHash": "h-new"}
+        service.db.collection.return_value.where.return_value.limit.return_value.get.return_value = [doc]
+
+        assert service._find_fingerprint_document("h-new") is doc
+        assert service.fingerprint_index.find_by_hash("h-new")["deviceId"] == "device_u2_1"
+
+    @patch('app.services.device_fingerprint_service.encryption_service')
+    def test_registration_does_not_load_index_inline(self, mock_encryption, service):
+        """A stale index is refreshed in the background, never on the request path"""
+        mock_encryption.encrypt_device_fingerprint.return_value = "encrypted"
+        service._get_user_devices = Mock(return_value=[])
+        service.db.collection.return_value.where.return_value.limit.return_value.get.return_value = []
+        service._stream_indexed_devices = Mock(return_value=[])
+        service.fingerprint_index.load_in_background = Mock(return_value=False)
+
+        assert service.register_device("u1", BASE_FINGERPRINT)["success"] is True
+        service.fingerprint_index.load_in_background.assert_called_once()
+        service._stream_indexed_devices.assert_not_called()
+
+
+class TestCollisionBenchmark:
+    """Fleet-wide collision scan latency"""
+
+    def test_fleet_collision_scan(self):
+        """Collisions across 10k devices are found in about a millisecond"""
+        rng = random.Random(5)
+        index = FingerprintIndex()
+        for i in range(10000):
+            fingerprint = make_variant(rng)
+            fingerprint.setdefault("canvas", {})["hash"] = f"canvas{i}"
+            index.upsert(f"d{i}", f"u{i // 3}", f"h{i}", fingerprint_vector(fingerprint))
+        index.upsert("shared", "attacker", "hx", fingerprint_vector(BASE_FINGERPRINT))
+        query = fingerprint_vector(BASE_FINGERPRINT)
+
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            collisions = index.find_collisions(query, exclude_user_id="victim")
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        assert collisions[0]["deviceId"] == "shared"
+        assert best < 0.05
+
+        print(f"✓ Fingerprint collision benchmark: {len(index)} devices")
+        print(f"  - Best of 20: {best * 1000:.3f}ms")
+
+
+class TestSharedIndex:
+    """Device changes are visible to every caller"""
+
+    def test_callers_share_one_index(self):
+        """Routes and services use the global service, so a deactivation reaches every index lookup"""
+        from app.routes import device_routes
+        from app.services.continuous_auth_service import continuous_auth_service
+        from app.services.device_fingerprint_service import device_fingerprint_service
+
+        assert device_routes.device_service is device_fingerprint_service
+        assert continuous_auth_service.device_service.fingerprint_index is device_fingerprint_service.fingerprint_index
@@ -0,0 +1,145 @@
+"""
+Unit tests for the Peer Cohort Store
+Tests incremental aggregate updates and peer/user statistics derivation
+"""
+
+import pytest
+from unittest.mock import Mock, patch
+from datetime import datetime, timedelta
+
+from app.services.peer_cohort_store import PeerCohortStore
+
+
+def make_snapshot(ref, data):
+    """Build a fake document snapshot for a reference"""
+    snapshot = Mock()
+    snapshot.exists = data is not None
+    snapshot.reference = ref
+    snapshot.to_dict.return_value = data
+    return snapshot
+
+
+class TestPeerCohortStore:
+    """Unit tests for PeerCohortStore"""
+
+    @pytest.fixture
+    def store(self):
+        """Create a PeerCohortStore with a mocked Firestore client"""
+        db = Mock()
+        db.collection.side_effect = lambda name: Mock(
+            document=lambda doc_id: Mock(path=f"{name}/{doc_id}")
+        )
+        return PeerCohortStore(db=db)
+
+    def test_record_decision_batches_both_aggregates(self, store):
+        """A decided request updates cohort and user documents in one batch"""
+        with patch('app.services.peer_cohort_store.firestore'):
+            assert store.record_decision('u1', 'student', 'CS', 'lab_server', 'granted',
+                                         datetime(2026, 10, 16))
+
+        batch = store.db.batch.return_value
+        assert batch.set.call_count == 2
+        batch.commit.assert_called_once()
+
+    def test_pending_decision_ignored(self, store):
+        """Undecided requests are not folded into aggregates"""
+        assert not store.record_decision('u1', 'student', 'CS', 'lab_server', 'pending')
+        store.db.batch.assert_not_called()
+
+    def test_get_stats_excludes_user_share(self, store):
+        """Peer figures subtract the evaluated user's own requests"""
+        now = datetime.utcnow()
+        month = now.strftime('%Y-%m')
+        cohort_ref = store._cohort_ref('student', 'CS', 'lab_server')
+        user_ref = store._user_ref('u1', 'lab_server')
+
+        store.db.get_all.return_value = [
+            make_snapshot(user_ref, {
+                'totalRequests': 4, 'approvedRequests': 0,
+                'monthly': {month: 4}, 'daily': {now.strftime('%Y-%m-%d'): 3}
+            }),
+            make_snapshot(cohort_ref, {
+                'totalRequests': 24, 'approvedRequests': 15, 'monthly': {month: 34}
+            })
+        ]
+
+        peer_stats, user_stats = store.get_stats('u1', 'student', 'CS', 'lab_server', peer_count=5)
+
+        store.db.get_all.assert_called_once()
+        assert peer_stats['approval_rate'] == pytest.approx(15 / 20)
+        assert peer_stats['avg_requests_per_month'] == pytest.approx(30 / 3 / 5)
+        assert user_stats['approval_rate'] == 0
+        assert user_stats['recent_access_count'] == 3
+
+    def test_missing_aggregates_are_neutral(self, store):
+        """Users and cohorts without history get neutral statistics"""
+        store.db.get_all.return_value = []
+        peer_stats, user_stats = store.get_stats('u1', 'student', 'CS', 'lab_server', peer_count=0)
+
+        assert peer_stats['approval_rate'] == 0.5
+        assert peer_stats['avg_requests_per_month'] == 0
+        assert user_stats['approval_rate'] == 0.5
+        assert user_stats['recent_access_count'] == 0
+
+    def test_peer_rate_uses_full_cohort_size(self, store):
+        """Cohorts larger than the old 50-peer sample are averaged over every member"""
+        month = datetime.utcnow().strftime('%Y-%m')
+        cohort_ref = store._cohort_ref('student', 'CS', 'lab_server')
+        store.db.get_all.return_value = [
+            make_snapshot(cohort_ref, {'totalRequests': 600, 'approvedRequests': 300, 'monthly': {month: 600}})
+        ]
+
+        peer_stats, _ = store.get_stats('u1', 'student', 'CS', 'lab_server', peer_count=200)
+
+        assert peer_stats['avg_requests_per_month'] == pytest.approx(600 / 3 / 200)
+
+    def test_stale_daily_buckets_deleted_by_next_decision(self, store):
+        """Every bucket past retention seen on read is deleted with the next write, not only the one at the cutoff"""
+        now = datetime.utcnow()
+        fresh = now.strftime('%Y-%m-%d')
+        stale = [(now - timedelta(days=d)).strftime('%Y-%m-%d') for d in (41, 55, 300)]
+        user_ref = Mock(path='userAccessStats/u1')
+        user_ref.get.return_value = make_snapshot(user_ref, {'daily': dict({fresh: 2}, **{day: 1 for day in stale})})
+        store._user_ref = Mock(return_value=user_ref)
+
+        assert store.get_user_stats('u1', 'lab_server')['recent_access_count'] == 2
+        user_ref.update.assert_not_called()
+        user_ref.set.assert_not_called()
+
+        with patch('app.services.peer_cohort_store.firestore') as mock_firestore:
+            assert store.record_decision('u1', 'student', 'CS', 'lab_server', 'granted', now)
+
+        user_write = store.db.batch.return_value.set.call_args_list[1][0]
+        assert user_write[0] is user_ref
+        daily = user_write[1]['daily']
+        assert all(daily[day] is mock_firestore.DELETE_FIELD for day in stale)
+        assert daily[fresh] is mock_firestore.Increment.return_value
+        # Remembered keys are only deleted once
+        assert store._take_stale_days(user_ref.path) == []
+
+    def test_reads_without_stale_buckets_remember_nothing(self, store):
+        user_ref = Mock(path='userAccessStats/u1')
+        user_ref.get.return_value = make_snapshot(user_ref, {'daily': {datetime.utcnow().strftime('%Y-%m-%d'): 1}})
+        store._user_ref = Mock(return_value=user_ref)
+
+        store.get_user_stats('u1', 'lab_server')
+
+        assert store._take_stale_days(user_ref.path) == []
+
+    def test_get_stats_reuses_user_doc(self, store):
+        """A user aggregate already read is not fetched again with the cohort"""
+        month = datetime.utcnow().strftime('%Y-%m')
+        cohort_ref = Mock(path='peerCohortStats/c1')
+        cohort_ref.get.return_value = make_snapshot(cohort_ref, {
+            'totalRequests': 24, 'approvedRequests': 15, 'monthly': {month: 34}
+        })
+        store._cohort_ref = Mock(return_value=cohort_ref)
+        user_doc = {'totalRequests': 4, 'approvedRequests': 0, 'monthly': {month: 4}}
+
+        peer_stats, user_stats = store.get_stats('u1', 'student', 'CS', 'lab_server', peer_count=5,
+                                                 user_doc=user_doc)
+
+        store.db.get_all.assert_not_called()
+        cohort_ref.get.assert_called_once()
+        assert peer_stats['approval_rate'] == pytest.approx(15 / 20)
+        assert user_stats['approval_rate'] == 0
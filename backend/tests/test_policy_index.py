@@ -0,0 +1,111 @@
+"""
+Unit tests for the in-memory Policy Index
+Tests rule compilation, prefix/wildcard matching, ordering and incremental updates
+"""
+
+import pytest
+from unittest.mock import Mock
+
+from app.services.policy_index import PolicyIndex
+
+
+def make_doc(policy_id, rules, priority=0, is_active=True):
+    """Build a fake Firestore document snapshot"""
+    doc = Mock()
+    doc.id = policy_id
+    doc.to_dict.return_value = {
+        'name': policy_id,
+        'rules': rules,
+        'priority': priority,
+        'isActive': is_active
+    }
+    return doc
+
+
+class TestPolicyIndex:
+    """Unit tests for PolicyIndex"""
+
+    @pytest.fixture
+    def index(self):
+        """Create a PolicyIndex populated with sample policies"""
+        index = PolicyIndex(db=None, use_listener=False, refresh_interval=3600)
+        index.build([
+            make_doc('lab', [{'resourceType': 'lab_server', 'allowedRoles': ['faculty', 'admin']}], priority=5),
+            make_doc('lab_prefix', [{'resourceType': 'lab', 'allowedRoles': ['student']}], priority=1),
+            make_doc('any', [{'resourceType': '*', 'allowedRoles': ['admin']}], priority=10),
+            make_doc('open', [{'resourceType': 'library', 'allowedRoles': ['*']}], priority=2)
+        ])
+        return index
+
+    def test_exact_match(self, index):
+        """Exact resource and role match"""
+        result = index.lookup('lab_server', 'faculty')
+        assert [p['policyId'] for p in result] == ['lab']
+
+    def test_prefix_match(self, index):
+        """Rule resourceType matches as a prefix of the requested resource"""
+        result = index.lookup('lab_server', 'student')
+        assert [p['policyId'] for p in result] == ['lab_prefix']
+
+    def test_wildcards_sorted_by_priority(self, index):
+        """Wildcard resource and role rules are included, highest priority first"""
+        result = index.lookup('lab_server', 'admin')
+        assert [p['policyId'] for p in result] == ['any', 'lab']
+
+        result = index.lookup('library', 'visitor')
+        assert [p['policyId'] for p in result] == ['open']
+
+    def test_no_match(self, index):
+        """Unknown role/resource returns empty list"""
+        assert index.lookup('finance_db', 'student') == []
+
+    def test_incremental_upsert_and_remove(self, index):
+        """Upserts replace compiled rules and removals drop them"""
+        index.upsert('lab', {
+            'rules': [{'resourceType': 'lab_server', 'allowedRoles': ['student']}],
+            'priority': 5,
+            'isActive': True
+        })
+        assert 'lab' not in [p['policyId'] for p in index.lookup('lab_server', 'faculty')]
+        assert [p['policyId'] for p in index.lookup('lab_server', 'student')] == ['lab', 'lab_prefix']
+
+        index.remove('lab_prefix')
+        assert [p['policyId'] for p in index.lookup('lab_server', 'student')] == ['lab']
+
+    def test_inactive_policy_is_dropped(self, index):
+        """Deactivating a policy removes it from the index"""
+        index.upsert('open', {
+            'rules': [{'resourceType': 'library', 'allowedRoles': ['*']}],
+            'isActive': False
+        })
+        assert index.lookup('library', 'visitor') == []
+
+    def test_snapshot_changes_applied(self, index):
+        """Listener snapshots apply added and removed documents"""
+        added = Mock()
+        added.type.name = 'ADDED'
+        added.document = make_doc('it', [{'resourceType': 'it_admin', 'allowedRoles': ['admin']}], priority=3)
+        removed = Mock()
+        removed.type.name = 'REMOVED'
+        removed.document = make_doc('any', [])
+
+        index._on_snapshot(None, [added, removed], None)
+
+        assert [p['policyId'] for p in index.lookup('it_admin', 'admin')] == ['it']
+        assert index.get_stats()['policyCount'] == 4
+
+    def test_refresh_reads_collection_once(self):
+        """The collection is read once and subsequent lookups are served from memory"""
+        db = Mock()
+        db.collection.return_value.where.return_value.stream.return_value = [
+            make_doc('lab', [{'resourceType': 'lab_server', 'allowedRoles': ['faculty']}])
+        ]
+        index = PolicyIndex(db=db, use_listener=False, refresh_interval=3600)
+
+        for _ in range(5):
+            assert len(index.lookup('lab_server', 'faculty')) == 1
+
+        assert db.collection.return_value.where.return_value.stream.call_count == 1
+        stats = index.get_stats()
+        assert stats['lookups'] == 5
+        assert stats['fullBuilds'] == 1
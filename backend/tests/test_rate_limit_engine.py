@@ -0,0 +1,199 @@
+"""
+Unit tests and benchmark for the Rate Limit Engine
+Tests GCRA semantics, grouped buckets and throughput under contention
+"""
+
+import time
+import threading
+import pytest
+from unittest.mock import Mock
+
+from app.services.rate_limit_engine import (
+    RateLimit,
+    LocalRateLimitEngine,
+    RedisRateLimitEngine,
+    SlidingWindowCounterLimiter,
+    _parse_script_result
+)
+
+
+class TestLocalRateLimitEngine:
+    """Unit tests for LocalRateLimitEngine"""
+
+    def test_allows_up_to_limit_then_denies(self):
+        """A bucket allows `limit` requests at once and then denies"""
+        engine = LocalRateLimitEngine()
+        bucket = [RateLimit('client:a', limit=5, period=60)]
+
+        results = [engine.check(bucket, now=1000.0) for _ in range(6)]
+
+        assert [r.allowed for r in results] == [True] * 5 + [False]
+        assert results[4].buckets[0].remaining == 0
+        assert results[5].retry_after == pytest.approx(12.0)
+
+    def test_capacity_refills_continuously(self):
+        """One request's worth of capacity returns after period/limit seconds"""
+        engine = LocalRateLimitEngine()
+        bucket = [RateLimit('client:a', limit=5, period=60)]
+        for _ in range(5):
+            engine.check(bucket, now=1000.0)
+
+        assert not engine.check(bucket, now=1011.0).allowed
+        assert engine.check(bucket, now=1012.0).allowed
+
+    def test_grouped_buckets_use_overflow(self):
+        """Buckets in one group are alternatives: burst is spent after hourly"""
+        engine = LocalRateLimitEngine()
+        limits = [
+            RateLimit('hourly:a', limit=2, period=3600, group='hourly'),
+            RateLimit('burst:a', limit=1, period=60, group='hourly')
+        ]
+
+        first = engine.check(limits, now=0.0)
+        engine.check(limits, now=0.0)
+        third = engine.check(limits, now=0.0)
+        fourth = engine.check(limits, now=0.0)
+
+        assert first.buckets[0].consumed and not first.buckets[1].consumed
+        assert third.allowed and third.buckets[1].consumed
+        assert not fourth.allowed
+
+    def test_all_groups_must_pass(self):
+        """A request denied by one group consumes nothing from the others"""
+        engine = LocalRateLimitEngine()
+        client = RateLimit('client:a', limit=1, period=3600, group='client')
+        endpoint = RateLimit('endpoint:a', limit=10, period=3600, group='endpoint')
+
+        assert engine.check([endpoint, client], now=0.0).allowed
+        denied = engine.check([endpoint, client], now=0.0)
+
+        assert not denied.allowed
+        assert denied.buckets[0].remaining == 9
+
+    def test_idle_keys_are_evicted(self):
+        """Buckets that have fully refilled are dropped on sweep"""
+        engine = LocalRateLimitEngine(shards=1, sweep_interval=1)
+        for i in range(100):
+            engine.check([RateLimit(f'ip:{i}', limit=10, period=10)], now=0.0)
+        assert engine.size() == 100
+
+        engine.check([RateLimit('ip:new', limit=10, period=10)], now=60.0)
+        assert engine.size() == 1
+
+
+class TestRedisRateLimitEngine:
+    """Unit tests for RedisRateLimitEngine"""
+
+    def test_single_script_call_per_check(self):
+        """A check is one script invocation covering every bucket"""
+        redis_client = Mock()
+        script = Mock(return_value=[1, 4, '12000.000', '0.000', 1, 1, '0.000', '0.000', 0])
+        redis_client.register_script.return_value = script
+        engine = RedisRateLimitEngine(redis_client)
+
+        limits = [
+            RateLimit('hourly:a', limit=5, period=60, group='hourly'),
+            RateLimit('burst:a', limit=1, period=60, group='hourly')
+        ]
+        result = engine.check(limits)
+
+        script.assert_called_once()
+        assert script.call_args.kwargs['keys'] == ['hourly:a', 'burst:a']
+        assert result.allowed
+        assert result.buckets[0].remaining == 4
+        assert result.buckets[0].reset_after == pytest.approx(12.0)
+        assert result.buckets[0].consumed and not result.buckets[1].consumed
+
+    def test_check_many_pipelines(self):
+        """Several checks share one pipeline execute"""
+        redis_client = Mock()
+        redis_client.register_script.return_value = Mock()
+        pipe = redis_client.pipeline.return_value
+        pipe.execute.return_value = [[1, 0, '1000.000', '0.000', 1], [0, 0, '1000.000', '500.000', 0]]
+        engine = RedisRateLimitEngine(redis_client)
+
+        results = engine.check_many([
+            [RateLimit('a', limit=1, period=1)],
+            [RateLimit('b', limit=1, period=1)]
+        ])
+
+        pipe.execute.assert_called_once()
+        assert [r.allowed for r in results] == [True, False]
+        assert results[1].retry_after == pytest.approx(0.5)
+
+
+class TestSlidingWindowCounterLimiter:
+    """Unit tests for SlidingWindowCounterLimiter"""
+
+    def test_limit_within_window(self):
+        """Requests beyond the limit inside one window are rejected"""
+        limiter = SlidingWindowCounterLimiter()
+        results = [limiter.hit('auth:1.2.3.4', limit=3, window=60, now=600.0 + i) for i in range(4)]
+
+        assert [allowed for allowed, _ in results] == [True, True, True, False]
+        assert results[-1][1] == 3
+
+    def test_previous_window_weighted(self):
+        """The previous window's count decays linearly across the current window"""
+        limiter = SlidingWindowCounterLimiter()
+        for _ in range(10):
+            limiter.hit('k', limit=10, window=60, now=0.0)
+
+        # Halfway through the next window half of the old count still applies
+        assert not limiter.hit('k', limit=5, window=60, now=90.0)[0]
+        assert limiter.hit('k', limit=10, window=60, now=90.0)[0]
+        # Two windows later all state is gone
+        assert limiter.hit('k', limit=1, window=60, now=180.0)[0]
+
+    def test_idle_keys_evicted_and_memory_capped(self):
+        """Idle keys are swept and each shard is capped"""
+        limiter = SlidingWindowCounterLimiter(shards=1, max_keys_per_shard=50, sweep_interval=1)
+        for i in range(200):
+            limiter.hit(f'ip:{i}', limit=10, window=60, now=0.0)
+        assert limiter.size() == 50
+
+        limiter.hit('ip:late', limit=10, window=60, now=500.0)
+        assert limiter.size() == 1
+
+    def test_constant_cost_regardless_of_limit(self):
+        """Per-request work does not grow with the number of requests in the window"""
+        limiter = SlidingWindowCounterLimiter()
+
+        def timed(limit):
+            start = time.perf_counter()
+            for i in range(5000):
+                limiter.hit(f'api:{limit}', limit=limit, window=3600, now=1000.0)
+            return time.perf_counter() - start
+
+        small, large = timed(10), timed(100000)
+        assert large < small * 5
+
+
+@pytest.mark.slow
+def test_local_engine_throughput_under_contention():
+    """Benchmark: requests/sec for the local engine with 8 threads on shared and distinct keys"""
+    engine = LocalRateLimitEngine()
+    per_thread = 20000
+    threads_count = 8
+
+    def worker(thread_index, shared):
+        for i in range(per_thread):
+            key = 'shared' if shared else f'client:{thread_index}:{i % 500}'
+            engine.check([
+                RateLimit(key, limit=1000, period=3600, group='hourly'),
+                RateLimit(f'burst:{key}', limit=50, period=60, group='hourly')
+            ])
+
+    for shared in (True, False):
+        threads = [threading.Thread(target=worker, args=(t, shared)) for t in range(threads_count)]
+        start_time = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start_time
+
+        rate = (per_thread * threads_count) / elapsed
+        label = 'single hot key' if shared else 'distinct keys'
+        print(f"\nLocal rate limit engine ({label}): {rate:,.0f} checks/sec")
+        assert rate > 10000
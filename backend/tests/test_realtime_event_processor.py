@@ -0,0 +1,143 @@
+"""
+Unit tests for the Real-Time Event Processor
+Tests bounded heatmap and tracker state, device failure tracking and the blocking event consumer
+"""
+
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.services import realtime_event_service
+from app.services.realtime_event_service import RealTimeEventProcessor
+
+
+@pytest.fixture
+def processor():
+    processor = RealTimeEventProcessor()
+    processor._store_event = Mock()
+    processor._broadcast_alert = Mock()
+    processor._broadcast_to_administrators = Mock()
+    yield processor
+    processor.stop_processing()
+
+
+def failed_login(device_id, timestamp):
+    return {'eventType': 'failed_login', 'deviceId': device_id, 'userId': 'u1',
+            'timestamp': timestamp.isoformat()}
+
+
+class TestBoundedState:
+    """State stays bounded over long uptimes"""
+
+    def test_heatmap_cache_capped(self, processor):
+        """The oldest heatmap entries are evicted beyond the cache size"""
+        processor.heatmap_cache_size = 100
+        for i in range(250):
+            processor.process_security_event({'eventId': f'e{i}', 'eventType': 'jit_request'})
+
+        assert len(processor.heatmap_cache) == 100
+        assert next(iter(processor.heatmap_cache)) == 'e150'
+
+    def test_heatmap_buckets_expire(self, processor):
+        """Entries in minute buckets past the retention are evicted"""
+        processor.heatmap_retention_minutes = 5
+        now = time.time()
+        with patch.object(realtime_event_service.time, 'time', return_value=now - 600):
+            processor.process_security_event({'eventId': 'old', 'eventType': 'jit_request'})
+        processor.process_security_event({'eventId': 'new', 'eventType': 'jit_request'})
+
+        assert list(processor.heatmap_cache) == ['new']
+
+    def test_idle_devices_dropped(self, processor):
+        """Devices without failures in the last hour leave the tracker"""
+        start = datetime.utcnow() - timedelta(hours=3)
+        for i in range(500):
+            processor._check_coordinated_attacks(failed_login(f'd{i}', start))
+        processor._check_coordinated_attacks(failed_login('recent', datetime.utcnow()))
+
+        assert list(processor.coordinated_attack_tracker) == ['recent']
+
+    def test_hourly_metrics_retained(self, processor):
+        """Hourly counters beyond the retained hours are discarded"""
+        processor.metrics_retention_hours = 3
+        hours = [datetime(2024, 3, 4, h) for h in range(6)]
+        for hour in hours:
+            with patch.object(realtime_event_service, 'datetime', Mock(utcnow=Mock(return_value=hour))):
+                processor._update_activity_metrics({'eventType': 'jit_request', 'severity': 'low'})
+
+        hourly = sorted(k for k in processor.get_activity_metrics() if k.startswith('hourly_'))
+        assert hourly == ['hourly_2024-03-04-03', 'hourly_2024-03-04-04', 'hourly_2024-03-04-05']
+
+
+class TestCoordinatedAttacks:
+    """Failed-login tracking per device"""
+
+    def test_five_failures_in_ten_minutes_raise_event(self, processor):
+        """Failures older than the window are pruned before counting"""
+        processor.process_security_event = Mock()
+        now = datetime.utcnow()
+        processor._check_coordinated_attacks(failed_login('d1', now - timedelta(minutes=30)))
+        for minutes in (8, 6, 4, 2):
+            processor._check_coordinated_attacks(failed_login('d1', now - timedelta(minutes=minutes)))
+        processor.process_security_event.assert_not_called()
+
+        processor._check_coordinated_attacks(failed_login('d1', now))
+
+        attack = processor.process_security_event.call_args[0][0]
+        assert attack['eventType'] == 'coordinated_attack'
+        assert attack['eventData']['failure_count'] == 5
+        assert 'd1' not in processor.coordinated_attack_tracker
+
+
+class TestAdministratorBroadcast:
+    """Admin room updates queued on the broadcast scheduler"""
+
+    def test_heatmap_keyed_by_cell_and_events_unkeyed(self):
+        """Heatmap points coalesce per grid cell while every security event is sent"""
+        processor = RealTimeEventProcessor()
+        processor._store_event = Mock()
+        processor._broadcast_alert = Mock()
+        processor._generate_heatmap_coordinates = Mock(return_value={
+            'coordinates': {'x': 120, 'y': 230}, 'intensity': 25, 'category': 'security'
+        })
+
+        with patch.object(realtime_event_service, 'schedule_broadcast') as schedule:
+            for i in range(3):
+                processor.process_security_event({'eventId': f'e{i}', 'eventType': 'jit_request'})
+
+        heatmap_keys = {c[1]['key'] for c in schedule.call_args_list if c[0][0] == 'heatmap_update'}
+        event_calls = [c for c in schedule.call_args_list if c[0][0] == 'security_event']
+        assert heatmap_keys == {'security:2:4'}
+        assert len(event_calls) == 3
+        assert all(c[1].get('key') is None for c in event_calls)
+
+
+class TestEventConsumer:
+    """Background consumer"""
+
+    def test_consumer_blocks_and_stops_promptly(self, processor):
+        """Queued events are consumed without polling and stop wakes the consumer"""
+        processor.start_processing()
+        for i in range(50):
+            processor.process_security_event({'eventId': f'e{i}', 'eventType': 'jit_request'})
+
+        deadline = time.time() + 2
+        while processor.event_queue.qsize() and time.time() < deadline:
+            time.sleep(0.01)
+        assert processor.event_queue.qsize() == 0
+
+        started = time.time()
+        processor.stop_processing()
+        assert time.time() - started < 1.0
+        assert not processor.processing_thread.is_alive()
+
+    def test_full_queue_drops_events(self, processor):
+        """Events beyond the queue size are counted as dropped instead of growing memory"""
+        processor.event_queue.maxsize = 10
+        for i in range(15):
+            processor.process_security_event({'eventId': f'e{i}', 'eventType': 'jit_request'})
+
+        assert processor.event_queue.qsize() == 10
+        assert processor.get_activity_metrics()['dropped_events'] == 5
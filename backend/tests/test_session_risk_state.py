@@ -0,0 +1,129 @@
+"""
+Unit tests for incremental continuous authentication
+Tests the rolling session risk state and event-driven risk updates
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+from app.services.continuous_auth_service import ContinuousAuthService
+from app.services.session_risk_state import SessionRiskState, REQUEST_RATE_TAU_MINUTES
+
+T0 = datetime(2024, 3, 4, 10, 0, 0)
+
+
+class TestSessionRiskState:
+    """Tests for SessionRiskState"""
+
+    def test_request_rate_tracks_steady_traffic(self):
+        """The EWMA converges to the steady request rate and decays when idle"""
+        state = SessionRiskState('s1', 'u1')
+        for i in range(200):
+            state.record_access(T0 + timedelta(seconds=10 * i))
+
+        last = T0 + timedelta(seconds=10 * 199)
+        assert state.request_rate_at(last) == pytest.approx(6.0, rel=0.1)
+        assert state.request_rate_at(last + timedelta(minutes=REQUEST_RATE_TAU_MINUTES)) == \
+            pytest.approx(state.request_rate / 2.718281828, rel=0.01)
+
+    def test_locations_and_resources_bounded(self):
+        """Only the last two locations are kept"""
+        state = SessionRiskState('s1', 'u1')
+        for i, ip in enumerate(['10.0.0.1', '10.0.0.2', '10.0.0.3']):
+            state.record_access(T0 + timedelta(minutes=i), resource=f'r{i % 2}', ip_address=ip)
+
+        assert [loc['ip_address'] for loc in state.recent_locations] == ['10.0.0.2', '10.0.0.3']
+        assert state.current_ip == '10.0.0.3'
+        assert state.resources == {'r0', 'r1'}
+
+    def test_roundtrip(self):
+        """State survives storage on the session document"""
+        state = SessionRiskState('s1', 'u1', typical_ips=['10.0.0.1'], hour_histogram={'9': 0.3},
+                                 baseline_available=True, device_validation={'success': True, 'similarity': 97})
+        state.record_access(T0, resource='dashboard', ip_address='10.0.0.1')
+        state.updated_at = T0
+
+        restored = SessionRiskState.from_dict('s1', state.to_dict())
+
+        assert restored.to_dict() == state.to_dict()
+        assert restored.request_rate_at(T0) == state.request_rate_at(T0)
+
+
+@pytest.fixture
+def service():
+    service = ContinuousAuthService()
+    service.db = Mock()
+    service.device_service = Mock()
+    service.device_service.validate_fingerprint.return_value = {'success': True, 'similarity': 97}
+    service._get_user_typical_locations = Mock(return_value=[{'ip_address': '10.0.0.1', 'frequency': 5}])
+    service._has_behavioral_baseline = Mock(return_value=True)
+    session_doc = Mock(exists=True)
+    session_doc.to_dict.return_value = {
+        'userId': 'u1',
+        'ipAddress': '10.0.0.1',
+        'deviceFingerprint': {'canvas': {'hash': 'abc'}},
+        'accessLog': [{'timestamp': (datetime.utcnow() - timedelta(minutes=5)).isoformat(), 'resource': 'dashboard'}]
+    }
+    service.db.collection.return_value.document.return_value.get.return_value = session_doc
+    return service
+
+
+class TestRecordSessionActivity:
+    """Tests for ContinuousAuthService.record_session_activity"""
+
+    def test_state_built_once(self, service):
+        """The session is evaluated in full once; later activity reuses the state"""
+        for _ in range(5):
+            result = service.record_session_activity('s1', {'timestamp': datetime.utcnow(), 'resource': 'dashboard'})
+
+        assert result['success'] is True
+        assert result['baseline_available'] is True
+        assert service.db.collection.return_value.document.return_value.get.call_count == 1
+        assert service._get_user_typical_locations.call_count == 1
+        assert service.device_service.validate_fingerprint.call_count == 1
+
+    def test_state_persisted_with_score(self, service):
+        """Each update stores the state; history is only appended when the action changes"""
+        service.record_session_activity('s1', {'timestamp': datetime.utcnow(), 'resource': 'dashboard'})
+        service.record_session_activity('s1', {'timestamp': datetime.utcnow(), 'resource': 'dashboard'})
+
+        updates = [c[0][0] for c in service.db.collection.return_value.document.return_value.update.call_args_list]
+        assert all('riskState' in update for update in updates)
+        assert 'riskProfile.riskHistory' in updates[0]
+        assert 'riskProfile.riskHistory' not in updates[1]
+
+    def test_request_burst_raises_risk(self, service):
+        """A burst of requests raises the request frequency factor immediately"""
+        quiet = service.record_session_activity('s1', {'timestamp': datetime.utcnow(), 'resource': 'dashboard'})
+        now = datetime.utcnow()
+        for i in range(60):
+            burst = service.record_session_activity('s1', {'timestamp': now, 'resource': 'dashboard'})
+
+        assert quiet['risk_factors']['request_frequency'] == 0.0
+        assert burst['risk_factors']['request_frequency'] == 100.0
+        assert burst['risk_score'] > quiet['risk_score']
+
+    def test_escalation_applies_action(self, service):
+        """An escalation to termination is applied as it happens"""
+        service.device_service.validate_fingerprint.return_value = {'success': False}
+        service._calculate_location_stability_risk = Mock(return_value=100.0)
+        service._calculate_time_appropriateness_risk = Mock(return_value=80.0)
+        service._calculate_access_pattern_risk = Mock(return_value=100.0)
+        service.terminate_suspicious_session = Mock(return_value={'success': True})
+        service.trigger_reauthentication = Mock(return_value={'success': True})
+        now = datetime.utcnow()
+
+        for _ in range(60):
+            result = service.record_session_activity('s1', {'timestamp': now, 'resource': 'admin'})
+            if result['action_required'] == 'terminate_session':
+                break
+
+        assert result['action_required'] == 'terminate_session'
+        service.terminate_suspicious_session.assert_called_once()
+        assert 's1' not in service._risk_states
+
+    def test_unknown_session(self, service):
+        """Activity for a missing session is rejected"""
+        service.db.collection.return_value.document.return_value.get.return_value = Mock(exists=False)
+        assert service.record_session_activity('missing', {})['error'] == 'SESSION_NOT_FOUND'
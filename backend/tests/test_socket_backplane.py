@@ -0,0 +1,199 @@
+"""
+Unit tests for the Socket Backplane
+Tests cross-worker fan-out, shared presence with TTLs and in-process dispatch cost as workers are added
+"""
+
+import statistics
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from app.services.socket_backplane import (
+    BROADCAST_CHANNEL, LocalPresenceStore, LocalPubSub, RedisPresenceStore, SocketBackplane
+)
+
+
+class Worker:
+    """Simulated worker delivering broadcasts to the clients connected to it"""
+
+    def __init__(self, name, pubsub, presence, **kwargs):
+        self.received = []
+        self.clients = {}
+        self.backplane = SocketBackplane(self.deliver, pubsub=pubsub, presence=presence,
+                                         node_id=name, **kwargs)
+        self.backplane._ensure_started = Mock()
+
+    def deliver(self, event, data, room=None):
+        recipients = [sid for sid, rooms in self.clients.items() if room is None or room in rooms]
+        self.received.append((event, data, room, len(recipients), time.perf_counter()))
+
+    def connect(self, sid, user_id=None, role=None):
+        rooms = [f'user_{user_id}', f'role_{role}'] if user_id else []
+        self.clients[sid] = rooms
+        self.backplane.register(sid)
+        if user_id:
+            self.backplane.update(sid, user_id=user_id, role=role, rooms=rooms)
+
+
+def make_cluster(size, **kwargs):
+    pubsub, presence = LocalPubSub(), LocalPresenceStore()
+    return [Worker(f'node{i}', pubsub, presence, **kwargs) for i in range(size)]
+
+
+class TestFanOut:
+    """Broadcasts reach every worker"""
+
+    def test_broadcast_reaches_clients_on_other_workers(self):
+        """An admin connected to another worker receives a broadcast published here"""
+        first, second = make_cluster(2)
+        second.connect('s1', user_id='admin1', role='admin')
+
+        assert first.backplane.publish('admin_notification', {'type': 'security_alert'}, room='role_admin')
+
+        assert second.received[0][:4] == ('admin_notification', {'type': 'security_alert'}, 'role_admin', 1)
+        assert first.received[0][3] == 0
+        assert first.backplane.get_metrics()['published'] == 1
+
+    def test_without_transport_delivers_directly(self):
+        """With no pub/sub the emit is delivered locally, as with a Socket.IO message queue"""
+        deliver = Mock()
+        backplane = SocketBackplane(deliver, node_id='n1')
+
+        backplane.publish('heatmap_update', {'x': 1}, room='admin_room')
+
+        deliver.assert_called_once_with('heatmap_update', {'x': 1}, 'admin_room')
+        assert backplane.get_metrics()['transport'] == 'direct'
+
+    def test_failed_publish_falls_back_to_local_delivery(self):
+        """Clients on this worker still get the event when the transport is down"""
+        pubsub = Mock()
+        pubsub.publish.side_effect = ConnectionError("down")
+        deliver = Mock()
+        backplane = SocketBackplane(deliver, pubsub=pubsub, node_id='n1')
+
+        assert backplane.publish('security_event', {'id': 'e1'}) is False
+        deliver.assert_called_once_with('security_event', {'id': 'e1'}, None)
+
+    def test_delivery_error_does_not_stop_other_workers(self):
+        """A failing worker is counted and the rest still receive the broadcast"""
+        first, second, third = make_cluster(3)
+        second.backplane.deliver = Mock(side_effect=RuntimeError("emit failed"))
+
+        first.backplane.publish('risk_score_update', {'risk_score': 80})
+
+        assert len(third.received) == 1
+        assert second.backplane.get_metrics()['delivery_errors'] == 1
+
+    def test_shutdown_unsubscribes(self):
+        """A stopped worker no longer receives broadcasts and withdraws its presence"""
+        first, second = make_cluster(2)
+        second.connect('s1')
+        second.backplane.shutdown()
+
+        first.backplane.publish('security_event', {})
+
+        assert second.received == []
+        assert first.backplane.connections_per_node() == {}
+
+
+class TestPresence:
+    """Shared connection registry"""
+
+    def test_connections_and_users_visible_across_workers(self):
+        """Every worker sees connection counts and online users of the whole cluster"""
+        first, second = make_cluster(2)
+        first.connect('a', user_id='u1', role='user')
+        second.connect('b', user_id='u2', role='admin')
+        second.connect('c')
+
+        assert first.backplane.connections_per_node() == {'node0': 1, 'node1': 2}
+        assert first.backplane.online_users() == ['u1', 'u2']
+        assert first.backplane.online_users(role='admin') == ['u2']
+
+        second.backplane.unregister('b')
+        assert first.backplane.online_users() == ['u1']
+
+    def test_crashed_worker_expires(self):
+        """Connections of a worker that stops heart-beating disappear after the TTL"""
+        first, second = make_cluster(2, presence_ttl=1)
+        first.connect('a')
+        second.connect('b')
+
+        time.sleep(0.6)
+        first.backplane.heartbeat()
+        time.sleep(0.6)
+
+        assert first.backplane.connections_per_node() == {'node0': 1}
+
+    def test_heartbeat_restores_lost_entries(self):
+        """A presence store that lost this worker's entries is refilled on the next heartbeat"""
+        (worker,) = make_cluster(1)
+        worker.connect('a', user_id='u1', role='user')
+        worker.backplane.presence.drop_node('node0')
+
+        worker.backplane.heartbeat()
+
+        assert worker.backplane.online_users() == ['u1']
+
+    def test_redis_store_uses_node_hashes_with_ttl(self):
+        """Connections go to a per-node hash whose expiry is refreshed with the node's score"""
+        client = Mock()
+        pipe = client.pipeline.return_value
+        store = RedisPresenceStore(client)
+
+        store.put('node0', 's1', {'sid': 's1'}, 90)
+
+        pipe.hset.assert_called_once_with('ws:presence:node0', 's1', '{"sid": "s1"}')
+        pipe.expire.assert_called_once_with('ws:presence:node0', 90)
+        assert pipe.zadd.call_args[0][0] == 'ws:nodes'
+        pipe.execute.assert_called_once()
+
+
+@pytest.mark.slow
+def test_in_process_dispatch_cost_as_workers_added():
+    """
+    Backplane dispatch cost and connections per node for growing simulated clusters
+
+    Every "worker" runs in this process on LocalPubSub, so the figures cover
+    the backplane's own work (message encoding, per-worker delivery and
+    presence bookkeeping). They do not include network or Redis latency and
+    are not a measure of cross-worker fan-out time.
+    """
+    total_connections = 2000
+    broadcasts = 200
+    print("\n=== Socket backplane in-process dispatch (LocalPubSub, no network) ===")
+    print(f"{'workers':>8} {'conn/node':>10} {'p50 ms':>8} {'p95 ms':>8}")
+
+    for size in (1, 2, 4, 8):
+        workers = make_cluster(size)
+        for i in range(total_connections):
+            workers[i % size].connect(f's{i}', user_id=f'u{i}', role='admin' if i % 50 == 0 else 'user')
+
+        latencies = []
+        for n in range(broadcasts):
+            started = time.perf_counter()
+            workers[n % size].backplane.publish('security_event', {'n': n}, room='role_admin')
+            latencies.append(max(w.received[-1][4] for w in workers) - started)
+
+        per_node = workers[0].backplane.connections_per_node()
+        p50 = statistics.median(latencies) * 1000
+        p95 = statistics.quantiles(latencies, n=20)[18] * 1000
+        print(f"{size:>8} {total_connections // size:>10} {p50:>8.3f} {p95:>8.3f}")
+
+        assert all(len(w.received) == broadcasts for w in workers)
+        assert sum(w.received[0][3] for w in workers) == total_connections // 50
+        assert sorted(per_node.values()) == [total_connections // size] * size
+        assert p95 < 50
+
+
+def test_local_pubsub_subscribers():
+    """Publishing returns the number of subscribers that received a copy of the message"""
+    pubsub = LocalPubSub()
+    received = []
+    pubsub.subscribe(BROADCAST_CHANNEL, received.append)
+    message = {'event': 'x', 'data': {'a': [1]}}
+
+    assert pubsub.publish(BROADCAST_CHANNEL, message) == 1
+    assert received == [message] and received[0] is not message
+    assert pubsub.publish('other', message) == 0
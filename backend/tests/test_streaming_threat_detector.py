@@ -0,0 +1,188 @@
+"""
+Unit tests for the Streaming Threat Detector
+Tests sliding-window expiry, threshold firing, rebuild from audit logs and the detectors that read the windows
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.services.streaming_threat_detector import (
+    FAILURES_BY_DEVICE, FAILURES_BY_PATTERN, LOGIN_FAILURES_BY_IP,
+    SlidingWindowCounter, StreamingThreatDetector
+)
+
+
+def make_detector(records=None, **kwargs):
+    """Detector whose rebuild reads the given audit records"""
+    db = Mock()
+    docs = [Mock(to_dict=Mock(return_value=record)) for record in records or []]
+    db.collection.return_value.where.return_value.stream.side_effect = [docs, []]
+    return StreamingThreatDetector(db=db, **kwargs)
+
+
+def failed_login(ip='203.0.113.7', user='u1', minutes_ago=0.0):
+    return {'action': 'login', 'result': 'failure', 'ip_address': ip, 'user_id': user,
+            'timestamp': datetime.utcnow() - timedelta(minutes=minutes_ago)}
+
+
+class TestSlidingWindowCounter:
+    """Bucketed per-key counts"""
+
+    @pytest.fixture
+    def now(self):
+        """A clock frozen halfway into a 10 second bucket, so bucket boundaries are deterministic"""
+        frozen = (time.time() // 10) * 10 + 5
+        with patch('app.services.streaming_threat_detector.time.time', return_value=frozen):
+            yield frozen
+
+    def test_counts_expire_with_their_buckets(self, now):
+        """Events leave the window bucket by bucket and take their members with them"""
+        counter = SlidingWindowCounter(window_seconds=60, bucket_seconds=10)
+        counter.add('k', now - 50, {'users': 'u1'})
+        counter.add('k', now - 20, {'users': 'u2'})
+        counter.add('k', now - 20, {'users': 'u2'})
+
+        window = counter.get('k', now)
+        assert window.count == 3
+        assert window.members['users'] == {'u1': 1, 'u2': 2}
+
+        window = counter.get('k', now + 20)
+        assert window.count == 2
+        assert window.members['users'] == {'u2': 2}
+
+        assert counter.get('k', now + 60) is None
+        assert len(counter) == 0
+
+    def test_idle_keys_dropped_without_scanning(self, now):
+        """Keys whose last event left the window are removed from the front"""
+        counter = SlidingWindowCounter(window_seconds=60, bucket_seconds=10)
+        for i in range(100):
+            counter.add(f'old{i}', now - 55)
+        counter.add('recent', now)
+
+        assert counter.expire(now + 10) == 100
+        assert len(counter) == 1
+
+    def test_events_outside_window_ignored(self):
+        """An event already older than the window does not create a key"""
+        counter = SlidingWindowCounter(window_seconds=60, bucket_seconds=10)
+        assert counter.add('k', time.time() - 3600) is None
+        assert len(counter) == 0
+
+
+class TestStreamingThreatDetector:
+    """Threshold firing and rebuild"""
+
+    def test_brute_force_fires_once_when_threshold_crossed(self):
+        """Subscribers hear about the crossing event and not about the ones after it"""
+        detector = make_detector()
+        subscriber = Mock()
+        detector.subscribe(subscriber)
+
+        fired = [detector.ingest(failed_login(user=f'u{i % 3}')) for i in range(12)]
+
+        assert [len(f) for f in fired] == [0] * 9 + [1, 0, 0]
+        detection = subscriber.call_args[0][0]
+        assert subscriber.call_count == 1
+        assert detection['threat_type'] == 'brute_force_attack'
+        assert detection['key'] == '203.0.113.7'
+        assert detection['members']['users'] == ['u0', 'u1', 'u2']
+
+    def test_coordinated_attack_fires(self):
+        """Three users failing the same resource and action five times each is a coordinated attack"""
+        detector = make_detector()
+        fired = []
+        for attempt in range(5):
+            for user in ('u1', 'u2', 'u3'):
+                fired += detector.ingest({'user_id': user, 'resource_type': 'database', 'action': 'access',
+                                          'result': 'denied', 'timestamp': datetime.utcnow()})
+
+        assert [d['threat_type'] for d in fired] == ['coordinated_attack']
+        assert fired[0]['key'] == 'database:access'
+        assert detector.snapshot(FAILURES_BY_PATTERN)[0]['count'] == 15
+
+    def test_successes_are_not_counted(self):
+        """Only failed and denied attempts reach the windows"""
+        detector = make_detector()
+        assert detector.ingest(dict(failed_login(), result='success')) == []
+        assert detector.get_metrics()['events'] == 0
+
+    def test_rebuild_replays_logs_from_before_start(self):
+        """Recent failures logged before the detector started are replayed once, in time order"""
+        before = [failed_login(minutes_ago=m) for m in (5, 50, 30)]
+        detector = make_detector(before + [
+            dict(failed_login(), timestamp=datetime.utcnow() + timedelta(seconds=5)),
+            dict(failed_login(), result='success')
+        ])
+        detector.ingest(failed_login())
+
+        windows = detector.snapshot(LOGIN_FAILURES_BY_IP)
+
+        assert windows[0]['count'] == 4
+        assert detector.get_metrics()['rebuilt_events'] == 3
+        detector.snapshot(LOGIN_FAILURES_BY_IP)
+        assert detector.db.collection.return_value.where.return_value.stream.call_count == 2
+
+    def test_failed_rebuild_is_backed_off(self):
+        """A failing rebuild is not retried on every read"""
+        detector = make_detector()
+        detector.db.collection.return_value.where.return_value.stream.side_effect = Exception("UNAVAILABLE")
+
+        assert detector.ensure_rebuilt() is False
+        assert detector.ensure_rebuilt() is False
+        assert detector.get_metrics()['rebuild_failures'] == 1
+
+    def test_device_samples_kept_and_bounded(self):
+        """Recent failure records of a device are kept up to the sample limit"""
+        detector = make_detector(max_samples=5)
+        for i in range(8):
+            detector.ingest({'result': 'failure', 'device_fingerprint': 'fp1', 'user_id': f'u{i}',
+                             'ip_address': '10.0.0.1', 'timestamp': datetime.utcnow()})
+
+        window = detector.snapshot(FAILURES_BY_DEVICE, key='fp1')[0]
+        assert window['count'] == 8
+        assert len(window['samples']) == 5
+        assert window['members']['ips'] == {'10.0.0.1': 8}
+
+
+    def test_create_audit_log_denial_reaches_windows(self):
+        """Denials persisted through create_audit_log are counted like audit_logger events"""
+        from app.models.audit_log import create_audit_log
+
+        detector = make_detector()
+        with patch('app.services.streaming_threat_detector.streaming_threat_detector', detector), \
+             patch('app.services.threat_feature_store.threat_feature_store'):
+            create_audit_log(Mock(), 'access_request', 'u1', 'access', 'database', 'denied',
+                             ip_address='10.0.0.9')
+
+        window = detector.snapshot(FAILURES_BY_PATTERN, key='database:access')[0]
+        assert window['count'] == 1
+        assert window['members']['users'] == {'u1': 1}
+
+
+class TestAutomatedThreatResponse:
+    """AutomatedThreatResponse reads the windows instead of querying audit logs"""
+
+    def test_multiple_failed_attempts_detected_from_windows(self):
+        """Device lockouts are decided from the streaming counts"""
+        module = pytest.importorskip('app.services.automated_threat_response')
+        detector = make_detector()
+        for i in range(10):
+            detector.ingest({'result': 'failure', 'device_fingerprint': 'fp1', 'user_id': 'u1',
+                             'ip_address': '10.0.0.1', 'timestamp': datetime.utcnow()})
+
+        service = module.AutomatedThreatResponse()
+        service.block_device_fingerprint = AsyncMock(return_value=True)
+        service.alert_administrators = AsyncMock(return_value=True)
+        with patch.object(module, 'streaming_threat_detector', detector), patch.object(module, 'db') as mock_db:
+            threats = asyncio.run(service.detect_multiple_failed_attempts())
+
+        mock_db.collection.assert_not_called()
+        assert threats[0]['device_fingerprint'] == 'fp1'
+        assert threats[0]['failed_attempts'] == 10
+        assert threats[0]['user_ids'] == ['u1']
+        service.block_device_fingerprint.assert_awaited_once()
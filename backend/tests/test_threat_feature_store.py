@@ -0,0 +1,304 @@
+"""
+Unit tests for the Threat Feature Store
+Tests parity with history-based feature extraction, incremental counters, retention and fallback
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from app.services.threat_feature_store import (
+    ThreatFeatureStore, features_from_aggregates, hour_key, threat_event
+)
+from app.services.threat_predictor import ThreatPredictor
+
+DELETE = object()
+
+
+class FakeRef:
+
+    def __init__(self, doc_id):
+        self.id = doc_id
+
+
+class FakeBatch:
+    """Applies merged sets with increments and field deletes on commit"""
+
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data, merge=False):
+        self.writes.append((ref, data))
+
+    def commit(self):
+        if self.db.fail_commits:
+            self.db.fail_commits -= 1
+            raise Exception("UNAVAILABLE")
+        for ref, data in self.writes:
+            _apply(self.db.docs.setdefault(ref.id, {}), data)
+        self.db.commits += 1
+
+
+def _apply(target, data):
+    for name, value in data.items():
+        if value is DELETE:
+            target.pop(name, None)
+        elif isinstance(value, tuple) and value[0] == 'increment':
+            target[name] = target.get(name, 0) + value[1]
+        elif isinstance(value, dict):
+            _apply(target.setdefault(name, {}), value)
+        else:
+            target[name] = value
+
+
+class FakeDb:
+
+    def __init__(self):
+        self.docs = {}
+        self.commits = 0
+        self.fail_commits = 0
+
+    def collection(self, name):
+        collection = Mock()
+        collection.document.side_effect = FakeRef
+        return collection
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs):
+        for ref in refs:
+            data = self.docs.get(ref.id)
+            yield Mock(id=ref.id, exists=data is not None, to_dict=Mock(return_value=data))
+
+
+class SeedingDb(FakeDb):
+    """FakeDb whose document().set() replaces the document"""
+
+    def collection(self, name):
+        collection = Mock()
+
+        def document(doc_id):
+            ref = FakeRef(doc_id)
+            ref.set = lambda data: self.docs.__setitem__(doc_id, _plain(data))
+            return ref
+
+        collection.document.side_effect = document
+        return collection
+
+
+def _plain(data):
+    return {k: (_plain(v) if isinstance(v, dict) else v) for k, v in data.items()}
+
+
+@pytest.fixture(autouse=True)
+def fake_firestore():
+    with patch('app.services.threat_feature_store.firestore') as mock_firestore:
+        mock_firestore.Increment.side_effect = lambda value: ('increment', value)
+        mock_firestore.DELETE_FIELD = DELETE
+        mock_firestore.SERVER_TIMESTAMP = 'server-time'
+        yield mock_firestore
+
+
+def make_store(db):
+    store = ThreatFeatureStore(db=db, flush_interval=60)
+    store._ensure_started = Mock()
+    return store
+
+
+def sample_history(now):
+    """Audit records away from hour boundaries of the 24h and 7-day windows"""
+    history = []
+    for day in range(1, 7):
+        history.append({'timestamp': now - timedelta(days=day, minutes=30), 'action': 'access',
+                        'result': 'success', 'resource_type': 'documents', 'location': 'NY',
+                        'device_id': 'laptop'})
+    for minutes in (20, 95, 200, 400, 700, 1000):
+        history.append({'timestamp': now - timedelta(minutes=minutes), 'action': 'login',
+                        'result': 'failure', 'resource_type': 'auth', 'device_id': f'dev{minutes % 3}'})
+    history.append({'timestamp': now - timedelta(hours=3), 'action': 'access', 'result': 'denied',
+                    'resource_type': 'admin', 'location': 'Lagos'})
+    off_hours = now - timedelta(hours=1)
+    while not 2 <= off_hours.hour < 6:
+        off_hours -= timedelta(hours=1)
+    history.append({'timestamp': off_hours, 'action': 'access', 'result': 'success',
+                    'resource_type': 'documents', 'location': 'NY'})
+    return history
+
+
+class TestThreatFeatures:
+    """Features computed from aggregates"""
+
+    def test_matches_history_extraction(self):
+        """A store seeded from history yields the features extract_threat_features computes"""
+        now = datetime.utcnow()
+        history = sample_history(now)
+        store = make_store(SeedingDb())
+
+        rebuilt = store.rebuild_from_history('u1', history, now)
+        features = store.get_features('u1', now)
+        assert rebuilt.tolist() == features.tolist()
+
+        expected = ThreatPredictor().extract_threat_features('u1', history)
+        assert features.tolist() == pytest.approx(expected.tolist(), abs=1e-6)
+        assert features[0] == 6
+
+    def test_audit_log_documents_normalized(self):
+        """AuditLog documents count failed logins only and read details fields"""
+        login = threat_event({'userId': 'u1', 'eventType': 'authentication', 'action': 'Login failed',
+                              'result': 'failure', 'resource': 'authentication_system',
+                              'timestamp': datetime(2024, 3, 4), 'details': {'deviceId': 'd1', 'location': 'NY'}})
+        mfa = threat_event({'userId': 'u1', 'eventType': 'authentication', 'action': 'mfa_verify',
+                            'result': 'failure', 'timestamp': datetime(2024, 3, 4)})
+
+        assert login['login_failure'] is True
+        assert mfa['login_failure'] is False
+        assert login['device_id'] == 'd1'
+        assert login['location'] == 'NY'
+        assert threat_event({'userId': 'anonymous', 'result': 'failure'}) is None
+
+
+class TestThreatFeatureStore:
+    """Incremental maintenance of the stored aggregates"""
+
+    def test_events_accumulate_across_flushes_and_workers(self):
+        """Deltas are visible before flushing and add up as increments across stores"""
+        db = FakeDb()
+        now = datetime.utcnow()
+        db.docs['u1'] = {'hours': {}}
+        first, second = make_store(db), make_store(db)
+
+        for _ in range(3):
+            first.record_event({'user_id': 'u1', 'action': 'login', 'result': 'failure',
+                                'timestamp': now - timedelta(minutes=5)})
+        assert first.get_features('u1', now)[0] == 3
+        assert second.get_features('u1', now)[0] == 0
+
+        second.record_event({'user_id': 'u1', 'action': 'login', 'result': 'failure', 'timestamp': now})
+        assert first.flush() == 1
+        assert second.flush() == 1
+
+        assert db.docs['u1']['hours'][hour_key(now - timedelta(minutes=5))]['failedLogins'] >= 1
+        assert make_store(db).get_features('u1', now)[0] == 4
+        assert first.get_metrics()['pending_users'] == 0
+
+    def test_unseeded_user_has_no_features(self):
+        """Pending deltas alone do not count as stored aggregates"""
+        store = make_store(FakeDb())
+        store.record_event({'user_id': 'u1', 'action': 'login', 'result': 'failure'})
+
+        assert store.get_features('u1') is None
+
+    def test_failed_flush_is_retried(self):
+        """Deltas of a failed commit stay pending"""
+        db = FakeDb()
+        db.docs['u1'] = {}
+        db.fail_commits = 1
+        store = make_store(db)
+        now = datetime.utcnow()
+        store.record_event({'user_id': 'u1', 'result': 'denied', 'timestamp': now})
+
+        assert store.flush() == 0
+        assert store.get_metrics()['failed_commits'] == 1
+        assert store.flush() == 1
+        assert db.docs['u1']['hours'][hour_key(now)]['denied'] == 1
+
+    def test_expired_buckets_deleted(self):
+        """Buckets past the baseline are dropped from features and deleted on the next flush"""
+        db = FakeDb()
+        now = datetime(2024, 3, 10, 12, 30)
+        old = hour_key(now - timedelta(days=9))
+        recent = hour_key(now - timedelta(hours=1))
+        bucket = {'total': 50, 'failedLogins': 0, 'offHours': 0, 'denied': 0, 'resources': {}, 'locations': {}}
+        db.docs['u1'] = {'hours': {old: dict(bucket), recent: dict(bucket, total=2)}}
+        store = make_store(db)
+
+        features = store.get_features('u1', now)
+        assert features[3] == pytest.approx((2 - 2 / 7) / (2 / 7 + 1))
+
+        assert store.flush() == 1
+        assert list(db.docs['u1']['hours']) == [recent]
+
+    def test_pending_users_bounded(self):
+        """Events of further users are dropped once the pending limit is reached"""
+        store = ThreatFeatureStore(db=FakeDb(), max_pending_users=1)
+        store._ensure_started = Mock()
+
+        assert store.record_event({'user_id': 'u1', 'result': 'success'}) is True
+        assert store.record_event({'user_id': 'u2', 'result': 'success'}) is False
+        assert store.get_metrics()['dropped'] == 1
+
+    def test_many_users_read_in_chunks(self):
+        """Fleet reads go through get_all in chunks"""
+        db = FakeDb()
+        now = datetime.utcnow()
+        for i in range(250):
+            db.docs[f'u{i}'] = {'hours': {hour_key(now): {'total': 1, 'failedLogins': i % 2, 'offHours': 0,
+                                                         'denied': 0, 'resources': {}, 'locations': {}}}}
+        db.get_all = Mock(side_effect=FakeDb.get_all.__get__(db))
+        store = make_store(db)
+
+        features = store.get_features_many([f'u{i}' for i in range(250)] + ['missing'], now)
+
+        assert len(features) == 250
+        assert db.get_all.call_count == 3
+        assert features['u1'][0] == 1
+
+
+class TestPredictorIntegration:
+    """ThreatPredictor feature lookup"""
+
+    def test_store_features_skip_history(self):
+        """Stored features are used without reading the access history"""
+        predictor = ThreatPredictor()
+        predictor._get_user_access_history = Mock()
+        features = np.array([12, 0, 0, 0, 0, 1, 0], dtype=np.float32)
+
+        with patch('app.services.threat_predictor.threat_feature_store') as store:
+            store.get_features.return_value = features
+            result = predictor.analyze_patterns('u1')
+
+        predictor._get_user_access_history.assert_not_called()
+        assert result['indicators'][0]['type'] == 'excessive_failed_attempts'
+
+    def test_unseeded_user_falls_back_and_seeds(self):
+        """Users without aggregates are computed from history and seeded"""
+        predictor = ThreatPredictor()
+        history = sample_history(datetime.utcnow())
+        predictor._get_feature_history = Mock(return_value=history)
+
+        with patch('app.services.threat_predictor.threat_feature_store') as store:
+            store.get_features.return_value = None
+            store.rebuild_from_history.return_value = np.array([6, 0, 0, 0, 0, 1, 0], dtype=np.float32)
+            result = predictor.analyze_patterns('u1')
+
+        store.rebuild_from_history.assert_called_once_with('u1', history)
+        assert result['features'][0] == 6
+
+    def test_seed_history_reads_both_audit_collections(self):
+        """Seeding reads audit_logs and auditLogs, the collections whose writers feed the store"""
+        predictor = ThreatPredictor()
+        predictor._get_user_access_history = Mock(return_value=[{'collection': 'audit_logs'}])
+        query = Mock()
+        query.where.return_value = query
+        query.order_by.return_value = query
+        query.limit.return_value = query
+        query.stream.return_value = [Mock(to_dict=Mock(return_value={'collection': 'auditLogs'}))]
+
+        with patch('app.services.threat_predictor.db') as mock_db:
+            mock_db.collection.return_value = query
+            history = predictor._get_feature_history('u1', days=7)
+
+        mock_db.collection.assert_called_once_with('auditLogs')
+        query.where.assert_any_call('userId', '==', 'u1')
+        assert [record['collection'] for record in history] == ['audit_logs', 'auditLogs']
+
+
+def test_features_from_empty_aggregates():
+    """Empty aggregates give all-zero features"""
+    features = features_from_aggregates({'hours': {}, 'resourceSuccess': {}, 'locationSuccess': {}, 'devices': {}})
+    assert features.tolist() == [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
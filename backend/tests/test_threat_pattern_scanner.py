@@ -0,0 +1,219 @@
+"""
+Unit tests for the Threat Pattern Scanner
+Tests parity with per-pattern matching, signature IDs, the payload walker and scan throughput
+"""
+
+import json
+import re
+import time
+
+from app.services.threat_pattern_scanner import (
+    DEFAULT_SIGNATURES, PATH_TRAVERSAL, SQL_INJECTION, SQL_INJECTION_SIGNATURES, XSS,
+    XSS_SIGNATURES, Signature, ThreatPatternScanner, signatures_for, threat_scanner
+)
+
+SAMPLES = [
+    '',
+    'alice@example.com',
+    'Quarterly report for the finance team',
+    "' OR '1'='1' --",
+    'admin" or 1=1 /* bypass */',
+    '1; DROP TABLE users',
+    "exec xp_cmdshell 'dir'",
+    '<script>alert("x")</script>',
+    '<SCRIPT src=x>\nsteal()\n</SCRIPT>',
+    '<img src=x onerror=alert(1)>',
+    "';alert(document.cookie)//",
+    '"; eval(atob("YQ=="))',
+    '<a href="javascript:void(0)">link</a>',
+    'background: expression(alert(1)); @import url(x.css)',
+    '<iframe src=//evil><object data=x><embed src=y><form action=z><input name=q>',
+    'data:text/html;base64,PHNjcmlwdD4=',
+    '../../etc/passwd',
+    '..\\..\\windows\\system32',
+    '%2E%2E%2Fetc%2Fpasswd',
+    '..%2f..%5cboot.ini',
+    'Select your option and update the form',
+    'C# and F# developers -- welcome',
+]
+
+
+def legacy_matches(value):
+    """Signature IDs found by searching each pattern on its own, as the sanitizers did"""
+    found = set()
+    for signature in DEFAULT_SIGNATURES:
+        if signature.category == SQL_INJECTION:
+            matched = re.search(signature.pattern, value.lower(), re.IGNORECASE)
+        elif signature.category == XSS:
+            matched = re.search(signature.pattern, value, re.IGNORECASE | re.DOTALL)
+        else:
+            matched = re.search(signature.pattern, value, re.IGNORECASE)
+        if matched:
+            found.add(signature.id)
+    return found
+
+
+class TestScan:
+    """One scan reports every matching signature"""
+
+    def test_same_matches_as_per_pattern_search(self):
+        for value in SAMPLES:
+            assert threat_scanner.scan(value) == legacy_matches(value), value
+
+    def test_overlapping_signatures_all_reported(self):
+        """Signatures matching the same text are reported together"""
+        matches = threat_scanner.scan("' OR '1'='1' --")
+        assert {'sqli_string_tautology', 'sqli_comment'} <= matches
+
+        matches = threat_scanner.scan('<script>"";alert("x")</script>')
+        assert {'xss_script_tag', 'xss_alert_call'} <= matches
+
+    def test_categories_and_patterns(self):
+        matches = threat_scanner.scan('../../etc/passwd?q=<iframe src=x>')
+
+        assert threat_scanner.categories(matches) == {PATH_TRAVERSAL, XSS}
+        assert threat_scanner.in_category(matches, XSS) == ['xss_iframe']
+        assert threat_scanner.pattern('xss_iframe') == r'<iframe[^>]*>'
+        assert threat_scanner.regex('xss_iframe').sub('', '<IFRAME src=x>ok') == 'ok'
+
+    def test_clean_and_non_string_values(self):
+        assert threat_scanner.scan('hello world') == frozenset()
+        assert threat_scanner.scan(None) == frozenset()
+        assert threat_scanner.scan(42) == frozenset()
+
+
+class TestSignatures:
+    """Scanners built from configured pattern lists"""
+
+    def test_known_patterns_keep_ids(self):
+        custom = r'\bwaitfor\s+delay\b'
+        signatures = signatures_for([SQL_INJECTION_SIGNATURES[0].pattern, custom], SQL_INJECTION)
+
+        assert signatures[0].id == 'sqli_keyword'
+        assert signatures[1] == Signature('sql_injection_1', SQL_INJECTION, custom)
+        scanner = ThreatPatternScanner(signatures)
+        assert scanner.scan("1; WAITFOR DELAY '0:0:5'") == {'sql_injection_1'}
+
+    def test_subset_only_matches_its_signatures(self):
+        """A scanner without the alert signature does not report it"""
+        scanner = ThreatPatternScanner(s for s in XSS_SIGNATURES if s.id != 'xss_alert_call')
+        assert scanner.scan("';alert(1)//") == frozenset()
+        assert scanner.scan('<script>alert(1)</script>') == {'xss_script_tag'}
+
+
+class TestWalk:
+    """Recursive payload walker"""
+
+    def test_reports_paths_of_keys_and_values(self):
+        payload = {
+            'name': 'bob',
+            'items': [{'note': '<script>x</script>'}, {'note': 'fine'}],
+            'onload=': 1,
+            'meta': {'path': '../../secret', 'count': 3, 'ok': True, 'none': None}
+        }
+
+        found = threat_scanner.scan_payload(payload)
+
+        assert found == {
+            ('items', 0, 'note'): {'xss_script_tag'},
+            ('onload=',): {'xss_event_handler'},
+            ('meta', 'path'): {'traversal_dot_slash'}
+        }
+
+    def test_matches_do_not_span_fields(self):
+        """Each key and value is scanned on its own, not the JSON dump of the whole payload"""
+        split = {'a': 'go and ', 'b': 'x'}
+        assert threat_scanner.scan(json.dumps(split)) == {'sqli_string_tautology'}
+        assert threat_scanner.scan_payload(split) == {}
+
+        assert threat_scanner.scan_payload({'a': "' OR '1'='1", 'b': 'x'}) == {
+            ('a',): {'sqli_string_tautology'}
+        }
+
+    def test_json_body_flagged_per_field(self):
+        """sanitize_input flags malicious_json_payload only when a single key or value matches"""
+        from app.middleware.security import sanitize_dict
+
+        threats = set()
+        sanitize_dict({'a': 'go and ', 'b': 'x'}, threats=threats)
+        assert not threats
+
+        sanitize_dict({'a': "' OR '1'='1", 'b': 'x'}, threats=threats)
+        assert SQL_INJECTION in threats
+
+    def test_repeated_strings_scanned_once(self):
+        """Keys shared by every record and repeated values cost one scan each"""
+        scanner = ThreatPatternScanner()
+        calls = []
+        original = scanner.scan
+
+        def counting_scan(value, cache=None):
+            if cache is None:
+                calls.append(value)
+            return original(value, cache)
+        scanner.scan = counting_scan
+
+        records = [{'id': str(i % 3), 'status': 'active'} for i in range(100)]
+        assert list(scanner.walk({'records': records})) == []
+        assert sorted(calls) == sorted(['records', 'id', 'status', '0', '1', '2', 'active'])
+
+
+def make_payload(records):
+    return {
+        'page': 1,
+        'records': [
+            {
+                'id': f'req-{i:06d}',
+                'user': {'email': f'user{i}@example.com', 'name': f'User Number {i}', 'roles': ['student', 'viewer']},
+                'justification': 'Need access to the research lab for the thesis experiments scheduled this week. ' * 3,
+                'resource': f'lab/building-{i % 40}/room-{i % 300}',
+                'duration_hours': i % 48,
+                'approved': i % 2 == 0,
+                'tags': [f'tag{i % 17}', 'priority', 'reviewed']
+            }
+            for i in range(records)
+        ]
+    }
+
+
+def legacy_walk(data):
+    """Per-pattern search on every key and value, without sharing work"""
+    found = []
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if legacy_matches(str(key)):
+                found.append(key)
+            found.extend(legacy_walk(value))
+    elif isinstance(data, list):
+        for item in data:
+            found.extend(legacy_walk(item))
+    elif isinstance(data, str) and legacy_matches(data):
+        found.append(data)
+    return found
+
+
+def test_scan_throughput_on_large_json():
+    """Compiled single-pass walk against per-pattern search on large payloads (timings are reported, not asserted)"""
+    print("\n=== Threat pattern scan throughput ===")
+    print(f"{'records':>8} {'KB':>8} {'legacy MB/s':>12} {'scanner MB/s':>13} {'speedup':>8}")
+
+    for records in (250, 1000, 2500):
+        payload = make_payload(records)
+        payload['records'][records // 2]['justification'] += " ' OR '1'='1"
+        size = len(json.dumps(payload))
+
+        started = time.perf_counter()
+        legacy_found = legacy_walk(payload)
+        legacy_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scanner_found = list(threat_scanner.walk(payload))
+        scanner_seconds = time.perf_counter() - started
+
+        assert len(legacy_found) == len(scanner_found) == 1
+        assert scanner_found[0][2] == {'sqli_string_tautology'}
+
+        legacy_rate = size / legacy_seconds / 1e6
+        scanner_rate = size / scanner_seconds / 1e6
+        print(f"{records:>8} {size // 1024:>8} {legacy_rate:>12.1f} {scanner_rate:>13.1f} "
+              f"{legacy_seconds / scanner_seconds:>7.1f}x")
@@ -23,6 +23,8 @@ except ImportError:
 sys.modules['app.firebase_config'] = Mock(db=Mock())
 
 from app.services.threat_predictor import ThreatPredictor
+from app.services.threat_feature_store import ThreatFeatureStore
+from app.services.streaming_threat_detector import StreamingThreatDetector
 
 # Skip all tests if numpy not available
 pytestmark = pytest.mark.skipif(not NUMPY_AVAILABLE, reason="NumPy not available")
@@ -36,6 +38,13 @@ class TestThreatPrediction:
         """Create threat predictor instance"""
         return ThreatPredictor()
     
+    @staticmethod
+    def make_detector():
+        """Streaming detector with no audit logs to rebuild from"""
+        db = Mock()
+        db.collection.return_value.where.return_value.stream.return_value = []
+        return StreamingThreatDetector(db=db)
+    
     @pytest.fixture
     def sample_access_history(self):
         """Generate sample access history data"""
@@ -160,29 +169,23 @@ class TestThreatPrediction:
     
     # ==================== Threat Detection Tests ====================
     
-    @patch('app.firebase_config.db')
-    def test_detect_brute_force(self, mock_db, predictor):
+    def test_detect_brute_force(self, predictor):
         """Test brute force attack detection"""
-        # Mock Firestore query for failed login attempts
-        mock_query = Mock()
-        mock_docs = []
+        detector = self.make_detector()
         
-        # Create 12 failed attempts from same IP
+        # Feed 12 failed attempts from same IP
         for i in range(12):
-            mock_doc = Mock()
-            mock_doc.to_dict.return_value = {
+            detector.ingest({
                 'action': 'login',
                 'result': 'failure',
                 'ip_address': '203.0.113.100',
                 'user_id': 'test_user_123',
-                'timestamp': datetime.utcnow() - timedelta(minutes=i*5)
-            }
-            mock_docs.append(mock_doc)
-        
-        mock_query.stream.return_value = mock_docs
-        mock_db.collection.return_value.where.return_value.where.return_value.where.return_value = mock_query
+                'timestamp': datetime.utcnow() - timedelta(minutes=55 - i*5)
+            })
         
-        result = predictor.detect_brute_force(user_id='test_user_123')
+        with patch('app.services.threat_predictor.streaming_threat_detector', detector):
+            result = predictor.detect_brute_force(user_id='test_user_123')
+            assert predictor.detect_brute_force(user_id='other_user') is None
         
         assert result is not None
         assert result['detected'] is True
@@ -230,30 +233,23 @@ class TestThreatPrediction:
         print(f"✓ Privilege escalation detected")
         print(f"  - Attempts: {result['attempt_count']}")
     
-    @patch('app.firebase_config.db')
-    def test_detect_coordinated_attack(self, mock_db, predictor):
+    def test_detect_coordinated_attack(self, predictor):
         """Test coordinated attack detection"""
-        # Mock multiple users attacking same resource
-        mock_query = Mock()
-        mock_docs = []
+        detector = self.make_detector()
         
-        # Create attacks from 5 different users
+        # Feed attacks from 5 different users
         for user_num in range(5):
             for attempt in range(3):
-                mock_doc = Mock()
-                mock_doc.to_dict.return_value = {
+                detector.ingest({
                     'user_id': f'user_{user_num}',
                     'resource_type': 'database',
                     'action': 'access',
                     'result': 'denied',
-                    'timestamp': datetime.utcnow() - timedelta(minutes=attempt)
-                }
-                mock_docs.append(mock_doc)
+                    'timestamp': datetime.utcnow() - timedelta(minutes=3 - attempt)
+                })
         
-        mock_query.stream.return_value = mock_docs
-        mock_db.collection.return_value.where.return_value.where.return_value.limit.return_value = mock_query
-        
-        result = predictor.detect_coordinated_attack()
+        with patch('app.services.threat_predictor.streaming_threat_detector', detector):
+            result = predictor.detect_coordinated_attack()
         
         assert result is not None
         assert result['detected'] is True
@@ -430,5 +426,96 @@ class TestThreatPrediction:
         print(f"✓ False positive rate: {false_positive_rate:.2%}")
 
 
+class TestFleetPrediction:
+    """Test fleet-wide threat prediction"""
+    
+    @pytest.fixture
+    def predictor(self):
+        """Create threat predictor instance with bounded concurrency"""
+        predictor = ThreatPredictor()
+        predictor.fleet_concurrency = 3
+        return predictor
+    
+    @staticmethod
+    def brute_force_features():
+        return np.array([12, 0.5, 0, 0, 0, 1, 0.6], dtype=np.float32)
+    
+    @patch('app.services.threat_predictor.db')
+    @patch('app.services.threat_predictor.threat_feature_store')
+    def test_fleet_scan_uses_store_and_batches_writes(self, mock_store, mock_db, predictor):
+        """Stored features skip history reads and predictions are saved in one batch"""
+        quiet = np.zeros(7, dtype=np.float32)
+        mock_store.get_features_many.return_value = {
+            f'user_{i}': self.brute_force_features() if i % 2 else quiet for i in range(20)
+        }
+        predictor._get_user_access_history = Mock(return_value=[])
+        
+        result = predictor.predict_fleet_threats([f'user_{i}' for i in range(20)] + ['new_user'])
+        
+        predictor._get_user_access_history.assert_called_once_with('new_user', days=predictor.lookback_days)
+        assert result['users_scanned'] == 20
+        assert result['users_flagged'] == 10
+        assert {p['user_id'] for p in result['predictions']} == {f'user_{i}' for i in range(1, 20, 2)}
+        assert set(result['timings_ms']) == {'candidates', 'feature_store', 'history_fetch', 'scoring', 'model', 'write'}
+        assert mock_db.batch.return_value.commit.call_count == 1
+        assert mock_db.batch.return_value.set.call_count == 10
+        
+        print(f"✓ Fleet scan: {result['users_scanned']} users in {result['total_ms']}ms")
+    
+    @patch('app.services.threat_predictor.db')
+    @patch('app.services.threat_predictor.threat_feature_store')
+    def test_history_fetches_bounded(self, mock_store, mock_db, predictor):
+        """Histories of users missing from the store are fetched on a bounded pool"""
+        import threading
+        import time
+        
+        mock_store.get_features_many.return_value = {}
+        mock_store.rebuild_from_history.side_effect = ThreatFeatureStore(db=Mock()).rebuild_from_history
+        lock = threading.Lock()
+        active = {'now': 0, 'max': 0}
+        
+        def fetch(user_id, days):
+            with lock:
+                active['now'] += 1
+                active['max'] = max(active['max'], active['now'])
+            time.sleep(0.01)
+            with lock:
+                active['now'] -= 1
+            return [{'action': 'login', 'result': 'failure', 'timestamp': datetime.utcnow()}] * 12
+        
+        predictor._get_user_access_history = Mock(side_effect=fetch)
+        
+        result = predictor.predict_fleet_threats([f'user_{i}' for i in range(12)])
+        
+        assert 1 < active['max'] <= 3
+        assert result['history_fetches'] == 12
+        assert result['users_flagged'] == 12
+        assert mock_store.rebuild_from_history.call_count == 12
+    
+    @patch('app.services.threat_predictor.db')
+    @patch('app.services.threat_predictor.threat_feature_store')
+    def test_fleet_matches_single_user_prediction(self, mock_store, mock_db, predictor):
+        """The vectorized scan builds the same indicators as per-user analysis"""
+        features = self.brute_force_features()
+        mock_store.get_features_many.return_value = {'user_1': features}
+        mock_store.get_features.return_value = features
+        
+        fleet = predictor.predict_fleet_threats(['user_1'])['predictions'][0]
+        single = predictor.analyze_patterns('user_1')
+        
+        assert fleet['indicators'] == single['indicators']
+        assert fleet['threat_type'] == 'brute_force_attack'
+    
+    @patch.object(ThreatPredictor, 'predict_fleet_threats')
+    def test_predict_threats_uses_fleet_scan(self, mock_fleet, predictor):
+        """Predicting without a user runs the fleet scan"""
+        mock_fleet.return_value = {'predictions': [{'user_id': 'user_1', 'confidence': 0.9}]}
+        
+        predictions = predictor.predict_threats()
+        
+        assert predictions == [{'user_id': 'user_1', 'confidence': 0.9}]
+        mock_fleet.assert_called_once_with()
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v', '-s'])
@@ -0,0 +1,207 @@
+"""
+Unit tests for the Token Verifier
+Tests the verified-claims cache, expiry and inactivity limits, key rotation and revocation
+"""
+
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import jwt
+import pytest
+
+from app.services import token_verifier as verifier_module
+from app.services.token_verifier import TokenError, TokenVerifier, load_signing_keys
+
+
+def make_token(key='secret', **claims):
+    payload = {'user_id': 'u1', 'role': 'admin', 'type': 'access',
+               'iat': datetime.utcnow() - timedelta(seconds=5),
+               'exp': datetime.utcnow() + timedelta(hours=1),
+               'last_activity': datetime.utcnow().isoformat()}
+    payload.update(claims)
+    return jwt.encode(payload, key, algorithm='HS256')
+
+
+@pytest.fixture
+def verifier():
+    return TokenVerifier(keys=['secret'], algorithm='HS256')
+
+
+class TestCache:
+    """Repeat verifications are a lookup"""
+
+    def test_second_verify_skips_decoding(self, verifier):
+        """Only the first verification of a token runs the signature check"""
+        token = make_token()
+        with patch.object(verifier_module.jwt, 'decode', wraps=jwt.decode) as decode:
+            for _ in range(5):
+                claims = verifier.verify(token)
+
+        assert decode.call_count == 1
+        assert claims['user_id'] == 'u1'
+        assert verifier.get_metrics()['hits'] == 4
+
+    def test_returned_claims_are_copies(self, verifier):
+        token = make_token()
+        verifier.verify(token)['role'] = 'changed'
+        assert verifier.verify(token)['role'] == 'admin'
+
+    def test_cache_bounded(self):
+        """The least recently used tokens are evicted beyond the cache size"""
+        verifier = TokenVerifier(keys=['secret'], max_entries=3)
+        tokens = [make_token(user_id=f'u{i}') for i in range(5)]
+        for token in tokens:
+            verifier.verify(token)
+
+        metrics = verifier.get_metrics()
+        assert metrics['cached_tokens'] == 3
+        assert metrics['evictions'] == 2
+
+    def test_invalid_tokens_not_cached(self, verifier):
+        for _ in range(2):
+            with pytest.raises(TokenError) as exc:
+                verifier.verify(make_token(key='other'))
+            assert exc.value.code == 'invalid'
+        assert verifier.get_metrics()['cached_tokens'] == 0
+
+
+class TestLimits:
+    """Expiry and inactivity are honoured for cached tokens"""
+
+    def test_cached_token_expires_at_exp(self, verifier):
+        """A cached token is rejected once its exp has passed"""
+        token = make_token(exp=datetime.utcnow() + timedelta(seconds=2))
+        verifier.verify(token)
+
+        with patch.object(verifier_module.time, 'time', return_value=time.time() + 5):
+            with pytest.raises(TokenError) as exc:
+                verifier.verify(token)
+        assert exc.value.code == 'expired'
+
+    def test_expired_token_rejected(self, verifier):
+        with pytest.raises(TokenError) as exc:
+            verifier.verify(make_token(exp=datetime.utcnow() - timedelta(seconds=1)))
+        assert exc.value.code == 'expired'
+
+    def test_inactivity_checked_on_every_call(self, verifier):
+        """The inactivity limit applies to cache hits as time passes"""
+        token = make_token(last_activity=(datetime.utcnow() - timedelta(minutes=20)).isoformat())
+
+        assert verifier.verify(token, max_inactivity=30 * 60)['user_id'] == 'u1'
+        with patch.object(verifier_module.time, 'time', return_value=time.time() + 15 * 60):
+            with pytest.raises(TokenError) as exc:
+                verifier.verify(token, max_inactivity=30 * 60)
+        assert exc.value.code == 'inactive'
+        assert verifier.verify(token)['user_id'] == 'u1'
+
+
+class TestKeys:
+    """Single key-loading path with rotation"""
+
+    def test_previous_keys_accepted_and_new_key_signs(self):
+        """After rotation tokens signed with the retired key stay valid and new tokens use the new key"""
+        with patch.dict('os.environ', {'JWT_SECRET_KEY': 'new', 'JWT_PREVIOUS_SECRET_KEYS': 'old, new'}):
+            assert load_signing_keys() == ['new', 'old']
+            verifier = TokenVerifier()
+
+        assert verifier.verify(make_token(key='old'))['user_id'] == 'u1'
+        assert jwt.decode(verifier.encode({'user_id': 'u2'}), 'new', algorithms=['HS256'])['user_id'] == 'u2'
+
+    def test_reload_drops_cache_of_removed_keys(self):
+        verifier = TokenVerifier(keys=['new', 'old'])
+        token = make_token(key='old')
+        verifier.verify(token)
+
+        assert verifier.reload_keys(['new']) is True
+        with pytest.raises(TokenError):
+            verifier.verify(token)
+        assert verifier.reload_keys(['new']) is False
+
+
+class TestRevocation:
+    """Revoked tokens are rejected even when cached"""
+
+    def test_revoked_token_rejected(self, verifier):
+        token = make_token()
+        other = make_token(user_id='u2')
+        verifier.verify(token)
+
+        verifier.revoke(token)
+
+        with pytest.raises(TokenError) as exc:
+            verifier.verify(token)
+        assert exc.value.code == 'revoked'
+        assert verifier.verify(other)['user_id'] == 'u2'
+
+    def test_revoke_user_rejects_earlier_tokens(self, verifier):
+        """Tokens a user was issued before the cutoff are rejected, later ones are not"""
+        old = make_token(iat=datetime.utcnow() - timedelta(minutes=5))
+        verifier.verify(old)
+
+        with patch.object(verifier_module.time, 'time', return_value=time.time() - 60):
+            verifier.revoke_user('u1')
+
+        with pytest.raises(TokenError):
+            verifier.verify(old)
+        assert verifier.verify(make_token())['user_id'] == 'u1'
+        assert verifier.get_metrics()['revoked_rejections'] == 1
+
+    def test_expired_revocations_pruned(self, verifier):
+        token = make_token(exp=datetime.utcnow() + timedelta(seconds=2))
+        verifier.revoke(token)
+
+        with patch.object(verifier_module.time, 'time', return_value=time.time() + 10):
+            verifier.revoke(make_token())
+
+        assert verifier.get_metrics()['revoked_tokens'] == 1
+
+
+class FakeRedis:
+    """Dict-backed stand-in for the redis_config helpers"""
+
+    def __init__(self):
+        self.store = {}
+
+    def cache_set(self, key, value, ttl=None):
+        self.store[key] = value
+        return True
+
+    def cache_get(self, key):
+        return self.store.get(key)
+
+
+class TestSharedRevocation:
+    """Revocations reach other workers through Redis"""
+
+    @pytest.fixture
+    def shared(self):
+        with patch.object(verifier_module, 'redis_config', FakeRedis()) as fake:
+            yield fake
+
+    def test_other_worker_rejects_once_cache_expires(self, shared):
+        """A token cached by another worker is rejected there after at most cache_ttl seconds"""
+        token = make_token()
+        worker_a = TokenVerifier(keys=['secret'], cache_ttl=30)
+        worker_b = TokenVerifier(keys=['secret'], cache_ttl=30)
+        worker_b.verify(token)
+
+        worker_a.revoke(token)
+
+        with patch.object(verifier_module.time, 'time', return_value=time.time() + 31):
+            with pytest.raises(TokenError) as exc:
+                worker_b.verify(token)
+        assert exc.value.code == 'revoked'
+        with pytest.raises(TokenError):
+            TokenVerifier(keys=['secret']).verify(token)
+
+    def test_other_worker_rejects_revoked_user(self, shared):
+        old = make_token(iat=datetime.utcnow() - timedelta(minutes=5))
+
+        with patch.object(verifier_module.time, 'time', return_value=time.time() - 60):
+            TokenVerifier(keys=['secret']).revoke_user('u1')
+
+        worker = TokenVerifier(keys=['secret'])
+        with pytest.raises(TokenError):
+            worker.verify(old)
+        assert worker.verify(make_token())['user_id'] == 'u1'
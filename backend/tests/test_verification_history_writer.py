@@ -0,0 +1,164 @@
+"""
+Unit tests for the Verification History Writer
+Tests per-device coalescing, the fixed worker pool, capped history and daily rollups
+"""
+
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.services.verification_history_writer import VerificationHistoryWriter
+
+T0 = datetime(2024, 3, 4, 10, 0, 0)
+
+
+class FakeDoc:
+    """Device document reference with an in-memory rollup subcollection"""
+
+    def __init__(self, db, doc_id):
+        self.db = db
+        self.id = doc_id
+
+    def get(self, transaction=None):
+        data = self.db.devices.get(self.id)
+        return Mock(exists=data is not None, to_dict=Mock(return_value=dict(data or {})))
+
+    def collection(self, name):
+        collection = Mock()
+        collection.document.side_effect = lambda day: (self.id, day)
+        return collection
+
+
+class FakeTransaction:
+    """Applies updates and merged sets directly to the fake db"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def update(self, ref, data):
+        self.db.devices[ref.id].update(data)
+        self.db.updates.append((ref.id, data))
+
+    def set(self, ref, data, merge=False):
+        rollup = self.db.rollups.setdefault(ref, {})
+        for name, value in data.items():
+            if isinstance(value, tuple) and value[0] == 'increment':
+                rollup[name] = rollup.get(name, 0) + value[1]
+            else:
+                rollup[name] = value
+
+
+class FakeDb:
+
+    def __init__(self, devices=None):
+        self.devices = devices or {}
+        self.rollups = {}
+        self.updates = []
+
+    def collection(self, name):
+        collection = Mock()
+        collection.document.side_effect = lambda doc_id: FakeDoc(self, doc_id)
+        return collection
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+
+@pytest.fixture(autouse=True)
+def fake_firestore():
+    with patch('app.services.verification_history_writer.firestore') as mock_firestore:
+        mock_firestore.transactional.side_effect = lambda func: func
+        mock_firestore.Increment.side_effect = lambda value: ('increment', value)
+        yield mock_firestore
+
+
+class TestVerificationHistoryWriter:
+    """Unit tests for VerificationHistoryWriter"""
+
+    def test_verifications_of_a_device_are_coalesced(self):
+        """Many verifications of one device become a single write"""
+        db = FakeDb({'d1': {}, 'd2': {}})
+        writer = VerificationHistoryWriter(db=db, workers=2, history_limit=50, flush_delay=0.2)
+
+        for i in range(30):
+            writer.submit('d1', 97.0, T0 + timedelta(seconds=i))
+        writer.submit('d2', 80.0, T0)
+        assert writer.flush(5.0)
+
+        metrics = writer.get_metrics()
+        assert metrics['transactions'] == 2
+        assert metrics['written'] == 31
+        assert metrics['coalesced'] == 29
+        assert len(db.devices['d1']['verificationHistory']) == 30
+        assert db.devices['d1']['verificationCount'] == 30
+        assert db.devices['d1']['lastVerified'] == T0 + timedelta(seconds=29)
+        assert db.devices['d2']['verificationHistory'][0]['result'] == 'failed'
+        writer.shutdown()
+
+    def test_worker_pool_is_fixed(self):
+        """The number of writer threads does not grow with the number of verifications"""
+        db = FakeDb({f'd{i}': {} for i in range(200)})
+        writer = VerificationHistoryWriter(db=db, workers=3, flush_delay=0.0)
+        before = threading.active_count()
+
+        for i in range(200):
+            writer.submit(f'd{i}', 99.0)
+        assert writer.flush(5.0)
+
+        assert threading.active_count() - before <= 3
+        assert writer.get_metrics()['written'] == 200
+        writer.shutdown()
+
+    def test_history_capped_and_rolled_up(self):
+        """Legacy arrays are trimmed and every entry pushed out is counted in daily rollups"""
+        legacy = [{'timestamp': T0 - timedelta(days=1), 'similarity': 90.0, 'result': 'partial'}] * 8
+        db = FakeDb({'d1': {'verificationHistory': legacy}})
+        writer = VerificationHistoryWriter(db=db, history_limit=5)
+
+        entries = [{'timestamp': T0, 'similarity': 96.0, 'result': 'success'}] * 4
+        assert writer.write('d1', entries) is True
+
+        device = db.devices['d1']
+        assert device['verificationHistory'] == [legacy[0]] + entries
+        assert device['verificationCount'] == 12
+        rollup = db.rollups[('d1', '2024-03-03')]
+        assert rollup['total'] == 7
+        assert rollup['partial'] == 7
+        assert rollup['similaritySum'] == pytest.approx(630.0)
+        assert writer.get_metrics()['rolled_up'] == 7
+
+    def test_pending_entries_beyond_cap_are_rolled_up(self):
+        """A burst larger than the cap keeps the newest entries and rolls up the rest"""
+        db = FakeDb({'d1': {}})
+        writer = VerificationHistoryWriter(db=db, history_limit=3, flush_delay=10.0)
+        writer._ensure_started = Mock()
+
+        for i in range(10):
+            writer.submit('d1', 99.0, T0 + timedelta(minutes=i))
+        writer._drain_inline()
+
+        device = db.devices['d1']
+        assert [e['timestamp'].minute for e in device['verificationHistory']] == [7, 8, 9]
+        assert device['verificationCount'] == 10
+        assert db.rollups[('d1', '2024-03-04')]['success'] == 7
+
+    def test_pending_devices_bounded(self):
+        """Verifications of further devices are dropped once the pending limit is reached"""
+        writer = VerificationHistoryWriter(db=FakeDb(), max_pending_devices=2, flush_delay=10.0)
+        writer._ensure_started = Mock()
+
+        assert writer.submit('d1', 99.0) is True
+        assert writer.submit('d2', 99.0) is True
+        assert writer.submit('d1', 98.0) is True
+        assert writer.submit('d3', 99.0) is False
+        assert writer.get_metrics()['dropped'] == 1
+
+    def test_unknown_device_is_skipped(self):
+        """Verifications of deleted devices are not written"""
+        db = FakeDb()
+        writer = VerificationHistoryWriter(db=db)
+
+        assert writer.write('missing', [{'timestamp': T0, 'similarity': 99.0, 'result': 'success'}]) is False
+        assert db.updates == []
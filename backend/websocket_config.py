@@ -4,7 +4,6 @@ Eventlet-safe, production-ready, high concurrency WebSocket server
 """
 
 import os
-import jwt
 import redis
 import logging
 import json
@@ -17,6 +16,12 @@ from flask_socketio import (
 )
 from dotenv import load_dotenv
 
+from app.services.broadcast_scheduler import BroadcastScheduler
+from app.services.socket_backplane import (
+    LocalPresenceStore, RedisPresenceStore, SocketBackplane
+)
+from app.services.token_verifier import TokenError, token_verifier
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -32,6 +37,9 @@ socketio = None
 active_connections = {}
 redis_client = None
 
+# Cross-worker fan-out and shared presence (see init_socketio)
+backplane = None
+
 
 # --------------------------------------------------
 # Decorators
@@ -70,8 +78,21 @@ def admin_only(f):
 # --------------------------------------------------
 # INIT
 # --------------------------------------------------
+def _redis_url():
+    password = os.getenv("REDIS_PASSWORD")
+    auth = f":{password}@" if password else ""
+    return os.getenv("WEBSOCKET_MESSAGE_QUEUE") or (
+        f"redis://{auth}{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', 6379)}/0"
+    )
+
+
+def _deliver(event, data, room=None):
+    if socketio is not None:
+        socketio.emit(event, data, room=room)
+
+
 def init_socketio(app):
-    global redis_client, socketio
+    global redis_client, socketio, backplane
 
     # Skip heavy Redis setup in development
     is_development = os.getenv("FLASK_ENV") == "development"
@@ -101,11 +122,6 @@ def init_socketio(app):
     if is_development and async_mode == "threading":
         socketio_kwargs["transports"] = ["polling"]
 
-    socketio = SocketIO(
-        app,
-        **socketio_kwargs
-    )
-
     # Redis ONLY in production
     if not is_development and os.getenv("ENABLE_REDIS_SCALING", "false").lower() == "true":
         try:
@@ -118,11 +134,22 @@ def init_socketio(app):
                 socket_timeout=2
             )
             redis_client.ping()
+            # Flask-SocketIO publishes every emit to the queue so clients
+            # on all workers receive it
+            socketio_kwargs["message_queue"] = _redis_url()
             logger.info("Redis enabled for WebSocket scaling")
         except Exception as e:
             logger.warning(f"Redis disabled: {e}")
             redis_client = None
 
+    socketio = SocketIO(
+        app,
+        **socketio_kwargs
+    )
+
+    presence = RedisPresenceStore(redis_client) if redis_client else LocalPresenceStore()
+    backplane = SocketBackplane(_deliver, presence=presence)
+
     register_handlers()
     logger.info("WebSocket server initialized (eventlet mode)")
     return socketio
@@ -133,12 +160,8 @@ def init_socketio(app):
 # --------------------------------------------------
 def verify_jwt_token(token):
     try:
-        return jwt.decode(
-            token,
-            os.getenv("JWT_SECRET_KEY", "dev_jwt_secret"),
-            algorithms=["HS256"]
-        )
-    except Exception:
+        return token_verifier.verify(token)
+    except TokenError:
         return None
 
 
@@ -158,6 +181,7 @@ def register_handlers():
             "role": None,
             "last_activity": datetime.utcnow().isoformat()
         }
+        backplane.register(sid)
         emit("connection_established", {
             "sid": sid,
             "authentication_required": True,
@@ -187,6 +211,12 @@ def register_handlers():
         join_room(role_room)
 
         active_connections[sid]["rooms"].extend([user_room, role_room])
+        backplane.update(
+            sid,
+            user_id=payload.get("user_id"),
+            role=payload.get("role"),
+            rooms=list(active_connections[sid]["rooms"])
+        )
 
         emit("authentication_success", {
             "user_id": payload["user_id"],
@@ -197,6 +227,7 @@ def register_handlers():
     def disconnect_handler():
         sid = request.sid
         user = active_connections.pop(sid, None)
+        backplane.unregister(sid)
         logger.info(f"Client disconnected: {sid} ({user})")
 
     @authenticated_only
@@ -207,36 +238,76 @@ def register_handlers():
             room = f"risk_score_{session_id}"
             join_room(room)
             active_connections[request.sid]["rooms"].append(room)
+            backplane.update(request.sid, rooms=list(active_connections[request.sid]["rooms"]))
+            # The new subscriber has no earlier state to apply deltas to
+            broadcast_scheduler.reset_room(room)
             emit("subscribed", {"room": room})
 
 
 # --------------------------------------------------
-# EMITTERS (unchanged logic)
+# EMITTERS
 # --------------------------------------------------
+def broadcast(event, data, room=None):
+    """
+    Emit to a room across all workers
+    Returns False when the WebSocket server is not initialized
+    """
+    if backplane is None:
+        return False
+    return backplane.publish(event, data, room)
+
+
+# Coalesces high-rate updates into one frame per room and interval
+broadcast_scheduler = BroadcastScheduler(broadcast)
+
+
+def schedule_broadcast(event, data, room, key=None):
+    """
+    Queue an update for the next frame of a room
+    Updates with the same event and key replace each other until the frame is sent
+    """
+    if backplane is None:
+        return False
+    return broadcast_scheduler.enqueue(event, data, room, key=key)
+
+
+def get_websocket_stats():
+    """Connections per worker and online users, across all workers"""
+    if backplane is None:
+        return {
+            "total_connections": len(active_connections),
+            "unique_users": len({c["user_id"] for c in active_connections.values() if c.get("user_id")}),
+            "nodes": {},
+        }
+
+    nodes = backplane.connections_per_node()
+    return {
+        "node_id": backplane.node_id,
+        "nodes": nodes,
+        "total_connections": sum(nodes.values()),
+        "unique_users": len(backplane.online_users()),
+        "admin_users": len(backplane.online_users(role="admin")),
+        "broadcast": broadcast_scheduler.get_metrics(),
+    }
+
+
 def emit_risk_score_update(session_id, risk_score, risk_level, details=None, user_id=None):
-    socketio.emit("risk_score_update", {
+    schedule_broadcast("risk_score_update", {
         "session_id": session_id,
         "risk_score": risk_score,
         "risk_level": risk_level,
         "details": details,
         "timestamp": datetime.utcnow().isoformat()
-    }, room=f"risk_score_{session_id}")
+    }, room=f"risk_score_{session_id}", key=session_id)
 
 def emit_admin_notification(notification_data):
     """
     Emit notification to all admin users
     (Backward compatibility function)
     """
-    if not socketio:
-        return
-
     enhanced_notification = {
         **notification_data,
         "timestamp": datetime.utcnow().isoformat()
     }
 
-    socketio.emit(
-        "admin_notification",
-        enhanced_notification,
-        room="admin_room"
-    )
+    broadcast("admin_notification", enhanced_notification, room="admin_room")